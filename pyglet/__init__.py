@@ -95,6 +95,8 @@ if getattr(sys, 'frozen', None):
 #:     * directsound, the Windows DirectSound audio module (Windows only)
 #:     * pulse, the PulseAudio module (Linux only)
 #:     * openal, the OpenAL audio module
+#:     * mixer, software mixing of all players into one stream, which is
+#:       discarded (see `pyglet.media.drivers.mixer`)
 #:     * silent, no audio
 #: debug_lib
 #:     If True, prints the path of each dynamic library loaded.
@@ -53,6 +53,13 @@ The `get_fps` function averages the framerate over a sliding window of
 approximately 1 second.  (You can calculate the instantaneous framerate by
 taking the reciprocal of ``dt``).
 
+An average hides occasional long frames, which are seen as stutter.  The
+`get_frame_stats` function summarises the durations of recent frames,
+measured with a monotonic high-resolution timer::
+
+    stats = clock.get_frame_stats()
+    print '99%% of frames took less than %f secs' % stats.p99
+
 Always remember to `tick` the clock!
 
 Limiting frame-rate
@@ -141,6 +148,9 @@ of the system clock.
 __docformat__ = 'restructuredtext'
 __version__ = '$Id$'
 
+import collections
+import heapq
+import math
 import time
 import sys
 import ctypes
@@ -164,6 +174,9 @@ if sys.platform in ('win32', 'cygwin'):
 
     _default_time_function = time.clock
 
+    # time.clock uses the performance counter, which is monotonic.
+    _monotonic_time_function = time.clock
+
 else:
     _c = pyglet.lib.load_library('c', darwin='/usr/lib/libc.dylib')
     _c.usleep.argtypes = [ctypes.c_ulong]
@@ -174,6 +187,46 @@ else:
 
     _default_time_function = time.time
 
+    if sys.platform == 'darwin':
+        class _mach_timebase_info(ctypes.Structure):
+            _fields_ = [('numer', ctypes.c_uint32),
+                        ('denom', ctypes.c_uint32)]
+
+        _c.mach_absolute_time.restype = ctypes.c_uint64
+        _timebase = _mach_timebase_info()
+        _c.mach_timebase_info(ctypes.byref(_timebase))
+        _timebase_scale = _timebase.numer / (_timebase.denom * 1e9)
+
+        def _monotonic_time_function():
+            return _c.mach_absolute_time() * _timebase_scale
+
+    else:
+        class _timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long),
+                        ('tv_nsec', ctypes.c_long)]
+
+        _CLOCK_MONOTONIC = 1
+
+        try:
+            _clock_gettime = _c.clock_gettime
+        except AttributeError:
+            # Older C libraries provide clock_gettime in librt.
+            try:
+                _clock_gettime = pyglet.lib.load_library('rt').clock_gettime
+            except (ImportError, AttributeError):
+                _clock_gettime = None
+
+        if _clock_gettime is not None:
+            _clock_gettime.argtypes = [ctypes.c_int,
+                                       ctypes.POINTER(_timespec)]
+            _ts = _timespec()
+
+            def _monotonic_time_function():
+                _clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(_ts))
+                return _ts.tv_sec + _ts.tv_nsec * 1e-9
+        else:
+            _monotonic_time_function = time.time
+
 class _ScheduledItem(object):
     __slots__ = ['func', 'args', 'kwargs']
     def __init__(self, func, args, kwargs):
@@ -192,6 +245,70 @@ class _ScheduledIntervalItem(object):
         self.args = args
         self.kwargs = kwargs
 
+class FrameStats(object):
+    '''Summary of the durations of recent frames.
+
+    All times are given in seconds.  Percentiles use the nearest-rank
+    method; for example, `p95` is the shortest time within which at least
+    95% of the frames completed.
+
+    :Ivariables:
+        `count` : int
+            Number of frames measured.
+        `mean` : float
+            Mean frame time.
+        `p50` : float
+            Median frame time.
+        `p95` : float
+            95th percentile frame time.
+        `p99` : float
+            99th percentile frame time.
+        `max` : float
+            Longest frame time.
+        `jitter` : float
+            Mean absolute difference between the times of consecutive
+            frames.  This is zero for perfectly paced frames, however fast
+            or slow.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, times):
+        '''Compute the statistics of a list of frame times.
+
+        :Parameters:
+            `times` : list of float
+                Frame times, in the order the frames occurred.
+
+        '''
+        self.count = len(times)
+        if not times:
+            self.mean = self.p50 = self.p95 = self.p99 = 0.
+            self.max = self.jitter = 0.
+            return
+
+        ordered = sorted(times)
+        self.mean = sum(times) / len(times)
+        self.p50 = self._percentile(ordered, 50)
+        self.p95 = self._percentile(ordered, 95)
+        self.p99 = self._percentile(ordered, 99)
+        self.max = ordered[-1]
+        if len(times) > 1:
+            self.jitter = sum([abs(b - a) for a, b in
+                               zip(times[:-1], times[1:])]) / (len(times) - 1)
+        else:
+            self.jitter = 0.
+
+    @staticmethod
+    def _percentile(ordered, percent):
+        rank = int(math.ceil(percent / 100. * len(ordered)))
+        return ordered[max(rank, 1) - 1]
+
+    def __repr__(self):
+        return ('%s(count=%d, mean=%f, p50=%f, p95=%f, p99=%f, max=%f, '
+                'jitter=%f)' % (self.__class__.__name__, self.count,
+                                self.mean, self.p50, self.p95, self.p99,
+                                self.max, self.jitter))
+
 def _dummy_schedule_func(*args, **kwargs):
     '''Dummy function that does nothing, placed onto zombie scheduled items
     to ensure they have no side effect if already queued inside tick() method.
@@ -215,16 +332,25 @@ class Clock(_ClockBase):
     #: to compensate for lazy operating systems.
     SLEEP_UNDERSHOOT = MIN_SLEEP - 0.001
 
+    #: The number of recent frames summarised by `get_frame_stats`.
+    FRAME_STATS_SIZE = 240
+
     # List of functions to call every tick.
     _schedule_items = None
 
-    # List of schedule interval items kept in sort order.
-    _schedule_interval_items = None
+    # Heap of (next_ts, sequence, item) for each schedule interval item.
+    # Unscheduled items are left in the heap with a dummy func until they
+    # reach the top, or the heap is rebuilt.
+    _schedule_interval_heap = None
+
+    # Map of func to the set of scheduled items calling it.
+    _schedule_index = None
 
     # If True, a sleep(0) is inserted on every tick.   
     _force_sleep = False
 
-    def __init__(self, fps_limit=None, time_function=_default_time_function):
+    def __init__(self, fps_limit=None, time_function=_default_time_function,
+                 frame_time_function=_monotonic_time_function):
         '''Initialise a Clock, with optional framerate limit and custom
         time function.
 
@@ -236,6 +362,12 @@ class Clock(_ClockBase):
                 Function to return the elapsed time of the application, 
                 in seconds.  Defaults to time.time, but can be replaced
                 to allow for easy time dilation effects or game pausing.
+            `frame_time_function` : function
+                Function to return the time in seconds, used to measure
+                the frame times reported by `get_frame_stats`.  Defaults
+                to a monotonic high-resolution timer, so that frame times
+                are not affected by changes to the system time or by
+                `time_function`.  Since pyglet 1.2.
 
         '''
 
@@ -243,13 +375,22 @@ class Clock(_ClockBase):
         self.time = time_function
         self.next_ts = self.time()
         self.last_ts = None
-        self.times = []
+        self.times = collections.deque()
+
+        self.frame_time = frame_time_function
+        self._last_frame_ts = None
+        self._frame_times = [0.] * self.FRAME_STATS_SIZE
+        self._frame_times_index = 0
+        self._frame_times_count = 0
 
         self.set_fps_limit(fps_limit)
         self.cumulative_time = 0
 
         self._schedule_items = []
-        self._schedule_interval_items = []
+        self._schedule_interval_heap = []
+        self._schedule_index = {}
+        self._schedule_sequence = 0
+        self._schedule_interval_count = 0
 
     def update_time(self):
         '''Get the elapsed time since the last call to `update_time`.
@@ -268,12 +409,21 @@ class Clock(_ClockBase):
             delta_t = 0
         else:
             delta_t = ts - self.last_ts
-            self.times.insert(0, delta_t)
+            self.times.appendleft(delta_t)
             if len(self.times) > self.window_size:
                 self.cumulative_time -= self.times.pop()
         self.cumulative_time += delta_t
         self.last_ts = ts
 
+        # Record the frame time in a ring buffer
+        frame_ts = self.frame_time()
+        if self._last_frame_ts is not None:
+            index = self._frame_times_index
+            self._frame_times[index] = frame_ts - self._last_frame_ts
+            self._frame_times_index = (index + 1) % len(self._frame_times)
+            self._frame_times_count += 1
+        self._last_frame_ts = frame_ts
+
         return delta_t
 
     def call_scheduled_functions(self, dt):
@@ -300,13 +450,23 @@ class Clock(_ClockBase):
             item.func(dt, *item.args, **item.kwargs)
 
         # Call all scheduled interval functions and reschedule for future.
-        need_resort = False
-        # Dupe list just in case one of the items unchedules itself
-        for item in list(self._schedule_interval_items):
-            if item.next_ts > ts:
-                break
+        # Items are taken off the heap before any are called, so that items
+        # scheduled by the callbacks are not called until the next tick.
+        heap = self._schedule_interval_heap
+        due = []
+        while heap and heap[0][0] <= ts:
+            due.append(heapq.heappop(heap)[2])
+
+        for item in due:
+            func = item.func
+            if func is _dummy_schedule_func:
+                # Unscheduled
+                continue
             result = True
-            item.func(ts - item.last_ts, *item.args, **item.kwargs)
+            func(ts - item.last_ts, *item.args, **item.kwargs)
+            if item.func is _dummy_schedule_func:
+                # Unscheduled during the call
+                continue
             if item.interval:
                 # Try to keep timing regular, even if overslept this time;
                 # but don't schedule in the past (which could lead to
@@ -325,18 +485,11 @@ class Clock(_ClockBase):
                         # future.  Unfortunately means the next reported dt is
                         # incorrect (looks like interval but actually isn't).
                         item.last_ts = item.next_ts - item.interval
-                need_resort = True
+                self._push_interval_item(item)
             else:
                 item.next_ts = None
-
-        # Remove finished one-shots.
-        self._schedule_interval_items = \
-            [item for item in self._schedule_interval_items \
-             if item.next_ts is not None]
-
-        if need_resort:
-            # TODO bubble up changed items might be faster
-            self._schedule_interval_items.sort(key=lambda a: a.next_ts)
+                self._unindex_item(item)
+                self._schedule_interval_count -= 1
 
         return result
 
@@ -434,17 +587,27 @@ class Clock(_ClockBase):
                 return 0.
             else:
                 wake_time = self.next_ts
-                if self._schedule_interval_items:
-                    wake_time = min(wake_time,
-                                    self._schedule_interval_items[0].next_ts)
+                next_ts = self._get_next_interval_ts()
+                if next_ts is not None:
+                    wake_time = min(wake_time, next_ts)
                 return max(wake_time - self.time(), 0.)
 
-        if self._schedule_interval_items:
-            return max(self._schedule_interval_items[0].next_ts - self.time(),
-                       0)
+        next_ts = self._get_next_interval_ts()
+        if next_ts is not None:
+            return max(next_ts - self.time(), 0)
             
         return None
 
+    def _get_next_interval_ts(self):
+        # Discard unscheduled items from the top of the heap and return the
+        # time of the next interval item, or None if there are none.
+        heap = self._schedule_interval_heap
+        while heap and heap[0][2].func is _dummy_schedule_func:
+            heapq.heappop(heap)
+        if heap:
+            return heap[0][0]
+        return None
+
     def set_fps_limit(self, fps_limit):
         '''Set the framerate limit.
 
@@ -490,6 +653,28 @@ class Clock(_ClockBase):
             return 0
         return len(self.times) / self.cumulative_time
 
+    def get_frame_stats(self):
+        '''Get statistics of the durations of recent frames.
+
+        The statistics cover the last `FRAME_STATS_SIZE` ticks, and include
+        percentiles, the longest frame time and the frame-to-frame jitter.
+        Unlike `get_fps`, these reveal occasional long frames (stutter)
+        in an otherwise fast framerate.
+
+        :since: pyglet 1.2
+
+        :rtype: `FrameStats`
+        :return: Statistics of recent frame times.
+        '''
+        times = self._frame_times
+        if self._frame_times_count < len(times):
+            times = times[:self._frame_times_count]
+        else:
+            # Oldest frame first
+            index = self._frame_times_index
+            times = times[index:] + times[:index]
+        return FrameStats(times)
+
     def schedule(self, func, *args, **kwargs):
         '''Schedule a function to be called every frame.
 
@@ -507,18 +692,34 @@ class Clock(_ClockBase):
         '''
         item = _ScheduledItem(func, args, kwargs)
         self._schedule_items.append(item)
+        self._index_item(item)
+
+    def _index_item(self, item):
+        items = self._schedule_index.get(item.func)
+        if items is None:
+            items = self._schedule_index[item.func] = set()
+        items.add(item)
+
+    def _unindex_item(self, item):
+        items = self._schedule_index.get(item.func)
+        if items is not None:
+            items.discard(item)
+            if not items:
+                del self._schedule_index[item.func]
+
+    def _push_interval_item(self, item):
+        # Items scheduled for the same time are called in the order they
+        # were scheduled.
+        self._schedule_sequence += 1
+        heapq.heappush(self._schedule_interval_heap,
+                       (item.next_ts, self._schedule_sequence, item))
 
     def _schedule_item(self, func, last_ts, next_ts, interval, *args, **kwargs):
         item = _ScheduledIntervalItem(
             func, interval, last_ts, next_ts, args, kwargs)
-
-        # Insert in sort order
-        for i, other in enumerate(self._schedule_interval_items):
-            if other.next_ts is not None and other.next_ts > next_ts:
-                self._schedule_interval_items.insert(i, item)
-                break
-        else:
-            self._schedule_interval_items.append(item)
+        self._push_interval_item(item)
+        self._index_item(item)
+        self._schedule_interval_count += 1
 
     def schedule_interval(self, func, interval, *args, **kwargs):
         '''Schedule a function to be called every `interval` seconds.
@@ -597,13 +798,10 @@ class Clock(_ClockBase):
             '''Return True if the given time has already got an item
             scheduled nearby.
             '''
-            for item in self._schedule_interval_items:
-                if item.next_ts is None:
-                    pass
-                elif abs(item.next_ts - ts) <= e:
+            for item_ts, sequence, item in self._schedule_interval_heap:
+                if (abs(item_ts - ts) <= e and
+                    item.func is not _dummy_schedule_func):
                     return True
-                elif item.next_ts > ts + e:
-                    return False
             return False
 
         # Binary division over interval:
@@ -672,25 +870,34 @@ class Clock(_ClockBase):
                 The function to remove from the schedule.
 
         '''
-        # First replace zombie items' func with a dummy func that does
-        # nothing, in case the list has already been cloned inside tick().
-        # (Fixes issue 326).
-        for item in self._schedule_items:
-            if item.func == func:
-                item.func = _dummy_schedule_func
-
-        for item in self._schedule_interval_items:
-            if item.func == func:
-                item.func = _dummy_schedule_func
-    
-        # Now remove matching items from both schedule lists.
-        self._schedule_items = \
-            [item for item in self._schedule_items \
-                  if item.func is not _dummy_schedule_func]
+        items = self._schedule_index.pop(func, None)
+        if not items:
+            return
+
+        # Replace the items' func with a dummy func that does nothing, in
+        # case they have already been taken from the schedule inside tick().
+        # (Fixes issue 326).  Interval items are discarded when they reach
+        # the top of the heap.
+        frame_items = False
+        for item in items:
+            item.func = _dummy_schedule_func
+            if isinstance(item, _ScheduledIntervalItem):
+                self._schedule_interval_count -= 1
+            else:
+                frame_items = True
 
-        self._schedule_interval_items = \
-            [item for item in self._schedule_interval_items \
-                  if item.func is not _dummy_schedule_func]
+        if frame_items:
+            self._schedule_items = \
+                [item for item in self._schedule_items \
+                      if item.func is not _dummy_schedule_func]
+
+        # Rebuild the heap once most of it is unscheduled items.
+        heap = self._schedule_interval_heap
+        if len(heap) - self._schedule_interval_count > len(heap) // 2:
+            heap = [entry for entry in heap \
+                    if entry[2].func is not _dummy_schedule_func]
+            heapq.heapify(heap)
+            self._schedule_interval_heap = heap
 
 # Default clock.
 _default = Clock()
@@ -763,6 +970,15 @@ def get_fps():
     '''
     return _default.get_fps()
 
+def get_frame_stats():
+    '''Return statistics of recent frame times of the default clock.
+
+    :since: pyglet 1.2
+
+    :rtype: `FrameStats`
+    '''
+    return _default.get_frame_stats()
+
 def set_fps_limit(fps_limit):
     '''Set the framerate limit for the default clock.
 
@@ -896,7 +1112,11 @@ class ClockDisplay(object):
                 The number of seconds between updating the display.
             `format` : str
                 A format string describing the format of the text.  This
-                string is modulated with the dict ``{'fps' : fps}``.
+                string is modulated with the dict ``{'fps' : fps}``,
+                which also has the keys ``'mean'``, ``'p50'``, ``'p95'``,
+                ``'p99'``, ``'max'`` and ``'jitter'`` giving the frame
+                time statistics of `Clock.get_frame_stats` in
+                milliseconds; for example, ``'%(fps).1f %(p99).1fms'``.
             `color` : 4-tuple of float
                 The color, including alpha, passed to ``glColor4f``.
             `clock` : `Clock`
@@ -935,7 +1155,11 @@ class ClockDisplay(object):
     def update_text(self, dt=0):
         '''Scheduled method to update the label text.''' 
         fps = self.clock.get_fps()
-        self.label.text = self.format % {'fps': fps}
+        stats = self.clock.get_frame_stats()
+        values = {'fps': fps}
+        for key in ('mean', 'p50', 'p95', 'p99', 'max', 'jitter'):
+            values[key] = getattr(stats, key) * 1000
+        self.label.text = self.format % values
 
     def draw(self):
         '''Method called each frame to render the label.'''
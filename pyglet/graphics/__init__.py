@@ -317,6 +317,16 @@ class Batch(object):
 
     Call `VertexList.delete` to remove a vertex list from the batch.
     '''
+
+    #: Fraction of a domain's capacity that may be lost to fragmentation
+    #: before the domain is compacted automatically when the batch is drawn.
+    #: If ``None`` (the default), domains are only compacted by calling
+    #: `compact`.
+    #:
+    #: :type: float
+    #: :since: pyglet 1.2
+    compact_threshold = None
+
     def __init__(self):
         '''Create a graphics batch.'''
         # Mapping to find domain.  
@@ -472,8 +482,7 @@ class Batch(object):
                 if domain._is_empty():
                     del domain_map[(formats, mode, indexed)]
                     continue
-                draw_list.append(
-                    (lambda d, m: lambda: d.draw(m))(domain, mode))
+                draw_list.append(('draw', domain, mode))
 
             # Sort and visit child groups of this group
             children = self.group_children.get(group)
@@ -483,7 +492,7 @@ class Batch(object):
                     draw_list.extend(visit(child))
 
             if children or domain_map:
-                return [group.set_state] + draw_list + [group.unset_state]
+                return [('set', group)] + draw_list + [('unset', group)]
             else:
                 # Remove unused group from batch
                 del self.group_map[group]
@@ -499,17 +508,86 @@ class Batch(object):
                     pass
                 return []
 
-        self._draw_list = []
+        ops = []
 
         self.top_groups.sort()
         for group in list(self.top_groups):
-            self._draw_list.extend(visit(group))
+            ops.extend(visit(group))
 
+        self._draw_list = self._compile_draw_list(ops)
         self._draw_list_dirty = False
 
         if _debug_graphics_batch:
             self._dump_draw_list()
 
+    def _compile_draw_list(self, ops):
+        '''Create the list of functions called by `draw` from the
+        ``('set', group)``, ``('draw', domain, mode)`` and
+        ``('unset', group)`` operations found by visiting the group tree.
+
+        Redundant state changes are left out: groups that do not override
+        `Group.set_state` or `Group.unset_state` are skipped, siblings with a
+        shared `Group.state_key` are switched between directly, and
+        consecutive domains with the same vertex arrays keep the client
+        state set up between them.
+        '''
+        # Replace unset/set pairs of sibling groups with a single switch
+        transitions = []
+        for op in ops:
+            if op[0] == 'set' and transitions and \
+               transitions[-1][0] == 'unset':
+                previous = transitions[-1][1]
+                group = op[1]
+                if (group.state_key is not None and
+                    group.__class__ is previous.__class__ and
+                    group.state_key == previous.state_key):
+                    transitions[-1] = ('switch', previous, group)
+                    continue
+            transitions.append(op)
+
+        draw_list = []
+        client_domain = None    # Domain whose client state is set
+        client_key = None
+        for op in transitions:
+            if op[0] == 'draw':
+                _, domain, mode = op
+                key = domain._get_client_state_key()
+                if client_domain is None:
+                    draw_list.append(domain._set_client_state)
+                elif key is not None and key == client_key:
+                    draw_list.append(domain._switch_client_state)
+                else:
+                    draw_list.append(client_domain._unset_client_state)
+                    draw_list.append(domain._set_client_state)
+                draw_list.append(
+                    (lambda d, m: lambda: d._draw_all(m))(domain, mode))
+                client_domain = domain
+                client_key = key
+                continue
+
+            group = op[-1]
+            if op[0] == 'switch':
+                func = (lambda p, g: lambda: g.switch_state(p))(op[1], group)
+            elif op[0] == 'set':
+                if _is_default_method(group.set_state, Group.set_state):
+                    continue
+                func = group.set_state
+            else:
+                if _is_default_method(group.unset_state, Group.unset_state):
+                    continue
+                func = group.unset_state
+
+            # Only groups with a state key promise to leave client state
+            # alone.
+            if client_domain is not None and group.state_key is None:
+                draw_list.append(client_domain._unset_client_state)
+                client_domain = None
+            draw_list.append(func)
+
+        if client_domain is not None:
+            draw_list.append(client_domain._unset_client_state)
+        return draw_list
+
     def _dump_draw_list(self):
         def dump(group, indent=''):
             print indent, 'Begin group', group
@@ -540,9 +618,56 @@ class Batch(object):
         if self._draw_list_dirty:
             self._update_draw_list()
 
+        if self.compact_threshold is not None:
+            self.compact(self.compact_threshold)
+
         for func in self._draw_list:
             func()
 
+    def get_draw_cache_stats(self):
+        '''Get the number of draw range cache hits and misses.
+
+        Each vertex domain caches the ranges of vertices it draws, and
+        rebuilds them only after vertex lists are added, deleted or resized.
+        The returned counts are totals over the domains currently in the
+        batch; a static batch should only register hits.
+
+        :rtype: (int, int)
+        :return: hits, misses
+        :since: pyglet 1.2
+        '''
+        hits = misses = 0
+        for domain_map in self.group_map.values():
+            for domain in domain_map.values():
+                hits += domain.draw_cache_hits
+                misses += domain.draw_cache_misses
+        return hits, misses
+
+    def compact(self, threshold=None, shrink=True):
+        '''Defragment the vertex domains of the batch.
+
+        Vertex lists that are deleted or resized leave gaps in their domain's
+        buffers, and each gap costs an extra range when the domain is drawn.
+        Compacting a domain moves its vertex lists together and updates their
+        ``start`` positions; previously retrieved attribute arrays (such as
+        ``vertex_list.vertices``) must be fetched again afterwards.
+
+        :Parameters:
+            `threshold` : float
+                Only compact domains with more than this fraction of their
+                capacity lost to fragmentation.  If ``None``, all domains are
+                compacted.
+            `shrink` : bool
+                If True, buffers are reduced in size after compaction.
+
+        :since: pyglet 1.2
+        '''
+        for domain_map in self.group_map.values():
+            for domain in domain_map.values():
+                if (threshold is None or
+                    domain.get_fragmented_fraction() > threshold):
+                    domain.compact(shrink)
+
     def draw_subset(self, vertex_lists):
         '''Draw only some vertex lists in the batch.
 
@@ -582,6 +707,11 @@ class Batch(object):
         for group in self.top_groups:
             visit(group)
 
+def _is_default_method(method, default):
+    # True if bound `method` is the unoverridden `default` method.
+    return getattr(method, '__func__', method) is \
+           getattr(default, '__func__', default)
+
 class Group(object):
     '''Group of common OpenGL state.
 
@@ -590,6 +720,21 @@ class Group(object):
     subclasses; the default state change has no effect, and groups vertex
     lists only in the order in which they are drawn.
     '''
+
+    #: Description of the kind of OpenGL state set by the group, or ``None``.
+    #:
+    #: Groups of the same class with equal state keys set and unset the same
+    #: OpenGL state, though perhaps with different values (for example, two
+    #: texture groups with different textures).  When a batch draws such a
+    #: group directly after its sibling, it calls `switch_state` instead of
+    #: unsetting the sibling and setting the group.
+    #:
+    #: A group giving a state key must not change the vertex array client
+    #: state or buffer bindings in any of its state methods.  The key must
+    #: not change while the group is in a batch.
+    #:
+    #: :since: pyglet 1.2
+    state_key = None
     def __init__(self, parent=None):
         '''Create a group.
 
@@ -616,6 +761,22 @@ class Group(object):
         The default implementation does nothing.'''
         pass
 
+    def switch_state(self, previous):
+        '''Change from the OpenGL state of `previous` to that of this group.
+
+        Only called when `previous` is a sibling of the same class with an
+        equal `state_key`.  The default implementation unsets `previous` and
+        sets this group.
+
+        :Parameters:
+            `previous` : `Group`
+                Group whose state is currently set.
+
+        :since: pyglet 1.2
+        '''
+        previous.unset_state()
+        self.set_state()
+
     def set_state_recursive(self):
         '''Set this group and its ancestry.
 
@@ -668,6 +829,13 @@ class TextureGroup(Group):
         super(TextureGroup, self).__init__(parent)
         self.texture = texture
 
+        # A subclass setting other state is only switched to directly if it
+        # gives its own state key.
+        if (_is_default_method(self.set_state, TextureGroup.set_state) and
+            _is_default_method(self.unset_state, TextureGroup.unset_state) and
+            _is_default_method(self.switch_state, TextureGroup.switch_state)):
+            self.state_key = texture.target
+
     def set_state(self):
         glEnable(self.texture.target)
         glBindTexture(self.texture.target, self.texture.id)
@@ -675,6 +843,9 @@ class TextureGroup(Group):
     def unset_state(self):
         glDisable(self.texture.target)
 
+    def switch_state(self, previous):
+        glBindTexture(self.texture.target, self.texture.id)
+
     def __hash__(self):
         return hash((self.texture.target, self.texture.id, self.parent))
 
@@ -45,10 +45,23 @@ allocation.  The buffer is never resized smaller.
 
 The allocator maintains references to free space only; it is the caller's
 responsibility to maintain the allocated regions.
+
+Two implementations are provided.  `Allocator` keeps a list of allocated
+blocks and searches it linearly; `FreeListAllocator` keeps balanced trees of
+free blocks, so the expected cost of allocation, reallocation and deallocation
+grows only logarithmically with the number of free blocks in the buffer.
+Both share the same interface and the same `AllocatorMemoryException`
+contract.
+
+Both allocators increment their ``version`` attribute when the allocated
+regions change, so that data derived from `get_allocated_regions` (such as
+the arrays passed to ``glMultiDrawArrays``) can be cached.
 '''
 
 __docformat__ = 'restructuredtext'
 __version__ = '$Id: $'
+
+import random
  
 # Common cases:
 # -regions will be the same size (instances of same object, e.g. sprites)
@@ -70,8 +83,8 @@ __version__ = '$Id: $'
 # -allocator does not track individual allocated regions.  Trusts caller
 #  to provide accurate (start, size) tuple, which completely describes
 #  a region from the allocator's point of view.
-# -this means that compacting is probably not feasible, or would be hideously
-#  expensive
+# -this means that compacting can't be done by the allocator; the vertex
+#  domain, which knows its vertex lists, does it instead (VertexDomain.compact)
 
 class AllocatorMemoryException(Exception):
     '''The buffer is not large enough to fulfil an allocation.
@@ -116,6 +129,9 @@ class Allocator(object):
         self.starts = []
         self.sizes = []
 
+        # Incremented whenever the allocated regions may have changed.
+        self.version = 0
+
     def set_capacity(self, size):
         '''Resize the maximum buffer size.
         
@@ -128,6 +144,7 @@ class Allocator(object):
         '''
         assert size > self.capacity
         self.capacity = size
+        self.version += 1
 
     def alloc(self, size):
         '''Allocate memory in the buffer.
@@ -147,6 +164,8 @@ class Allocator(object):
         if size == 0:
             return 0
 
+        self.version += 1
+
         # return start
         # or raise AllocatorMemoryException
 
@@ -216,6 +235,8 @@ class Allocator(object):
         elif size == 0:
             return self.alloc(new_size)
 
+        self.version += 1
+
         # return start
         # or raise AllocatorMemoryException
 
@@ -291,6 +312,7 @@ class Allocator(object):
             return
 
         assert self.starts
+        self.version += 1
         
         # Find which block needs to be split
         for i, (alloc_start, alloc_size) in \
@@ -402,3 +424,515 @@ class Allocator(object):
 
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, str(self))
+
+#: Allocation policy: use the free block with the lowest start index that is
+#: large enough.  This keeps regions packed towards the start of the buffer.
+FIRST_FIT = 'first_fit'
+
+#: Allocation policy: use the smallest free block that is large enough.  This
+#: leaves larger free blocks intact for larger allocations.
+BEST_FIT = 'best_fit'
+
+# Priorities of the free block trees; kept apart from the global generator so
+# that allocating does not disturb an application's random sequence.
+_random = random.Random()
+
+class _FreeBlockNode(object):
+    __slots__ = ('key', 'size', 'max_size', 'priority', 'left', 'right')
+
+    def __init__(self, key, size):
+        self.key = key
+        self.size = size
+        self.max_size = size
+        self.priority = _random.random()
+        self.left = None
+        self.right = None
+
+    def update(self):
+        max_size = self.size
+        if self.left is not None and self.left.max_size > max_size:
+            max_size = self.left.max_size
+        if self.right is not None and self.right.max_size > max_size:
+            max_size = self.right.max_size
+        self.max_size = max_size
+
+def _split(node, key):
+    # Split the treap into the blocks before `key` and the rest.
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        node.update()
+        return node, right
+    else:
+        left, node.left = _split(node.left, key)
+        node.update()
+        return left, node
+
+def _merge(left, right):
+    # Join two treaps, all blocks of `left` preceding those of `right`.
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.update()
+        return left
+    else:
+        right.left = _merge(left, right.left)
+        right.update()
+        return right
+
+class _FreeBlockTree(object):
+    # Free blocks ordered by key, as a treap whose nodes also hold the
+    # largest block size in their subtree.  Every operation takes O(log n)
+    # expected time.
+    #
+    # Keyed by start, the first block large enough for an allocation is
+    # found by descending into the leftmost subtree with a large enough
+    # block, and the neighbours of a block by descending to its start.
+    # Keyed by (size, start), the smallest block large enough is the first
+    # key not less than (size, -1).
+    def __init__(self):
+        self.root = None
+
+    def add(self, key, size):
+        new = _FreeBlockNode(key, size)
+        path = []
+        node = self.root
+        while node is not None and node.priority > new.priority:
+            path.append(node)
+            if key < node.key:
+                node = node.left
+            else:
+                node = node.right
+        new.left, new.right = _split(node, key)
+        new.update()
+        self._link(path, key, new)
+
+    def remove(self, key):
+        path = []
+        node = self.root
+        while node.key != key:
+            path.append(node)
+            if key < node.key:
+                node = node.left
+            else:
+                node = node.right
+        self._link(path, key, _merge(node.left, node.right))
+
+    def _link(self, path, key, new):
+        # Make `new` the child on the side of `key` of the last node of
+        # `path`, and update the nodes of `path`.
+        if not path:
+            self.root = new
+            return
+        parent = path[-1]
+        if key < parent.key:
+            parent.left = new
+        else:
+            parent.right = new
+        for node in reversed(path):
+            node.update()
+
+    def replace(self, old_key, key, size):
+        # Change a block in place; its position in key order must not
+        # change.
+        node = self.root
+        path = []
+        while node.key != old_key:
+            path.append(node)
+            if old_key < node.key:
+                node = node.left
+            else:
+                node = node.right
+        node.key = key
+        node.size = size
+        node.update()
+        for node in reversed(path):
+            node.update()
+
+    def find_first_fit(self, size):
+        # Key of the first block of at least `size`, or None.
+        node = self.root
+        if node is None or node.max_size < size:
+            return None
+        while True:
+            left = node.left
+            if left is not None and left.max_size >= size:
+                node = left
+            elif node.size >= size:
+                return node.key
+            else:
+                node = node.right
+
+    def find_before(self, key):
+        # Greatest key less than `key`, or None.
+        result = None
+        node = self.root
+        while node is not None:
+            if node.key < key:
+                result = node.key
+                node = node.right
+            else:
+                node = node.left
+        return result
+
+    def find_from(self, key):
+        # Least key not less than `key`, or None.
+        result = None
+        node = self.root
+        while node is not None:
+            if node.key < key:
+                node = node.right
+            else:
+                result = node.key
+                node = node.left
+        return result
+
+    def find_last(self):
+        node = self.root
+        if node is None:
+            return None
+        while node.right is not None:
+            node = node.right
+        return node.key
+
+    def __iter__(self):
+        # Keys in order.
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.key
+                node = node.right
+
+class FreeListAllocator(object):
+    '''Buffer space allocation implementation using an index of free blocks.
+
+    Free blocks are kept in a tree in start order (for coalescing on
+    deallocation and finding the first fit), and for `BEST_FIT` also in a
+    tree in size order, so allocation and deallocation walk neither the
+    allocated regions nor the free blocks.  The aggregate allocated regions
+    returned by `get_allocated_regions` are computed from the free blocks and
+    cached until the next change.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, capacity, policy=FIRST_FIT):
+        '''Create an allocator for a buffer of the specified capacity.
+
+        :Parameters:
+            `capacity` : int
+                Maximum size of the buffer.
+            `policy` : str
+                Allocation policy; either `FIRST_FIT` or `BEST_FIT`.
+
+        '''
+        assert policy in (FIRST_FIT, BEST_FIT), 'Unknown policy %r' % policy
+        self.capacity = capacity
+        self.policy = policy
+
+        # Free blocks.  A tree of starts in address order, with sizes
+        # keyed by start.
+        #
+        # # = allocated, - = free
+        #
+        #  0  3 5        15   20  24                    40
+        # |###--##########-----####----------------------|
+        #
+        # _free_tree keys = 3, 15, 24
+        # _free_sizes = {3: 2, 15: 5, 24: 16}
+        self._free_tree = _FreeBlockTree()
+        self._free_sizes = {}
+        self._free_total = 0
+
+        # For BEST_FIT, a tree of (size, start) of the free blocks.
+        self._size_tree = None
+        if policy == BEST_FIT:
+            self._size_tree = _FreeBlockTree()
+
+        # Incremented whenever the allocated regions change.
+        self.version = 0
+
+        # Cached result of get_allocated_regions, and the version it is for.
+        self._regions = None
+        self._regions_version = -1
+
+        if capacity > 0:
+            self._insert_free(0, capacity)
+            self._free_total = capacity
+
+    # Free block maintenance
+
+    def _insert_free(self, start, size):
+        self._free_tree.add(start, size)
+        self._free_sizes[start] = size
+        if self._size_tree is not None:
+            self._size_tree.add((size, start), size)
+
+    def _remove_free(self, start):
+        size = self._free_sizes.pop(start)
+        self._free_tree.remove(start)
+        if self._size_tree is not None:
+            self._size_tree.remove((size, start))
+
+    def _replace_free(self, old_start, start, size):
+        # Address order is unchanged by the caller's guarantee.
+        old_size = self._free_sizes.pop(old_start)
+        self._free_tree.replace(old_start, start, size)
+        self._free_sizes[start] = size
+        if self._size_tree is not None:
+            self._size_tree.remove((old_size, old_start))
+            self._size_tree.add((size, start), size)
+
+    def _find_free(self, size):
+        if self._size_tree is not None:
+            key = self._size_tree.find_from((size, -1))
+            if key is not None:
+                return key[1]
+            return None
+        return self._free_tree.find_first_fit(size)
+
+    def _take_free(self, start, size):
+        # Allocate `size` from the beginning of the free block at `start`.
+        free_size = self._free_sizes[start]
+        if free_size == size:
+            self._remove_free(start)
+        else:
+            self._replace_free(start, start + size, free_size - size)
+        self._free_total -= size
+        self.version += 1
+
+    def _get_final_free_size(self):
+        start = self._free_tree.find_last()
+        if start is not None:
+            size = self._free_sizes[start]
+            if start + size == self.capacity:
+                return size
+        return 0
+
+    def _is_allocated(self, start, size):
+        if start < 0 or start + size > self.capacity:
+            return False
+        if start in self._free_sizes:
+            return False
+        previous = self._free_tree.find_before(start)
+        if previous is not None and \
+           previous + self._free_sizes[previous] > start:
+            return False
+        next_start = self._free_tree.find_from(start)
+        if next_start is not None and next_start < start + size:
+            return False
+        return True
+
+    # Allocator interface
+
+    def set_capacity(self, size):
+        '''Resize the maximum buffer size.
+
+        The capaity cannot be reduced.
+
+        :Parameters:
+            `size` : int
+                New maximum size of the buffer.
+
+        '''
+        assert size > self.capacity
+        final_free_size = self._get_final_free_size()
+        if final_free_size:
+            start = self.capacity - final_free_size
+            self._replace_free(start, start,
+                               final_free_size + size - self.capacity)
+        else:
+            self._insert_free(self.capacity, size - self.capacity)
+        self._free_total += size - self.capacity
+        self.capacity = size
+        self.version += 1
+
+    def alloc(self, size):
+        '''Allocate memory in the buffer.
+
+        Raises `AllocatorMemoryException` if the allocation cannot be
+        fulfilled.
+
+        :Parameters:
+            `size` : int
+                Size of region to allocate.
+
+        :rtype: int
+        :return: Starting index of the allocated region.
+        '''
+        assert size >= 0
+
+        if size == 0:
+            return 0
+
+        start = self._find_free(size)
+        if start is None:
+            raise AllocatorMemoryException(
+                self.capacity + size - self._get_final_free_size())
+
+        self._take_free(start, size)
+        return start
+
+    def realloc(self, start, size, new_size):
+        '''Reallocate a region of the buffer.
+
+        The region is resized in place if it is followed by enough free
+        space, otherwise it is moved.
+
+        Raises `AllocatorMemoryException` if the allocation cannot be
+        fulfilled.
+
+        :Parameters:
+            `start` : int
+                Current starting index of the region.
+            `size` : int
+                Current size of the region.
+            `new_size` : int
+                New size of the region.
+
+        '''
+        assert size >= 0 and new_size >= 0
+
+        if new_size == 0:
+            if size != 0:
+                self.dealloc(start, size)
+            return 0
+        elif size == 0:
+            return self.alloc(new_size)
+
+        assert self._is_allocated(start, size), 'Region not allocated'
+
+        # Truncation is the same as deallocating the tail cruft
+        if new_size < size:
+            self.dealloc(start + new_size, size - new_size)
+            return start
+        elif new_size == size:
+            return start
+
+        # Expand in place into the following free block
+        free_size = self._free_sizes.get(start + size, 0)
+        if free_size >= new_size - size:
+            self._take_free(start + size, new_size - size)
+            return start
+
+        # Allocate before deallocating, so that the region is intact if the
+        # allocation fails.
+        result = self.alloc(new_size)
+        self.dealloc(start, size)
+        return result
+
+    def dealloc(self, start, size):
+        '''Free a region of the buffer.
+
+        :Parameters:
+            `start` : int
+                Starting index of the region.
+            `size` : int
+                Size of the region.
+
+        '''
+        assert size >= 0
+
+        if size == 0:
+            return
+
+        assert self._is_allocated(start, size), 'Region not allocated'
+
+        free_sizes = self._free_sizes
+        end = start + size
+        previous_start = self._free_tree.find_before(start)
+
+        merge_previous = previous_start is not None and \
+            previous_start + free_sizes[previous_start] == start
+        merge_next = end in free_sizes
+
+        if merge_previous and merge_next:
+            next_size = free_sizes[end]
+            self._remove_free(end)
+            self._replace_free(previous_start, previous_start,
+                free_sizes[previous_start] + size + next_size)
+        elif merge_previous:
+            self._replace_free(previous_start, previous_start,
+                free_sizes[previous_start] + size)
+        elif merge_next:
+            self._replace_free(end, start, size + free_sizes[end])
+        else:
+            self._insert_free(start, size)
+
+        self._free_total += size
+        self.version += 1
+
+    def get_allocated_regions(self):
+        '''Get a list of (aggregate) allocated regions.
+
+        The result of this method is ``(starts, sizes)``, where ``starts`` is
+        a list of starting indices of the regions and ``sizes`` their
+        corresponding lengths.  The lists must not be modified.
+
+        :rtype: (list, list)
+        '''
+        if self._regions_version != self.version:
+            starts = []
+            sizes = []
+            free_sizes = self._free_sizes
+            end = 0
+            for free_start in self._free_tree:
+                if free_start > end:
+                    starts.append(end)
+                    sizes.append(free_start - end)
+                end = free_start + free_sizes[free_start]
+            if end < self.capacity:
+                starts.append(end)
+                sizes.append(self.capacity - end)
+            self._regions = (starts, sizes)
+            self._regions_version = self.version
+        return self._regions
+
+    def get_fragmented_free_size(self):
+        '''Returns the amount of space unused, not including the final
+        free block.
+
+        :rtype: int
+        '''
+        return self._free_total - self._get_final_free_size()
+
+    def get_free_size(self):
+        '''Return the amount of space unused.
+
+        :rtype: int
+        '''
+        return self._free_total
+
+    def get_usage(self):
+        '''Return fraction of capacity currently allocated.
+
+        :rtype: float
+        '''
+        return 1. - self.get_free_size() / float(self.capacity)
+
+    def get_fragmentation(self):
+        '''Return fraction of free space that is not expandable.
+
+        :rtype: float
+        '''
+        free_size = self.get_free_size()
+        if free_size == 0:
+            return 0.
+        return self.get_fragmented_free_size() / float(free_size)
+
+    def _is_empty(self):
+        return self._free_total == self.capacity
+
+    def __str__(self):
+        return 'allocs=' + repr(zip(*self.get_allocated_regions()))
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, str(self))
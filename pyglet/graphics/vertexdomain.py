@@ -54,6 +54,10 @@ buffers automatically.
 The entire domain can be efficiently drawn in one step with the
 `VertexDomain.draw` method, assuming all the vertices comprise primitives of
 the same OpenGL primitive mode.
+
+Deleting and resizing vertex lists leaves unused gaps in the buffers, each of
+which splits the domain into another range to draw.  `VertexDomain.compact`
+moves the live vertex lists together and optionally shrinks the buffers.
 '''
 
 __docformat__ = 'restructuredtext'
@@ -155,8 +159,27 @@ class VertexDomain(object):
     _version = 0
     _initial_count = 16
 
+    #: Number of times `draw` reused the cached draw ranges for the domain.
+    #:
+    #: :type: int
+    draw_cache_hits = 0
+
+    #: Number of times `draw` had to rebuild the draw ranges for the domain,
+    #: because vertex lists were created, deleted or resized.
+    #:
+    #: :type: int
+    draw_cache_misses = 0
+
+    # Cached result of _get_draw_ranges and the allocator state it is for.
+    _draw_ranges = None
+    _draw_ranges_key = None
+    _draw_ranges_multi = False
+
     def __init__(self, attribute_usages):
-        self.allocator = allocation.Allocator(self._initial_count)
+        self.allocator = allocation.FreeListAllocator(self._initial_count)
+
+        # Live vertex lists, required for compaction.
+        self._vertex_lists = set()
 
         # If there are any MultiTexCoord attributes, then a TexCoord attribute
         # must be converted.
@@ -274,7 +297,81 @@ class VertexDomain(object):
         :rtype: `VertexList`
         '''
         start = self._safe_alloc(count)
-        return VertexList(self, start, count)
+        vertex_list = VertexList(self, start, count)
+        self._vertex_lists.add(vertex_list)
+        return vertex_list
+
+    def _move_region(self, buffer, element_size, start, new_start, count):
+        # Move elements within a mappable buffer; regions may overlap.
+        size = count * element_size
+        ptr_type = ctypes.POINTER(ctypes.c_byte * size)
+        old = buffer.get_region(start * element_size, size, ptr_type)
+        new = buffer.get_region(new_start * element_size, size, ptr_type)
+        ctypes.memmove(new.array, old.array, size)
+        new.invalidate()
+
+    def _compact_vertices(self, shrink):
+        # Returns list of (vertex_list, old_start) for moved vertex lists.
+        moved = []
+        vertex_lists = sorted(self._vertex_lists, key=lambda v: v.start)
+        end = 0
+        for vertex_list in vertex_lists:
+            if vertex_list.count == 0:
+                continue
+            if vertex_list.start != end:
+                for buffer, _ in self.buffer_attributes:
+                    self._move_region(buffer, buffer.element_size,
+                        vertex_list.start, end, vertex_list.count)
+                moved.append((vertex_list, vertex_list.start))
+                vertex_list.start = end
+            end += vertex_list.count
+
+        capacity = self.allocator.capacity
+        if shrink:
+            capacity = max(self._initial_count, _nearest_pow2(end))
+            if capacity < self.allocator.capacity:
+                for buffer, _ in self.buffer_attributes:
+                    buffer.resize(capacity * buffer.element_size)
+            else:
+                capacity = self.allocator.capacity
+
+        self.allocator = allocation.FreeListAllocator(capacity,
+                                                      self.allocator.policy)
+        self.allocator.alloc(end)
+        return moved
+
+    def compact(self, shrink=True):
+        '''Move all vertex lists in the domain together.
+
+        After compaction the vertex lists occupy a single contiguous region
+        at the start of the buffers, so the domain is drawn with one range.
+        The ``start`` of moved vertex lists is updated, and arrays previously
+        returned by their attribute properties are invalidated.
+
+        Only vertex lists created with `create` (or migrated into this
+        domain) are preserved; any space allocated directly from the
+        allocator is released.
+
+        :Parameters:
+            `shrink` : bool
+                If True, the buffers are reduced to the smallest power of two
+                that holds the vertex lists.
+
+        '''
+        self._compact_vertices(shrink)
+        self._version += 1
+
+    def get_fragmented_fraction(self):
+        '''Get the fraction of the domain's capacity lost to fragmentation.
+
+        This is the amount of free space that lies between vertex lists (and
+        so cannot be used to extend the final one), relative to the capacity
+        of the buffers.  `compact` reduces it to zero.
+
+        :rtype: float
+        '''
+        return (self.allocator.get_fragmented_free_size() /
+                float(self.allocator.capacity))
 
     def draw(self, mode, vertex_list=None):
         '''Draw vertices in the domain.
@@ -292,6 +389,15 @@ class VertexDomain(object):
                 Vertex list to draw, or ``None`` for all lists in this domain.
 
         '''
+        self._set_client_state()
+        if vertex_list is not None:
+            glDrawArrays(mode, vertex_list.start, vertex_list.count)
+        else:
+            self._draw_all(mode)
+        self._unset_client_state()
+
+    def _set_client_state(self):
+        # Bind the buffers and enable the vertex arrays of this domain.
         glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
         for buffer, attributes in self.buffer_attributes:
             buffer.bind()
@@ -301,30 +407,85 @@ class VertexDomain(object):
         if vertexbuffer._workaround_vbo_finish:
             glFinish()
 
-        if vertex_list is not None:
-            glDrawArrays(mode, vertex_list.start, vertex_list.count)
-        else:
-            starts, sizes = self.allocator.get_allocated_regions()
-            primcount = len(starts)
-            if primcount == 0:
-                pass
-            elif primcount == 1:
-                # Common case
-                glDrawArrays(mode, starts[0], sizes[0])
-            elif gl_info.have_version(1, 4):
-                starts = (GLint * primcount)(*starts)
-                sizes = (GLsizei * primcount)(*sizes)
-                glMultiDrawArrays(mode, starts, sizes, primcount)
-            else:
-                for start, size in zip(starts, sizes):
-                    glDrawArrays(mode, start, size)
+    def _switch_client_state(self):
+        # Replace the client state set by a domain with the same
+        # _client_state_key: the same arrays are already enabled, so only
+        # the buffers and pointers change.
+        for buffer, attributes in self.buffer_attributes:
+            buffer.bind()
+            for attribute in attributes:
+                attribute.set_pointer(attribute.buffer.ptr)
+        if vertexbuffer._workaround_vbo_finish:
+            glFinish()
 
+    def _unset_client_state(self):
         for buffer, _ in self.buffer_attributes:
             buffer.unbind()
         glPopClientAttrib()
 
+    def _get_client_state_key(self):
+        # Domains with equal keys enable the same vertex arrays and use the
+        # same kind of buffers, so can use _switch_client_state between
+        # them.  None if the state cannot be switched.
+        buffer_classes = set([buffer.__class__
+                              for buffer, _ in self.buffer_attributes])
+        if len(buffer_classes) != 1:
+            # Vertex arrays mixed with VBOs rely on the VBO being unbound.
+            return None
+        arrays = []
+        for attribute in self.attributes:
+            if isinstance(attribute, vertexattribute.MultiTexCoordAttribute):
+                # Pointer depends on the client active texture
+                return None
+            arrays.append((attribute.__class__,
+                           getattr(attribute, 'index', None)))
+        return (buffer_classes.pop(), frozenset(arrays), None)
+
+    def _draw_all(self, mode):
+        # Draw every vertex list; client state must be set.
+        primcount, starts, sizes = self._get_draw_ranges()
+        if primcount == 0:
+            pass
+        elif primcount == 1:
+            # Common case
+            glDrawArrays(mode, starts[0], sizes[0])
+        elif self._draw_ranges_multi:
+            glMultiDrawArrays(mode, starts, sizes, primcount)
+        else:
+            for start, size in zip(starts, sizes):
+                glDrawArrays(mode, start, size)
+
+    def _get_draw_ranges(self):
+        '''Get the ranges of vertices to draw for the entire domain.
+
+        The result is ``(primcount, starts, sizes)``.  If
+        ``_draw_ranges_multi`` is set, ``starts`` and ``sizes`` are ctypes
+        arrays ready for ``glMultiDrawArrays``.  The result is cached until
+        the allocator changes.
+        '''
+        allocator = self.allocator
+        key = self._draw_ranges_key
+        if (key is not None and key[0] is allocator and
+            key[1] == allocator.version):
+            self.draw_cache_hits += 1
+            return self._draw_ranges
+
+        self.draw_cache_misses += 1
+        starts, sizes = allocator.get_allocated_regions()
+        primcount = len(starts)
+        self._draw_ranges_multi = primcount > 1 and gl_info.have_version(1, 4)
+        if self._draw_ranges_multi:
+            starts = (GLint * primcount)(*starts)
+            sizes = (GLsizei * primcount)(*sizes)
+        else:
+            starts = list(starts)
+            sizes = list(sizes)
+        self._draw_ranges = (primcount, starts, sizes)
+        self._draw_ranges_key = (allocator, allocator.version)
+        return self._draw_ranges
+
     def _is_empty(self):
-        return not self.allocator.starts
+        return self.allocator._is_empty()
 
     def __repr__(self):
         return '<%s@%x %s>' % (self.__class__.__name__, id(self),
@@ -397,6 +558,7 @@ class VertexList(object):
     def delete(self):
         '''Delete this group.'''
         self.domain.allocator.dealloc(self.start, self.count)
+        self.domain._vertex_lists.discard(self)
 
     def migrate(self, domain):
         '''Move this group from its current domain and add to the specified
@@ -422,8 +584,10 @@ class VertexList(object):
             new.invalidate()
 
         self.domain.allocator.dealloc(self.start, self.count)
+        self.domain._vertex_lists.discard(self)
         self.domain = domain
         self.start = new_start
+        domain._vertex_lists.add(self)
 
         self._colors_cache_version = None
         self._fog_coords_cache_version = None
@@ -607,7 +771,8 @@ class IndexedVertexDomain(VertexDomain):
     def __init__(self, attribute_usages, index_gl_type=GL_UNSIGNED_INT):
         super(IndexedVertexDomain, self).__init__(attribute_usages)
 
-        self.index_allocator = allocation.Allocator(self._initial_index_count)
+        self.index_allocator = allocation.FreeListAllocator(
+            self._initial_index_count)
 
         self.index_gl_type = index_gl_type
         self.index_c_type = vertexattribute._c_types[index_gl_type]
@@ -650,7 +815,100 @@ class IndexedVertexDomain(VertexDomain):
         '''
         start = self._safe_alloc(count)
         index_start = self._safe_index_alloc(index_count)
-        return IndexedVertexList(self, start, count, index_start, index_count)
+        vertex_list = IndexedVertexList(self, start, count,
+                                        index_start, index_count)
+        self._vertex_lists.add(vertex_list)
+        return vertex_list
+
+    def compact(self, shrink=True):
+        '''Move all vertex lists and their indices together.
+
+        See `VertexDomain.compact`; the index buffer is compacted in the same
+        way, and the indices of moved vertex lists are rewritten to refer to
+        the new vertex positions.
+
+        :Parameters:
+            `shrink` : bool
+                If True, the buffers are reduced to the smallest power of two
+                that holds the vertex lists and indices.
+
+        '''
+        moved = self._compact_vertices(shrink)
+
+        index_lists = sorted(self._vertex_lists, key=lambda v: v.index_start)
+        end = 0
+        for vertex_list in index_lists:
+            if vertex_list.index_count == 0:
+                continue
+            if vertex_list.index_start != end:
+                self._move_region(self.index_buffer, self.index_element_size,
+                    vertex_list.index_start, end, vertex_list.index_count)
+                vertex_list.index_start = end
+            end += vertex_list.index_count
+
+        capacity = self.index_allocator.capacity
+        if shrink:
+            capacity = max(self._initial_index_count, _nearest_pow2(end))
+            if capacity < self.index_allocator.capacity:
+                self.index_buffer.resize(capacity * self.index_element_size)
+            else:
+                capacity = self.index_allocator.capacity
+
+        self.index_allocator = allocation.FreeListAllocator(capacity,
+            self.index_allocator.policy)
+        self.index_allocator.alloc(end)
+        self._version += 1
+
+        # Change indices (because vertices moved)
+        for vertex_list, old_start in moved:
+            diff = vertex_list.start - old_start
+            region = self.get_index_region(vertex_list.index_start,
+                                           vertex_list.index_count)
+            region.array[:] = [i + diff for i in region.array]
+            region.invalidate()
+
+    def get_fragmented_fraction(self):
+        '''Get the fraction of the domain's capacity lost to fragmentation.
+
+        The greater of the vertex and index buffer fractions is returned.
+        See `VertexDomain.get_fragmented_fraction`.
+
+        :rtype: float
+        '''
+        index_fraction = (self.index_allocator.get_fragmented_free_size() /
+                          float(self.index_allocator.capacity))
+        return max(super(IndexedVertexDomain, self).get_fragmented_fraction(),
+                   index_fraction)
+
+    def _get_draw_ranges(self):
+        '''Get the ranges of indices to draw for the entire domain.
+
+        As for `VertexDomain._get_draw_ranges`, except that ``starts`` gives
+        pointers into the index buffer (an array of ``c_void_p`` for
+        ``glMultiDrawElements`` if ``_draw_ranges_multi`` is set).
+        '''
+        allocator = self.index_allocator
+        ptr = self.index_buffer.ptr
+        key = self._draw_ranges_key
+        if (key is not None and key[0] is allocator and
+            key[1] == allocator.version and key[2] == ptr):
+            self.draw_cache_hits += 1
+            return self._draw_ranges
+
+        self.draw_cache_misses += 1
+        starts, sizes = allocator.get_allocated_regions()
+        primcount = len(starts)
+        element_size = self.index_element_size
+        starts = [ptr + start * element_size for start in starts]
+        self._draw_ranges_multi = primcount > 1 and gl_info.have_version(1, 4)
+        if self._draw_ranges_multi:
+            starts = (ctypes.c_void_p * primcount)(*starts)
+            sizes = (GLsizei * primcount)(*sizes)
+        else:
+            sizes = list(sizes)
+        self._draw_ranges = (primcount, starts, sizes)
+        self._draw_ranges_key = (allocator, allocator.version, ptr)
+        return self._draw_ranges
 
     def get_index_region(self, start, count):
         '''Get a region of the index buffer.
@@ -684,45 +942,46 @@ class IndexedVertexDomain(VertexDomain):
                 Vertex list to draw, or ``None`` for all lists in this domain.
 
         '''
-        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
-        for buffer, attributes in self.buffer_attributes:
-            buffer.bind()
-            for attribute in attributes:
-                attribute.enable()
-                attribute.set_pointer(attribute.buffer.ptr)
-        self.index_buffer.bind()
-        if vertexbuffer._workaround_vbo_finish:
-            glFinish()
-
+        self._set_client_state()
         if vertex_list is not None:
             glDrawElements(mode, vertex_list.index_count, self.index_gl_type,
                 self.index_buffer.ptr +
                     vertex_list.index_start * self.index_element_size)
         else:
-            starts, sizes = self.index_allocator.get_allocated_regions()
-            primcount = len(starts)
-            if primcount == 0:
-                pass
-            elif primcount == 1:
-                # Common case
-                glDrawElements(mode, sizes[0], self.index_gl_type,
-                    self.index_buffer.ptr + starts[0])
-            elif gl_info.have_version(1, 4):
-                starts = [s * self.index_element_size + self.index_buffer.ptr for s in starts]
-                starts = ctypes.cast((GLuint * primcount)(*starts), ctypes.POINTER(ctypes.c_void_p))
-                sizes = (GLsizei * primcount)(*sizes)
-                glMultiDrawElements(mode, sizes, GL_UNSIGNED_INT, starts,
-                                    primcount)
-            else:
-                for start, size in zip(starts, sizes):
-                    glDrawElements(mode, size, self.index_gl_type,
-                        self.index_buffer.ptr +
-                            start * self.index_element_size)
+            self._draw_all(mode)
+        self._unset_client_state()
+
+    def _set_client_state(self):
+        super(IndexedVertexDomain, self)._set_client_state()
+        self.index_buffer.bind()
+
+    def _switch_client_state(self):
+        super(IndexedVertexDomain, self)._switch_client_state()
+        self.index_buffer.bind()
 
+    def _unset_client_state(self):
         self.index_buffer.unbind()
-        for buffer, _ in self.buffer_attributes:
-            buffer.unbind()
-        glPopClientAttrib()
+        super(IndexedVertexDomain, self)._unset_client_state()
+
+    def _get_client_state_key(self):
+        key = super(IndexedVertexDomain, self)._get_client_state_key()
+        if key is None:
+            return None
+        return key[:2] + (self.index_buffer.__class__,)
+
+    def _draw_all(self, mode):
+        primcount, starts, sizes = self._get_draw_ranges()
+        if primcount == 0:
+            pass
+        elif primcount == 1:
+            # Common case
+            glDrawElements(mode, sizes[0], self.index_gl_type, starts[0])
+        elif self._draw_ranges_multi:
+            glMultiDrawElements(mode, sizes, self.index_gl_type, starts,
+                                primcount)
+        else:
+            for start, size in zip(starts, sizes):
+                glDrawElements(mode, size, self.index_gl_type, start)
 
 class IndexedVertexList(VertexList):
     '''A list of vertices within an `IndexedVertexDomain` that are indexed.
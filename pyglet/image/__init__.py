@@ -131,8 +131,8 @@ use of the data in this arbitrary format).
 __docformat__ = 'restructuredtext'
 __version__ = '$Id$'
 
+import mmap
 import sys
-import re
 import warnings
 import weakref
 
@@ -149,6 +149,11 @@ from pyglet.window import *
 from pyglet.image import atlas
 from pyglet.compat import asbytes, bytes_type
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class ImageException(Exception):
     pass
 
@@ -166,9 +171,10 @@ def load(filename, file=None, decoder=None):
         `file` : file-like object or None
             Source of image data in any supported format.        
         `decoder` : ImageDecoder or None
-            If unspecified, all decoders that are registered for the filename
-            extension are tried.  If none succeed, the exception from the
-            first decoder is raised.
+            If unspecified, the decoders that recognise the beginning of the
+            file are tried, starting with those registered for the filename
+            extension.  If none succeed, the exception from the first decoder
+            is raised.
 
     :rtype: AbstractImage
     '''
@@ -182,7 +188,8 @@ def load(filename, file=None, decoder=None):
         return decoder.decode(file, filename)
     else:
         first_exception = None
-        for decoder in codecs.get_decoders(filename):
+        header = codecs.get_file_header(file)
+        for decoder in codecs.get_decoders(filename, header):
             try:
                 image = decoder.decode(file, filename)
                 return image
@@ -193,6 +200,9 @@ def load(filename, file=None, decoder=None):
                 file.seek(0)
 
         if not first_exception:
+            if codecs.get_decoders():
+                raise codecs.ImageDecodeException(
+                    'Unrecognised image format: %r' % (filename or file))
             raise codecs.ImageDecodeException('No image decoders are available')
         raise first_exception 
 
@@ -582,9 +592,170 @@ class UniformTextureSequence(TextureSequence):
         raise NotImplementedError('abstract')
     item_height = property(_get_item_height)
 
+def _get_byte_length(data):
+    # Length in bytes of image data of any supported type.
+    if isinstance(data, Array):
+        return sizeof(data)
+    nbytes = getattr(data, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes
+    return len(data) * getattr(data, 'itemsize', 1)
+
+def _as_bytes(data):
+    # Copy image data of any supported type into a byte string.
+    if isinstance(data, bytes_type):
+        return data
+    elif isinstance(data, Array):
+        return string_at(addressof(data), sizeof(data))
+    elif isinstance(data, mmap.mmap):
+        return data[:]
+    elif hasattr(data, 'tobytes'):
+        return data.tobytes()
+    elif hasattr(data, 'tostring'):
+        return data.tostring()
+    return bytes_type(data)
+
+def _get_byte_view(data):
+    # Return image data in a form that can be sliced by byte offsets, without
+    # copying it if possible.
+    if isinstance(data, bytes_type):
+        return data
+    if numpy is not None:
+        try:
+            return numpy.frombuffer(data, numpy.uint8)
+        except (TypeError, ValueError, AttributeError):
+            pass
+    return _as_bytes(data)
+
+def _get_pointer(data):
+    # Return image data in a form that can be passed to a GL function
+    # expecting a pointer, without copying it if possible.  The caller must
+    # keep a reference to data while the pointer is in use.
+    if isinstance(data, (bytes_type, Array)):
+        return data
+    if numpy is not None and isinstance(data, numpy.ndarray):
+        if data.flags.c_contiguous:
+            return data.ctypes.data_as(c_void_p)
+        return _as_bytes(numpy.ascontiguousarray(data))
+    try:
+        return (c_ubyte * _get_byte_length(data)).from_buffer(data)
+    except (TypeError, ValueError):
+        # Read-only buffer
+        return _as_bytes(data)
+
+def _crop_data(data, pitch, components, x, y, width, height):
+    # Return the rows of a region of image data as a byte string, bottom row
+    # first and tightly packed.
+    row = abs(pitch)
+    view = _get_byte_view(data)
+    x1 = x * components
+    x2 = (x + width) * components
+    if pitch > 0:
+        starts = range(y * row, (y + height) * row, row)
+    else:
+        rows = _get_byte_length(view) // row
+        if _get_byte_length(view) % row >= x2:
+            rows += 1
+        starts = range((rows - y - 1) * row, (rows - y - height - 1) * row,
+                       -row)
+    return asbytes('').join([_as_bytes(view[i + x1:i + x2]) for i in starts])
+
+def _convert_data(data, width, current_format, current_pitch, format, pitch):
+    # Convert a string of pixel data between formats and pitches.  Components
+    # of the new format that are missing from the current format are copied
+    # from its first component.  Rows are padded with zero bytes.
+    current_components = len(current_format)
+    components = len(format)
+    swizzle = format != current_format
+    if swizzle and current_components > 4:
+        raise ImageException('Current image format is wider than 32 bits.')
+    indices = []
+    for c in format:
+        try:
+            indices.append(current_format.index(c))
+        except ValueError:
+            indices.append(0)
+
+    current_row = abs(current_pitch)
+    current_packed = width * current_components
+    row = abs(pitch)
+    packed = width * components
+    flip = current_pitch * pitch < 0
+
+    # Include a final row that is not padded to the full pitch.
+    length = _get_byte_length(data)
+    rows = length // current_row
+    if length % current_row >= current_packed:
+        rows += 1
+
+    if swizzle and numpy is not None:
+        # Faster than strided copies for large images; reordering rows alone
+        # is faster without NumPy.
+        return _convert_data_numpy(data, rows, width, current_components,
+                                   current_row, indices, swizzle, row, flip)
+
+    data = _as_bytes(data)
+
+    # Crop the padding from each row, reversing the row order if needed.
+    if swizzle:
+        row_size = current_packed
+    else:
+        row_size = min(current_row, row)
+        packed = row_size
+    if current_row != row_size or flip:
+        starts = range(0, rows * current_row, current_row)
+        if flip:
+            starts.reverse()
+        data = asbytes('').join([data[i:i + row_size] for i in starts])
+
+    # Reorder the components of all pixels with one strided copy per
+    # component.
+    if swizzle:
+        converted = bytearray(packed * rows)
+        for i, index in enumerate(indices):
+            converted[i::components] = data[index::current_components]
+        data = bytes_type(converted)
+
+    # Pad each row out to the new pitch.
+    if row != packed:
+        pad = asbytes('\0') * (row - packed)
+        data = pad.join([data[i:i + packed]
+                         for i in range(0, rows * packed, packed)]) + pad
+    return data
+
+def _convert_data_numpy(data, rows, width, current_components, current_row,
+                        indices, swizzle, row, flip):
+    pixels = _get_byte_view(data)
+    if not isinstance(pixels, numpy.ndarray):
+        pixels = numpy.frombuffer(pixels, numpy.uint8)
+    if len(pixels) < rows * current_row:
+        padded = numpy.zeros(rows * current_row, numpy.uint8)
+        padded[:len(pixels)] = pixels
+        pixels = padded
+    pixels = pixels[:rows * current_row].reshape(rows, current_row)
+    if flip:
+        pixels = pixels[::-1]
+    if swizzle:
+        pixels = pixels[:, :width * current_components]
+        pixels = pixels.reshape(rows, width, current_components)[:, :, indices]
+        pixels = pixels.reshape(rows, width * len(indices))
+
+    if pixels.shape[1] == row:
+        return pixels.tostring()
+    converted = numpy.zeros((rows, row), numpy.uint8)
+    size = min(row, pixels.shape[1])
+    converted[:, :size] = pixels[:, :size]
+    return converted.tostring()
+
 class ImageData(AbstractImage):
     '''An image represented as a string of unsigned bytes.
 
+    The data can also be given as any object supporting the buffer
+    interface, such as a ``bytearray``, ``array.array``, ``mmap`` or NumPy
+    array, or as a ctypes array.  When the format and pitch of the data can
+    be used by OpenGL directly, it is uploaded to textures without being
+    copied.
+
     :Ivariables:
         `data` : str
             Pixel data, encoded according to `format` and `pitch`.
@@ -599,11 +770,6 @@ class ImageData(AbstractImage):
     `format` and `pitch` to obtain the current encoding is not deprecated).
     '''
 
-    _swap1_pattern = re.compile(asbytes('(.)'), re.DOTALL)
-    _swap2_pattern = re.compile(asbytes('(.)(.)'), re.DOTALL)
-    _swap3_pattern = re.compile(asbytes('(.)(.)(.)'), re.DOTALL)
-    _swap4_pattern = re.compile(asbytes('(.)(.)(.)(.)'), re.DOTALL)
-
     _current_texture = None
     _current_mipmap_texture = None
 
@@ -618,7 +784,8 @@ class ImageData(AbstractImage):
             `format` : str
                 A valid format string, such as 'RGB', 'RGBA', 'ARGB', etc.
             `data` : sequence
-                String or array/list of bytes giving the decoded data.
+                String, ctypes array or buffer object giving the decoded
+                data.  Buffer objects are not copied.
             `pitch` : int or None
                 If specified, the number of bytes per row.  Negative values
                 indicate a top-to-bottom arrangement.  Defaults to 
@@ -700,7 +867,10 @@ class ImageData(AbstractImage):
         :rtype: sequence of bytes, or str
         '''
         if format == self._current_format and pitch == self._current_pitch:
-            return self._current_data
+            data = self._current_data
+            if not isinstance(data, (bytes_type, Array)):
+                data = _as_bytes(data)
+            return data
         return self._convert(format, pitch)
 
     def set_data(self, format, pitch, data):
@@ -713,7 +883,8 @@ class ImageData(AbstractImage):
                 Number of bytes per row.  Negative values indicate a
                 top-to-bottom arrangement.
             `data` : str or sequence of bytes
-                Image data.
+                Image data.  This can be a ctypes array or any object
+                supporting the buffer interface, which is not copied.
 
         :since: pyglet 1.1
         '''
@@ -934,6 +1105,7 @@ class ImageData(AbstractImage):
         # already in, unless that's an obscure format, upside-down or the
         # driver is old).
         data = self._convert(data_format, data_pitch)
+        pixels = _get_pointer(data)
 
         if data_pitch & 0x1:
             alignment = 1
@@ -953,20 +1125,20 @@ class ImageData(AbstractImage):
                             x, y, z,
                             self.width, self.height, 1,
                             format, type,
-                            data)
+                            pixels)
         elif internalformat:
             glTexImage2D(target, level,
                          internalformat,
                          self.width, self.height,
                          0,
                          format, type,
-                         data)
+                         pixels)
         else:
             glTexSubImage2D(target, level,
                             x, y,
                             self.width, self.height,
                             format, type,
-                            data)
+                            pixels)
         glPopClientAttrib()
 
         if matrix:
@@ -988,75 +1160,13 @@ class ImageData(AbstractImage):
                 return asbytes(self._current_data)
             return self._current_data
 
-        self._ensure_string_data()
-        data = self._current_data
-        current_pitch = self._current_pitch
-        current_format = self._current_format
-        sign_pitch = current_pitch // abs(current_pitch)
-        if format != self._current_format:
-            # Create replacement string, e.g. r'\4\1\2\3' to convert RGBA to
-            # ARGB
-            repl = asbytes('')
-            for c in format:
-                try:
-                    idx = current_format.index(c) + 1
-                except ValueError:
-                    idx = 1
-                repl += asbytes(r'\%d' % idx)
-
-            if len(current_format) == 1:
-                swap_pattern = self._swap1_pattern
-            elif len(current_format) == 2:
-                swap_pattern = self._swap2_pattern
-            elif len(current_format) == 3:
-                swap_pattern = self._swap3_pattern
-            elif len(current_format) == 4:
-                swap_pattern = self._swap4_pattern
-            else:
-                raise ImageException(
-                    'Current image format is wider than 32 bits.')
-
-            packed_pitch = self.width * len(current_format)
-            if abs(self._current_pitch) != packed_pitch:
-                # Pitch is wider than pixel data, need to go row-by-row.
-                rows = re.findall(
-                    asbytes('.') * abs(self._current_pitch), data, re.DOTALL)
-                rows = [swap_pattern.sub(repl, r[:packed_pitch]) for r in rows]
-                data = asbytes('').join(rows)
-            else:
-                # Rows are tightly packed, apply regex over whole image.
-                data = swap_pattern.sub(repl, data)
-
-            # After conversion, rows will always be tightly packed
-            current_pitch = sign_pitch * (len(format) * self.width)
-
-        if pitch != current_pitch:
-            diff = abs(current_pitch) - abs(pitch)
-            if diff > 0:
-                # New pitch is shorter than old pitch, chop bytes off each row
-                pattern = re.compile(
-                    asbytes('(%s)%s' % ('.' * abs(pitch), '.' * diff)), re.DOTALL)
-                data = pattern.sub(asbytes(r'\1'), data)    
-            elif diff < 0:
-                # New pitch is longer than old pitch, add '0' bytes to each row
-                pattern = re.compile(
-                    asbytes('(%s)' % ('.' * abs(current_pitch))), re.DOTALL)
-                pad = '.' * -diff
-                data = pattern.sub(asbytes(r'\1%s' % pad), data)
-
-            if current_pitch * pitch < 0:
-                # Pitch differs in sign, swap row order
-                rows = re.findall(asbytes('.') * abs(pitch), data, re.DOTALL)
-                rows.reverse()
-                data = asbytes('').join(rows)
-
-        return asbytes(data)
+        return _convert_data(self._current_data, self.width,
+                             self._current_format, self._current_pitch,
+                             format, pitch)
 
     def _ensure_string_data(self):
         if type(self._current_data) is not bytes_type:
-            buf = create_string_buffer(len(self._current_data))
-            memmove(buf, self._current_data, len(self._current_data))
-            self._current_data = buf.raw
+            self._current_data = _as_bytes(self._current_data)
 
     def _get_gl_format_and_type(self, format):
         if format == 'I':
@@ -1131,21 +1241,20 @@ class ImageDataRegion(ImageData):
             'y': self.y
         }
 
-    def _get_data(self):
-        # Crop the data first
-        x1 = len(self._current_format) * self.x
-        x2 = len(self._current_format) * (self.x + self.width)
-
-        self._ensure_string_data()
-        data = self._convert(self._current_format, abs(self._current_pitch))
-        rows = re.findall('.' * abs(self._current_pitch), data, re.DOTALL)
-        rows = [row[x1:x2] for row in rows[self.y:self.y+self.height]]
-        self._current_data = ''.join(rows)
-        self._current_pitch = self.width * len(self._current_format)
-        self._current_texture = None
-        self.x = 0
-        self.y = 0
+    def _crop(self):
+        # Replace the data of the whole image with a copy of just the region.
+        if self.x or self.y or self._current_pitch < 0 or \
+           self._current_pitch != self.width * len(self._current_format):
+            self._current_data = _crop_data(self._current_data,
+                self._current_pitch, len(self._current_format),
+                self.x, self.y, self.width, self.height)
+            self._current_pitch = self.width * len(self._current_format)
+            self._current_texture = None
+            self.x = 0
+            self.y = 0
 
+    def _get_data(self):
+        self._crop()
         return super(ImageDataRegion, self)._get_data()
 
     def _set_data(self, data):
@@ -1156,20 +1265,7 @@ class ImageDataRegion(ImageData):
     data = property(_get_data, _set_data)
 
     def get_data(self, format, pitch):
-        x1 = len(self._current_format) * self.x
-        x2 = len(self._current_format) * (self.x + self.width)
-
-        self._ensure_string_data()
-        data = self._convert(self._current_format, abs(self._current_pitch))
-        rows = re.findall(asbytes('.') * abs(self._current_pitch), data,
-                          re.DOTALL)
-        rows = [row[x1:x2] for row in rows[self.y:self.y+self.height]]
-        self._current_data = asbytes('').join(rows)
-        self._current_pitch = self.width * len(self._current_format)
-        self._current_texture = None
-        self.x = 0
-        self.y = 0
-
+        self._crop()
         return super(ImageDataRegion, self).get_data(format, pitch) 
     
     def _apply_region_unpack(self):
@@ -1190,7 +1286,7 @@ class CompressedImageData(AbstractImage):
     '''
 
     _current_texture = None
-    _current_mipmapped_texture = None
+    _current_mipmap_texture = None
 
     def __init__(self, width, height, gl_format, data, 
                  extension=None, decoder=None):
@@ -1205,7 +1301,8 @@ class CompressedImageData(AbstractImage):
                 GL constant giving format of compressed data; for example,
                 ``GL_COMPRESSED_RGBA_S3TC_DXT5_EXT``.
             `data` : sequence
-                String or array/list of bytes giving compressed image data.
+                String, ctypes array or buffer object giving compressed
+                image data.
             `extension` : str or None
                 If specified, gives the name of a GL extension to check for
                 before creating a texture.
@@ -1281,9 +1378,9 @@ class CompressedImageData(AbstractImage):
             glCompressedTexImage2DARB(texture.target, texture.level,
                 self.gl_format,
                 self.width, self.height, 0,
-                len(self.data), self.data)
+                _get_byte_length(self.data), _get_pointer(self.data))
         else:
-            image = self.decoder(self.data, self.width, self.height)
+            image = self.decoder(_as_bytes(self.data), self.width, self.height)
             texture = image.get_texture()
             assert texture.width == self.width
             assert texture.height == self.height
@@ -1321,7 +1418,7 @@ class CompressedImageData(AbstractImage):
         glCompressedTexImage2DARB(texture.target, texture.level,
             self.gl_format,
             self.width, self.height, 0,
-            len(self.data), self.data) 
+            _get_byte_length(self.data), _get_pointer(self.data))
 
         width, height = self.width, self.height
         level = 0
@@ -1332,7 +1429,7 @@ class CompressedImageData(AbstractImage):
             glCompressedTexImage2DARB(texture.target, level,
                 self.gl_format,
                 width, height, 0,
-                len(data), data)
+                _get_byte_length(data), _get_pointer(data))
 
         glFlush()
 
@@ -1347,13 +1444,13 @@ class CompressedImageData(AbstractImage):
                 x - self.anchor_x, y - self.anchor_y, z,
                 self.width, self.height, 1,
                 self.gl_format,
-                len(self.data), self.data)
+                _get_byte_length(self.data), _get_pointer(self.data))
         else:
             glCompressedTexSubImage2DARB(target, level, 
                 x - self.anchor_x, y - self.anchor_y,
                 self.width, self.height,
                 self.gl_format,
-                len(self.data), self.data)
+                _get_byte_length(self.data), _get_pointer(self.data))
         
 def _nearest_pow2(v):
     # From http://graphics.stanford.edu/~seander/bithacks.html#RoundUpPowerOf2
@@ -2397,9 +2494,10 @@ def load_animation(filename, file=None, decoder=None):
         `file` : file-like object or None
             File object containing the animation stream.
         `decoder` : ImageDecoder or None
-            If unspecified, all decoders that are registered for the filename
-            extension are tried.  If none succeed, the exception from the
-            first decoder is raised.
+            If unspecified, the decoders that recognise the beginning of the
+            file are tried, starting with those registered for the filename
+            extension.  If none succeed, the exception from the first decoder
+            is raised.
 
     :rtype: Animation
     '''
@@ -2409,10 +2507,11 @@ def load_animation(filename, file=None, decoder=None):
         file = StringIO(file.read())
 
     if decoder:
-        return decoder.decode(file, filename)
+        return decoder.decode_animation(file, filename)
     else:
         first_exception = None
-        for decoder in codecs.get_animation_decoders(filename):
+        header = codecs.get_file_header(file)
+        for decoder in codecs.get_animation_decoders(filename, header):
             try:
                 image = decoder.decode_animation(file, filename)
                 return image
@@ -2421,6 +2520,9 @@ def load_animation(filename, file=None, decoder=None):
                 file.seek(0)
 
         if not first_exception:
+            if codecs.get_animation_decoders():
+                raise codecs.ImageDecodeException(
+                    'Unrecognised animation format: %r' % (filename or file))
             raise codecs.ImageDecodeException('No image decoders are available')
         raise first_exception  
 
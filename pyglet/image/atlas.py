@@ -49,18 +49,47 @@ Example usage::
     car_texture = bin.add(car_image)
     boat_texture = bin.add(boat_image)
 
+A set of images known in advance packs more tightly when added at once::
+
+    car_texture, boat_texture = bin.add_many([car_image, boat_image])
+
+The packing algorithm is chosen with the ``allocator_class`` argument of
+`TextureAtlas` and `TextureBin`.  `Allocator`, the default, is fast and
+packs well when images are added in decreasing height order;
+`SkylineAllocator` and `MaxRectsAllocator` pack images of mixed sizes added
+in any order more tightly.
+
 The result of `TextureBin.add` is a `TextureRegion` containing the image.
-Once added, an image cannot be removed from a bin (or an atlas); nor can a
-list of images be obtained from a given bin or atlas -- it is the
+A list of images cannot be obtained from a given bin or atlas -- it is the
 application's responsibility to keep track of the regions returned by the
 ``add`` methods.
 
+Regions no longer needed are given back with `TextureBin.remove` (or
+`TextureAtlas.remove`).  `MaxRectsAllocator` reuses the space of removed
+regions straight away; the other allocators only reclaim it when the atlas
+is defragmented.  `TextureBin.defragment` packs the regions still in use
+(removed regions and regions that have been garbage collected are left
+out) together, moving them out of the least used atlases into the others
+where they fit, and discards atlases with no regions left, so a
+long-running application can keep the number of textures bounded by
+defragmenting periodically::
+
+    bin = TextureBin(allocator_class=MaxRectsAllocator)
+    pyglet.clock.schedule_interval(lambda dt: bin.defragment(), 10)
+
+Defragmenting updates the texture, position and texture coordinates of the
+moved regions; anything holding a copy of their texture coordinates, such as a
+`pyglet.sprite.Sprite`, must be given the region again (for example, by
+setting the sprite's ``image``).
+
 :since: pyglet 1.1
 '''
 
 __docformat__ = 'restructuredtext'
 __version__ = '$Id: $'
 
+import weakref
+
 import pyglet
 
 class AllocatorException(Exception):
@@ -145,6 +174,27 @@ class Allocator(object):
         raise AllocatorException('No more space in %r for box %dx%d' % (
                 self, width, height))
 
+    def dealloc(self, x, y, width, height):
+        '''Give back an area previously returned by `alloc`.
+
+        The area is not reused until the atlas using the allocator is
+        defragmented.
+
+        :Parameters:
+            `x` : int
+                X coordinate of the bottom-left corner of the area.
+            `y` : int
+                Y coordinate of the bottom-left corner of the area.
+            `width` : int
+                Width of the area.
+            `height` : int
+                Height of the area.
+
+        :since: pyglet 1.2
+        '''
+        assert self.used_area >= width * height
+        self.used_area -= width * height
+
     def get_usage(self):
         '''Get the fraction of area already allocated.
 
@@ -168,10 +218,359 @@ class Allocator(object):
         possible_area = self.strips[-1].y2 * self.width
         return 1.0 - self.used_area / float(possible_area)
 
+class _Segment(object):
+    def __init__(self, x, y, width):
+        self.x = x
+        self.y = y
+        self.width = width
+
+class SkylineAllocator(object):
+    '''Rectangular area allocation algorithm using a skyline.
+
+    The allocator keeps the height of the allocated area at each position
+    along its width (the skyline), and places each rectangle at the lowest
+    position along the skyline where it fits, preferring the position
+    leaving the least space beneath it.  It packs rectangles of varying
+    height well in any order, and is a little slower than `Allocator`.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, width, height):
+        '''Create a `SkylineAllocator` of the given size.
+
+        :Parameters:
+            `width` : int
+                Width of the allocation region.
+            `height` : int
+                Height of the allocation region.
+
+        '''
+        assert width > 0 and height > 0
+        self.width = width
+        self.height = height
+        self.skyline = [_Segment(0, 0, width)]
+        self.used_area = 0
+
+    def _fit(self, index, width, height):
+        # Return the y coordinate and the area left beneath a rectangle
+        # placed at the start of a segment, or None if it does not fit.
+        x = self.skyline[index].x
+        if x + width > self.width:
+            return None
+        segments = []
+        remaining = width
+        y = 0
+        for segment in self.skyline[index:]:
+            y = max(y, segment.y)
+            segments.append(segment)
+            remaining -= segment.width
+            if remaining <= 0:
+                break
+        if y + height > self.height:
+            return None
+        waste = 0
+        remaining = width
+        for segment in segments:
+            waste += (y - segment.y) * min(segment.width, remaining)
+            remaining -= segment.width
+        return y, waste
+
+    def alloc(self, width, height):
+        '''Get a free area in the allocator of the given size.
+
+        After calling `alloc`, the requested area will no longer be used.
+        If there is not enough room to fit the given area `AllocatorException`
+        is raised.
+
+        :Parameters:
+            `width` : int
+                Width of the area to allocate.
+            `height` : int
+                Height of the area to allocate.
+
+        :rtype: int, int
+        :return: The X and Y coordinates of the bottom-left corner of the
+            allocated region.
+        '''
+        assert width > 0 and height > 0
+        best = None
+        for i in range(len(self.skyline)):
+            fit = self._fit(i, width, height)
+            if fit is None:
+                continue
+            y, waste = fit
+            key = (y + height, waste)
+            if best is None or key < best[0]:
+                best = key, i, y
+        if best is None:
+            raise AllocatorException('No more space in %r for box %dx%d' % (
+                    self, width, height))
+
+        key, index, y = best
+        x = self.skyline[index].x
+        self.skyline.insert(index, _Segment(x, y + height, width))
+
+        # Shorten or remove the segments now beneath the new segment.
+        right = x + width
+        i = index + 1
+        while i < len(self.skyline):
+            segment = self.skyline[i]
+            if segment.x >= right:
+                break
+            if segment.x + segment.width <= right:
+                del self.skyline[i]
+            else:
+                segment.width -= right - segment.x
+                segment.x = right
+                break
+
+        # Merge neighbouring segments of the same height.
+        i = max(index - 1, 0)
+        while i < len(self.skyline) - 1:
+            segment = self.skyline[i]
+            following = self.skyline[i + 1]
+            if segment.y == following.y:
+                segment.width += following.width
+                del self.skyline[i + 1]
+            else:
+                i += 1
+
+        self.used_area += width * height
+        return x, y
+
+    def dealloc(self, x, y, width, height):
+        '''Give back an area previously returned by `alloc`.
+
+        The area is not reused until the atlas using the allocator is
+        defragmented.
+
+        :Parameters:
+            `x` : int
+                X coordinate of the bottom-left corner of the area.
+            `y` : int
+                Y coordinate of the bottom-left corner of the area.
+            `width` : int
+                Width of the area.
+            `height` : int
+                Height of the area.
+
+        :since: pyglet 1.2
+        '''
+        assert self.used_area >= width * height
+        self.used_area -= width * height
+
+    def get_usage(self):
+        '''Get the fraction of area already allocated.
+
+        This method is useful for debugging and profiling only.
+
+        :rtype: float
+        '''
+        return self.used_area / float(self.width * self.height)
+
+    def get_fragmentation(self):
+        '''Get the fraction of area beneath the skyline that is not
+        allocated, and so cannot be used.
+
+        This method is useful for debugging and profiling only.
+
+        :rtype: float
+        '''
+        possible_area = sum([segment.y * segment.width
+                             for segment in self.skyline])
+        if not possible_area:
+            return 0.
+        return 1.0 - self.used_area / float(possible_area)
+
+class MaxRectsAllocator(object):
+    '''Rectangular area allocation algorithm tracking the free area as a
+    list of maximal free rectangles.
+
+    Each rectangle is placed in the free rectangle it fits most tightly
+    (best short side fit).  It packs more tightly than `Allocator` and
+    `SkylineAllocator`, particularly for rectangles of mixed sizes added in
+    any order, but allocation time grows with the number of free
+    rectangles.
+
+    Areas given back with `dealloc` are reused by later allocations.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, width, height):
+        '''Create a `MaxRectsAllocator` of the given size.
+
+        :Parameters:
+            `width` : int
+                Width of the allocation region.
+            `height` : int
+                Height of the allocation region.
+
+        '''
+        assert width > 0 and height > 0
+        self.width = width
+        self.height = height
+        #: List of (x, y, width, height) tuples of maximal free rectangles.
+        self.free_rects = [(0, 0, width, height)]
+        #: Set of (x, y, width, height) tuples of allocated rectangles.
+        self.allocated_rects = set()
+        self.used_area = 0
+
+        # True if areas have been deallocated since the free rectangles were
+        # last made maximal.
+        self._dirty = False
+
+    def alloc(self, width, height):
+        '''Get a free area in the allocator of the given size.
+
+        After calling `alloc`, the requested area will no longer be used.
+        If there is not enough room to fit the given area `AllocatorException`
+        is raised.
+
+        :Parameters:
+            `width` : int
+                Width of the area to allocate.
+            `height` : int
+                Height of the area to allocate.
+
+        :rtype: int, int
+        :return: The X and Y coordinates of the bottom-left corner of the
+            allocated region.
+        '''
+        assert width > 0 and height > 0
+        best = self._find(width, height)
+        if best is None and self._dirty:
+            # Deallocated areas may join up with their neighbours into a
+            # rectangle large enough.
+            self._rebuild()
+            best = self._find(width, height)
+        if best is None:
+            raise AllocatorException('No more space in %r for box %dx%d' % (
+                    self, width, height))
+
+        x, y = best[3], best[2]
+        self._split(x, y, width, height)
+        self.allocated_rects.add((x, y, width, height))
+        self.used_area += width * height
+        return x, y
+
+    def dealloc(self, x, y, width, height):
+        '''Give back an area previously returned by `alloc`, so that it
+        can be allocated again.
+
+        :Parameters:
+            `x` : int
+                X coordinate of the bottom-left corner of the area.
+            `y` : int
+                Y coordinate of the bottom-left corner of the area.
+            `width` : int
+                Width of the area.
+            `height` : int
+                Height of the area.
+
+        '''
+        rect = (x, y, width, height)
+        if rect not in self.allocated_rects:
+            raise AllocatorException('Box %dx%d at %d, %d is not allocated '
+                                     'in %r' % (width, height, x, y, self))
+        self.allocated_rects.remove(rect)
+        self.used_area -= width * height
+
+        # The area is free to be allocated as it is; it is only merged with
+        # the free area around it when an allocation does not fit.
+        self.free_rects.append(rect)
+        self._dirty = True
+
+    def _find(self, width, height):
+        # Return the sort key of the best free rectangle for the given size,
+        # or None if it does not fit.
+        best = None
+        for free_x, free_y, free_width, free_height in self.free_rects:
+            if free_width < width or free_height < height:
+                continue
+            leftover_x = free_width - width
+            leftover_y = free_height - height
+            key = (min(leftover_x, leftover_y), max(leftover_x, leftover_y),
+                   free_y, free_x)
+            if best is None or key < best:
+                best = key
+        return best
+
+    def _rebuild(self):
+        # Recompute the maximal free rectangles from the allocated ones.
+        self.free_rects = [(0, 0, self.width, self.height)]
+        for rect in self.allocated_rects:
+            self._split(*rect)
+        self._dirty = False
+
+    def _split(self, x, y, width, height):
+        # Replace the free rectangles overlapping the allocated rectangle
+        # with the maximal rectangles of their remaining area.
+        right = x + width
+        top = y + height
+        free_rects = []
+        for rect in self.free_rects:
+            free_x, free_y, free_width, free_height = rect
+            free_right = free_x + free_width
+            free_top = free_y + free_height
+            if (free_x >= right or free_right <= x or
+                free_y >= top or free_top <= y):
+                free_rects.append(rect)
+                continue
+            if free_x < x:
+                free_rects.append((free_x, free_y, x - free_x, free_height))
+            if free_right > right:
+                free_rects.append((right, free_y, free_right - right,
+                                   free_height))
+            if free_y < y:
+                free_rects.append((free_x, free_y, free_width, y - free_y))
+            if free_top > top:
+                free_rects.append((free_x, top, free_width, free_top - top))
+        self.free_rects = self._prune(free_rects)
+
+    def _prune(self, free_rects):
+        # Remove free rectangles contained in another free rectangle.
+        free_rects = list(set(free_rects))
+        free_rects.sort(key=lambda rect: rect[2] * rect[3], reverse=True)
+        result = []
+        for rect in free_rects:
+            x, y, width, height = rect
+            for other_x, other_y, other_width, other_height in result:
+                if (other_x <= x and other_y <= y and
+                    x + width <= other_x + other_width and
+                    y + height <= other_y + other_height):
+                    break
+            else:
+                result.append(rect)
+        return result
+
+    def get_usage(self):
+        '''Get the fraction of area already allocated.
+
+        This method is useful for debugging and profiling only.
+
+        :rtype: float
+        '''
+        return self.used_area / float(self.width * self.height)
+
+    def get_fragmentation(self):
+        '''Get the fraction of the free area outside the largest free
+        rectangle, which can only hold smaller images.
+
+        This method is useful for debugging and profiling only.
+
+        :rtype: float
+        '''
+        free_area = self.width * self.height - self.used_area
+        if not free_area or not self.free_rects:
+            return 0.
+        largest = max([width * height
+                       for x, y, width, height in self.free_rects])
+        return 1.0 - largest / float(free_area)
+
 class TextureAtlas(object):
     '''Collection of images within a texture.
     '''
-    def __init__(self, width=256, height=256):
+    def __init__(self, width=256, height=256, allocator_class=Allocator):
         '''Create a texture atlas of the given size.
 
         :Parameters:
@@ -179,11 +578,22 @@ class TextureAtlas(object):
                 Width of the underlying texture.
             `height` : int
                 Height of the underlying texture.
+            `allocator_class` : class
+                Allocation algorithm to pack images with; `Allocator`,
+                `SkylineAllocator` or `MaxRectsAllocator`.  Since pyglet
+                1.2.
 
         '''
         self.texture = pyglet.image.Texture.create(
             width, height, pyglet.gl.GL_RGBA, rectangle=True)
-        self.allocator = Allocator(width, height)
+        self.allocator = allocator_class(width, height)
+
+        # Regions added and not removed; regions that are garbage collected
+        # drop out, and their area is reclaimed by `defragment`.
+        self._regions = weakref.WeakKeyDictionary()
+
+        # Area of the regions added since the atlas was last laid out.
+        self._added_area = 0
 
     def add(self, img):
         '''Add an image to the atlas.
@@ -206,15 +616,118 @@ class TextureAtlas(object):
         x, y = self.allocator.alloc(img.width, img.height)
         self.texture.blit_into(img, x, y, 0)
         region = self.texture.get_region(x, y, img.width, img.height)
+        self._regions[region] = True
+        self._added_area += img.width * img.height
         return region
 
+    def remove(self, region):
+        '''Remove a region returned by `add` from the atlas.
+
+        The area of the region is given back to the allocator; the region
+        must no longer be used.  `ValueError` is raised if the region is not
+        in the atlas.
+
+        :Parameters:
+            `region` : `TextureRegion`
+                The region to remove.
+
+        :since: pyglet 1.2
+        '''
+        if region not in self._regions:
+            raise ValueError('%r is not in %r' % (region, self))
+        del self._regions[region]
+        self.allocator.dealloc(region.x, region.y,
+                               region.width, region.height)
+
+    def get_region_count(self):
+        '''Get the number of regions in the atlas that are still in use.
+
+        :rtype: int
+        :since: pyglet 1.2
+        '''
+        return len(self._regions)
+
+    def get_region_area(self):
+        '''Get the total area of the regions in the atlas that are still in
+        use.
+
+        :rtype: int
+        :since: pyglet 1.2
+        '''
+        return sum([region.width * region.height
+                    for region in self._regions.keys()])
+
+    def defragment(self):
+        '''Pack the regions still in use together within the texture.
+
+        The regions are allocated again in decreasing order of height with a
+        new allocator, and the texture data of each region that moves is
+        copied to its new position.  The position and texture coordinates
+        of the moved regions are updated; the texture itself is kept.  The
+        atlas is left unchanged if no region has been removed or garbage
+        collected since it was last laid out.
+
+        `AllocatorException` is raised, and the atlas is left unchanged, if
+        the regions do not fit when allocated again.
+
+        :since: pyglet 1.2
+        '''
+        area = self.get_region_area()
+        if area == self._added_area:
+            return
+
+        regions = self._regions.keys()
+
+        regions.sort(key=lambda region: (-region.height, -region.width))
+        allocator = self.allocator.__class__(self.allocator.width,
+                                             self.allocator.height)
+        positions = [allocator.alloc(region.width, region.height)
+                     for region in regions]
+
+        data = None
+        for region, (x, y) in zip(regions, positions):
+            if (x, y) == (region.x, region.y):
+                continue
+            if data is None:
+                # Copy the texture before any region is overwritten.
+                data = self.texture.get_image_data()
+            self.texture.blit_into(data.get_region(region.x, region.y,
+                region.width, region.height), x, y, 0)
+            self._place(region, x, y)
+
+        self.allocator = allocator
+        self._added_area = area
+
+    def _take(self, region, atlas, data):
+        # Move a region of another atlas into this one, given the image data
+        # of the other atlas's texture.  Raises AllocatorException if there
+        # is no room.
+        x, y = self.allocator.alloc(region.width, region.height)
+        self.texture.blit_into(data.get_region(region.x, region.y,
+            region.width, region.height), x, y, 0)
+        atlas.remove(region)
+        self._place(region, x, y)
+        self._regions[region] = True
+        self._added_area += region.width * region.height
+
+    def _place(self, region, x, y):
+        # Point a region at a new position in this atlas's texture.
+        moved = self.texture.get_region(x, y, region.width, region.height)
+        region.x = x
+        region.y = y
+        region.owner = self.texture
+        region.id = self.texture.id
+        region.target = self.texture.target
+        region.tex_coords = moved.tex_coords
+
 class TextureBin(object):
     '''Collection of texture atlases.
 
     `TextureBin` maintains a collection of texture atlases, and creates new
     ones as necessary to accommodate images added to the bin.
     '''
-    def __init__(self, texture_width=256, texture_height=256):
+    def __init__(self, texture_width=256, texture_height=256,
+                 allocator_class=Allocator):
         '''Create a texture bin for holding atlases of the given size.
 
         :Parameters:
@@ -222,11 +735,24 @@ class TextureBin(object):
                 Width of texture atlases to create.
             `texture_height` : int
                 Height of texture atlases to create.
+            `allocator_class` : class
+                Allocation algorithm used by the atlases; `Allocator`,
+                `SkylineAllocator` or `MaxRectsAllocator`.  Since pyglet
+                1.2.
 
         '''
         self.atlases = []
         self.texture_width = texture_width
         self.texture_height = texture_height
+        self.allocator_class = allocator_class
+
+        # Atlas of each region added, including atlases no longer in
+        # `atlases`.  An atlas is kept alive as long as any of its regions.
+        self._region_atlases = weakref.WeakKeyDictionary()
+
+        # Weak references to every atlas created by the bin, including full
+        # ones no longer in `atlases`.
+        self._atlas_refs = []
 
     def add(self, img):
         '''Add an image into this texture bin.
@@ -246,7 +772,9 @@ class TextureBin(object):
         '''
         for atlas in list(self.atlases):
             try:
-                return atlas.add(img)
+                region = atlas.add(img)
+                self._region_atlases[region] = atlas
+                return region
             except AllocatorException:
                 # Remove atlases that are no longer useful (this is so their
                 # textures can later be freed if the images inside them get
@@ -254,6 +782,145 @@ class TextureBin(object):
                 if img.width < 64 and img.height < 64:
                     self.atlases.remove(atlas)
 
-        atlas = TextureAtlas(self.texture_width, self.texture_height)
+        atlas = TextureAtlas(self.texture_width, self.texture_height,
+                             self.allocator_class)
         self.atlases.append(atlas)
-        return atlas.add(img)
+        self._atlas_refs.append(weakref.ref(atlas))
+        region = atlas.add(img)
+        self._region_atlases[region] = atlas
+        return region
+
+    def add_many(self, images):
+        '''Add a set of images into this texture bin.
+
+        The images are added in decreasing order of height, which packs them
+        more tightly and into fewer atlases than adding them in an arbitrary
+        order.
+
+        `AllocatorException` is raised if an image exceeds the dimensions of
+        ``texture_width`` and ``texture_height``.
+
+        :Parameters:
+            `images` : sequence of `AbstractImage`
+                The images to add.
+
+        :rtype: list of `TextureRegion`
+        :return: The regions containing each of the images, in the order the
+            images were given.
+
+        :since: pyglet 1.2
+        '''
+        images = list(images)
+        order = range(len(images))
+        order.sort(key=lambda i: (-images[i].height, -images[i].width))
+        regions = [None] * len(images)
+        for i in order:
+            regions[i] = self.add(images[i])
+        return regions
+
+    def remove(self, region):
+        '''Remove a region returned by `add` or `add_many` from the bin.
+
+        The area of the region can be used by images added later.
+        `ValueError` is raised if the region is not in the bin.
+
+        :Parameters:
+            `region` : `TextureRegion`
+                The region to remove.
+
+        :since: pyglet 1.2
+        '''
+        atlas = self._region_atlases.get(region)
+        if atlas is None:
+            raise ValueError('%r is not in %r' % (region, self))
+        atlas.remove(region)
+        del self._region_atlases[region]
+        if atlas not in self.atlases:
+            self.atlases.append(atlas)
+
+    def defragment(self):
+        '''Defragment the atlases of the bin, and move the regions of the
+        least used atlases into the others where they fit.
+
+        Each atlas is defragmented with `TextureAtlas.defragment`.  Then,
+        starting with the atlas with the smallest area in use, regions are
+        moved into the other atlases until an atlas cannot be emptied.
+        Atlases left with no regions in use are discarded, so their textures
+        are freed once nothing else refers to them.  A moved region takes
+        the texture, position and texture coordinates of its new atlas.
+
+        Call this method periodically in an application that adds and
+        removes images for a long time.
+
+        :since: pyglet 1.2
+        '''
+        atlases = [atlas for atlas in self._get_atlases()
+                   if atlas.get_region_count()]
+        atlases.sort(key=lambda atlas: atlas.get_region_area(), reverse=True)
+        for atlas in atlases:
+            atlas.defragment()
+
+        while len(atlases) > 1:
+            source = atlases.pop()
+            data = source.texture.get_image_data()
+            regions = source._regions.keys()
+            regions.sort(key=lambda region: (-region.height, -region.width))
+            for region in regions:
+                for atlas in atlases:
+                    try:
+                        atlas._take(region, source, data)
+                        self._region_atlases[region] = atlas
+                        break
+                    except AllocatorException:
+                        pass
+            if source.get_region_count():
+                source.defragment()
+                atlases.append(source)
+                break
+        self.atlases = atlases
+
+    def _get_atlases(self):
+        # Every atlas created by the bin that is still alive, whether or not
+        # it is in `atlases`.
+        atlases = []
+        refs = []
+        for ref in self._atlas_refs:
+            atlas = ref()
+            if atlas is not None:
+                atlases.append(atlas)
+                refs.append(ref)
+        self._atlas_refs = refs
+        return atlases
+
+    def get_usage(self):
+        '''Get the fraction of the area of the bin's atlases already
+        allocated.
+
+        Full atlases no longer used for new images are included while they
+        are alive.  This method is useful for debugging and profiling only.
+
+        :rtype: float
+        :since: pyglet 1.2
+        '''
+        atlases = self._get_atlases()
+        if not atlases:
+            return 0.
+        used_area = sum([atlas.allocator.used_area for atlas in atlases])
+        return used_area / float(len(atlases) *
+                                 self.texture_width * self.texture_height)
+
+    def get_fragmentation(self):
+        '''Get the mean fragmentation of the bin's atlases, as given by
+        the ``get_fragmentation`` method of their allocators.
+
+        Full atlases no longer used for new images are included while they
+        are alive.  This method is useful for debugging and profiling only.
+
+        :rtype: float
+        :since: pyglet 1.2
+        '''
+        atlases = self._get_atlases()
+        if not atlases:
+            return 0.
+        return sum([atlas.allocator.get_fragmentation()
+                    for atlas in atlases]) / len(atlases)
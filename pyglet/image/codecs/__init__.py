@@ -37,6 +37,10 @@
 Modules must subclass ImageDecoder and ImageEncoder for each method of
 decoding/encoding they support.
 
+Decoders of a single file format should also return the bytes that files of
+that format begin with from `ImageDecoder.get_file_signatures`, so that files
+of other formats are not given to them.
+
 Modules must also implement the two functions::
     
     def get_decoders():
@@ -59,6 +63,12 @@ _decoders = []              # List of registered ImageDecoders
 _decoder_extensions = {}    # Map str -> list of matching ImageDecoders
 _decoder_animation_extensions = {}    
                             # Map str -> list of matching ImageDecoders
+_decoder_signatures = {}    # Map ImageDecoder -> tuple of signatures
+_signatures = []            # List of all decoder signatures
+_signature_length = 0       # Length of the longest signature
+_decoder_cache = {}         # Map (str, tuple) -> list of ImageDecoders
+_animation_decoder_cache = {}
+                            # Map (str, tuple) -> list of ImageDecoders
 _encoders = []              # List of registered ImageEncoders
 _encoder_extensions = {}    # Map str -> list of matching ImageEncoders
 
@@ -81,6 +91,19 @@ class ImageDecoder(object):
         '''
         return []
 
+    def get_file_signatures(self):
+        '''Return a list of byte strings that files accepted by this decoder
+        begin with, e.g. ['\\x89PNG\\r\\n\\x1a\\n'].
+
+        When the beginning of a file is known, the file is only given to
+        decoders that have a matching signature or that return an empty
+        list, the default.  Decoders supporting many formats should
+        return an empty list.
+
+        :since: pyglet 1.2
+        '''
+        return []
+
     def decode(self, file, filename):
         '''Decode the given file object and return an instance of `Image`.
         Throws ImageDecodeException if there is an error.  filename
@@ -121,35 +144,76 @@ def get_encoders(filename=None):
     encoders += [e for e in _encoders if e not in encoders]
     return encoders
 
-def get_decoders(filename=None):
-    '''Get an ordered list of decoders to attempt.  filename can be used
-     as a hint for the filetype.
+def get_file_header(file):
+    '''Read enough of the beginning of a file to match decoder signatures.
+
+    The file position is left unchanged.
+
+    :since: pyglet 1.2
     '''
-    decoders = []
+    position = file.tell()
+    header = file.read(_signature_length)
+    file.seek(position)
+    return header
+
+def _accepts(decoder, signatures):
+    decoder_signatures = _decoder_signatures.get(decoder, ())
+    if not decoder_signatures:
+        return True
+    for signature in decoder_signatures:
+        if signature in signatures:
+            return True
+    return False
+
+def _get_decoders(filename, header, extensions, cache):
+    extension = None
     if filename:
         extension = os.path.splitext(filename)[1].lower()
-        decoders += _decoder_extensions.get(extension, [])
-    decoders += [e for e in _decoders if e not in decoders]
-    return decoders
+    signatures = None
+    if header is not None:
+        signatures = tuple([s for s in _signatures if header.startswith(s)])
 
-def get_animation_decoders(filename=None):
+    key = (extension, signatures)
+    if key not in cache:
+        decoders = list(extensions.get(extension, []))
+        decoders += [e for e in _decoders if e not in decoders]
+        if signatures is not None:
+            decoders = [e for e in decoders if _accepts(e, signatures)]
+        cache[key] = decoders
+    return list(cache[key])
+
+def get_decoders(filename=None, header=None):
     '''Get an ordered list of decoders to attempt.  filename can be used
-     as a hint for the filetype.
+    as a hint for the filetype.  If header is given, decoders with file
+    signatures not matching it are excluded.
     '''
-    decoders = []
-    if filename:
-        extension = os.path.splitext(filename)[1].lower()
-        decoders += _decoder_animation_extensions.get(extension, [])
-    decoders += [e for e in _decoders if e not in decoders]
-    return decoders
+    return _get_decoders(filename, header, _decoder_extensions,
+                         _decoder_cache)
+
+def get_animation_decoders(filename=None, header=None):
+    '''Get an ordered list of decoders to attempt.  filename can be used
+    as a hint for the filetype.  If header is given, decoders with file
+    signatures not matching it are excluded.
+    '''
+    return _get_decoders(filename, header, _decoder_animation_extensions,
+                         _animation_decoder_cache)
 
 def add_decoders(module):
     '''Add a decoder module.  The module must define `get_decoders`.  Once
     added, the appropriate decoders defined in the codec will be returned by
     pyglet.image.codecs.get_decoders.
     '''
+    global _signature_length
+    _decoder_cache.clear()
+    _animation_decoder_cache.clear()
     for decoder in module.get_decoders():
         _decoders.append(decoder)
+        signatures = tuple(decoder.get_file_signatures())
+        _decoder_signatures[decoder] = signatures
+        for signature in signatures:
+            if signature not in _signatures:
+                _signatures.append(signature)
+            _signature_length = max(_signature_length, len(signature))
         for extension in decoder.get_file_extensions():
             if extension not in _decoder_extensions:
                 _decoder_extensions[extension] = []
@@ -240,3 +304,11 @@ def add_default_image_codecs():
         add_decoders(bmp)
     except ImportError:
         pass
+
+    # Fallback: GIF loader (slow)
+    try:
+        import pyglet.image.codecs.gif
+        add_encoders(gif)
+        add_decoders(gif)
+    except ImportError:
+        pass
@@ -34,8 +34,8 @@
 
 '''Decoder for BMP files.
 
-Currently supports version 3 and 4 bitmaps with BI_RGB and BI_BITFIELDS
-encoding.  Alpha channel is supported for 32-bit BI_RGB only.
+Currently supports version 3 and 4 bitmaps with BI_RGB, BI_RLE8, BI_RLE4 and
+BI_BITFIELDS encoding.  Alpha channel is supported for 32-bit BI_RGB only.
 '''
 
 # Official docs are at
@@ -47,7 +47,9 @@ encoding.  Alpha channel is supported for 32-bit BI_RGB only.
 __docformat__ = 'restructuredtext'
 __version__ = '$Id$'
 
+import binascii
 import ctypes
+import struct
 
 from pyglet.image import ImageData
 from pyglet.image.codecs import ImageDecoder, ImageDecodeException
@@ -147,10 +149,18 @@ def to_ctypes(buffer, offset, type):
     ptr = ptr_add(ctypes.pointer(buffer), offset)
     return ctypes.cast(ptr, ctypes.POINTER(type)).contents
 
+def get_bits(buffer, offset, size):
+    if offset + size > len(buffer):
+        raise ImageDecodeException('BMP file is truncated')
+    return buffer[offset:offset + size]
+
 class BMPImageDecoder(ImageDecoder):
     def get_file_extensions(self):
         return ['.bmp']
 
+    def get_file_signatures(self):
+        return ['BM']
+
     def decode(self, file, filename):
         if not file:
             file = open(filename, 'rb')
@@ -180,61 +190,70 @@ class BMPImageDecoder(ImageDecoder):
         height = abs(height)
 
         compression = info_header.biCompression
-        if compression not in (BI_RGB, BI_BITFIELDS):
+        bitcount = info_header.biBitCount
+        if compression not in (BI_RGB, BI_BITFIELDS, BI_RLE8, BI_RLE4):
             raise ImageDecodeException(
                 'Unsupported compression: %r' % (filename or file))
+        if ((compression == BI_RLE8 and bitcount != 8) or
+            (compression == BI_RLE4 and bitcount != 4)):
+            raise ImageDecodeException(
+                'BMP file has corrupt parameters: %r' % (filename or file))
 
         clr_used = 0
-        bitcount = info_header.biBitCount 
         if bitcount == 1:
             pitch = (width + 7) // 8
-            bits_type = ctypes.c_ubyte
             decoder = decode_1bit
         elif bitcount == 4:
             pitch = (width + 1) // 2
-            bits_type = ctypes.c_ubyte
             decoder = decode_4bit
         elif bitcount == 8:
-            bits_type = ctypes.c_ubyte
             pitch = width
             decoder = decode_8bit
         elif bitcount == 16:
             pitch = width * 2
-            bits_type = ctypes.c_uint16
             decoder = decode_bitfields
         elif bitcount == 24:
             pitch = width * 3
-            bits_type = ctypes.c_ubyte
-            decoder = decode_24bit 
+            decoder = decode_24bit
         elif bitcount == 32:
             pitch = width * 4
             if compression == BI_RGB:
                 decoder = decode_32bit_rgb
-                bits_type = ctypes.c_ubyte
-            elif compression == BI_BITFIELDS:
-                decoder = decode_bitfields
-                bits_type = ctypes.c_uint32
             else:
-                raise ImageDecodeException(
-                    'Unsupported compression: %r' % (filename or file))
+                decoder = decode_bitfields
         else:
             raise ImageDecodeException(
                 'Unsupported bit count %d: %r' % (bitcount, filename or file))
 
         pitch = (pitch + 3) & ~3
-        packed_width = pitch // ctypes.sizeof(bits_type)
 
-        if bitcount < 16 and compression == BI_RGB: 
+        if compression in (BI_RLE8, BI_RLE4):
+            clr_used = info_header.biClrUsed or (1 <<  bitcount)
+            palette = to_ctypes(buffer, palette_offset, RGBQUAD * clr_used)
+            size = info_header.biSizeImage or len(bytes) - bits_offset
+            bits = get_bits(bytes, bits_offset, size)
+            if compression == BI_RLE8:
+                decoder = decode_rle8
+            else:
+                decoder = decode_rle4
+            return decoder(bits, palette, width, height, pitch_sign)
+        elif bitcount < 16 and compression == BI_RGB:
             clr_used = info_header.biClrUsed or (1 <<  bitcount)
             palette = to_ctypes(buffer, palette_offset, RGBQUAD * clr_used)
-            bits = to_ctypes(buffer, bits_offset, 
-                             bits_type * packed_width * height)
+            bits = get_bits(bytes, bits_offset, pitch * height)
             return decoder(bits, palette, width, height, pitch, pitch_sign)
-        elif bitcount >= 16 and compression == BI_RGB:
-            bits = to_ctypes(buffer, bits_offset, 
-                             bits_type * (packed_width * height))
+        elif bitcount == 16 and compression == BI_RGB:
+            # 16-bit images without bit fields are X1R5G5B5.
+            bits = get_bits(bytes, bits_offset, pitch * height)
+            return decoder(bits, 0x7c00, 0x3e0, 0x1f,
+                           width, height, pitch, pitch_sign, 2)
+        elif compression == BI_RGB:
+            bits = get_bits(bytes, bits_offset, pitch * height)
             return decoder(bits, None, width, height, pitch, pitch_sign)
         elif compression == BI_BITFIELDS:
+            if bitcount not in (16, 32):
+                raise ImageDecodeException(
+                    'Unsupported compression: %r' % (filename or file))
             if info_header.biSize >= ctypes.sizeof(BITMAPV4HEADER):
                 info_header = to_ctypes(buffer, info_header_offset,
                                         BITMAPV4HEADER)
@@ -243,79 +262,140 @@ class BMPImageDecoder(ImageDecoder):
                 b_mask = info_header.bV4BlueMask
             else:
                 fields_offset = info_header_offset + \
-                    ctypes.sizeof(BITMAPINFOHEADER) 
+                    ctypes.sizeof(BITMAPINFOHEADER)
                 fields = to_ctypes(buffer, fields_offset, RGBFields)
                 r_mask = fields.red
                 g_mask = fields.green
                 b_mask = fields.blue
-            class _BitsArray(ctypes.LittleEndianStructure):
-                _pack_ = 1
-                _fields_ = [
-                    ('data', bits_type * packed_width * height),
-                ]
-            bits = to_ctypes(buffer, bits_offset, _BitsArray).data
-            return decoder(bits, r_mask, g_mask, b_mask, 
-                           width, height, pitch, pitch_sign)
+            bits = get_bits(bytes, bits_offset, pitch * height)
+            return decoder(bits, r_mask, g_mask, b_mask,
+                           width, height, pitch, pitch_sign, bitcount // 8)
+
+# Translation tables giving the palette index of each pixel packed into a
+# byte, from the most significant bits.
+_bit_tables = [''.join([chr((i >> (7 - bit)) & 1) for i in range(256)])
+               for bit in range(8)]
+_nibble_tables = [''.join([chr(i >> 4) for i in range(256)]),
+                  ''.join([chr(i & 0xf) for i in range(256)])]
+
+def get_palette_tables(palette):
+    '''Return translation tables mapping palette indices to the red, green
+    and blue components of each palette entry.
+    '''
+    tables = [bytearray(256), bytearray(256), bytearray(256)]
+    for i, rgb in enumerate(palette[:256]):
+        tables[0][i] = rgb.rgbRed
+        tables[1][i] = rgb.rgbGreen
+        tables[2][i] = rgb.rgbBlue
+    return [str(table) for table in tables]
+
+def unpack_indices(bits, tables):
+    '''Return one byte per palette index for bits packing len(tables)
+    indices into each byte.
+    '''
+    count = len(tables)
+    indices = bytearray(len(bits) * count)
+    for i, table in enumerate(tables):
+        indices[i::count] = bits.translate(table)
+    return indices
+
+def expand_indices(indices, palette):
+    '''Return RGB data for a string of 8-bit palette indices.'''
+    rgb = bytearray(len(indices) * 3)
+    for i, table in enumerate(get_palette_tables(palette)):
+        rgb[i::3] = indices.translate(table)
+    return str(rgb)
 
 def decode_1bit(bits, palette, width, height, pitch, pitch_sign):
-    rgb_pitch = (((pitch << 3) + 7) & ~0x7) * 3
-    buffer = (ctypes.c_ubyte * (height * rgb_pitch))()
-    i = 0
-    for row in bits:
-        for packed in row:
-            for _ in range(8):
-                rgb = palette[(packed & 0x80) >> 7]
-                buffer[i] = rgb.rgbRed
-                buffer[i + 1] = rgb.rgbGreen
-                buffer[i + 2] = rgb.rgbBlue
-                i += 3
-                packed <<= 1
-
+    rgb_pitch = pitch * 8 * 3
+    buffer = expand_indices(unpack_indices(bits, _bit_tables), palette)
     return ImageData(width, height, 'RGB', buffer, pitch_sign * rgb_pitch)
 
 def decode_4bit(bits, palette, width, height, pitch, pitch_sign):
-    rgb_pitch = (((pitch << 1) + 1) & ~0x1) * 3
-    buffer = (ctypes.c_ubyte * (height * rgb_pitch))()
-    i = 0
-    for row in bits:
-        for packed in row:
-            for index in ((packed & 0xf0) >> 4, packed & 0xf):
-                rgb = palette[index]
-                buffer[i] = rgb.rgbRed
-                buffer[i + 1] = rgb.rgbGreen
-                buffer[i + 2] = rgb.rgbBlue
-                i += 3
-
+    rgb_pitch = pitch * 2 * 3
+    buffer = expand_indices(unpack_indices(bits, _nibble_tables), palette)
     return ImageData(width, height, 'RGB', buffer, pitch_sign * rgb_pitch)
 
 def decode_8bit(bits, palette, width, height, pitch, pitch_sign):
     rgb_pitch = pitch * 3
-    buffer = (ctypes.c_ubyte * (height * rgb_pitch))()
-    i = 0
-    for row in bits:
-        for index in row:
-            rgb = palette[index]
-            buffer[i] = rgb.rgbRed
-            buffer[i + 1] = rgb.rgbGreen
-            buffer[i + 2] = rgb.rgbBlue
-            i += 3
-
+    buffer = expand_indices(bits, palette)
     return ImageData(width, height, 'RGB', buffer, pitch_sign * rgb_pitch)
 
+def decode_rle_indices(bits, width, height, tables):
+    '''Return one byte per pixel for run-length encoded bits.
+
+    `tables` are the translation tables unpacking the indices of each byte,
+    `_nibble_tables` for BI_RLE4 or ``None`` for BI_RLE8.  Pixels skipped by
+    the encoding are given index 0.
+    '''
+    indices = bytearray(width * height)
+    length = len(bits)
+    x = y = 0
+    i = 0
+    while i + 1 < length and y < height:
+        count = ord(bits[i])
+        value = bits[i + 1]
+        i += 2
+        if count:
+            # Encoded mode: repeat the index (or pair of indices) count times
+            if tables:
+                run = value.translate(tables[0]) + value.translate(tables[1])
+                run = (run * ((count + 1) // 2))[:count]
+            else:
+                run = value * count
+        else:
+            value = ord(value)
+            if value == 0:
+                # End of line
+                x = 0
+                y += 1
+                continue
+            elif value == 1:
+                # End of bitmap
+                break
+            elif value == 2:
+                # Delta
+                x += ord(bits[i:i + 1] or '\0')
+                y += ord(bits[i + 1:i + 2] or '\0')
+                i += 2
+                continue
+            # Absolute mode: value indices follow, padded to a word
+            # boundary.
+            if tables:
+                size = (value + 1) // 2
+                run = unpack_indices(bits[i:i + size], tables)[:value]
+            else:
+                size = value
+                run = bits[i:i + size]
+            i += (size + 1) & ~1
+            count = value
+
+        if x < width:
+            start = y * width + x
+            end = start + min(count, width - x)
+            indices[start:end] = run[:end - start]
+        x += count
+    return indices
+
+def decode_rle8(bits, palette, width, height, pitch_sign):
+    indices = decode_rle_indices(bits, width, height, None)
+    buffer = expand_indices(indices, palette)
+    return ImageData(width, height, 'RGB', buffer, pitch_sign * width * 3)
+
+def decode_rle4(bits, palette, width, height, pitch_sign):
+    indices = decode_rle_indices(bits, width, height, _nibble_tables)
+    buffer = expand_indices(indices, palette)
+    return ImageData(width, height, 'RGB', buffer, pitch_sign * width * 3)
 
 def decode_24bit(bits, palette, width, height, pitch, pitch_sign):
-    buffer = (ctypes.c_ubyte * (height * pitch))()
-    ctypes.memmove(buffer, bits, len(buffer))
-    return ImageData(width, height, 'BGR', buffer, pitch_sign * pitch)
+    return ImageData(width, height, 'BGR', bits, pitch_sign * pitch)
 
 def decode_32bit_rgb(bits, palette, width, height, pitch, pitch_sign):
-    buffer = (ctypes.c_ubyte * (height * pitch))()
-    ctypes.memmove(buffer, bits, len(buffer))
-    return ImageData(width, height, 'BGRA', buffer, pitch_sign * pitch)
+    return ImageData(width, height, 'BGRA', bits, pitch_sign * pitch)
 
 def get_shift(mask):
     if not mask:
-        return 0
+        return 0, 0
 
     # Shift down
     shift = 0
@@ -333,24 +413,55 @@ def get_shift(mask):
     else:
         return s, 0
 
-def decode_bitfields(bits, r_mask, g_mask, b_mask, 
-                     width, height, pitch, pitch_sign):
-    r_shift1, r_shift2 = get_shift(r_mask)
-    g_shift1, g_shift2 = get_shift(g_mask)
-    b_shift1, b_shift2 = get_shift(b_mask)
-
-    rgb_pitch = 3 * len(bits[0])
-    buffer = (ctypes.c_ubyte * (height * rgb_pitch))()
-
-    i = 0
-    for row in bits:
-        for packed in row:
-            buffer[i] = (packed & r_mask) >> r_shift1 << r_shift2
-            buffer[i+1] = (packed & g_mask) >> g_shift1 << g_shift2
-            buffer[i+2] = (packed & b_mask) >> b_shift1 << b_shift2
-            i += 3
-
-    return ImageData(width, height, 'RGB', buffer, pitch_sign * rgb_pitch)
+def or_bytes(a, b):
+    '''Return the bitwise OR of corresponding bytes of two equal length
+    strings.
+    '''
+    if not a:
+        return a
+    value = int(binascii.hexlify(a), 16) | int(binascii.hexlify(b), 16)
+    return binascii.unhexlify('%0*x' % (len(a) * 2, value))
+
+def decode_bitfield(bits, mask, bytes_per_pixel):
+    '''Return one byte per pixel giving the 8-bit value of the component
+    selected by `mask`.
+    '''
+    shift1, shift2 = get_shift(mask)
+    if mask & ((1 << shift1) - 1):
+        # Components wider than 8 bits lose their low bits, which may
+        # straddle bytes; shift each pixel.
+        format = '<%d%s' % (len(bits) // bytes_per_pixel,
+                            bytes_per_pixel == 2 and 'H' or 'I')
+        return str(bytearray([(packed & mask) >> shift1 << shift2 & 0xff
+                              for packed in struct.unpack(format, bits)]))
+
+    # The component bits in each byte of a pixel map to distinct bits of
+    # the result, so each byte can be translated separately and the results
+    # combined.
+    result = None
+    for i in range(bytes_per_pixel):
+        byte_mask = (mask >> (i * 8)) & 0xff
+        if not byte_mask:
+            continue
+        table = ''.join([chr(((j & byte_mask) << (i * 8)) >> shift1
+                             << shift2 & 0xff) for j in range(256)])
+        plane = bits[i::bytes_per_pixel].translate(table)
+        if result is None:
+            result = plane
+        else:
+            result = or_bytes(result, plane)
+    if result is None:
+        result = '\0' * (len(bits) // bytes_per_pixel)
+    return result
+
+def decode_bitfields(bits, r_mask, g_mask, b_mask,
+                     width, height, pitch, pitch_sign, bytes_per_pixel):
+    rgb_pitch = 3 * (pitch // bytes_per_pixel)
+    buffer = bytearray(height * rgb_pitch)
+    for i, mask in enumerate((r_mask, g_mask, b_mask)):
+        buffer[i::3] = decode_bitfield(bits, mask, bytes_per_pixel)
+    return ImageData(width, height, 'RGB', str(buffer),
+                     pitch_sign * rgb_pitch)
 
 def get_decoders():
     return [BMPImageDecoder()]
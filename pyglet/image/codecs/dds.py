@@ -34,6 +34,12 @@
 
 '''DDS texture loader.
 
+Large textures can be loaded without reading them into memory by decoding
+with a `DDSImageDecoder` created with ``use_mmap=True``::
+
+    decoder = DDSImageDecoder(use_mmap=True)
+    texture = pyglet.image.load('terrain.dds', decoder=decoder).get_texture()
+
 Reference: http://msdn2.microsoft.com/en-us/library/bb172993.aspx
 '''
 
@@ -41,10 +47,11 @@ __docformat__ = 'restructuredtext'
 __version__ = '$Id$'
 
 from ctypes import *
+import mmap
 import struct
 
 from pyglet.gl import *
-from pyglet.image import CompressedImageData
+from pyglet.image import CompressedImageData, ImageException
 from pyglet.image import codecs
 from pyglet.image.codecs import s3tc
 from pyglet.compat import izip_longest
@@ -154,11 +161,131 @@ def _check_error():
     if e != 0:
         print 'GL error %d' % e
 
+class MappedCompressedImageData(CompressedImageData):
+    '''Compressed image data referring to the mipmap levels of a
+    memory-mapped file.
+
+    The levels are passed to GL directly from the mapping, which is closed
+    once a texture has been created from the image or the image has been
+    blitted into a texture, so the file contents are never copied into
+    memory.  After the mapping is closed, only the texture already created
+    is available.
+
+    :since: pyglet 1.2
+    '''
+
+    #: If True, the mapping is closed after the first upload.  Set to False
+    #: to create several textures from the image, and call `release` when
+    #: done.
+    release_after_upload = True
+
+    def __init__(self, width, height, gl_format, mapping, levels,
+                 extension=None, decoder=None):
+        '''Construct compressed image data from a file mapping.
+
+        :Parameters:
+            `width` : int
+                Width of image
+            `height` : int
+                Height of image
+            `gl_format` : int
+                GL constant giving format of compressed data.
+            `mapping` : mmap.mmap
+                Mapping of the file containing the levels.
+            `levels` : list of ctypes arrays
+                Compressed data of each mipmap level, starting with the
+                full size image, sharing memory with `mapping`.
+            `extension` : str or None
+                If specified, gives the name of a GL extension to check for
+                before creating a texture.
+            `decoder` : function(data, width, height) -> AbstractImage
+                A function to decode the compressed data, to be used if the
+                required extension is not present.
+
+        '''
+        super(MappedCompressedImageData, self).__init__(width, height,
+            gl_format, levels[0], extension, decoder)
+        for level, data in enumerate(levels[1:]):
+            self.set_mipmap_data(level + 1, data)
+        self.mapping = mapping
+
+    def _check_mapping(self):
+        if self.mapping is None:
+            raise ImageException(
+                'The file mapping of %r has been released' % self)
+
+    def get_texture(self, rectangle=False, force_rectangle=False):
+        if self._current_texture:
+            return self._current_texture
+        self._check_mapping()
+        texture = super(MappedCompressedImageData, self).get_texture(
+            rectangle, force_rectangle)
+        if self.release_after_upload:
+            self.release()
+        return texture
+
+    def get_mipmapped_texture(self):
+        if self._current_mipmap_texture:
+            return self._current_mipmap_texture
+        self._check_mapping()
+        texture = super(MappedCompressedImageData, self).get_mipmapped_texture()
+        if self.release_after_upload:
+            self.release()
+        return texture
+
+    def blit_to_texture(self, target, level, x, y, z):
+        self._check_mapping()
+        super(MappedCompressedImageData, self).blit_to_texture(
+            target, level, x, y, z)
+        if self.release_after_upload:
+            self.release()
+
+    def release(self):
+        '''Close the file mapping.
+
+        The levels must not be used after the mapping is closed, so no
+        other references to `data` or `mipmap_data` may be kept.
+        '''
+        if self.mapping is None:
+            return
+        self.data = None
+        self.mipmap_data = []
+        self.mapping.close()
+        self.mapping = None
+
+def _map_file(file):
+    # Return a copy-on-write mapping of the whole file, which can be shared
+    # with ctypes arrays, or None if the file cannot be mapped.
+    try:
+        fileno = file.fileno()
+    except (AttributeError, IOError):
+        return None
+    try:
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_COPY)
+    except (EnvironmentError, ValueError):
+        return None
+
 class DDSImageDecoder(codecs.ImageDecoder):
+    def __init__(self, use_mmap=False):
+        '''Create a DDS decoder.
+
+        :Parameters:
+            `use_mmap` : bool
+                If True, files that can be memory-mapped are decoded into
+                `MappedCompressedImageData` referring to the mapping
+                instead of being read into memory.
+
+        '''
+        self.use_mmap = use_mmap
+
     def get_file_extensions(self):
         return ['.dds']
 
+    def get_file_signatures(self):
+        return ['DDS ']
+
     def decode(self, file, filename):
+        offset = file.tell() + DDSURFACEDESC2.get_size()
         header = file.read(DDSURFACEDESC2.get_size())
         desc = DDSURFACEDESC2(header)
         if desc.dwMagic != 'DDS ' or desc.dwSize != 124:
@@ -191,12 +318,13 @@ class DDSImageDecoder(codecs.ImageDecoder):
             raise DDSException('Unsupported texture compression %s' % \
                 desc.ddpfPixelFormat.dwFourCC)
 
-        if format == GL_COMPRESSED_RGB_S3TC_DXT1_EXT:
+        if format in (GL_COMPRESSED_RGB_S3TC_DXT1_EXT,
+                      GL_COMPRESSED_RGBA_S3TC_DXT1_EXT):
             block_size = 8
         else:
             block_size = 16
 
-        datas = []
+        sizes = []
         w, h = width, height
         for i in range(mipmaps):
             if not w and not h:
@@ -205,12 +333,26 @@ class DDSImageDecoder(codecs.ImageDecoder):
                 w = 1
             if not h:
                 h = 1
-            size = ((w + 3) / 4) * ((h + 3) / 4) * block_size
-            data = file.read(size)
-            datas.append(data)
+            sizes.append(((w + 3) / 4) * ((h + 3) / 4) * block_size)
             w >>= 1
             h >>= 1
 
+        mapping = None
+        if self.use_mmap:
+            mapping = _map_file(file)
+        if mapping is not None:
+            levels = []
+            for size in sizes:
+                if offset + size > len(mapping):
+                    del levels[:]
+                    mapping.close()
+                    raise DDSException('DDS file is truncated')
+                levels.append((c_ubyte * size).from_buffer(mapping, offset))
+                offset += size
+            return MappedCompressedImageData(width, height, format,
+                mapping, levels, 'GL_EXT_texture_compression_s3tc', decoder)
+
+        datas = [file.read(size) for size in sizes]
         image = CompressedImageData(width, height, format, datas[0],
             'GL_EXT_texture_compression_s3tc', decoder)
         level = 0
@@ -220,8 +362,44 @@ class DDSImageDecoder(codecs.ImageDecoder):
 
         return image
 
+class DDSImageEncoder(codecs.ImageEncoder):
+    '''Save images as DDS files compressed with DXT5, or with DXT1 if the
+    image has no alpha channel.  Mipmaps are not saved.
+    '''
+    def get_file_extensions(self):
+        return ['.dds']
+
+    def encode(self, image, file, filename):
+        if not filename or not filename.lower().endswith('.dds'):
+            raise codecs.ImageEncodeException('Not a DDS filename')
+
+        image = image.get_image_data()
+        width = image.width
+        height = image.height
+        data = image.get_data('RGBA', width * 4)
+        if 'A' in image.format:
+            fourcc = 'DXT5'
+            alpha_mask = 0xff000000
+            data = s3tc.encode_dxt5(data, width, height)
+        else:
+            fourcc = 'DXT1'
+            alpha_mask = 0
+            data = s3tc.encode_dxt1(data, width, height)
+
+        pixel_format = struct.pack(DDPIXELFORMAT.get_format(),
+            DDPIXELFORMAT.get_size(), DDPF_FOURCC, fourcc,
+            0, 0, 0, 0, alpha_mask)
+        header = struct.pack(DDSURFACEDESC2.get_format(),
+            'DDS ', 124,
+            DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT |
+            DDSD_LINEARSIZE,
+            height, width, len(data), 0, 0, '', pixel_format,
+            DDSCAPS_TEXTURE, 0, '', 0)
+        file.write(header)
+        file.write(data)
+
 def get_decoders():
     return [DDSImageDecoder()]
 
 def get_encoders():
-    return []
+    return [DDSImageEncoder()]
@@ -32,7 +32,12 @@
 # POSSIBILITY OF SUCH DAMAGE.
 # ----------------------------------------------------------------------------
 
-'''Read GIF control data.
+'''Read GIF control data and decode GIF images and animations.
+
+The decoder is written in pure Python and is used when no platform image
+library is available.  The frames of an animation are composed when their
+image is first used; recently used frames are kept within a memory budget
+and discarded frames are composed again when they are next needed.
 
 http://www.w3.org/Graphics/GIF/spec-gif89a.txt
 '''
@@ -40,19 +45,32 @@ http://www.w3.org/Graphics/GIF/spec-gif89a.txt
 __docformat__ = 'restructuredtext'
 __version__ = '$Id$'
 
+import re
 import struct
 
-from pyglet.image.codecs import ImageDecodeException
+from pyglet.image import ImageData, Animation, AnimationFrame
+from pyglet.image.codecs import ImageDecoder, ImageDecodeException
 
 class GIFStream(object):
+    width = 0
+    height = 0
+    color_table = None
+    background_color_index = 0
+
     def __init__(self):
         self.images = []
 
 class GIFImage(object):
     delay = None
+    disposal = 0
+    transparent_color_index = None
+    color_table = None
+    interlaced = False
 
 class GraphicsScope(object):
     delay = None
+    disposal = 0
+    transparent_color_index = None
 
 # Appendix A.
 LABEL_EXTENSION_INTRODUCER = 0x21
@@ -60,6 +78,18 @@ LABEL_GRAPHIC_CONTROL_EXTENSION = 0xf9
 LABEL_IMAGE_DESCRIPTOR = 0x2c
 LABEL_TRAILER = 0x3b
 
+# 23. Graphic control extension disposal methods
+DISPOSAL_NONE = 0
+DISPOSAL_LEAVE = 1
+DISPOSAL_BACKGROUND = 2
+DISPOSAL_PREVIOUS = 3
+
+#: Duration of frames without a delay, in seconds.
+DEFAULT_DELAY = 0.1
+
+#: Default number of bytes of composed frames kept by each animation.
+DEFAULT_CACHE_BUDGET = 16 << 20
+
 def unpack(format, file):
     size = struct.calcsize(format)
     data = file.read(size)
@@ -89,15 +119,18 @@ def read(file):
     # 18. Logical screen descriptor
     (logical_screen_width,
      logical_screen_height,
-     fields, 
+     fields,
      background_color_index,
-     pixel_aspect_ratio) = unpack('HHBBB', file)
+     pixel_aspect_ratio) = unpack('<HHBBB', file)
     global_color_table_flag = fields & 0x80
     global_color_table_size = fields & 0x7
+    stream.width = logical_screen_width
+    stream.height = logical_screen_height
+    stream.background_color_index = background_color_index
 
     # 19. Global color table
     if global_color_table_flag:
-        global_color_table = file.read(6 << global_color_table_size)
+        stream.color_table = file.read(6 << global_color_table_size)
 
     # <Data>*
     graphics_scope = GraphicsScope()
@@ -120,7 +153,7 @@ def read(file):
         block_type = read_byte(file)
 
     return stream
-        
+
 def skip_data_sub_blocks(file):
     # 15. Data sub-blocks
     block_size = read_byte(file)
@@ -128,28 +161,47 @@ def skip_data_sub_blocks(file):
         data = file.read(block_size)
         block_size = read_byte(file)
 
+def read_data_sub_blocks(file):
+    # 15. Data sub-blocks
+    blocks = []
+    block_size = read_byte(file)
+    while block_size != 0:
+        blocks.append(file.read(block_size))
+        block_size = read_byte(file)
+    return ''.join(blocks)
+
 def read_table_based_image(file, stream, graphics_scope):
     gif_image = GIFImage()
     stream.images.append(gif_image)
     gif_image.delay = graphics_scope.delay
-        
+    gif_image.disposal = graphics_scope.disposal
+    gif_image.transparent_color_index = \
+        graphics_scope.transparent_color_index
+
     # 20. Image descriptor
     (image_left_position,
      image_top_position,
      image_width,
      image_height,
-     fields) = unpack('HHHHB', file)
+     fields) = unpack('<HHHHB', file)
+    gif_image.left = image_left_position
+    gif_image.top = image_top_position
+    gif_image.width = image_width
+    gif_image.height = image_height
 
     local_color_table_flag = fields & 0x80
+    interlace_flag = fields & 0x40
     local_color_table_size = fields & 0x7
+    gif_image.interlaced = bool(interlace_flag)
 
     # 21. Local color table
     if local_color_table_flag:
-        local_color_table = file.read(6 << local_color_table_size)
+        gif_image.color_table = file.read(6 << local_color_table_size)
 
-    # 22. Table based image data
-    lzw_code_size = file.read(1)
-    skip_data_sub_blocks(file)
+    # 22. Table based image data.  The data is decompressed when the image
+    # is composed.
+    gif_image.lzw_code_size = read_byte(file)
+    gif_image.data = read_data_sub_blocks(file)
 
 def read_graphic_control_extension(file, stream, graphics_scope):
     # 23. Graphic control extension
@@ -157,13 +209,360 @@ def read_graphic_control_extension(file, stream, graphics_scope):
      fields,
      delay_time,
      transparent_color_index,
-     terminator) = unpack('BBHBB', file)
+     terminator) = unpack('<BBHBB', file)
     if block_size != 4:
         raise ImageDecodeException('Incorrect block size')
-    
+
+    graphics_scope.disposal = (fields >> 2) & 0x7
+    if fields & 0x1:
+        graphics_scope.transparent_color_index = transparent_color_index
+
     if delay_time:
         # Follow Firefox/Mac behaviour: use 100ms delay for any delay
         # less than 10ms.
         if delay_time <= 1:
             delay_time = 10
         graphics_scope.delay = float(delay_time) / 100
+
+def decode_lzw(data, lzw_code_size, size):
+    '''Decompress GIF image data.
+
+    :Parameters:
+        `data` : str
+            Concatenated data sub-blocks of the image.
+        `lzw_code_size` : int
+            Initial code size of the image data.
+        `size` : int
+            Number of color indices in the image.
+
+    :rtype: str
+    :return: `size` color indices, one per byte.  Missing indices at the
+        end of truncated data are 0.
+    '''
+    # Appendix F.
+    if not 1 <= lzw_code_size <= 11:
+        raise ImageDecodeException('Invalid LZW code size')
+    clear_code = 1 << lzw_code_size
+    end_code = clear_code + 1
+    initial_table = [chr(i) for i in range(clear_code)] + [None, None]
+
+    table = initial_table[:]
+    code_size = lzw_code_size + 1
+    code_mask = (1 << code_size) - 1
+    output = []
+    previous = None
+    bits = 0
+    bit_count = 0
+    for byte in bytearray(data):
+        bits |= byte << bit_count
+        bit_count += 8
+        while bit_count >= code_size:
+            code = bits & code_mask
+            bits >>= code_size
+            bit_count -= code_size
+
+            if code == clear_code:
+                table = initial_table[:]
+                code_size = lzw_code_size + 1
+                code_mask = (1 << code_size) - 1
+                previous = None
+                continue
+            elif code == end_code:
+                bit_count = 0
+                break
+
+            table_size = len(table)
+            if code < table_size:
+                entry = table[code]
+                if entry is None:
+                    raise ImageDecodeException('Invalid LZW code')
+                if previous is not None and table_size < 4096:
+                    table.append(previous + entry[0])
+                    table_size += 1
+            elif code == table_size and previous is not None:
+                entry = previous + previous[0]
+                table.append(entry)
+                table_size += 1
+            else:
+                raise ImageDecodeException('Invalid LZW code')
+            output.append(entry)
+            previous = entry
+
+            if table_size > code_mask and code_size < 12:
+                code_size += 1
+                code_mask = (1 << code_size) - 1
+        else:
+            continue
+        break
+
+    indices = ''.join(output)
+    if len(indices) < size:
+        indices += '\0' * (size - len(indices))
+    return indices[:size]
+
+def deinterlace(indices, width, height):
+    '''Reorder the rows of an interlaced image from top to bottom.
+
+    :rtype: str
+    '''
+    # Appendix E.
+    rows = range(0, height, 8) + range(4, height, 8) + \
+           range(2, height, 4) + range(1, height, 2)
+    result = [None] * height
+    for i, y in enumerate(rows):
+        result[y] = indices[i * width:(i + 1) * width]
+    return ''.join(result)
+
+def get_color_tables(color_table):
+    '''Return translation tables mapping color indices to the red, green,
+    blue and alpha components of each color.
+    '''
+    return [color_table[i::3].ljust(256, '\0')[:256] for i in range(3)] + \
+           ['\xff' * 256]
+
+class GIFFrameCache(object):
+    '''Frames of a GIF stream, composed on demand.
+
+    Composed frames are kept until their total size exceeds `budget`
+    bytes, after which the least recently used frames are discarded.  A
+    discarded frame is composed again, starting from the nearest earlier
+    frame that is still available, when it is next needed.
+
+    :since: pyglet 1.2
+    '''
+
+    #: Maximum number of bytes of composed frames to keep.  At least one
+    #: frame is always kept.
+    budget = DEFAULT_CACHE_BUDGET
+
+    def __init__(self, stream, budget=None):
+        '''Create a frame cache for a GIF stream.
+
+        :Parameters:
+            `stream` : `GIFStream`
+                Stream to compose frames from.
+            `budget` : int
+                Maximum number of bytes of composed frames to keep.  If
+                unspecified, `DEFAULT_CACHE_BUDGET` is used.
+
+        '''
+        if not stream.images:
+            raise ImageDecodeException('GIF stream has no images')
+        self.stream = stream
+        if budget is not None:
+            self.budget = budget
+
+        # The logical screen is enlarged to fit images extending beyond it.
+        self.width = max([stream.width] +
+                         [image.left + image.width for image in stream.images])
+        self.height = max([stream.height] +
+                          [image.top + image.height
+                           for image in stream.images])
+        self.frame_size = self.width * self.height * 4
+
+        self._frames = {}
+        self._order = []
+
+        # The screen after composing frame _index, and the area covered by
+        # that frame before it was composed, if it is restored afterwards.
+        self._index = -1
+        self._canvas = None
+        self._restore = None
+
+    def _get_size(self):
+        return len(self._frames) * self.frame_size
+
+    size = property(_get_size,
+                    doc='''Number of bytes of composed frames kept.
+
+    :type: int
+    ''')
+
+    def get_frame(self, index):
+        '''Get the image of a frame.
+
+        :Parameters:
+            `index` : int
+                Index of the frame in the stream.
+
+        :rtype: `ImageData`
+        '''
+        if index in self._frames:
+            self._order.remove(index)
+            self._order.append(index)
+            return self._frames[index]
+
+        images = self.stream.images
+        if not 0 <= index < len(images):
+            raise IndexError('GIF frame index out of range')
+
+        # Resume from the latest earlier frame available.  Frames restoring
+        # the previous screen can only be resumed from the current screen.
+        start = -1
+        canvas = None
+        restore = None
+        if self._index < index:
+            start = self._index
+            canvas = self._canvas
+            restore = self._restore
+        for i in self._frames:
+            if (start < i < index and
+                images[i].disposal != DISPOSAL_PREVIOUS):
+                start = i
+                canvas = None
+                restore = None
+        if start < 0:
+            canvas = bytearray(self.frame_size)
+        elif canvas is None:
+            canvas = bytearray(self._frames[start].get_data('RGBA',
+                                                            -self.width * 4))
+
+        for i in range(start + 1, index + 1):
+            if i > 0:
+                self._dispose(canvas, images[i - 1], restore)
+            restore = self._compose(canvas, images[i])
+            self._add_frame(i, ImageData(self.width, self.height, 'RGBA',
+                                         str(canvas), -self.width * 4))
+
+        self._index = index
+        self._canvas = canvas
+        self._restore = restore
+        return self._frames[index]
+
+    def clear(self):
+        '''Discard all composed frames.'''
+        self._frames.clear()
+        del self._order[:]
+        self._index = -1
+        self._canvas = None
+        self._restore = None
+
+    def _add_frame(self, index, image):
+        # A frame composed again while cached is moved to the end, so each
+        # index is listed once in _order.
+        if index in self._frames:
+            self._order.remove(index)
+        self._frames[index] = image
+        self._order.append(index)
+        while len(self._order) > 1 and self.size > self.budget:
+            del self._frames[self._order.pop(0)]
+
+    def _get_rows(self, gif_image):
+        pitch = self.width * 4
+        start = gif_image.top * pitch + gif_image.left * 4
+        for y in range(gif_image.height):
+            yield start, start + gif_image.width * 4
+            start += pitch
+
+    def _dispose(self, canvas, gif_image, restore):
+        if gif_image.disposal == DISPOSAL_BACKGROUND:
+            blank = '\0' * (gif_image.width * 4)
+            for start, end in self._get_rows(gif_image):
+                canvas[start:end] = blank
+        elif gif_image.disposal == DISPOSAL_PREVIOUS and restore:
+            for (start, end), row in zip(self._get_rows(gif_image), restore):
+                canvas[start:end] = row
+
+    def _compose(self, canvas, gif_image):
+        color_table = gif_image.color_table or self.stream.color_table
+        if not color_table:
+            raise ImageDecodeException('GIF image has no color table')
+
+        width = gif_image.width
+        indices = decode_lzw(gif_image.data, gif_image.lzw_code_size,
+                             width * gif_image.height)
+        if gif_image.interlaced:
+            indices = deinterlace(indices, width, gif_image.height)
+        rgba = bytearray(len(indices) * 4)
+        for i, table in enumerate(get_color_tables(color_table)):
+            rgba[i::4] = indices.translate(table)
+
+        restore = None
+        if gif_image.disposal == DISPOSAL_PREVIOUS:
+            restore = [canvas[start:end]
+                       for start, end in self._get_rows(gif_image)]
+
+        transparent = gif_image.transparent_color_index
+        if transparent is None:
+            for y, (start, end) in enumerate(self._get_rows(gif_image)):
+                canvas[start:end] = rgba[y * width * 4:(y + 1) * width * 4]
+        else:
+            # Copy each run of opaque pixels.
+            opaque = re.compile('[^%s]+' % re.escape(chr(transparent)))
+            for y, (start, end) in enumerate(self._get_rows(gif_image)):
+                row = y * width
+                for match in opaque.finditer(indices, row, row + width):
+                    run_start, run_end = match.span()
+                    canvas[start + (run_start - row) * 4:
+                           start + (run_end - row) * 4] = \
+                        rgba[run_start * 4:run_end * 4]
+        return restore
+
+class GIFAnimationFrame(AnimationFrame):
+    '''A frame of a GIF animation, composed when its image is first used.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, cache, index, duration):
+        '''Create an animation frame.
+
+        :Parameters:
+            `cache` : `GIFFrameCache`
+                Frame cache to get the image from.
+            `index` : int
+                Index of the frame in the stream.
+            `duration` : float
+                Number of seconds to display the frame, or ``None`` if it is
+                the last frame in the animation.
+
+        '''
+        self.cache = cache
+        self.index = index
+        self.duration = duration
+        self._image = None
+
+    def _get_image(self):
+        if self._image is not None:
+            return self._image
+        return self.cache.get_frame(self.index)
+
+    def _set_image(self, image):
+        self._image = image
+
+    image = property(_get_image, _set_image,
+                     doc='''The image of this frame.
+
+    Until an image is assigned, the frame is composed by the cache.
+
+    :type: `AbstractImage`
+    ''')
+
+class GIFImageDecoder(ImageDecoder):
+    def __init__(self, cache_budget=DEFAULT_CACHE_BUDGET):
+        self.cache_budget = cache_budget
+
+    def get_file_extensions(self):
+        return ['.gif']
+
+    def get_animation_file_extensions(self):
+        return ['.gif']
+
+    def get_file_signatures(self):
+        return ['GIF87a', 'GIF89a']
+
+    def decode(self, file, filename):
+        stream = read(file)
+        return GIFFrameCache(stream, 0).get_frame(0)
+
+    def decode_animation(self, file, filename):
+        stream = read(file)
+        cache = GIFFrameCache(stream, self.cache_budget)
+        frames = [GIFAnimationFrame(cache, i, image.delay or DEFAULT_DELAY)
+                  for i, image in enumerate(stream.images)]
+        return Animation(frames)
+
+def get_decoders():
+    return [GIFImageDecoder()]
+
+def get_encoders():
+    return []
@@ -33,12 +33,21 @@
 # ----------------------------------------------------------------------------
 
 '''Encoder and decoder for PNG files, using PyPNG (pypng.py).
+
+Non-interlaced images with 8 bits per sample, which are the most common, are
+decoded by a faster reader in this module.  It decompresses the image data
+incrementally into a preallocated buffer, and reverses the scanline filters
+a row at a time.  The other images are decoded by PyPNG.
 '''
 
 __docformat__ = 'restructuredtext'
 __version__ = '$Id: $'
 
 import array
+import binascii
+import struct
+import zlib
+from StringIO import StringIO
 
 from pyglet.gl import *
 from pyglet.image import *
@@ -46,13 +55,224 @@ from pyglet.image.codecs import *
 
 import pyglet.image.codecs.pypng
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_signature = struct.pack('8B', 137, 80, 78, 71, 13, 10, 26, 10)
+
+# Number of samples per pixel for each supported colour type.
+_color_type_planes = {
+    0: 1,   # greyscale
+    2: 3,   # RGB
+    4: 2,   # greyscale with alpha
+    6: 4,   # RGBA
+}
+
+class _UnsupportedPNG(Exception):
+    # The image is valid but must be decoded by PyPNG.
+    pass
+
+# Masks for adding every byte of two rows at once, keyed by row length.
+_byte_masks = {}
+
+def _get_byte_masks(length):
+    try:
+        return _byte_masks[length]
+    except KeyError:
+        masks = (int('7f' * length, 16), int('80' * length, 16))
+        _byte_masks[length] = masks
+        return masks
+
+def _to_int(line):
+    return int(binascii.hexlify(line), 16)
+
+def _from_int(value, length):
+    return binascii.unhexlify('%0*x' % (length * 2, value))
+
+def _add_bytes(x, y, low, high):
+    # Add corresponding bytes of x and y modulo 256.  Carries out of the low
+    # 7 bits of each byte are kept within the byte by the masks.
+    return ((x & low) + (y & low)) ^ ((x ^ y) & high)
+
+def _unfilter_sub(line, prior, psize):
+    length = len(line)
+    low, high = _get_byte_masks(length)
+    # Prefix sum of each sample with the previous samples of the same
+    # channel, in log2(width) steps.
+    value = _to_int(line)
+    shift = psize
+    while shift < length:
+        value = _add_bytes(value, value >> (shift * 8), low, high)
+        shift *= 2
+    return _from_int(value, length)
+
+def _unfilter_up(line, prior, psize):
+    length = len(line)
+    low, high = _get_byte_masks(length)
+    return _from_int(_add_bytes(_to_int(line), _to_int(prior), low, high),
+                     length)
+
+def _unfilter_average(line, prior, psize):
+    line = bytearray(line)
+    prior = bytearray(prior)
+    for i in range(psize):
+        line[i] = (line[i] + (prior[i] >> 1)) & 0xff
+    for i in range(psize, len(line)):
+        line[i] = (line[i] + ((line[i - psize] + prior[i]) >> 1)) & 0xff
+    return bytes(line)
+
+def _unfilter_paeth(line, prior, psize):
+    line = bytearray(line)
+    prior = bytearray(prior)
+    for i in range(psize):
+        line[i] = (line[i] + prior[i]) & 0xff
+    for i in range(psize, len(line)):
+        a = line[i - psize]
+        b = prior[i]
+        c = prior[i - psize]
+        pa = b - c
+        pb = a - c
+        pc = pa + pb
+        if pa < 0:
+            pa = -pa
+        if pb < 0:
+            pb = -pb
+        if pc < 0:
+            pc = -pc
+        if pa <= pb and pa <= pc:
+            line[i] = (line[i] + a) & 0xff
+        elif pb <= pc:
+            line[i] = (line[i] + b) & 0xff
+        else:
+            line[i] = (line[i] + c) & 0xff
+    return bytes(line)
+
+_unfilters = {
+    1: _unfilter_sub,
+    2: _unfilter_up,
+    3: _unfilter_average,
+    4: _unfilter_paeth,
+}
+
+def _unfilter_sub_numpy(line, prior, psize):
+    line = numpy.frombuffer(line, numpy.uint8).reshape((-1, psize))
+    return numpy.cumsum(line, axis=0, dtype=numpy.uint8).tostring()
+
+def _unfilter_up_numpy(line, prior, psize):
+    return (numpy.frombuffer(line, numpy.uint8) +
+            numpy.frombuffer(prior, numpy.uint8)).tostring()
+
+_unfilters_numpy = {
+    1: _unfilter_sub_numpy,
+    2: _unfilter_up_numpy,
+    3: _unfilter_average,
+    4: _unfilter_paeth,
+}
+
+def _read_chunks(file):
+    # Yield the tag and data of each chunk up to IEND.
+    while True:
+        header = file.read(8)
+        if len(header) != 8:
+            raise ImageDecodeException('Chunk too short for header')
+        length, tag = struct.unpack('!I4s', header)
+        data = file.read(length)
+        checksum = file.read(4)
+        if len(data) != length or len(checksum) != 4:
+            raise ImageDecodeException('Chunk %s is truncated' % tag)
+        if zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff != \
+           struct.unpack('!I', checksum)[0]:
+            raise ImageDecodeException('Checksum error in %s chunk' % tag)
+        yield tag, data
+        if tag == 'IEND':
+            break
+
+def _decompress_chunks(chunks):
+    # Yield the decompressed image data as each IDAT chunk is read.
+    decompressor = zlib.decompressobj()
+    for tag, data in chunks:
+        if tag == 'IDAT':
+            yield decompressor.decompress(data)
+    yield decompressor.flush()
+
+def _decode(file):
+    '''Decode a non-interlaced PNG file with 8 bits per sample.
+
+    Scanlines are reconstructed as soon as they have been decompressed, so
+    the whole decompressed image is never held in memory.
+
+    :rtype: (int, int, int, bytearray)
+    :return: width, height, colour type and the pixel rows, top row first.
+    '''
+    if file.read(8) != _signature:
+        raise ImageDecodeException('PNG file has invalid header')
+    chunks = _read_chunks(file)
+    tag, data = chunks.next()
+    if tag != 'IHDR' or len(data) != 13:
+        raise ImageDecodeException('PNG file has no IHDR chunk')
+    (width, height, bit_depth, color_type, compression_method,
+     filter_method, interlace_method) = struct.unpack('!2I5B', data)
+    if (bit_depth != 8 or color_type not in _color_type_planes or
+        compression_method != 0 or filter_method != 0 or interlace_method):
+        raise _UnsupportedPNG()
+
+    psize = _color_type_planes[color_type]
+    row_bytes = width * psize
+    if numpy is not None:
+        unfilters = _unfilters_numpy
+    else:
+        unfilters = _unfilters
+
+    pixels = bytearray(row_bytes * height)
+    prior = '\0' * row_bytes
+    pending = ''
+    offset = 0
+    end = len(pixels)
+    for data in _decompress_chunks(chunks):
+        pending += data
+        start = 0
+        while len(pending) - start > row_bytes and offset < end:
+            filter_type = ord(pending[start])
+            line = pending[start + 1:start + 1 + row_bytes]
+            if filter_type:
+                try:
+                    line = unfilters[filter_type](line, prior, psize)
+                except KeyError:
+                    raise ImageDecodeException(
+                        'Unknown filter type %d' % filter_type)
+            pixels[offset:offset + row_bytes] = line
+            prior = line
+            offset += row_bytes
+            start += row_bytes + 1
+        pending = pending[start:]
+    if offset != end:
+        raise ImageDecodeException('PNG image data is truncated')
+    return width, height, color_type, pixels
+
 class PNGImageDecoder(ImageDecoder):
     def get_file_extensions(self):
         return ['.png']
 
+    def get_file_signatures(self):
+        return ['\x89PNG\r\n\x1a\n']
+
     def decode(self, file, filename):
+        data = file.read()
+        try:
+            width, height, color_type, pixels = _decode(StringIO(data))
+            format = {0: 'L', 2: 'RGB', 4: 'LA', 6: 'RGBA'}[color_type]
+            return ImageData(width, height, format, pixels,
+                             -width * len(format))
+        except _UnsupportedPNG:
+            pass
+        except ImageDecodeException, e:
+            raise ImageDecodeException(
+                'Cannot read %r: %s' % (filename or file, e))
+
         try:
-            reader = pyglet.image.codecs.pypng.Reader(file=file)
+            reader = pyglet.image.codecs.pypng.Reader(file=StringIO(data))
             width, height, pixels, metadata = reader.read()
         except Exception, e:
             raise ImageDecodeException(
@@ -69,7 +289,7 @@ class PNGImageDecoder(ImageDecoder):
             else:
                 format = 'RGB'
         pitch = len(format) * width
-        return ImageData(width, height, format, pixels.tostring(), -pitch)
+        return ImageData(width, height, format, pixels, -pitch)
 
 class PNGImageEncoder(ImageEncoder):
     def get_file_extensions(self):
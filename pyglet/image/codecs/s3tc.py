@@ -33,20 +33,31 @@
 # ----------------------------------------------------------------------------
 # $Id:$
 
-'''Software decoder for S3TC compressed texture (i.e., DDS).
+'''Software decoder and encoder for S3TC compressed texture (i.e., DDS).
+
+The decoders are used when the driver does not support S3TC.  Each block's
+palette is computed once and rows of four pixels are looked up from it, so no
+per-pixel arithmetic is done in Python.  If NumPy is installed, all blocks
+are decoded at once instead.
+
+The encoders choose each block's endpoints from the range of its colours,
+and are intended for saving images rather than for high quality offline
+compression.
 
 http://oss.sgi.com/projects/ogl-sample/registry/EXT/texture_compression_s3tc.txt
 '''
 
 import ctypes
-import re
+import struct
 
 from pyglet.gl import *
 from pyglet.gl import gl_info
-from pyglet.image import AbstractImage, Texture
+from pyglet.image import AbstractImage, ImageData, Texture
 
-split_8byte = re.compile('.' * 8, flags=re.DOTALL)
-split_16byte = re.compile('.' * 16, flags=re.DOTALL)
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class PackedImageData(AbstractImage):
     _current_texture = None
@@ -97,291 +108,430 @@ class PackedImageData(AbstractImage):
            a more detailed documentation of the method. '''
         return self._get_texture()
 
+_chr = [chr(i) for i in range(256)]
+
+# Palette indices of the four pixels in a row of a colour block, for each
+# value of the row's byte.
+_color_row_codes = [(b & 3, (b >> 2) & 3, (b >> 4) & 3, b >> 6)
+                    for b in range(256)]
+
+# Alpha values of the two pixels in each byte of an explicit alpha block.
+_dxt3_alpha_pairs = [_chr[(b & 0xf) * 17] + _chr[(b >> 4) * 17]
+                     for b in range(256)]
+
+# Palette indices of the four pixels in a 12-bit row of an interpolated
+# alpha block.
+_alpha_row_codes = [(v & 7, (v >> 3) & 7, (v >> 6) & 7, v >> 9)
+                    for v in range(4096)]
+
+def _expand_565(color):
+    r = color >> 11
+    g = (color >> 5) & 0x3f
+    b = color & 0x1f
+    return (r << 3 | r >> 2, g << 2 | g >> 4, b << 3 | b >> 2)
+
+def _pack_565(r, g, b):
+    return (r >> 3) << 11 | (g >> 2) << 5 | b >> 3
+
+def _get_color_palette(color0, color1, four_color, transparent):
+    # Return the four RGBA colours of a colour block.  DXT3 and DXT5 blocks
+    # always use four colours; DXT1 blocks use three colours and black when
+    # color0 <= color1.
+    r0, g0, b0 = _expand_565(color0)
+    r1, g1, b1 = _expand_565(color1)
+    if four_color or color0 > color1:
+        return [(r0, g0, b0, 255),
+                (r1, g1, b1, 255),
+                ((2 * r0 + r1) // 3, (2 * g0 + g1) // 3,
+                 (2 * b0 + b1) // 3, 255),
+                ((r0 + 2 * r1) // 3, (g0 + 2 * g1) // 3,
+                 (b0 + 2 * b1) // 3, 255)]
+    elif transparent:
+        return [(r0, g0, b0, 255),
+                (r1, g1, b1, 255),
+                ((r0 + r1) // 2, (g0 + g1) // 2, (b0 + b1) // 2, 255),
+                (0, 0, 0, 0)]
+    else:
+        return [(r0, g0, b0, 255),
+                (r1, g1, b1, 255),
+                ((r0 + r1) // 2, (g0 + g1) // 2, (b0 + b1) // 2, 255),
+                (0, 0, 0, 255)]
+
+def _get_alpha_palette(alpha0, alpha1):
+    # Return the eight alpha values of an interpolated alpha block.
+    if alpha0 > alpha1:
+        return [alpha0, alpha1] + \
+            [((7 - i) * alpha0 + i * alpha1) // 7 for i in range(1, 7)]
+    else:
+        return [alpha0, alpha1] + \
+            [((5 - i) * alpha0 + i * alpha1) // 5 for i in range(1, 5)] + \
+            [0, 255]
+
+def _decode_color_blocks(data, width, height, offset, stride, four_color,
+                         components):
+    # Decode the colour blocks of `data` to rows of RGB or RGBA pixels,
+    # bottom row first.  Rows of four pixels are cached for each distinct
+    # pair of endpoints.
+    blocks_x = (width + 3) // 4
+    row_bytes = width * components
+    rows = []
+    palettes = {}
+    i = offset
+    for block_y in range((height + 3) // 4):
+        block_rows = ([], [], [], [])
+        for block_x in range(blocks_x):
+            endpoints = data[i:i + 4]
+            try:
+                palette, cache = palettes[endpoints]
+            except KeyError:
+                color0, color1 = struct.unpack('<HH', endpoints)
+                palette = _get_color_palette(color0, color1, four_color,
+                                             components == 4)
+                palette = [''.join([_chr[c] for c in color[:components]])
+                           for color in palette]
+                cache = [None] * 256
+                palettes[endpoints] = palette, cache
+            for y in range(4):
+                code = ord(data[i + 4 + y])
+                row = cache[code]
+                if row is None:
+                    c0, c1, c2, c3 = _color_row_codes[code]
+                    row = cache[code] = \
+                        palette[c0] + palette[c1] + palette[c2] + palette[c3]
+                block_rows[y].append(row)
+            i += stride
+        for block_row in block_rows:
+            rows.append(''.join(block_row)[:row_bytes])
+    return rows[:height]
+
+def _decode_explicit_alpha_blocks(data, width, height):
+    # Decode the alpha blocks of DXT3 data to rows of alpha values.
+    blocks_x = (width + 3) // 4
+    rows = []
+    pairs = _dxt3_alpha_pairs
+    i = 0
+    for block_y in range((height + 3) // 4):
+        block_rows = ([], [], [], [])
+        for block_x in range(blocks_x):
+            for y in range(4):
+                j = i + y * 2
+                block_rows[y].append(pairs[ord(data[j])] +
+                                     pairs[ord(data[j + 1])])
+            i += 16
+        for block_row in block_rows:
+            rows.append(''.join(block_row)[:width])
+    return rows[:height]
+
+def _decode_interpolated_alpha_blocks(data, width, height):
+    # Decode the alpha blocks of DXT5 data to rows of alpha values.
+    blocks_x = (width + 3) // 4
+    rows = []
+    palettes = {}
+    i = 0
+    for block_y in range((height + 3) // 4):
+        block_rows = ([], [], [], [])
+        for block_x in range(blocks_x):
+            endpoints = data[i:i + 2]
+            try:
+                palette, cache = palettes[endpoints]
+            except KeyError:
+                palette = [_chr[a] for a in
+                           _get_alpha_palette(ord(data[i]), ord(data[i + 1]))]
+                cache = {}
+                palettes[endpoints] = palette, cache
+            lo, hi = struct.unpack('<IH', data[i + 2:i + 8])
+            bits = lo | hi << 32
+            for y in range(4):
+                code = bits & 0xfff
+                try:
+                    row = cache[code]
+                except KeyError:
+                    a0, a1, a2, a3 = _alpha_row_codes[code]
+                    row = cache[code] = \
+                        palette[a0] + palette[a1] + palette[a2] + palette[a3]
+                block_rows[y].append(row)
+                bits >>= 12
+            i += 16
+        for block_row in block_rows:
+            rows.append(''.join(block_row)[:width])
+    return rows[:height]
+
+def _merge_alpha(rgb, alpha, width, height):
+    rgba = bytearray(width * height * 4)
+    rgb = bytearray(rgb)
+    rgba[0::4] = rgb[0::3]
+    rgba[1::4] = rgb[1::3]
+    rgba[2::4] = rgb[2::3]
+    rgba[3::4] = alpha
+    return str(rgba)
+
+def _get_blocks_numpy(data, width, height, stride):
+    blocks_x = (width + 3) // 4
+    blocks_y = (height + 3) // 4
+    count = blocks_x * blocks_y
+    return numpy.frombuffer(data, numpy.uint8, count * stride).reshape(
+        (count, stride))
+
+def _assemble_numpy(pixels, width, height):
+    # Arrange (block, pixel, component) values into image rows.
+    blocks_x = (width + 3) // 4
+    blocks_y = (height + 3) // 4
+    components = pixels.shape[2]
+    pixels = pixels.reshape((blocks_y, blocks_x, 4, 4, components))
+    pixels = pixels.transpose((0, 2, 1, 3, 4)).reshape(
+        (blocks_y * 4, blocks_x * 4, components))
+    return numpy.ascontiguousarray(pixels[:height, :width]).tostring()
+
+def _decode_color_blocks_numpy(blocks, four_color, transparent):
+    count = len(blocks)
+    colors = numpy.ascontiguousarray(blocks[:, 0:4]).view('<u2').astype(
+        numpy.int32)
+    color0 = colors[:, 0]
+    color1 = colors[:, 1]
+
+    def expand(color):
+        r = color >> 11
+        g = (color >> 5) & 0x3f
+        b = color & 0x1f
+        return numpy.column_stack((r << 3 | r >> 2, g << 2 | g >> 4,
+                                   b << 3 | b >> 2))
+    e0 = expand(color0)
+    e1 = expand(color1)
+
+    palette = numpy.empty((count, 4, 4), numpy.int32)
+    palette[:, :, 3] = 255
+    palette[:, 0, :3] = e0
+    palette[:, 1, :3] = e1
+    palette[:, 2, :3] = (2 * e0 + e1) // 3
+    palette[:, 3, :3] = (e0 + 2 * e1) // 3
+    if not four_color:
+        three_color = color0 <= color1
+        palette[three_color, 2, :3] = (e0[three_color] + e1[three_color]) // 2
+        palette[three_color, 3, :3] = 0
+        if transparent:
+            palette[three_color, 3, 3] = 0
+
+    bits = numpy.ascontiguousarray(blocks[:, 4:8]).view('<u4').astype(
+        numpy.int64)
+    codes = (bits >> (2 * numpy.arange(16))) & 3
+    return palette[numpy.arange(count)[:, None], codes].astype(numpy.uint8)
+
+def _decode_explicit_alpha_blocks_numpy(blocks):
+    alpha = numpy.empty((len(blocks), 16), numpy.uint8)
+    alpha[:, 0::2] = (blocks[:, 0:8] & 0xf) * 17
+    alpha[:, 1::2] = (blocks[:, 0:8] >> 4) * 17
+    return alpha
+
+def _decode_interpolated_alpha_blocks_numpy(blocks):
+    count = len(blocks)
+    alpha0 = blocks[:, 0].astype(numpy.int32)[:, None]
+    alpha1 = blocks[:, 1].astype(numpy.int32)[:, None]
+    i = numpy.arange(1, 7)
+    palette = numpy.empty((count, 8), numpy.int32)
+    palette[:, 0:1] = alpha0
+    palette[:, 1:2] = alpha1
+    palette[:, 2:] = ((7 - i) * alpha0 + i * alpha1) // 7
+    five = (alpha0 <= alpha1)[:, 0]
+    i = numpy.arange(1, 5)
+    palette[five, 2:6] = ((5 - i) * alpha0[five] + i * alpha1[five]) // 5
+    palette[five, 6] = 0
+    palette[five, 7] = 255
+
+    bits = numpy.zeros(count, numpy.int64)
+    for j in range(6):
+        bits |= blocks[:, 2 + j].astype(numpy.int64) << (8 * j)
+    codes = (bits[:, None] >> (3 * numpy.arange(16))) & 7
+    return palette[numpy.arange(count)[:, None], codes].astype(numpy.uint8)
+
 def decode_dxt1_rgb(data, width, height):
-    # Decode to 16-bit RGB UNSIGNED_SHORT_5_6_5
-    out = (ctypes.c_uint16 * (width * height))()
-
-    # Read 8 bytes at a time
-    image_offset = 0
-    for c0_lo, c0_hi, c1_lo, c1_hi, b0, b1, b2, b3 in split_8byte.findall(data):
-        color0 = ord(c0_lo) | ord(c0_hi) << 8
-        color1 = ord(c1_lo) | ord(c1_hi) << 8
-        bits = ord(b0) | ord(b1) << 8 | ord(b2) << 16 | ord(b3) << 24
-
-        r0 = color0 & 0x1f
-        g0 = (color0 & 0x7e0) >> 5
-        b0 = (color0 & 0xf800) >> 11
-        r1 = color1 & 0x1f
-        g1 = (color1 & 0x7e0) >> 5
-        b1 = (color1 & 0xf800) >> 11
-
-        # i is the dest ptr for this block
-        i = image_offset
-        for y in range(4):
-            for x in range(4):
-                code = bits & 0x3
-
-                if code == 0:
-                    out[i] = color0
-                elif code == 1:
-                    out[i] = color1
-                elif code == 3 and color0 <= color1:
-                    out[i] = 0
-                else:
-                    if code == 2 and color0 > color1:
-                        r = (2 * r0 + r1) / 3
-                        g = (2 * g0 + g1) / 3
-                        b = (2 * b0 + b1) / 3
-                    elif code == 3 and color0 > color1:
-                        r = (r0 + 2 * r1) / 3
-                        g = (g0 + 2 * g1) / 3
-                        b = (b0 + 2 * b1) / 3
-                    else:
-                        assert code == 2 and color0 <= color1
-                        r = (r0 + r1) / 2
-                        g = (g0 + g1) / 2
-                        b = (b0 + b1) / 2
-                    out[i] = r | g << 5 | b << 11
-
-                bits >>= 2
-                i += 1
-            i += width - 4
-
-        # Move dest ptr to next 4x4 block
-        advance_row = (image_offset + 4) % width == 0
-        image_offset += width * 3 * advance_row + 4
-
-    return PackedImageData(width, height, 
-        GL_RGB, GL_UNSIGNED_SHORT_5_6_5, out)
+    '''Decode DXT1 data to an RGB `ImageData`.'''
+    if numpy is not None:
+        blocks = _get_blocks_numpy(data, width, height, 8)
+        pixels = _decode_color_blocks_numpy(blocks, False, False)[:, :, :3]
+        data = _assemble_numpy(pixels, width, height)
+    else:
+        data = ''.join(_decode_color_blocks(data, width, height, 0, 8,
+                                            False, 3))
+    return ImageData(width, height, 'RGB', data)
 
 def decode_dxt1_rgba(data, width, height):
-    # Decode to GL_RGBA
-    out = (ctypes.c_ubyte * (width * height * 4))()
-    pitch = width << 2
-
-    # Read 8 bytes at a time
-    image_offset = 0
-    for c0_lo, c0_hi, c1_lo, c1_hi, b0, b1, b2, b3 in split_8byte.findall(data):
-        color0 = ord(c0_lo) | ord(c0_hi) << 8
-        color1 = ord(c1_lo) | ord(c1_hi) << 8
-        bits = ord(b0) | ord(b1) << 8 | ord(b2) << 16 | ord(b3) << 24
-
-        r0 = color0 & 0x1f
-        g0 = (color0 & 0x7e0) >> 5
-        b0 = (color0 & 0xf800) >> 11
-        r1 = color1 & 0x1f
-        g1 = (color1 & 0x7e0) >> 5
-        b1 = (color1 & 0xf800) >> 11
-
-        # i is the dest ptr for this block
-        i = image_offset
-        for y in range(4):
-            for x in range(4):
-                code = bits & 0x3
-                a = 255
-
-                if code == 0:
-                    r, g, b = r0, g0, b0
-                elif code == 1:
-                    r, g, b = r1, g1, b1
-                elif code == 3 and color0 <= color1:
-                    r = g = b = a = 0
-                else:
-                    if code == 2 and color0 > color1:
-                        r = (2 * r0 + r1) / 3
-                        g = (2 * g0 + g1) / 3
-                        b = (2 * b0 + b1) / 3
-                    elif code == 3 and color0 > color1:
-                        r = (r0 + 2 * r1) / 3
-                        g = (g0 + 2 * g1) / 3
-                        b = (b0 + 2 * b1) / 3
-                    else:
-                        assert code == 2 and color0 <= color1
-                        r = (r0 + r1) / 2
-                        g = (g0 + g1) / 2
-                        b = (b0 + b1) / 2
-
-                out[i] = b << 3
-                out[i+1] = g << 2
-                out[i+2] = r << 3
-                out[i+3] = a << 4
-
-                bits >>= 2
-                i += 4
-            i += pitch - 16
-
-        # Move dest ptr to next 4x4 block
-        advance_row = (image_offset + 16) % pitch == 0
-        image_offset += pitch * 3 * advance_row + 16
-
-    return PackedImageData(width, height, GL_RGBA, GL_UNSIGNED_BYTE, out)
-
+    '''Decode DXT1 data with 1-bit alpha to an RGBA `ImageData`.'''
+    if numpy is not None:
+        blocks = _get_blocks_numpy(data, width, height, 8)
+        pixels = _decode_color_blocks_numpy(blocks, False, True)
+        data = _assemble_numpy(pixels, width, height)
+    else:
+        data = ''.join(_decode_color_blocks(data, width, height, 0, 8,
+                                            False, 4))
+    return ImageData(width, height, 'RGBA', data)
 
 def decode_dxt3(data, width, height):
-    # Decode to GL_RGBA
-    out = (ctypes.c_ubyte * (width * height * 4))()
-    pitch = width << 2
-
-    # Read 16 bytes at a time
-    image_offset = 0
-    for (a0, a1, a2, a3, a4, a5, a6, a7,
-         c0_lo, c0_hi, c1_lo, c1_hi, 
-         b0, b1, b2, b3) in split_16byte.findall(data):
-        color0 = ord(c0_lo) | ord(c0_hi) << 8
-        color1 = ord(c1_lo) | ord(c1_hi) << 8
-        bits = ord(b0) | ord(b1) << 8 | ord(b2) << 16 | ord(b3) << 24
-        alpha = ord(a0) | ord(a1) << 8 | ord(a2) << 16 | ord(a3) << 24 | \
-            ord(a4) << 32 | ord(a5) << 40 | ord(a6) << 48 | ord(a7) << 56
-
-        r0 = color0 & 0x1f
-        g0 = (color0 & 0x7e0) >> 5
-        b0 = (color0 & 0xf800) >> 11
-        r1 = color1 & 0x1f
-        g1 = (color1 & 0x7e0) >> 5
-        b1 = (color1 & 0xf800) >> 11
-
-        # i is the dest ptr for this block
-        i = image_offset
-        for y in range(4):
-            for x in range(4):
-                code = bits & 0x3
-                a = alpha & 0xf
-
-                if code == 0:
-                    r, g, b = r0, g0, b0
-                elif code == 1:
-                    r, g, b = r1, g1, b1
-                elif code == 3 and color0 <= color1:
-                    r = g = b = 0
-                else:
-                    if code == 2 and color0 > color1:
-                        r = (2 * r0 + r1) / 3
-                        g = (2 * g0 + g1) / 3
-                        b = (2 * b0 + b1) / 3
-                    elif code == 3 and color0 > color1:
-                        r = (r0 + 2 * r1) / 3
-                        g = (g0 + 2 * g1) / 3
-                        b = (b0 + 2 * b1) / 3
-                    else:
-                        assert code == 2 and color0 <= color1
-                        r = (r0 + r1) / 2
-                        g = (g0 + g1) / 2
-                        b = (b0 + b1) / 2
-
-                out[i] = b << 3
-                out[i+1] = g << 2
-                out[i+2] = r << 3
-                out[i+3] = a << 4
-
-                bits >>= 2
-                alpha >>= 4
-                i += 4
-            i += pitch - 16
-
-        # Move dest ptr to next 4x4 block
-        advance_row = (image_offset + 16) % pitch == 0
-        image_offset += pitch * 3 * advance_row + 16
-
-    return PackedImageData(width, height, GL_RGBA, GL_UNSIGNED_BYTE, out)
+    '''Decode DXT3 data to an RGBA `ImageData`.'''
+    if numpy is not None:
+        blocks = _get_blocks_numpy(data, width, height, 16)
+        pixels = _decode_color_blocks_numpy(blocks[:, 8:], True, False)
+        pixels[:, :, 3] = _decode_explicit_alpha_blocks_numpy(blocks)
+        data = _assemble_numpy(pixels, width, height)
+    else:
+        rgb = ''.join(_decode_color_blocks(data, width, height, 8, 16,
+                                           True, 3))
+        alpha = ''.join(_decode_explicit_alpha_blocks(data, width, height))
+        data = _merge_alpha(rgb, alpha, width, height)
+    return ImageData(width, height, 'RGBA', data)
 
 def decode_dxt5(data, width, height):
-    # Decode to GL_RGBA
-    out = (ctypes.c_ubyte * (width * height * 4))()
-    pitch = width << 2
-
-    # Read 16 bytes at a time
-    image_offset = 0
-    for (alpha0, alpha1, ab0, ab1, ab2, ab3, ab4, ab5, 
-         c0_lo, c0_hi, c1_lo, c1_hi, 
-         b0, b1, b2, b3) in split_16byte.findall(data):
-        color0 = ord(c0_lo) | ord(c0_hi) << 8
-        color1 = ord(c1_lo) | ord(c1_hi) << 8
-        alpha0 = ord(alpha0)
-        alpha1 = ord(alpha1)
-        bits = ord(b0) | ord(b1) << 8 | ord(b2) << 16 | ord(b3) << 24
-        abits = ord(ab0) | ord(ab1) << 8 | ord(ab2) << 16 | ord(ab3) << 24 | \
-            ord(ab4) << 32 | ord(ab5) << 40
-
-        r0 = color0 & 0x1f
-        g0 = (color0 & 0x7e0) >> 5
-        b0 = (color0 & 0xf800) >> 11
-        r1 = color1 & 0x1f
-        g1 = (color1 & 0x7e0) >> 5
-        b1 = (color1 & 0xf800) >> 11
-
-        # i is the dest ptr for this block
-        i = image_offset
-        for y in range(4):
-            for x in range(4):
-                code = bits & 0x3
-                acode = abits & 0x7
-
-                if code == 0:
-                    r, g, b = r0, g0, b0
-                elif code == 1:
-                    r, g, b = r1, g1, b1
-                elif code == 3 and color0 <= color1:
-                    r = g = b = 0
-                else:
-                    if code == 2 and color0 > color1:
-                        r = (2 * r0 + r1) / 3
-                        g = (2 * g0 + g1) / 3
-                        b = (2 * b0 + b1) / 3
-                    elif code == 3 and color0 > color1:
-                        r = (r0 + 2 * r1) / 3
-                        g = (g0 + 2 * g1) / 3
-                        b = (b0 + 2 * b1) / 3
-                    else:
-                        assert code == 2 and color0 <= color1
-                        r = (r0 + r1) / 2
-                        g = (g0 + g1) / 2
-                        b = (b0 + b1) / 2
-                
-                if acode == 0:
-                    a = alpha0
-                elif acode == 1:
-                    a = alpha1
-                elif alpha0 > alpha1:
-                    if acode == 2:
-                        a = (6 * alpha0 + 1 * alpha1) / 7
-                    elif acode == 3:
-                        a = (5 * alpha0 + 2 * alpha1) / 7
-                    elif acode == 4:
-                        a = (4 * alpha0 + 3 * alpha1) / 7
-                    elif acode == 5:
-                        a = (3 * alpha0 + 4 * alpha1) / 7
-                    elif acode == 6:
-                        a = (2 * alpha0 + 5 * alpha1) / 7
-                    else:
-                        assert acode == 7
-                        a = (1 * alpha0 + 6 * alpha1) / 7
-                else:
-                    if acode == 2:
-                        a = (4 * alpha0 + 1 * alpha1) / 5
-                    elif acode == 3:
-                        a = (3 * alpha0 + 2 * alpha1) / 5
-                    elif acode == 4:
-                        a = (2 * alpha0 + 3 * alpha1) / 5
-                    elif acode == 5:
-                        a = (1 * alpha0 + 4 * alpha1) / 5
-                    elif acode == 6:
-                        a = 0
-                    else:
-                        assert acode == 7
-                        a = 255
-
-                out[i] = b << 3
-                out[i+1] = g << 2
-                out[i+2] = r << 3
-                out[i+3] = a
-
-                bits >>= 2
-                abits >>= 3
-                i += 4
-            i += pitch - 16
-
-        # Move dest ptr to next 4x4 block
-        advance_row = (image_offset + 16) % pitch == 0
-        image_offset += pitch * 3 * advance_row + 16
-
-    return PackedImageData(width, height, GL_RGBA, GL_UNSIGNED_BYTE, out)
+    '''Decode DXT5 data to an RGBA `ImageData`.'''
+    if numpy is not None:
+        blocks = _get_blocks_numpy(data, width, height, 16)
+        pixels = _decode_color_blocks_numpy(blocks[:, 8:], True, False)
+        pixels[:, :, 3] = _decode_interpolated_alpha_blocks_numpy(blocks)
+        data = _assemble_numpy(pixels, width, height)
+    else:
+        rgb = ''.join(_decode_color_blocks(data, width, height, 8, 16,
+                                           True, 3))
+        alpha = ''.join(_decode_interpolated_alpha_blocks(data, width,
+                                                          height))
+        data = _merge_alpha(rgb, alpha, width, height)
+    return ImageData(width, height, 'RGBA', data)
+
+def _get_blocks(data, width, height):
+    # Yield the 16 RGBA pixels of each 4x4 block of `data`, in the order
+    # they are stored in compressed data.  Pixels beyond the edges of the
+    # image repeat the last row or column.
+    pitch = width * 4
+    for block_y in range(0, height, 4):
+        ys = [min(block_y + y, height - 1) for y in range(4)]
+        for block_x in range(0, width, 4):
+            xs = [min(block_x + x, width - 1) * 4 for x in range(4)]
+            yield [struct.unpack('4B', data[y * pitch + x:y * pitch + x + 4])
+                   for y in ys for x in xs]
+
+def _get_nearest(palette, value, size):
+    # Index of the palette entry nearest to value, comparing the first
+    # `size` components.
+    best = 0
+    best_distance = None
+    for i, entry in enumerate(palette):
+        distance = 0
+        for j in range(size):
+            d = entry[j] - value[j]
+            distance += d * d
+        if best_distance is None or distance < best_distance:
+            best = i
+            best_distance = distance
+    return best
+
+def _get_endpoints(pixels):
+    # Return the two corners of the bounding box of the pixels' colours
+    # that lie on the diagonal closest to the direction the colours vary in.
+    lo = [min([p[i] for p in pixels]) for i in range(3)]
+    hi = [max([p[i] for p in pixels]) for i in range(3)]
+    ranges = [h - l for l, h in zip(lo, hi)]
+    axis = ranges.index(max(ranges))
+    mean = [sum([p[i] for p in pixels]) / float(len(pixels))
+            for i in range(3)]
+    for i in range(3):
+        covariance = sum([(p[axis] - mean[axis]) * (p[i] - mean[i])
+                          for p in pixels])
+        if covariance < 0:
+            lo[i], hi[i] = hi[i], lo[i]
+    return _pack_565(*lo), _pack_565(*hi)
+
+def _encode_color_block(pixels, punch_through):
+    # If punch_through is True (DXT1 with alpha), blocks with transparent
+    # pixels use the three colour mode.
+    opaque = [p for p in pixels if not punch_through or p[3] >= 128]
+    if not opaque:
+        return struct.pack('<HHI', 0, 0, 0xffffffff)
+    lo, hi = _get_endpoints(opaque)
+    if lo > hi:
+        lo, hi = hi, lo
+    transparent = len(opaque) < len(pixels)
+    if transparent:
+        color0, color1 = lo, hi
+    else:
+        color0, color1 = hi, lo
+        if color0 == color1:
+            return struct.pack('<HHI', color0, color1, 0)
+
+    palette = _get_color_palette(color0, color1, not transparent,
+                                 transparent)
+    if transparent:
+        palette = palette[:3]
+    bits = 0
+    for i, pixel in enumerate(pixels):
+        if transparent and pixel[3] < 128:
+            code = 3
+        else:
+            code = _get_nearest(palette, pixel, 3)
+        bits |= code << (i * 2)
+    return struct.pack('<HHI', color0, color1, bits)
+
+def _encode_alpha_block(pixels):
+    alphas = [p[3] for p in pixels]
+    alpha0 = max(alphas)
+    alpha1 = min(alphas)
+    bits = 0
+    if alpha0 != alpha1:
+        palette = [(a,) for a in _get_alpha_palette(alpha0, alpha1)]
+        for i, alpha in enumerate(alphas):
+            bits |= _get_nearest(palette, (alpha,), 1) << (i * 3)
+    return struct.pack('<BBIH', alpha0, alpha1, bits & 0xffffffff,
+                       bits >> 32)
+
+def _get_rgba_data(data, width, height):
+    if isinstance(data, AbstractImage):
+        data = data.get_image_data().get_data('RGBA', width * 4)
+    return data
+
+def encode_dxt1(data, width, height, alpha=False):
+    '''Compress RGBA image data with DXT1.
+
+    :Parameters:
+        `data` : str or `AbstractImage`
+            RGBA image data with a pitch of ``width * 4``, bottom row first,
+            or an image to compress.
+        `width` : int
+            Width of the image.
+        `height` : int
+            Height of the image.
+        `alpha` : bool
+            If True, pixels with alpha less than 128 are made transparent;
+            otherwise alpha is ignored.
+
+    :rtype: str
+    '''
+    data = _get_rgba_data(data, width, height)
+    return ''.join([_encode_color_block(pixels, alpha)
+                    for pixels in _get_blocks(data, width, height)])
+
+def encode_dxt3(data, width, height):
+    '''Compress RGBA image data with DXT3.
+
+    Parameters are as for `encode_dxt1`.
+
+    :rtype: str
+    '''
+    data = _get_rgba_data(data, width, height)
+    result = []
+    for pixels in _get_blocks(data, width, height):
+        bits = 0
+        for i, pixel in enumerate(pixels):
+            bits |= ((pixel[3] + 8) // 17) << (i * 4)
+        result.append(struct.pack('<Q', bits))
+        result.append(_encode_color_block(pixels, False))
+    return ''.join(result)
+
+def encode_dxt5(data, width, height):
+    '''Compress RGBA image data with DXT5.
+
+    Parameters are as for `encode_dxt1`.
+
+    :rtype: str
+    '''
+    data = _get_rgba_data(data, width, height)
+    result = []
+    for pixels in _get_blocks(data, width, height):
+        result.append(_encode_alpha_block(pixels))
+        result.append(_encode_color_block(pixels, False))
+    return ''.join(result)
@@ -0,0 +1,294 @@
+# ----------------------------------------------------------------------------
+# pyglet
+# Copyright (c) 2006-2008 Alex Holkner
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions 
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright 
+#    notice, this list of conditions and the following disclaimer in
+#    the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of pyglet nor the names of its
+#    contributors may be used to endorse or promote products
+#    derived from this software without specific prior written
+#    permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+# ----------------------------------------------------------------------------
+
+'''Upload image data to textures over several frames.
+
+Uploading a large image with `Texture.blit_into` stalls the application until
+all of its data has been copied.  A `TextureUploadQueue` instead spreads
+uploads over several calls to `TextureUploadQueue.update`, copying no more
+than a given number of bytes in each, so that loading large images or
+streaming video does not cause long frames.
+
+Where pixel buffer objects are supported, the data is staged through a ring
+of pixel unpack buffers, so the driver can copy it to the texture without
+blocking.  Otherwise the data is uploaded from client memory.
+
+Example usage::
+
+    queue = TextureUploadQueue(budget=2 * 1024 * 1024)
+    pyglet.clock.schedule(queue.update)
+
+    texture = pyglet.image.Texture.create(background.width, background.height)
+    queue.put(background, texture)
+
+Uploads to the same position in the same texture replace each other if the
+earlier upload has not finished, so a queue fed with video frames never falls
+behind by more than one frame.  The replacing image is copied from the row
+the earlier upload had reached, wrapping around to the first row, so every
+row is updated even when frames arrive faster than the budget allows.
+
+:since: pyglet 1.2
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import collections
+
+import pyglet
+from pyglet.gl import *
+from pyglet.gl import gl_info
+from pyglet.graphics import vertexbuffer
+
+class _Upload(object):
+    def __init__(self, image, texture, x, y, z):
+        self.texture = texture
+        self.x = x
+        self.y = y
+        self.z = z
+        self.row = 0
+        self.set_image(image)
+
+    def set_image(self, image):
+        # A replacing image of the same size continues from the current row
+        # and wraps around to the first, so rows are not starved when images
+        # are replaced faster than they are uploaded.
+        self.image = image
+        self.pending_rows = image.height
+
+        # Upload in a format OpenGL accepts without conversion.
+        format = image.format
+        if image._get_gl_format_and_type(format)[0] is None:
+            format = {1: 'L', 2: 'LA', 3: 'RGB', 4: 'RGBA'}[len(format)]
+        self.format = format
+        self.pitch = image.width * len(format)
+
+    def get_pending_bytes(self):
+        return self.pending_rows * self.pitch
+
+class TextureUploadQueue(object):
+    '''Upload images to textures within a per-update byte budget.
+
+    Images are copied a band of rows at a time.  Each call to `update` copies
+    at most `budget` bytes, except that at least one row is always copied so
+    that every upload completes eventually.
+
+    :Ivariables:
+        `budget` : int
+            Maximum number of bytes to upload in each call to `update`.
+        `uploaded_bytes` : int
+            Total number of bytes uploaded by the queue.
+
+    '''
+    def __init__(self, budget=4 * 1024 * 1024, buffer_count=3,
+                 use_pbo=None):
+        '''Create an upload queue.
+
+        :Parameters:
+            `budget` : int
+                Maximum number of bytes to upload in each call to `update`.
+                The pixel unpack buffers are created with this size.
+            `buffer_count` : int
+                Number of pixel unpack buffers in the ring.
+            `use_pbo` : bool
+                If False, data is always uploaded from client memory.  If
+                None (the default), pixel buffer objects are used if the
+                current context supports them.
+
+        '''
+        if use_pbo is None:
+            use_pbo = (gl_info.have_version(2, 1) or
+                       gl_info.have_extension('GL_ARB_pixel_buffer_object'))
+        self.budget = budget
+        self.uploaded_bytes = 0
+        self._use_pbo = use_pbo and vertexbuffer._enable_vbo
+        self._buffer_count = buffer_count
+        self._buffers = []
+        self._buffer_index = 0
+        self._queue = collections.deque()
+        self._uploads = {}
+
+    def put(self, image, texture, x=0, y=0, z=0):
+        '''Queue an image to be copied into a texture.
+
+        The image is positioned as for `Texture.blit_into`.  If an upload to
+        the same position in `texture` is still pending, it is replaced by
+        this one.  The image data must not be modified until the upload has
+        completed.
+
+        :Parameters:
+            `image` : `AbstractImage`
+                Image to upload.  Its `get_image_data` method is called
+                immediately.
+            `texture` : `Texture`
+                Texture or texture region to copy the image into.
+            `x` : int
+                X coordinate of the image's anchor point in the texture.
+            `y` : int
+                Y coordinate of the image's anchor point in the texture.
+            `z` : int
+                Image slice to copy into, if `texture` is a 3D texture.
+
+        '''
+        image = image.get_image_data()
+        x -= image.anchor_x
+        y -= image.anchor_y
+        key = (id(texture), x, y, z)
+        upload = self._uploads.get(key)
+        if (upload and upload.texture is texture and
+            (upload.image.width, upload.image.height) ==
+            (image.width, image.height)):
+            upload.set_image(image)
+        else:
+            upload = _Upload(image, texture, x, y, z)
+            self._uploads[key] = upload
+            self._queue.append(upload)
+
+    def update(self, dt=None):
+        '''Upload queued images, up to the byte budget.
+
+        This method must be called with the OpenGL context of the queued
+        textures current.  Its signature allows it to be scheduled on the
+        clock directly.
+
+        :rtype: int
+        :return: The number of bytes uploaded.
+        '''
+        remaining = self.budget
+        uploaded = 0
+        while self._queue and remaining > 0:
+            upload = self._queue[0]
+            rows = min(remaining // upload.pitch, upload.pending_rows,
+                       upload.image.height - upload.row)
+            if not rows:
+                if uploaded:
+                    break
+                rows = 1
+            self._upload_rows(upload, rows)
+            upload.row += rows
+            upload.pending_rows -= rows
+            remaining -= rows * upload.pitch
+            uploaded += rows * upload.pitch
+            if upload.row >= upload.image.height:
+                upload.row = 0
+            if not upload.pending_rows:
+                self._queue.popleft()
+                key = (id(upload.texture), upload.x, upload.y, upload.z)
+                if self._uploads.get(key) is upload:
+                    del self._uploads[key]
+        self.uploaded_bytes += uploaded
+        return uploaded
+
+    def flush(self):
+        '''Upload all queued images immediately.'''
+        budget = self.budget
+        self.budget = self.pending_bytes
+        try:
+            self.update()
+        finally:
+            self.budget = budget
+
+    def clear(self):
+        '''Discard all queued uploads that have not completed.'''
+        self._queue.clear()
+        self._uploads.clear()
+
+    def delete(self):
+        '''Discard queued uploads and delete the pixel unpack buffers.'''
+        self.clear()
+        for buffer in self._buffers:
+            buffer.delete()
+        self._buffers = []
+
+    def _get_buffer(self):
+        # Use the buffers in turn, so that the driver may still be copying
+        # from the others.
+        if len(self._buffers) < self._buffer_count:
+            buffer = vertexbuffer.VertexBufferObject(self.budget,
+                GL_PIXEL_UNPACK_BUFFER, GL_STREAM_DRAW)
+            self._buffers.append(buffer)
+        else:
+            buffer = self._buffers[self._buffer_index]
+            self._buffer_index = (self._buffer_index + 1) % self._buffer_count
+        return buffer
+
+    def _upload_rows(self, upload, rows):
+        image = upload.image
+        band = image.get_region(0, upload.row, image.width, rows)
+        length = rows * upload.pitch
+        if not self._use_pbo or length > self.budget:
+            upload.texture.blit_into(band, upload.x, upload.y + upload.row,
+                                     upload.z)
+            return
+
+        data = band.get_data(upload.format, upload.pitch)
+        buffer = self._get_buffer()
+        # Orphan the previous contents rather than waiting for them to be
+        # copied to a texture.
+        buffer.set_data(None)
+        buffer.set_data_region(data, 0, length)
+
+        texture = upload.texture
+        owner = getattr(texture, 'owner', texture)
+        x = upload.x + texture.x
+        y = upload.y + upload.row + texture.y
+        z = upload.z + texture.z
+        format, type = image._get_gl_format_and_type(upload.format)
+
+        glBindTexture(owner.target, owner.id)
+        buffer.bind()
+        glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glPixelStorei(GL_UNPACK_ROW_LENGTH, 0)
+        if owner.target == GL_TEXTURE_3D:
+            glTexSubImage3D(owner.target, owner.level, x, y, z,
+                            image.width, rows, 1, format, type, None)
+        else:
+            glTexSubImage2D(owner.target, owner.level, x, y,
+                            image.width, rows, format, type, None)
+        glPopClientAttrib()
+        buffer.unbind()
+
+    depth = property(lambda self: len(self._queue),
+                     doc='''Number of uploads that have not completed.
+
+    :type: int
+    ''')
+
+    pending_bytes = property(
+        lambda self: sum([u.get_pending_bytes() for u in self._queue]),
+        doc='''Number of bytes that have not been uploaded yet.
+
+    :type: int
+    ''')
@@ -67,6 +67,13 @@ rather than streamed from disk by wrapping the source in a `StaticSource`::
 The other advantage of a `StaticSource` is that it can be queued on any number
 of players, and so played many times simultaneously.
 
+Static sources loaded from the same file share their decoded data.  If
+`audio_cache` is given a directory, the decoded data is kept in files there,
+which later runs of the application map into memory instead of decoding the
+sources again::
+
+    media.audio_cache.path = pyglet.resource.get_settings_path('MyGame')
+
 '''
 
 __docformat__ = 'restructuredtext'
@@ -74,13 +81,18 @@ __version__ = '$Id$'
 
 import atexit
 import ctypes
+import hashlib
 import heapq
+import mmap
+import os
 import sys
+import tempfile
 import threading
 import time
+import weakref
 
 import pyglet
-from pyglet.compat import bytes_type, BytesIO
+from pyglet.compat import bytes_type
 
 _debug = pyglet.options['debug_media']
 
@@ -312,6 +324,12 @@ class AudioData(object):
 
     This class is used internally by pyglet.
 
+    The data of a packet is not copied when it is consumed: `data` becomes
+    a view of the remaining bytes of the original data, which is kept
+    alive by the packet.  Packets from an `AudioDataPool` are given back
+    to the pool with `release` once an audio player has written their
+    data.
+
     :Ivariables:
         `data` : str or ctypes array or pointer
             Sample data.
@@ -326,7 +344,32 @@ class AudioData(object):
             timestamped relative to this audio packet.
 
     '''
-    def __init__(self, data, length, timestamp, duration, events):
+    _pool = None
+
+    def __init__(self, data, length, timestamp, duration, events, offset=0):
+        '''Create a packet.
+
+        :Parameters:
+            `data` : str or ctypes array or pointer
+                Sample data.
+            `length` : int
+                Size of sample data, in bytes.
+            `timestamp` : float
+                Time of the first sample, in seconds.
+            `duration` : float
+                Total data duration, in seconds.
+            `events` : list of MediaEvent
+                List of events contained within this packet.
+            `offset` : int
+                Offset of the sample data in `data`, in bytes.  The data
+                is not copied.  **Since:** pyglet 1.2.
+
+        '''
+        self._owner = data
+        self._address = None
+        if offset:
+            self._address = _get_address(data) + offset
+            data = (ctypes.c_char * length).from_address(self._address)
         self.data = data
         self.length = length
         self.timestamp = timestamp
@@ -346,27 +389,138 @@ class AudioData(object):
         elif bytes == 0:
             return
 
-        if not isinstance(self.data, str):
-            # XXX Create a string buffer for the whole packet then
-            #     chop it up.  Could do some pointer arith here and
-            #     save a bit of data pushing, but my guess is this is
-            #     faster than fudging aruond with ctypes (and easier).
-            data = ctypes.create_string_buffer(self.length)
-            ctypes.memmove(data, self.data, self.length)
-            self.data = data
-        self.data = self.data[bytes:]
+        # Point into the same memory rather than copying the remaining data.
+        if self._address is None:
+            self._address = _get_address(self.data)
+        self._address += bytes
         self.length -= bytes
+        self.data = (ctypes.c_char * self.length).from_address(self._address)
         self.duration -= bytes / float(audio_format.bytes_per_second)
         self.timestamp += bytes / float(audio_format.bytes_per_second)
 
     def get_string_data(self):
         '''Return data as a string. (Python 3: return as bytes)'''
         if isinstance(self.data, bytes_type):
+            if len(self.data) == self.length:
+                return self.data
+            return self.data[:self.length]
+
+        return ctypes.string_at(self.data, self.length)
+
+    def get_buffer(self):
+        '''Return the data without copying it, as an object supporting the
+        buffer interface.
+
+        The buffer can be passed to `audioop` functions, written to files
+        and passed to ctypes functions taking a pointer.  It is only valid
+        until the packet is released.  The buffer of a packet from an
+        `AudioDataPool` is writable, for the source to fill it.
+
+        :since: pyglet 1.2
+
+        :rtype: str or ctypes array
+        '''
+        if isinstance(self.data, (bytes_type, ctypes.Array)) and \
+                len(self.data) == self.length:
             return self.data
 
-        buf = ctypes.create_string_buffer(self.length)
-        ctypes.memmove(buf, self.data, self.length)
-        return buf.raw
+        address = self._address
+        if address is None:
+            address = _get_address(self.data)
+        return (ctypes.c_char * self.length).from_address(address)
+
+    def release(self):
+        '''Give the packet back to the pool it was taken from.
+
+        Audio players call this once the data has been written; the packet
+        and its data must not be used afterwards.  Does nothing for packets
+        not taken from a pool.
+
+        :since: pyglet 1.2
+        '''
+        pool = self._pool
+        if pool is not None:
+            self._pool = None
+            pool._release(self)
+
+def _get_address(data):
+    # Address of the sample data of a str, ctypes array or pointer.
+    if isinstance(data, bytes_type):
+        return ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p).value
+    elif isinstance(data, ctypes.Array):
+        return ctypes.addressof(data)
+    else:
+        return ctypes.cast(data, ctypes.c_void_p).value
+
+class AudioDataPool(object):
+    '''Pool of audio data packets and sample buffers, reused by a source.
+
+    A streaming source takes a packet from the pool for each call to its
+    `get_audio_data`, and fills its buffer.  The audio player gives the
+    packet back with `AudioData.release` once the data is written, so the
+    same few buffers are used while a source plays.  Packets that are never
+    released are garbage collected as usual.
+
+    :since: pyglet 1.2
+
+    :Ivariables:
+        `allocations` : int
+            Number of buffers allocated by the pool.
+
+    '''
+
+    #: Maximum number of released packets kept for reuse.
+    max_packets = 8
+
+    #: Minimum size of a buffer, in bytes.
+    min_buffer_size = 4096
+
+    def __init__(self):
+        self._packets = []
+        self.allocations = 0
+
+    def get_audio_data(self, size, timestamp=0., duration=0.):
+        '''Take a packet with a buffer of at least `size` bytes.
+
+        The `data` of the packet is its whole buffer, and its `length` is
+        `size`.
+
+        :Parameters:
+            `size` : int
+                Number of bytes needed.
+            `timestamp` : float
+                Time of the first sample, in seconds.
+            `duration` : float
+                Data duration, in seconds.
+
+        :rtype: `AudioData`
+        '''
+        for i, packet in enumerate(self._packets):
+            if len(packet._owner) >= size:
+                del self._packets[i]
+                packet.data = packet._owner
+                packet._address = None
+                packet.length = size
+                packet.timestamp = timestamp
+                packet.duration = duration
+                if isinstance(packet.events, list):
+                    del packet.events[:]
+                else:
+                    packet.events = []
+                break
+        else:
+            buffer_size = self.min_buffer_size
+            while buffer_size < size:
+                buffer_size <<= 1
+            buffer = (ctypes.c_char * buffer_size)()
+            self.allocations += 1
+            packet = AudioData(buffer, size, timestamp, duration, [])
+        packet._pool = self
+        return packet
+
+    def _release(self, packet):
+        if len(self._packets) < self.max_packets:
+            self._packets.append(packet)
 
 class MediaEvent(object):
     def __init__(self, timestamp, event, *args):
@@ -583,14 +737,21 @@ class StreamingSource(Source):
 class StaticSource(Source):
     '''A source that has been completely decoded in memory.  This source can
     be queued onto multiple players any number of times.
+
+    Players read the decoded data in place, so they all share one copy of
+    it.
     '''
     
-    def __init__(self, source):
+    def __init__(self, source, filename=None):
         '''Construct a `StaticSource` for the data in `source`.
 
         :Parameters:
             `source` : `Source`
                 The source to read and decode audio and video data from.
+            `filename` : str
+                Path of the file `source` was loaded from.  If given, the
+                decoded data is shared through `audio_cache` with other
+                static sources of the same file.  **Since:** pyglet 1.2.
 
         '''
         source = source._get_queue_source()
@@ -602,18 +763,14 @@ class StaticSource(Source):
         if not self.audio_format:
             return
 
-        # Arbitrary: number of bytes to request at a time.
-        buffer_size = 1 << 20 # 1 MB
-
         # Naive implementation.  Driver-specific implementations may override
         # to load static audio data into device (or at least driver) memory. 
-        data = BytesIO()
-        while True:
-            audio_data = source.get_audio_data(buffer_size)
-            if not audio_data:
-                break
-            data.write(audio_data.get_string_data())
-        self._data = data.getvalue()
+        if filename is not None and audio_cache is not None:
+            self._data = audio_cache.get_data(filename, source)
+        else:
+            data = bytearray()
+            _decode_audio(source, data.extend)
+            self._data = _share_buffer(data)
 
         self._duration = len(self._data) / \
                 float(self.audio_format.bytes_per_second)
@@ -624,14 +781,178 @@ class StaticSource(Source):
     def get_audio_data(self, bytes):
         raise RuntimeError('StaticSource cannot be queued.')
 
+def _decode_audio(source, write):
+    # Pass all the audio data of source to write, a packet at a time.
+
+    # Arbitrary: number of bytes to request at a time.
+    buffer_size = 1 << 20 # 1 MB
+
+    while True:
+        audio_data = source.get_audio_data(buffer_size)
+        if not audio_data:
+            break
+        write(audio_data.get_buffer())
+        audio_data.release()
+
+def _share_buffer(data):
+    # Return a ctypes array sharing the memory of a bytearray or mapping,
+    # which it keeps alive.
+    if not len(data):
+        return bytes_type()
+    return (ctypes.c_char * len(data)).from_buffer(data)
+
+class AudioCache(object):
+    '''Cache of the decoded audio data of static sources.
+
+    Static sources loaded from the same file with the same audio format
+    share their decoded data while any of them is in use.  If the cache has
+    a directory, the data is also decoded into a file there, and mapped into
+    memory; static sources loaded from the file later, including in later
+    runs of the application, map that file rather than decoding the source
+    again.
+
+    Files are identified by their absolute path, size and modification
+    time, so a changed file is decoded again.  Use `clear` to remove the
+    files of old versions.
+
+    The cache used by `load` and `StaticSource` is `audio_cache`.
+
+    :since: pyglet 1.2
+
+    :Ivariables:
+        `path` : str
+            Directory of the cache files, or None to only share data within
+            this process.  The directory is created when needed.
+
+    '''
+    #: Extension of cache files.
+    extension = '.pcm'
+
+    def __init__(self, path=None):
+        self.path = path
+        self._data = weakref.WeakValueDictionary()
+
+    def get_key(self, filename, audio_format):
+        '''Get the key of the decoded data of a file.
+
+        :Parameters:
+            `filename` : str
+                Path of the file.
+            `audio_format` : `AudioFormat`
+                Format of the decoded data.
+
+        :rtype: str
+        :return: The name of the cache file for the data, without the
+            directory.
+        '''
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        key = repr((filename, stat.st_size, stat.st_mtime,
+                    audio_format.channels, audio_format.sample_size,
+                    audio_format.sample_rate))
+        return hashlib.md5(key).hexdigest() + self.extension
+
+    def get_data(self, filename, source):
+        '''Get the decoded audio data of a file, decoding `source` if it is
+        not cached.
+
+        :Parameters:
+            `filename` : str
+                Path of the file.
+            `source` : `Source`
+                Source reading the file.
+
+        :rtype: str or ctypes array
+        :return: The decoded data, sharing memory with the cache.
+        '''
+        key = self.get_key(filename, source.audio_format)
+        data = self._data.get(key)
+        if data is not None:
+            return data
+
+        if self.path is None:
+            buffer = bytearray()
+            _decode_audio(source, buffer.extend)
+            data = _share_buffer(buffer)
+        else:
+            cache_filename = os.path.join(self.path, key)
+            if not os.path.exists(cache_filename):
+                self._decode_file(source, cache_filename)
+            data = self._map_file(cache_filename)
+
+        if len(data):
+            self._data[key] = data
+        return data
+
+    def _decode_file(self, source, cache_filename):
+        # Decode into a temporary file and rename it, so that a partly
+        # written file is never mapped.
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        fd, temp_filename = tempfile.mkstemp(self.extension + '.tmp',
+                                             dir=self.path)
+        file = os.fdopen(fd, 'wb')
+        try:
+            try:
+                _decode_audio(source, file.write)
+            finally:
+                file.close()
+            if os.path.exists(cache_filename):
+                # Decoded by another process meanwhile.
+                os.remove(temp_filename)
+            else:
+                os.rename(temp_filename, cache_filename)
+        except:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise
+
+    def _map_file(self, cache_filename):
+        file = open(cache_filename, 'rb')
+        try:
+            if not os.fstat(file.fileno()).st_size:
+                return bytes_type()
+            # A copy-on-write mapping, so that ctypes arrays can share it;
+            # it is never written to.
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        finally:
+            file.close()
+        return _share_buffer(mapping)
+
+    def clear(self):
+        '''Remove all the files in the cache directory.
+
+        Data in use by static sources is kept in memory until they are
+        deleted.
+        '''
+        self._data.clear()
+        if self.path is None or not os.path.exists(self.path):
+            return
+        for name in os.listdir(self.path):
+            if name.endswith(self.extension):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    # Still mapped, on Windows.
+                    pass
+
+#: Cache of the decoded data of static sources loaded from files.
+#:
+#: :type: `AudioCache`
+#: :since: pyglet 1.2
+audio_cache = AudioCache()
+
 class StaticMemorySource(StaticSource):
     '''Helper class for default implementation of `StaticSource`.  Do not use
     directly.'''
 
     def __init__(self, data, audio_format):
         '''Construct a memory source over the given data buffer.
+
+        The data, a str or ctypes array, is not copied.
         '''
-        self._file = BytesIO(data)
+        self._data = data
+        self._offset = 0
         self._max_offset = len(data)
         self.audio_format = audio_format
         self._duration = len(data) / float(audio_format.bytes_per_second)
@@ -645,10 +966,10 @@ class StaticMemorySource(StaticSource):
         elif self.audio_format.bytes_per_sample == 4:
             offset &= 0xfffffffc
 
-        self._file.seek(offset)
+        self._offset = min(max(offset, 0), self._max_offset)
 
     def get_audio_data(self, bytes):
-        offset = self._file.tell()
+        offset = self._offset
         timestamp = float(offset) / self.audio_format.bytes_per_second
 
         # Align to sample size
@@ -657,12 +978,14 @@ class StaticMemorySource(StaticSource):
         elif self.audio_format.bytes_per_sample == 4:
             bytes &= 0xfffffffc
 
-        data = self._file.read(bytes)
-        if not len(data):
+        # The packet is a view of the data, not a copy.
+        bytes = min(bytes, self._max_offset - offset)
+        if bytes <= 0:
             return None
+        self._offset += bytes
 
-        duration = float(len(data)) / self.audio_format.bytes_per_second
-        return AudioData(data, len(data), timestamp, duration, [])
+        duration = float(bytes) / self.audio_format.bytes_per_second
+        return AudioData(self._data, bytes, timestamp, duration, [], offset)
 
 class SourceGroup(object):
     '''Read data from a queue of sources, with support for looping.  All
@@ -926,6 +1249,14 @@ class Player(pyglet.event.EventDispatcher):
     _cone_outer_angle = 360.
     _cone_outer_gain = 1.
 
+    #: Queue to upload video frames through, or None to upload each frame
+    #: as soon as it is decoded.  Frames in the queue are replaced by newer
+    #: ones, so video never falls behind by more than a frame.
+    #:
+    #: :type: `pyglet.image.upload.TextureUploadQueue`
+    #: :since: pyglet 1.2
+    upload_queue = None
+
     #: The player will pause when it reaches the end of the stream.
     #:
     #: :deprecated: Use `SourceGroup.advance_after_eos`
@@ -1142,7 +1473,10 @@ class Player(pyglet.event.EventDispatcher):
         if image is not None:
             if self._texture is None:
                 self._create_texture()
-            self._texture.blit_into(image, 0, 0, 0)
+            if self.upload_queue is not None:
+                self.upload_queue.put(image, self._texture)
+            else:
+                self._texture.blit_into(image, 0, 0, 0)
             self._last_video_timestamp = ts
 
     def _set_eos_action(self, eos_action):
@@ -1399,13 +1733,17 @@ def load(filename, file=None, streaming=True):
             Not yet supported.
         `streaming` : bool
             If False, a `StaticSource` will be returned; otherwise (default) a
-            `StreamingSource` is created.
+            `StreamingSource` is created.  The decoded data of static
+            sources loaded from real paths is shared through `audio_cache`.
 
     :rtype: `Source`
     '''
     source = get_source_loader().load(filename, file)
     if not streaming:
-        source = StaticSource(source)
+        if file is None:
+            source = StaticSource(source, filename)
+        else:
+            source = StaticSource(source)
     return source
 
 def get_audio_driver():
@@ -1430,6 +1768,10 @@ def get_audio_driver():
                 from drivers import directsound
                 _audio_driver = directsound.create_audio_driver()
                 break
+            elif driver_name == 'mixer':
+                from drivers import mixer
+                _audio_driver = mixer.create_audio_driver()
+                break
             elif driver_name == 'silent':
                 _audio_driver = get_silent_audio_driver()
                 break
@@ -51,7 +51,7 @@ from pyglet import image
 import pyglet.lib
 from pyglet.media import \
     MediaFormatException, StreamingSource, VideoFormat, AudioFormat, \
-    AudioData, MediaEvent, WorkerThread, SourceInfo
+    AudioData, AudioDataPool, MediaEvent, WorkerThread, SourceInfo
 from pyglet.compat import asbytes, asbytes_filename
 
 
@@ -317,6 +317,7 @@ class AVbinSource(StreamingSource):
         if self.audio_format:
             self._audio_buffer = \
                 (ctypes.c_uint8 * av.avbin_get_audio_buffer_size())()
+            self._audio_data_pool = AudioDataPool()
             
         if self.video_format:
             self._video_packets = []
@@ -479,19 +480,16 @@ class AVbinSource(StreamingSource):
             if size_out.value <= 0:
                 continue
 
-            # XXX how did this ever work?  replaced with copy below
-            # buffer = ctypes.string_at(self._audio_buffer, size_out)
-
-            # XXX to actually copy the data.. but it never used to crash, so
-            # maybe I'm  missing something
-            buffer = ctypes.create_string_buffer(size_out.value)
-            ctypes.memmove(buffer, self._audio_buffer, len(buffer))
-            buffer = buffer.raw
-
-            duration = float(len(buffer)) / self.audio_format.bytes_per_second
+            # The decode buffer is reused for the next packet, so copy the
+            # samples into a buffer from the pool.
+            duration = float(size_out.value) / \
+                self.audio_format.bytes_per_second
             self._audio_packet_timestamp = \
                 timestamp = timestamp_from_avbin(packet.timestamp)
-            return AudioData(buffer, len(buffer), timestamp, duration, []) 
+            audio_data = self._audio_data_pool.get_audio_data(size_out.value,
+                timestamp, duration)
+            ctypes.memmove(audio_data.data, self._audio_buffer, size_out.value)
+            return audio_data
 
     def _decode_video_packet(self, packet):
         width = self.video_format.width
@@ -294,6 +294,8 @@ class DirectSoundAudioPlayer(AbstractAudioPlayer):
                 self.write(audio_data, length)
                 if audio_data.length:
                     self._next_audio_data = audio_data
+                else:
+                    audio_data.release()
                 write_size -= length
             else:
                 # Write silence
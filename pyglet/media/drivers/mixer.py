@@ -0,0 +1,552 @@
+#!/usr/bin/env python
+
+'''Software audio mixer writing every player into a single output stream.
+
+Each player reads audio data from its source group, which is converted to
+the output sample rate and sample size and mixed with the other players'
+using the sample operations of the standard `audioop` module, which work on
+whole buffers at a time.  The volume and pitch of each player, and the
+attenuation and stereo pan given by its position relative to the listener,
+are applied as the data is mixed.  A single thread mixes for all players,
+instead of one thread and stream for each.
+
+The mixed stream is written to a sink: `NullAudioSink` discards it, and
+`FileAudioSink` writes it to a WAV file.  A sink consumes data either in real
+time, paced by the system clock like the silent driver, or as fast as it is
+mixed, for rendering audio offline or benchmarking.  The driver is used when
+``'mixer'`` is given in the ``audio`` option, with a real time
+`NullAudioSink`; or can be created with another sink and installed by the
+application.
+
+:since: pyglet 1.2
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id$'
+
+import audioop
+import math
+import time
+import wave
+
+from pyglet.media import AbstractAudioPlayer, AbstractAudioDriver, \
+                         AbstractListener, AudioFormat, MediaThread, \
+                         MediaEvent
+
+import pyglet
+_debug = pyglet.options['debug_media']
+
+class NullAudioSink(object):
+    '''Sink discarding the mixed audio stream.
+
+    A real time sink accepts data only as fast as it would be played, and
+    takes the play position from the system clock.  Otherwise data is
+    accepted as fast as it can be mixed, and is considered played as soon as
+    it is written.
+
+    :Ivariables:
+        `audio_format` : `AudioFormat`
+            Format of the mixed stream; 16-bit stereo.
+        `realtime` : bool
+            True if data is consumed in real time.
+        `buffer_frames` : int
+            Number of frames the sink holds before they are played.
+
+    '''
+    def __init__(self, audio_format=None, realtime=True, buffer_time=0.1):
+        '''Create a sink.
+
+        :Parameters:
+            `audio_format` : `AudioFormat`
+                Format of the mixed stream.  Only 16-bit stereo is
+                supported; the default sample rate is 44100 Hz.
+            `realtime` : bool
+                If True, data is consumed in real time.
+            `buffer_time` : float
+                Length of audio held by the sink before it is played, in
+                seconds.
+
+        '''
+        if audio_format is None:
+            audio_format = AudioFormat(channels=2, sample_size=16,
+                                       sample_rate=44100)
+        assert audio_format.channels == 2 and audio_format.sample_size == 16
+        self.audio_format = audio_format
+        self.realtime = realtime
+        self.buffer_frames = int(buffer_time * audio_format.sample_rate)
+
+        self._written_frames = 0
+
+        # System time at which the first frame was (or would have been)
+        # played.
+        self._start_time = None
+
+    def get_play_position(self):
+        '''Get the number of frames played since the sink was created.
+
+        :rtype: int
+        '''
+        if not self.realtime or self._start_time is None:
+            return self._written_frames
+        played = int((time.time() - self._start_time) *
+                     self.audio_format.sample_rate)
+        return min(played, self._written_frames)
+
+    def get_write_frames(self):
+        '''Get the number of frames the sink can accept now.
+
+        :rtype: int
+        '''
+        if not self.realtime:
+            return self.buffer_frames
+        return self.buffer_frames - \
+            (self._written_frames - self.get_play_position())
+
+    def write(self, data):
+        '''Write mixed data to the sink.
+
+        :Parameters:
+            `data` : str
+                Sample data, in the sink's format.
+
+        '''
+        if self.realtime and self.get_play_position() == self._written_frames:
+            # Nothing is left to play; playback of this data starts now.
+            self._start_time = time.time() - \
+                self._written_frames / float(self.audio_format.sample_rate)
+        self._written_frames += len(data) // self.audio_format.bytes_per_sample
+        self._write(data)
+
+    def _write(self, data):
+        pass
+
+    def close(self):
+        '''Finish writing to the sink.'''
+        pass
+
+class FileAudioSink(NullAudioSink):
+    '''Sink writing the mixed audio stream to a WAV file.
+    '''
+    def __init__(self, file, audio_format=None, realtime=False,
+                 buffer_time=0.1):
+        '''Create a sink writing to a file.
+
+        :Parameters:
+            `file` : str or file-like object
+                Filename or seekable file to write the WAV file to.
+            `audio_format` : `AudioFormat`
+                Format of the mixed stream.  Only 16-bit stereo is
+                supported; the default sample rate is 44100 Hz.
+            `realtime` : bool
+                If True, data is consumed in real time.
+            `buffer_time` : float
+                Length of audio held by the sink before it is played, in
+                seconds.
+
+        '''
+        super(FileAudioSink, self).__init__(audio_format, realtime,
+                                            buffer_time)
+        self._wave = wave.open(file, 'wb')
+        self._wave.setnchannels(self.audio_format.channels)
+        self._wave.setsampwidth(self.audio_format.sample_size >> 3)
+        self._wave.setframerate(self.audio_format.sample_rate)
+
+    def _write(self, data):
+        self._wave.writeframesraw(data)
+
+    def close(self):
+        '''Finish writing the WAV file.
+
+        If a file object was given it is not closed.
+        '''
+        if self._wave:
+            self._wave.close()
+            self._wave = None
+
+class MixerAudioListener(AbstractListener):
+    def __init__(self, driver):
+        self.driver = driver
+
+    # The listener is read each time data is mixed.
+
+    def _set_volume(self, volume):
+        self._volume = volume
+
+    def _set_position(self, position):
+        self._position = position
+
+    def _set_forward_orientation(self, orientation):
+        self._forward_orientation = orientation
+
+    def _set_up_orientation(self, orientation):
+        self._up_orientation = orientation
+
+class MixerAudioPlayer(AbstractAudioPlayer):
+    # Minimum number of bytes to request from source
+    _min_update_bytes = 1024
+
+    _volume = 1.0
+    _pitch = 1.0
+    _position = (0, 0, 0)
+    _min_distance = 1.0
+    _max_distance = 100000000.
+
+    def __init__(self, driver, source_group, player):
+        super(MixerAudioPlayer, self).__init__(source_group, player)
+        self.driver = driver
+
+        # Source data converted to the output sample rate and sample size,
+        # with the source's channels; and the timestamp of its first frame.
+        self._pending = ''
+        self._pending_timestamp = 0.
+        self._ratecv_state = None
+        self._eos = False
+
+        # List of (frame, frames, timestamp, pitch) of the data mixed from
+        # this player, giving the output frame it starts at.
+        self._marks = []
+
+        # List of MediaEvent, with absolute timestamps
+        self._events = []
+
+        # Actual play state, and the time when stopped.
+        self._playing = False
+        self._time = None
+
+    def delete(self):
+        if _debug:
+            print 'MixerAudioPlayer.delete'
+        self.driver._remove_player(self)
+
+    def play(self):
+        if _debug:
+            print 'MixerAudioPlayer.play'
+        self.driver.condition.acquire()
+        self._playing = True
+        self.driver._start()
+        self.driver.condition.notify()
+        self.driver.condition.release()
+
+    def stop(self):
+        if _debug:
+            print 'MixerAudioPlayer.stop'
+        self.driver.condition.acquire()
+        if self._playing:
+            self._time = self.get_time()
+            self._playing = False
+            del self._marks[:]
+        self.driver.condition.release()
+
+    def clear(self):
+        if _debug:
+            print 'MixerAudioPlayer.clear'
+        self.driver.condition.acquire()
+        self._pending = ''
+        self._ratecv_state = None
+        self._eos = False
+        del self._marks[:]
+        del self._events[:]
+        self._time = None
+        self.driver.condition.release()
+
+    def get_time(self):
+        self.driver.condition.acquire()
+        result = self._time
+        if self._playing:
+            played = self.driver.sink.get_play_position()
+            marks = self._marks
+            while len(marks) > 1 and marks[1][0] <= played:
+                del marks[0]
+            if marks and marks[0][0] <= played:
+                frame, frames, timestamp, pitch = marks[0]
+                result = timestamp + min(played - frame, frames) * pitch / \
+                    float(self.driver.audio_format.sample_rate)
+        self.driver.condition.release()
+
+        if _debug:
+            print 'MixerAudioPlayer.get_time() -> ', result
+        return result
+
+    def set_volume(self, volume):
+        self._volume = volume
+
+    def set_position(self, position):
+        self._position = position
+
+    def set_min_distance(self, min_distance):
+        self._min_distance = min_distance
+
+    def set_max_distance(self, max_distance):
+        self._max_distance = max_distance
+
+    def set_pitch(self, pitch):
+        self.driver.condition.acquire()
+        if pitch != self._pitch:
+            # The conversion state is only valid for the same rates.
+            self._ratecv_state = None
+        self._pitch = pitch
+        self.driver.condition.release()
+
+    def _is_active(self):
+        return self._playing and (self._pending or not self._eos)
+
+    def _convert(self, audio_data):
+        # Convert source data to 16-bit samples at the output sample rate.
+        audio_format = self.source_group.audio_format
+        data = buffer = audio_data.get_buffer()
+        if audio_format.sample_size == 8:
+            data = audioop.lin2lin(audioop.bias(data, 1, -128), 1, 2)
+        rate = max(int(round(audio_format.sample_rate * self._pitch)), 1)
+        if rate != self.driver.audio_format.sample_rate:
+            data, self._ratecv_state = audioop.ratecv(data, 2,
+                audio_format.channels, rate,
+                self.driver.audio_format.sample_rate, self._ratecv_state)
+        if data is buffer:
+            # Unconverted; copy the data before the packet is released.
+            data = audio_data.get_string_data()
+        return data
+
+    def _read(self, frames):
+        # Return up to the given number of converted frames, fewer at the
+        # end of the stream.
+        audio_format = self.source_group.audio_format
+        frame_size = 2 * audio_format.channels
+        size = frames * frame_size
+        rate = float(self.driver.audio_format.sample_rate)
+        while len(self._pending) < size and not self._eos:
+            bytes = ((size - len(self._pending)) // frame_size *
+                     audio_format.sample_rate * self._pitch / rate)
+            bytes = int(bytes) * audio_format.bytes_per_sample
+            audio_data = self.source_group.get_audio_data(
+                max(bytes, self._min_update_bytes))
+            if not audio_data:
+                self._eos = True
+                break
+
+            if not self._pending:
+                self._pending_timestamp = audio_data.timestamp
+            for event in audio_data.events:
+                event.timestamp += audio_data.timestamp
+                self._events.append(event)
+            self._pending += self._convert(audio_data)
+            audio_data.release()
+
+        data = self._pending[:size]
+        self._pending = self._pending[size:]
+        frames = len(data) // frame_size
+        if frames:
+            self._marks.append((self.driver._frame, frames,
+                                self._pending_timestamp, self._pitch))
+            self._pending_timestamp += frames * self._pitch / rate
+
+        if self._eos and not self._pending:
+            # The end of the stream is reached when the last data mixed has
+            # been played (the stream is always drained once the end is
+            # found).
+            timestamp = None
+            if self._marks:
+                timestamp = self._pending_timestamp
+            self._events.append(MediaEvent(timestamp, 'on_eos'))
+            self._events.append(MediaEvent(timestamp, 'on_source_group_eos'))
+        return data
+
+    def _get_gains(self):
+        # Return the gain of the left and right channels.
+        listener = self.driver._listener
+        gain = self._volume * listener._volume
+        offset = [p - l for p, l in zip(self._position, listener._position)]
+        distance = math.sqrt(sum([d * d for d in offset]))
+        if not distance:
+            return gain, gain
+
+        # Inverse distance attenuation, clamped to the distance range.
+        clamped = min(distance, self._max_distance)
+        if clamped > self._min_distance:
+            gain *= self._min_distance / clamped
+
+        # Pan by the direction of the player to the right of the listener.
+        fx, fy, fz = listener._forward_orientation
+        ux, uy, uz = listener._up_orientation
+        right = (fy * uz - fz * uy, fz * ux - fx * uz, fx * uy - fy * ux)
+        length = math.sqrt(sum([r * r for r in right]))
+        if not length:
+            return gain, gain
+        pan = sum([o * r for o, r in zip(offset, right)]) / (length * distance)
+        return gain * min(1., 1. - pan), gain * min(1., 1. + pan)
+
+    def _mix(self, frames):
+        # Return the given number of frames of stereo data, or None if the
+        # player is silent.
+        data = self._read(frames)
+        if not data:
+            return None
+
+        left, right = self._get_gains()
+        if self.source_group.audio_format.channels == 1:
+            data = audioop.tostereo(data, 2, left, right)
+        elif left != right:
+            data = audioop.add(
+                audioop.tostereo(audioop.tomono(data, 2, left, 0), 2, 1, 0),
+                audioop.tostereo(audioop.tomono(data, 2, 0, right), 2, 0, 1),
+                2)
+        elif left != 1.:
+            data = audioop.mul(data, 2, left)
+
+        size = frames * 4
+        if len(data) < size:
+            data += '\0' * (size - len(data))
+        return data
+
+    def _dispatch_events(self):
+        events = self._events
+        if not events:
+            return
+        timestamp = self.get_time()
+        while events:
+            if (events[0].timestamp is None or
+                timestamp is not None and events[0].timestamp <= timestamp):
+                events[0]._sync_dispatch_to_player(self.player)
+                del events[0]
+            else:
+                break
+
+class MixerAudioDriver(AbstractAudioDriver):
+    '''Audio driver mixing all players into one stream written to a sink.
+
+    :Ivariables:
+        `sink` : `NullAudioSink`
+            Sink the mixed stream is written to.
+        `audio_format` : `AudioFormat`
+            Format of the mixed stream.
+        `condition` : threading.Condition
+            Lock on the state of the driver and its players.
+
+    '''
+
+    #: Number of frames mixed at a time.
+    period = 1024
+
+    def __init__(self, sink=None, threaded=True):
+        '''Create a mixer driver.
+
+        :Parameters:
+            `sink` : `NullAudioSink`
+                Sink to write the mixed stream to; by default a real time
+                `NullAudioSink`.
+            `threaded` : bool
+                If True, a thread mixes data as the sink needs it.
+                Otherwise, the application must call `update` regularly.
+
+        '''
+        if sink is None:
+            sink = NullAudioSink()
+        self.sink = sink
+        self.audio_format = sink.audio_format
+        self.threaded = threaded
+
+        # Audio players created and not deleted.
+        self._players = []
+        self._listener = MixerAudioListener(self)
+
+        # Number of frames mixed.
+        self._frame = 0
+
+        self._thread = MediaThread(target=self._worker_func)
+        self._thread_started = False
+        self.condition = self._thread.condition
+
+    def create_audio_player(self, source_group, player):
+        assert source_group.audio_format
+        audio_player = MixerAudioPlayer(self, source_group, player)
+        self.condition.acquire()
+        self._players.append(audio_player)
+        self.condition.release()
+        return audio_player
+
+    def get_listener(self):
+        return self._listener
+
+    def delete(self):
+        '''Stop the mixing thread and close the sink.'''
+        if self._thread_started:
+            self._thread.stop()
+        self.sink.close()
+
+    def _start(self):
+        if self.threaded and not self._thread_started:
+            self._thread_started = True
+            self._thread.start()
+
+    def _remove_player(self, audio_player):
+        self.condition.acquire()
+        if audio_player in self._players:
+            self._players.remove(audio_player)
+        self.condition.release()
+
+    def _mix(self, players, frames):
+        # Return the given number of frames mixed from the players.
+        mixed = None
+        for audio_player in players:
+            data = audio_player._mix(frames)
+            if data is None:
+                continue
+            if mixed is None:
+                mixed = data
+            else:
+                mixed = audioop.add(mixed, data, 2)
+        if mixed is None:
+            mixed = '\0' * (frames * 4)
+        return mixed
+
+    def update(self):
+        '''Mix as much data as the sink can accept, and dispatch the events
+        of each player that playback has reached.
+
+        This is called by the mixing thread; if the driver was created with
+        ``threaded=False``, the application must call it instead.
+
+        :rtype: bool
+        :return: True if any player is playing and has data left to mix.
+        '''
+        self.condition.acquire()
+        try:
+            frames = self.sink.get_write_frames()
+            players = [p for p in self._players if p._is_active()]
+            while players and frames >= self.period:
+                self.sink.write(self._mix(players, self.period))
+                self._frame += self.period
+                frames -= self.period
+                players = [p for p in players if p._is_active()]
+
+            for audio_player in list(self._players):
+                audio_player._dispatch_events()
+            return bool(players)
+        finally:
+            self.condition.release()
+
+    def _worker_func(self):
+        thread = self._thread
+        period_time = self.period / float(self.audio_format.sample_rate)
+
+        while True:
+            thread.condition.acquire()
+            if thread.stopped:
+                thread.condition.release()
+                break
+
+            active = self.update()
+            if not active and not [p for p in self._players if p._events]:
+                sleep_time = None
+            elif self.sink.realtime:
+                sleep_time = period_time
+            else:
+                sleep_time = 0
+
+            if _debug:
+                print 'MixerAudioDriver(Worker).sleep', sleep_time
+            thread.sleep(sleep_time)
+
+            thread.condition.release()
+
+def create_audio_driver():
+    return MixerAudioDriver()
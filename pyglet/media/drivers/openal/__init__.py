@@ -479,6 +479,7 @@ class OpenALAudioPlayer(AbstractAudioPlayer):
             self._buffer_sizes.append(audio_data.length)
             self._buffer_timestamps.append(audio_data.timestamp)
             write_size -= audio_data.length
+            audio_data.release()
 
         # Check for underrun stopping playback
         if self._playing:
@@ -334,6 +334,7 @@ class PulseAudioPlayer(AbstractAudioPlayer):
                 break
 
             bytes -= consumption
+            audio_data.release()
             if bytes > 0:
                 audio_data = self.source_group.get_audio_data(bytes) #XXX name change
 
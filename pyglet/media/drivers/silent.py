@@ -182,6 +182,7 @@ class SilentAudioPlayerPacketConsumer(AbstractAudioPlayer):
                     events.append(event)
                 events.extend(audio_data.events)
                 bytes -= audio_data.length
+                audio_data.release()
 
             sleep_time = self._sleep_time
             if not self._playing:
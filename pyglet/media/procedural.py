@@ -33,19 +33,206 @@
 # ----------------------------------------------------------------------------
 # $Id:$
 
-from pyglet.media import Source, AudioFormat, AudioData
+'''Audio sources synthesized as they are played.
 
-import ctypes
-import os
+Each source generates whole buffers of samples at a time from the time of
+each sample, so the waveform is continuous across buffers and after seeking.
+Samples are computed with NumPy if it is installed, and with the standard
+`math` module otherwise.
+
+The amplitude of a source is shaped with an envelope, and several sources
+can be mixed into one::
+
+    note = Sine(0.5, 440, envelope=ADSREnvelope(0.01, 0.1, 0.2))
+    chord = Mix([Sine(1.0, 262), Sine(1.0, 330), Sine(1.0, 392)],
+                envelope=LinearDecayEnvelope())
+
+Modulating the frequency of a sine wave with another (`FM`) gives a wide
+range of tones cheaply.
+'''
+
+__docformat__ = 'restructuredtext'
+
+import array
 import math
+import os
+import random
+
+from pyglet.media import Source, AudioFormat, AudioData, MediaException
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def _get_times(start, count, sample_rate):
+    # Time of each sample in the range, in seconds.
+    if numpy is not None:
+        return numpy.arange(start, start + count) / float(sample_rate)
+    return [i / float(sample_rate) for i in xrange(start, start + count)]
+
+def _interp(times, knot_times, knot_values):
+    # Piecewise linear function through the knots, constant outside them.
+    if numpy is not None:
+        return numpy.interp(times, knot_times, knot_values)
+    result = []
+    last = len(knot_times) - 1
+    i = 0
+    for t in times:
+        while i < last and knot_times[i + 1] <= t:
+            i += 1
+        if t <= knot_times[0] or i == last:
+            result.append(knot_values[min(i, last)])
+        else:
+            t0, t1 = knot_times[i], knot_times[i + 1]
+            v0, v1 = knot_values[i], knot_values[i + 1]
+            result.append(v0 + (v1 - v0) * (t - t0) / (t1 - t0))
+    return result
+
+def _multiply(samples, gains):
+    if numpy is not None:
+        return samples * gains
+    return [s * g for s, g in zip(samples, gains)]
+
+def _get_data(samples, sample_size):
+    # Convert samples between -1 and 1 to 8-bit unsigned or 16-bit signed
+    # sample data.
+    if numpy is not None:
+        samples = numpy.clip(samples, -1., 1.)
+        if sample_size == 8:
+            return (samples * 127 + 128).astype(numpy.uint8).tostring()
+        return (samples * 32767).astype(numpy.int16).tostring()
+    if sample_size == 8:
+        return array.array('B', [int(min(max(s, -1.), 1.) * 127 + 128)
+                                 for s in samples]).tostring()
+    return array.array('h', [int(min(max(s, -1.), 1.) * 32767)
+                             for s in samples]).tostring()
+
+class Envelope(object):
+    '''Amplitude envelope applied to a procedural source.
+
+    The gain over the duration of the source is a piecewise linear function
+    given by `get_knots`.
+
+    :since: pyglet 1.2
+    '''
+    def get_knots(self, duration):
+        '''Get the times and gains the envelope passes through.
+
+        :Parameters:
+            `duration` : float
+                Duration of the source, in seconds.
+
+        :rtype: list of float, list of float
+        :return: Increasing times, in seconds, and the gain at each.
+        '''
+        raise NotImplementedError('abstract')
+
+    def get_gains(self, start, count, sample_rate, duration):
+        '''Get the gain of a range of samples.
+
+        :Parameters:
+            `start` : int
+                Index of the first sample.
+            `count` : int
+                Number of samples.
+            `sample_rate` : int
+                Samples per second.
+            `duration` : float
+                Duration of the source, in seconds.
+
+        :rtype: sequence of float
+        '''
+        knot_times, knot_gains = self.get_knots(duration)
+        return _interp(_get_times(start, count, sample_rate),
+                       knot_times, knot_gains)
+
+class FlatEnvelope(Envelope):
+    '''Envelope with a constant gain.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, amplitude=0.5):
+        self.amplitude = amplitude
+
+    def get_knots(self, duration):
+        return [0.], [self.amplitude]
+
+class LinearDecayEnvelope(Envelope):
+    '''Envelope falling linearly from its peak to silence over the duration
+    of the source.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, peak=1.0):
+        self.peak = peak
+
+    def get_knots(self, duration):
+        return [0., duration], [self.peak, 0.]
+
+class ADSREnvelope(Envelope):
+    '''Attack, decay, sustain and release envelope.
+
+    The gain rises from silence to 1 over the attack time, falls to the
+    sustain amplitude over the decay time, and falls to silence over the
+    release time at the end of the source.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, attack, decay, release, sustain_amplitude=0.5):
+        '''Create an ADSR envelope.
+
+        :Parameters:
+            `attack` : float
+                Attack time, in seconds.
+            `decay` : float
+                Decay time, in seconds.
+            `release` : float
+                Release time, in seconds.
+            `sustain_amplitude` : float
+                Gain between the decay and the release.
+
+        '''
+        self.attack = attack
+        self.decay = decay
+        self.release = release
+        self.sustain_amplitude = sustain_amplitude
+
+    def get_knots(self, duration):
+        sustain_start = self.attack + self.decay
+        release_start = max(duration - self.release, sustain_start)
+        return ([0., self.attack, sustain_start, release_start,
+                 max(duration, release_start)],
+                [0., 1., self.sustain_amplitude, self.sustain_amplitude, 0.])
 
 class ProceduralSource(Source):
-    def __init__(self, duration, sample_rate=44800, sample_size=16):
+    '''Source synthesizing mono audio.
+
+    Subclasses implement `_generate_samples`, or `_generate_data` to
+    produce sample data directly.
+    '''
+    def __init__(self, duration, sample_rate=44800, sample_size=16,
+                 envelope=None):
+        '''Create a procedural source.
+
+        :Parameters:
+            `duration` : float
+                Duration of the source, in seconds.
+            `sample_rate` : int
+                Samples per second.
+            `sample_size` : int
+                Bits per sample; 8 or 16.
+            `envelope` : `Envelope`
+                Amplitude envelope of the source, or None for a constant
+                gain of 1.  Since pyglet 1.2.
+
+        '''
         self._duration = float(duration)
         self.audio_format = AudioFormat(
             channels=1,
             sample_size=sample_size,
             sample_rate=sample_rate)
+        self.envelope = envelope
 
         self._offset = 0
         self._bytes_per_sample = sample_size >> 3
@@ -55,8 +242,10 @@ class ProceduralSource(Source):
         if self._bytes_per_sample == 2:
             self._max_offset &= 0xfffffffe
 
-    def _get_audio_data(self, bytes):
+    def get_audio_data(self, bytes):
         bytes = min(bytes, self._max_offset - self._offset)
+        if self._bytes_per_sample == 2:
+            bytes &= 0xfffffffe
         if bytes <= 0:
             return None
         
@@ -76,6 +265,25 @@ class ProceduralSource(Source):
 
         Return data as ctypes array or string.
         '''
+        start = offset // self._bytes_per_sample
+        count = bytes // self._bytes_per_sample
+        return _get_data(self._get_samples(start, count),
+                         self.audio_format.sample_size)
+
+    def _get_samples(self, start, count):
+        # Samples with the envelope applied.
+        samples = self._generate_samples(start, count)
+        if self.envelope is not None:
+            samples = _multiply(samples, self.envelope.get_gains(start,
+                count, self.audio_format.sample_rate, self._duration))
+        return samples
+
+    def _generate_samples(self, start, count):
+        '''Generate a range of samples, between -1 and 1.
+
+        Return a NumPy array of floats if NumPy is available, otherwise a
+        list of floats.
+        '''
         raise NotImplementedError('abstract')
 
     def seek(self, timestamp):
@@ -91,91 +299,165 @@ class ProceduralSource(Source):
 class Silence(ProceduralSource):
     def _generate_data(self, bytes, offset):
         if self._bytes_per_sample == 1:
-            return '\127' * bytes
+            return '\x80' * bytes
         else:
             return '\0' * bytes
 
+    def _generate_samples(self, start, count):
+        if numpy is not None:
+            return numpy.zeros(count)
+        return [0.] * count
+
 class WhiteNoise(ProceduralSource):
+    def _generate_samples(self, start, count):
+        if numpy is not None:
+            return numpy.random.uniform(-1., 1., count)
+        return [random.uniform(-1., 1.) for i in xrange(count)]
+
     def _generate_data(self, bytes, offset):
-        return os.urandom(bytes)
+        if self.envelope is None:
+            return os.urandom(bytes)
+        return super(WhiteNoise, self)._generate_data(bytes, offset)
 
 class Sine(ProceduralSource):
     def __init__(self, duration, frequency=440, **kwargs):
         super(Sine, self).__init__(duration, **kwargs)
         self.frequency = frequency
         
-    def _generate_data(self, bytes, offset):
-        if self._bytes_per_sample == 1:
-            start = offset
-            samples = bytes
-            bias = 127
-            amplitude = 127
-            data = (ctypes.c_ubyte * samples)()
-        else:
-            start = offset >> 1
-            samples = bytes >> 1
-            bias = 0
-            amplitude = 32767
-            data = (ctypes.c_short * samples)()
+    def _generate_samples(self, start, count):
         step = self.frequency * (math.pi * 2) / self.audio_format.sample_rate
-        for i in range(samples):
-            data[i] = int(math.sin(step * (i + start)) * amplitude + bias)
-        return data
+        if numpy is not None:
+            return numpy.sin(numpy.arange(start, start + count) * step)
+        return [math.sin(step * i) for i in xrange(start, start + count)]
 
 class Saw(ProceduralSource):
+    '''Triangle wave, rising from zero.'''
     def __init__(self, duration, frequency=440, **kwargs):
         super(Saw, self).__init__(duration, **kwargs)
         self.frequency = frequency
         
-    def _generate_data(self, bytes, offset):
-        # XXX TODO consider offset
-        if self._bytes_per_sample == 1:
-            samples = bytes
-            value = 127
-            max = 255
-            min = 0
-            data = (ctypes.c_ubyte * samples)()
-        else:
-            samples = bytes >> 1
-            value = 0
-            max = 32767
-            min = -32768
-            data = (ctypes.c_short * samples)()
-        step = (max - min) * 2 * self.frequency / self.audio_format.sample_rate
-        for i in range(samples):
-            value += step
-            if value > max:
-                value = max - (value - max)
-                step = -step
-            if value < min:
-                value = min - (value - min)
-                step = -step
-            data[i] = value
-        return data
+    def _generate_samples(self, start, count):
+        # Cycles completed at each sample, starting a quarter cycle in.
+        step = float(self.frequency) / self.audio_format.sample_rate
+        if numpy is not None:
+            cycles = numpy.arange(start, start + count) * step - 0.25
+            return numpy.abs(cycles - numpy.floor(cycles) - 0.5) * 4 - 1
+        result = []
+        for i in xrange(start, start + count):
+            cycles = i * step - 0.25
+            result.append(abs(cycles - math.floor(cycles) - 0.5) * 4 - 1)
+        return result
 
 class Square(ProceduralSource):
+    '''Square wave, starting low.'''
     def __init__(self, duration, frequency=440, **kwargs):
         super(Square, self).__init__(duration, **kwargs)
         self.frequency = frequency
         
-    def _generate_data(self, bytes, offset):
-        # XXX TODO consider offset
-        if self._bytes_per_sample == 1:
-            samples = bytes
-            value = 0
-            amplitude = 255
-            data = (ctypes.c_ubyte * samples)()
+    def _generate_samples(self, start, count):
+        step = float(self.frequency) / self.audio_format.sample_rate
+        if numpy is not None:
+            cycles = numpy.arange(start, start + count) * step
+            return numpy.where(cycles - numpy.floor(cycles) < 0.5, -1., 1.)
+        result = []
+        for i in xrange(start, start + count):
+            cycles = i * step
+            if cycles - math.floor(cycles) < 0.5:
+                result.append(-1.)
+            else:
+                result.append(1.)
+        return result
+
+class FM(ProceduralSource):
+    '''Sine wave with its phase modulated by another sine wave.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, duration, carrier=440, modulator=440,
+                 modulation_index=1.0, **kwargs):
+        '''Create a frequency modulated source.
+
+        :Parameters:
+            `duration` : float
+                Duration of the source, in seconds.
+            `carrier` : float
+                Frequency of the carrier wave, in Hertz.
+            `modulator` : float
+                Frequency of the modulating wave, in Hertz.
+            `modulation_index` : float
+                Amplitude of the modulating wave, in radians of the carrier
+                phase; higher values give more overtones.
+
+        Other keyword arguments are passed to `ProceduralSource`.
+        '''
+        super(FM, self).__init__(duration, **kwargs)
+        self.carrier = carrier
+        self.modulator = modulator
+        self.modulation_index = modulation_index
+
+    def _generate_samples(self, start, count):
+        rate = self.audio_format.sample_rate
+        carrier_step = self.carrier * (math.pi * 2) / rate
+        modulator_step = self.modulator * (math.pi * 2) / rate
+        index = self.modulation_index
+        if numpy is not None:
+            i = numpy.arange(start, start + count)
+            return numpy.sin(i * carrier_step +
+                             index * numpy.sin(i * modulator_step))
+        return [math.sin(i * carrier_step + index * math.sin(i * modulator_step))
+                for i in xrange(start, start + count)]
+
+class Mix(ProceduralSource):
+    '''Sum of procedural sources.
+
+    The sources are mixed from their start, with their envelopes; the mix
+    lasts as long as the longest of them.  Samples outside -1 to 1 are
+    clipped.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, sources, gains=None, **kwargs):
+        '''Create a mix of procedural sources.
+
+        :Parameters:
+            `sources` : sequence of `ProceduralSource`
+                Sources to mix, with the sample rate of the mix.  The
+                sources are used only to generate samples; they must not be
+                queued on a player.
+            `gains` : sequence of float
+                Gain of each source; by default 1 for each.
+
+        Other keyword arguments are passed to `ProceduralSource`, except the
+        duration.
+        '''
+        self.sources = list(sources)
+        if gains is None:
+            gains = [1.] * len(self.sources)
+        self.gains = list(gains)
+        duration = max([source.duration for source in self.sources])
+        super(Mix, self).__init__(duration, **kwargs)
+        for source in self.sources:
+            if source.audio_format.sample_rate != \
+                    self.audio_format.sample_rate:
+                raise MediaException('Mixed sources must have the sample '
+                                     'rate of the mix')
+
+    def _generate_samples(self, start, count):
+        rate = self.audio_format.sample_rate
+        if numpy is not None:
+            result = numpy.zeros(count)
         else:
-            samples = bytes >> 1
-            value = -32768
-            amplitude = 65535
-            data = (ctypes.c_short * samples)()
-        period = self.audio_format.sample_rate / self.frequency / 2
-        count = 0
-        for i in range(samples):
-            count += 1
-            if count == period:
-                value = amplitude - value
-                count = 0
-            data[i] = value
-        return data
+            result = [0.] * count
+        for source, gain in zip(self.sources, self.gains):
+            # Samples of the source that fall within its duration.
+            length = int(source.duration * rate)
+            source_count = min(count, length - start)
+            if source_count <= 0:
+                continue
+            samples = source._get_samples(start, source_count)
+            if numpy is not None:
+                result[:source_count] += samples * gain
+            else:
+                for i, sample in enumerate(samples):
+                    result[i] += sample * gain
+        return result
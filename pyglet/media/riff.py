@@ -32,7 +32,14 @@
 # POSSIBILITY OF SUCH DAMAGE.
 # ----------------------------------------------------------------------------
 
-'''Simple Python-only RIFF reader, supports uncompressed WAV files.
+'''Simple Python-only RIFF reader, supports WAV files.
+
+Integer PCM data of 8 to 32 bits, IEEE float data, `WAVE_FORMAT_EXTENSIBLE`
+files and IMA ADPCM compressed data are supported.  Samples are given to the
+audio driver as 8-bit (for 8-bit files) or 16-bit data.
+
+When the file can be mapped into memory, 8- and 16-bit PCM data is not read
+or copied: audio packets refer to the data chunk in the mapping.
 '''
 
 __docformat__ = 'restructuredtext'
@@ -46,17 +53,36 @@ __version__ = '$Id$'
 # http://www.borg.com/~jglatt/tech/wave.htm
 # http://www.sonicspot.com/guide/wavefiles.html
 
-from pyglet.media import StreamingSource, AudioData, AudioFormat
+from pyglet.media import StreamingSource, AudioData, AudioDataPool, \
+    AudioFormat
 from pyglet.media import MediaFormatException
-from pyglet.compat import BytesIO, asbytes
+from pyglet.compat import BytesIO, asbytes, bytes_type
 
+import array
+import audioop
+import ctypes
+import mmap
 import struct
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_IMA_ADPCM = 0x0011
+WAVE_FORMAT_EXTENSIBLE = 0xfffe
 IBM_FORMAT_MULAW = 0x0101
 IBM_FORMAT_ALAW = 0x0102
 IBM_FORMAT_ADPCM = 0x0103
 
+# The sub-format GUID of a WAVE_FORMAT_EXTENSIBLE file is the format tag
+# followed by these bytes.
+_KSDATAFORMAT_SUBTYPE = asbytes(
+    '\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71')
+
 class RIFFFormatException(MediaFormatException):
     pass
 
@@ -109,9 +135,8 @@ class RIFFForm(object):
             chunk = cls(self.file, name, length, offset)
             self._chunks.append(chunk)
 
-            offset += length
-            if offset & 0x3 != 0:
-                offset = (offset | 0x3) + 1
+            # Chunks are padded to an even length.
+            offset += length + (length & 1)
             self.file.seek(offset)
         return self._chunks
 
@@ -150,15 +175,39 @@ class WaveFormatChunk(RIFFChunk):
         super(WaveFormatChunk, self).__init__(*args, **kwargs)
         
         fmt = '<HHLLHH'
-        if struct.calcsize(fmt) != self.length:
+        if self.length < struct.calcsize(fmt):
             raise RIFFFormatException('Size of format chunk is incorrect.')
 
+        data = self.get_data()
         (self.wFormatTag,
          self.wChannels,
          self.dwSamplesPerSec,
          self.dwAvgBytesPerSec,
          self.wBlockAlign,
-         self.wBitsPerSample) = struct.unpack(fmt, self.get_data())
+         self.wBitsPerSample) = struct.unpack(fmt, data[:16])
+
+        # WAVEFORMATEX has the size of the format-specific data following.
+        extra = asbytes('')
+        if len(data) >= 18:
+            cbSize, = struct.unpack('<H', data[16:18])
+            extra = data[18:18 + cbSize]
+
+        # Format of the data, from the sub-format of extensible files.
+        self.format_tag = self.wFormatTag
+        self.wValidBitsPerSample = self.wBitsPerSample
+        self.wSamplesPerBlock = None
+        if self.wFormatTag == WAVE_FORMAT_EXTENSIBLE:
+            if len(extra) < 22:
+                raise RIFFFormatException(
+                    'Size of extensible format chunk is incorrect.')
+            (self.wValidBitsPerSample,
+             self.dwChannelMask,
+             self.format_tag,
+             subtype) = struct.unpack('<HLH14s', extra[:22])
+            if subtype != _KSDATAFORMAT_SUBTYPE:
+                raise WAVEFormatException('Unsupported WAVE sub-format')
+        elif self.wFormatTag == WAVE_FORMAT_IMA_ADPCM and len(extra) >= 2:
+            self.wSamplesPerBlock, = struct.unpack('<H', extra[:2])
 
 class WaveDataChunk(RIFFChunk):
     pass
@@ -179,6 +228,83 @@ class WaveForm(RIFFForm):
             if isinstance(chunk, WaveDataChunk):
                 return chunk
 
+def _map_file(file):
+    # Return a copy-on-write mapping of the whole file, which can be shared
+    # with ctypes arrays, or None if the file cannot be mapped.
+    try:
+        fileno = file.fileno()
+    except (AttributeError, IOError):
+        return None
+    try:
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_COPY)
+    except (EnvironmentError, ValueError):
+        return None
+
+def _convert_24(data, channels):
+    # 16-bit samples from the high bytes of 24-bit samples.
+    data = bytearray(data)
+    samples = bytearray(len(data) // 3 * 2)
+    samples[0::2] = data[1::3]
+    samples[1::2] = data[2::3]
+    return bytes_type(samples)
+
+def _convert_32(data, channels):
+    return audioop.lin2lin(data, 4, 2)
+
+def _get_float_converter(typecode):
+    def convert(data, channels):
+        # 16-bit samples from float samples between -1 and 1, rounded to
+        # the nearest value.
+        if numpy is not None:
+            samples = numpy.frombuffer(data, '<' + typecode)
+            samples = numpy.clip(samples, -1., 1.)
+            return numpy.round(samples * 32767).astype('<i2').tostring()
+        samples = array.array(typecode, data)
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        samples = array.array('h', [int(round(min(max(s, -1.), 1.) * 32767))
+                                    for s in samples])
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        return samples.tostring()
+    return convert
+
+# audioop decodes the high nibble of each byte first, IMA ADPCM in WAVE
+# files the low nibble.
+_swap_nibbles = ''.join([chr(((i & 0xf) << 4) | (i >> 4))
+                         for i in range(256)])
+
+def _decode_ima_adpcm(data, channels, block_align):
+    # Decode blocks of IMA ADPCM data to 16-bit samples.  Each block starts
+    # with the first sample and step index of each channel, followed by
+    # interleaved words of 8 samples for each channel.
+    blocks = []
+    for offset in range(0, len(data), block_align):
+        block = data[offset:offset + block_align]
+        header = struct.unpack('<' + 'hBx' * channels, block[:4 * channels])
+        body = block[4 * channels:]
+        if channels > 1:
+            words = array.array('I', body[:len(body) // (4 * channels) *
+                                          (4 * channels)])
+        samples = None
+        for channel in range(channels):
+            if channels > 1:
+                body = words[channel::channels].tostring()
+            sample = header[channel * 2]
+            index = min(header[channel * 2 + 1], 88)
+            decoded = audioop.adpcm2lin(body.translate(_swap_nibbles), 2,
+                                        (sample, index))[0]
+            decoded = array.array('h', struct.pack('<h', sample) + decoded)
+            if channels == 1:
+                samples = decoded
+            else:
+                if samples is None:
+                    samples = array.array('h', [0]) * (len(decoded) *
+                                                       channels)
+                samples[channel::channels] = decoded
+        blocks.append(samples.tostring())
+    return asbytes('').join(blocks)
+
 class WaveSource(StreamingSource):
     def __init__(self, filename, file=None):
         if file is None:
@@ -200,49 +326,127 @@ class WaveSource(StreamingSource):
                 raise WAVEFormatException(
                     'AVbin is required to decode compressed media')
 
-        if format.wFormatTag != WAVE_FORMAT_PCM:
+        channels = format.wChannels
+        bits = format.wBitsPerSample
+        if not channels:
+            raise WAVEFormatException('No channels in WAVE file')
+
+        # Data is read in blocks: frames of PCM data, or compressed blocks,
+        # converted with _convert to sample data for the driver.
+        self._convert = None
+        self._block_size = format.wBlockAlign
+        self._block_frames = 1
+        sample_size = 16
+        if format.format_tag == WAVE_FORMAT_PCM:
+            if bits not in (8, 16, 24, 32):
+                raise WAVEFormatException('Unsupported sample bit size: %d' %
+                    bits)
+            if bits == 8:
+                sample_size = 8
+            elif bits == 24:
+                self._convert = _convert_24
+            elif bits == 32:
+                self._convert = _convert_32
+            self._block_size = bits // 8 * channels
+        elif format.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            if bits == 32:
+                self._convert = _get_float_converter('f')
+            elif bits == 64:
+                self._convert = _get_float_converter('d')
+            else:
+                raise WAVEFormatException('Unsupported sample bit size: %d' %
+                    bits)
+            self._block_size = bits // 8 * channels
+        elif format.format_tag == WAVE_FORMAT_IMA_ADPCM:
+            if bits != 4 or format.wBlockAlign <= 4 * channels:
+                raise WAVEFormatException('Unsupported IMA ADPCM format')
+            block_align = format.wBlockAlign
+            self._convert = lambda data, channels: \
+                _decode_ima_adpcm(data, channels, block_align)
+            self._block_frames = format.wSamplesPerBlock or \
+                (block_align - 4 * channels) * 2 // channels + 1
+        else:
             raise WAVEFormatException('Unsupported WAVE format category')
 
-        if format.wBitsPerSample not in (8, 16):
-            raise WAVEFormatException('Unsupported sample bit size: %d' %
-                format.wBitsPerSample)
-
         self.audio_format = AudioFormat(
-            channels=format.wChannels,
-            sample_size=format.wBitsPerSample,
+            channels=channels,
+            sample_size=sample_size,
             sample_rate=format.dwSamplesPerSec)
-        self._duration = \
-            float(data_chunk.length) / self.audio_format.bytes_per_second
 
         self._start_offset = data_chunk.offset
-        self._max_offset = data_chunk.length
-        self._offset = 0
+        self._file.seek(0, 2)
+        self._max_offset = \
+            min(data_chunk.length, self._file.tell() - self._start_offset)
+        self._blocks = self._max_offset // self._block_size
+        self._frames = self._blocks * self._block_frames
+        if format.format_tag == WAVE_FORMAT_IMA_ADPCM:
+            # The last block may be shorter.
+            remainder = self._max_offset % self._block_size
+            if remainder > 4 * channels:
+                self._blocks += 1
+                self._frames += (remainder - 4 * channels) * 2 // channels + 1
+        self._duration = float(self._frames) / self.audio_format.sample_rate
+
+        self._block = 0
         self._file.seek(self._start_offset)
+        self._audio_data_pool = AudioDataPool()
+
+        # Data of mapped files is given to the driver as views of the
+        # mapping.
+        self._mapping = _map_file(self._file)
+        self._mapping_data = None
+        if self._mapping is not None:
+            self._mapping_data = (ctypes.c_char * len(self._mapping)).\
+                from_buffer(self._mapping)
 
     def get_audio_data(self, bytes):
-        bytes = min(bytes, self._max_offset - self._offset)
-        if not bytes:
+        audio_format = self.audio_format
+        block_bytes = self._block_frames * audio_format.bytes_per_sample
+        blocks = min(max(bytes // block_bytes, 1), self._blocks - self._block)
+        if blocks <= 0:
             return None
 
-        data = self._file.read(bytes)
-        self._offset += len(data)
-
-        timestamp = float(self._offset) / self.audio_format.bytes_per_second
-        duration = float(bytes) / self.audio_format.bytes_per_second
-
-        return AudioData(data, len(data), timestamp, duration, [])
+        offset = self._start_offset + self._block * self._block_size
+        length = min(blocks * self._block_size,
+                     self._max_offset - self._block * self._block_size)
+        timestamp = float(self._block * self._block_frames) / \
+            audio_format.sample_rate
+        self._block += blocks
+        frames = min(self._block * self._block_frames, self._frames) - \
+            (self._block - blocks) * self._block_frames
+        duration = float(frames) / audio_format.sample_rate
+
+        if self._convert is not None:
+            if self._mapping is not None:
+                data = self._mapping[offset:offset + length]
+            else:
+                self._file.seek(offset)
+                data = self._file.read(length)
+            data = self._convert(data, audio_format.channels)
+            return AudioData(data, len(data), timestamp, duration, [])
+        elif self._mapping is not None:
+            # A view of the mapping rather than a copy.
+            return AudioData(self._mapping_data, length, timestamp, duration,
+                             [], offset)
+
+        self._file.seek(offset)
+        if hasattr(self._file, 'readinto'):
+            # Read into a buffer from the pool rather than a new string.
+            audio_data = self._audio_data_pool.get_audio_data(length,
+                timestamp, duration)
+            read_length = self._file.readinto(audio_data.get_buffer())
+        else:
+            data = self._file.read(length)
+            read_length = len(data)
+            audio_data = AudioData(data, read_length, timestamp, duration,
+                                   [])
+        if read_length < length:
+            audio_data.release()
+            raise WAVEFormatException('Unexpected end of WAVE file')
+        return audio_data
 
     def seek(self, timestamp):
-        offset = int(timestamp * self.audio_format.bytes_per_second)
-
-        # Bound within duration
-        offset = min(max(offset, 0), self._max_offset)
-
-        # Align to sample
-        if self.audio_format.bytes_per_sample == 2:
-            offset &= 0xfffffffe
-        elif self.audio_format.bytes_per_sample == 4:
-            offset &= 0xfffffffc
-
-        self._file.seek(offset + self._start_offset)
-        self._offset = offset
+        # Seek to the start of a block; the file is only read from there
+        # when data is needed.
+        frame = int(round(timestamp * self.audio_format.sample_rate))
+        self._block = min(max(frame // self._block_frames, 0), self._blocks)
@@ -81,6 +81,29 @@ platforms.
 The default path is ``['.']``.  If you modify the path, you must call
 `reindex`.
 
+Preloading images
+^^^^^^^^^^^^^^^^^
+
+Images are normally decoded when they are first requested.  To load many
+images up front, for example while showing a loading screen, pass their names
+to `preload`.  The images are decoded on background threads, and the returned
+`PreloadProgress` uploads them to textures when its `update` method is called
+on the thread owning the OpenGL context::
+
+    progress = resource.preload(['player.png', 'enemy.png', 'tiles.png'])
+
+    def update_loading(dt):
+        progress.update()
+        loading_bar.width = progress.fraction * 200
+        if progress.done:
+            pyglet.clock.unschedule(update_loading)
+            start_level()
+
+    pyglet.clock.schedule(update_loading)
+
+Later calls to `image` for the preloaded names return the uploaded images
+without decoding them again.
+
 :since: pyglet 1.1
 '''
 
@@ -88,8 +111,10 @@ __docformat__ = 'restructuredtext'
 __version__ = '$Id: $'
 
 import os
+import Queue
 import weakref
 import sys
+import threading
 import zipfile
 
 import pyglet
@@ -249,6 +274,181 @@ class URLLocation(Location):
         url = urlparse.urljoin(self.base, filename)
         return urllib2.urlopen(url)
 
+# Serialises reading files for preloading; ZIP archives cannot be read by
+# several threads at once.
+_preload_file_lock = threading.Lock()
+
+def _get_preload_thread_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 2
+
+class PreloadProgress(object):
+    '''Progress of images being loaded by `Loader.preload`.
+
+    Images are decoded on background threads, but can only be uploaded to
+    textures on the thread owning the OpenGL context.  Call `update` from that
+    thread (for example, from a function scheduled on the clock) to upload the
+    images decoded so far, or `wait` to finish loading all of them.
+
+    :Ivariables:
+        `names` : list of str
+            Filenames of the images being loaded.
+        `images` : dict
+            Map of filename to the uploaded `Texture` or `TextureRegion`, for
+            each image loaded so far.
+        `errors` : dict
+            Map of filename to the exception raised while decoding or
+            uploading the image, for each image that could not be loaded.
+
+    :since: pyglet 1.2
+    '''
+    def __init__(self, loader, names, atlas, threads):
+        self.names = list(names)
+        self.images = {}
+        self.errors = {}
+        self._loader = loader
+        self._atlas = atlas
+        self._count = 0
+        self._total = len(self.names)
+        self._pending = Queue.Queue()
+        self._decoded = Queue.Queue()
+        for name in self.names:
+            self._pending.put(name)
+
+        for i in range(min(threads, len(self.names))):
+            thread = threading.Thread(target=self._decode_images)
+            thread.setDaemon(True)
+            thread.start()
+
+    def _decode_images(self):
+        while True:
+            try:
+                name = self._pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                _preload_file_lock.acquire()
+                try:
+                    file = self._loader.file(name)
+                    data = file.read()
+                    file.close()
+                finally:
+                    _preload_file_lock.release()
+                img = pyglet.image.load(name, file=BytesIO(data))
+                self._decoded.put((name, img, None))
+            except:
+                self._decoded.put((name, None, sys.exc_info()))
+
+    def _upload(self, decoded):
+        # Add the largest images to atlases first, which packs them more
+        # tightly.
+        decoded.sort(key=lambda (name, img, exc_info):
+                     img and (-img.height, -img.width))
+        cached_images = self._loader._cached_images
+        first_exc_info = None
+        for name, img, exc_info in decoded:
+            self._count += 1
+            if exc_info:
+                self.errors[name] = exc_info[1]
+                first_exc_info = first_exc_info or exc_info
+            elif name in cached_images:
+                self.images[name] = cached_images[name]
+            else:
+                # An image that cannot be uploaded is reported like one that
+                # cannot be decoded, so the rest of the batch is not lost.
+                try:
+                    texture = self._loader._upload_image(img, self._atlas)
+                except:
+                    exc_info = sys.exc_info()
+                    self.errors[name] = exc_info[1]
+                    first_exc_info = first_exc_info or exc_info
+                    continue
+                self.images[name] = cached_images[name] = texture
+        if first_exc_info:
+            raise first_exc_info[0], first_exc_info[1], first_exc_info[2]
+
+    def update(self):
+        '''Upload the images decoded since the last update.
+
+        This method must be called on the thread owning the OpenGL context.
+        If any of the images could not be decoded or uploaded, the exception
+        raised for the first of them is raised again after the others are
+        uploaded.
+
+        :rtype: int
+        :return: The number of images loaded by this update.
+        '''
+        decoded = []
+        while True:
+            try:
+                decoded.append(self._decoded.get_nowait())
+            except Queue.Empty:
+                break
+        self._upload(decoded)
+        return len(decoded)
+
+    def wait(self):
+        '''Wait for all the images to be decoded, uploading each as it
+        becomes available.
+
+        This method must be called on the thread owning the OpenGL context.
+        Exceptions are raised as for `update`.
+        '''
+        while not self.done:
+            try:
+                decoded = [self._decoded.get(True, 0.1)]
+            except Queue.Empty:
+                continue
+            self._upload(decoded)
+
+    def cancel(self):
+        '''Stop loading images that have not started decoding yet.
+
+        Images that are already being decoded are still loaded by later
+        updates.
+        '''
+        while True:
+            try:
+                self._pending.get_nowait()
+                self._total -= 1
+            except Queue.Empty:
+                break
+
+    count = property(lambda self: self._count,
+                     doc='''Number of images loaded or failed so far.
+
+    :type: int
+    ''')
+
+    total = property(lambda self: self._total,
+                     doc='''Number of images to be loaded.
+
+    This is reduced if loading is cancelled.
+
+    :type: int
+    ''')
+
+    def _get_fraction(self):
+        if not self._total:
+            return 1.
+        return min(float(self._count) / self._total, 1.)
+
+    fraction = property(_get_fraction,
+                        doc='''Fraction of the images loaded so far, between
+    0 and 1.
+
+    :type: float
+    ''')
+
+    done = property(lambda self: self._count >= self._total,
+                    doc='''True if all images have been loaded or failed.
+
+    :type: bool
+    ''')
+
 class Loader(object):
     '''Load program resource files from disk.
 
@@ -442,6 +642,9 @@ class Loader(object):
     def _alloc_image(self, name, atlas=True):
         file = self.file(name)
         img = pyglet.image.load(name, file=file)
+        return self._upload_image(img, atlas)
+
+    def _upload_image(self, img, atlas=True):
         if not atlas:
             return img.get_texture(True)
 
@@ -514,6 +717,34 @@ class Loader(object):
 
         return identity.get_transform(flip_x, flip_y, rotate)
 
+    def preload(self, names, atlas=True, threads=None):
+        '''Start loading several images in the background.
+
+        The images are decoded on a pool of threads.  They are uploaded to
+        textures by the `PreloadProgress.update` and `PreloadProgress.wait`
+        methods of the returned object, which must be called on the thread
+        owning the OpenGL context.  Once an image has been uploaded, `image`
+        returns it without decoding it again (as long as a reference to it
+        is kept, for example by the returned object).
+
+        :Parameters:
+            `names` : list of str
+                Filenames of the image sources to load.
+            `atlas` : bool
+                If True, the images will be loaded into atlases as for
+                `image`.
+            `threads` : int
+                Number of threads to decode images with.  Defaults to the
+                number of processors.
+
+        :rtype: `PreloadProgress`
+        :since: pyglet 1.2
+        '''
+        self._require_index()
+        if threads is None:
+            threads = _get_preload_thread_count()
+        return PreloadProgress(self, names, atlas, max(threads, 1))
+
     def animation(self, name, flip_x=False, flip_y=False, rotate=0):
         '''Load an animation with optional transformation.
 
@@ -711,6 +942,7 @@ file = _default_loader.file
 location = _default_loader.location
 add_font = _default_loader.add_font
 image = _default_loader.image
+preload = _default_loader.preload
 animation = _default_loader.animation
 get_cached_image_names = _default_loader.get_cached_image_names
 get_cached_animation_names = _default_loader.get_cached_animation_names
@@ -87,12 +87,36 @@ however a sprite can belong to at most one batch.  See the documentation for
 `pyglet.graphics` for more details on batched rendering, and grouping of
 sprites within batches.
 
+Updating many sprites
+=====================
+
+Each `Sprite` recomputes and uploads its own vertices whenever one of its
+properties changes, which becomes the bottleneck when thousands of sprites
+move every frame.  A `SpriteBatch` instead keeps the position, rotation,
+scale, opacity and color of many sprites sharing one texture in contiguous
+arrays, and writes the vertices of all of them in a single pass when
+`SpriteBatch.update` is called::
+
+    particles = pyglet.sprite.SpriteBatch(ball_image.get_texture(), batch)
+    for i in range(10000):
+        particles.add(x=random.randrange(640), y=random.randrange(480))
+
+    def update(dt):
+        for i in range(len(particles)):
+            particles.y[i] -= 100 * dt
+        particles.update()
+
+If NumPy is installed it is used to compute the vertices, and the arrays can
+be modified in bulk through ``numpy.frombuffer``.
+
 :since: pyglet 1.1
 '''
 
 __docformat__ = 'restructuredtext'
 __version__ = '$Id$'
 
+import array
+import ctypes
 import math
 import sys
 
@@ -104,6 +128,11 @@ from pyglet import image
 
 _is_epydoc = hasattr(sys, 'is_epydoc') and sys.is_epydoc
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class SpriteGroup(graphics.Group):
     '''Shared sprite rendering group.
 
@@ -134,6 +163,16 @@ class SpriteGroup(graphics.Group):
         self.blend_src = blend_src
         self.blend_dest = blend_dest
 
+        # A subclass setting other state is only switched to directly if it
+        # gives its own state key.
+        if (graphics._is_default_method(self.set_state,
+                                        SpriteGroup.set_state) and
+            graphics._is_default_method(self.unset_state,
+                                        SpriteGroup.unset_state) and
+            graphics._is_default_method(self.switch_state,
+                                        SpriteGroup.switch_state)):
+            self.state_key = (texture.target, blend_src, blend_dest)
+
     def set_state(self):
         glEnable(self.texture.target)
         glBindTexture(self.texture.target, self.texture.id)
@@ -146,6 +185,11 @@ class SpriteGroup(graphics.Group):
         glPopAttrib()
         glDisable(self.texture.target)
 
+    def switch_state(self, previous):
+        # Blend state and texture target are the same as previous; the
+        # attributes pushed by previous are popped by this group's unset.
+        glBindTexture(self.texture.target, self.texture.id)
+
     def __repr__(self):
         return '%s(%r)' % (self.__class__.__name__, self.texture)
 
@@ -162,6 +206,81 @@ class SpriteGroup(graphics.Group):
                      self.texture.id, self.texture.target,
                      self.blend_src, self.blend_dest))
 
+class _AnimationTimeline(object):
+    # Sprites displaying the same animation in step.  All of them are
+    # advanced by a single scheduled function, instead of each sprite
+    # rescheduling itself on every frame.
+    def __init__(self, animation, timeline_clock, key):
+        self.animation = animation
+        self.clock = timeline_clock
+        self.key = key
+        self.sprites = set()
+        self.frame_index = 0
+        self.next_dt = animation.frames[0].duration
+        self.clock.schedule_once(self._animate, self.next_dt)
+
+    def remove(self, sprite):
+        self.sprites.discard(sprite)
+        sprite._animation_timeline = None
+        if not self.sprites:
+            self.clock.unschedule(self._animate)
+            self._close()
+
+    def _close(self):
+        if _animation_timelines.get(self.key) is self:
+            del _animation_timelines[self.key]
+
+    def _animate(self, dt):
+        # Sprites can only join the timeline before its first frame change.
+        self._close()
+
+        frames = self.animation.frames
+        self.frame_index += 1
+        if self.frame_index >= len(frames):
+            self.frame_index = 0
+            for sprite in list(self.sprites):
+                if sprite._animation_timeline is self:
+                    sprite.dispatch_event('on_animation_end')
+            if not self.sprites:
+                return # Deleted in event handlers.
+
+        frame = frames[self.frame_index]
+        texture = frame.image.get_texture()
+        tex_coords = texture.tex_coords
+        for sprite in list(self.sprites):
+            if sprite._texture.id == texture.id:
+                sprite._vertex_list.tex_coords[:] = tex_coords
+                sprite._texture = texture
+            else:
+                sprite._set_texture(texture)
+
+        if frame.duration is not None:
+            duration = frame.duration - (self.next_dt - dt)
+            duration = min(max(0, duration), frame.duration)
+            self.clock.schedule_once(self._animate, duration)
+            self.next_dt = duration
+        else:
+            sprites = self.sprites
+            self.sprites = set()
+            for sprite in sprites:
+                sprite._animation_timeline = None
+            for sprite in sprites:
+                sprite.dispatch_event('on_animation_end')
+
+# Timelines that sprites can still join, keyed by animation, clock and start
+# time.
+_animation_timelines = {}
+
+def _join_animation_timeline(sprite, animation):
+    default = clock.get_default()
+    key = (animation, default, default.last_ts)
+    timeline = _animation_timelines.get(key)
+    if timeline is None:
+        timeline = _AnimationTimeline(animation, default, key)
+        _animation_timelines[key] = timeline
+    timeline.sprites.add(sprite)
+    sprite._animation_timeline = timeline
+
 class Sprite(event.EventDispatcher):
     '''Instance of an on-screen image.
 
@@ -169,6 +288,7 @@ class Sprite(event.EventDispatcher):
     '''
     _batch = None
     _animation = None
+    _animation_timeline = None
     _rotation = 0
     _opacity = 255
     _rgb = (255, 255, 255)
@@ -216,11 +336,9 @@ class Sprite(event.EventDispatcher):
 
         if isinstance(img, image.Animation):
             self._animation = img
-            self._frame_index = 0
             self._texture = img.frames[0].image.get_texture()
-            self._next_dt = img.frames[0].duration
-            if self._next_dt:
-                clock.schedule_once(self._animate, self._next_dt)
+            if img.frames[0].duration:
+                _join_animation_timeline(self, img)
         else:
             self._texture = img.get_texture()
 
@@ -242,8 +360,8 @@ class Sprite(event.EventDispatcher):
         collector will not necessarily call the finalizer as soon as the
         sprite is garbage.
         '''
-        if self._animation:
-            clock.unschedule(self._animate)
+        if self._animation_timeline is not None:
+            self._animation_timeline.remove(self)
         self._vertex_list.delete()
         self._vertex_list = None
         self._texture = None
@@ -251,25 +369,6 @@ class Sprite(event.EventDispatcher):
         # Easy way to break circular reference, speeds up GC
         self._group = None
 
-    def _animate(self, dt):
-        self._frame_index += 1
-        if self._frame_index >= len(self._animation.frames):
-            self._frame_index = 0
-            self.dispatch_event('on_animation_end')
-            if self._vertex_list is None:
-                return # Deleted in event handler.
-
-        frame = self._animation.frames[self._frame_index]
-        self._set_texture(frame.image.get_texture())
-
-        if frame.duration is not None:
-            duration = frame.duration - (self._next_dt - dt)
-            duration = min(max(0, duration), frame.duration)
-            clock.schedule_once(self._animate, duration)
-            self._next_dt = duration
-        else:
-            self.dispatch_event('on_animation_end')
-
     def _set_batch(self, batch):
         if self._batch == batch:
             return
@@ -326,17 +425,15 @@ class Sprite(event.EventDispatcher):
         return self._texture
 
     def _set_image(self, img):
-        if self._animation is not None:
-            clock.unschedule(self._animate)
-            self._animation = None
+        if self._animation_timeline is not None:
+            self._animation_timeline.remove(self)
+        self._animation = None
 
         if isinstance(img, image.Animation):
             self._animation = img
-            self._frame_index = 0
             self._set_texture(img.frames[0].image.get_texture())
-            self._next_dt = img.frames[0].duration
-            if self._next_dt:
-                clock.schedule_once(self._animate, self._next_dt)
+            if img.frames[0].duration:
+                _join_animation_timeline(self, img)
         else:
             self._set_texture(img.get_texture())
         self._update_position()
@@ -567,3 +664,364 @@ class Sprite(event.EventDispatcher):
             '''
 
 Sprite.register_event_type('on_animation_end')
+
+def _copy_into(target, data):
+    # Copy an array.array or NumPy array into an array obtained from a vertex
+    # list.  Regions of interleaved buffers are not contiguous and must be
+    # assigned element-wise.
+    if not isinstance(target, ctypes.Array):
+        target[:] = data.tolist()
+    elif isinstance(data, array.array):
+        address, length = data.buffer_info()
+        ctypes.memmove(target, address, length * data.itemsize)
+    else:
+        ctypes.memmove(target, data.ctypes.data, data.nbytes)
+
+class SpriteBatch(object):
+    '''Array-backed collection of sprites sharing one texture.
+
+    The attributes of every sprite are kept in the arrays `x`, `y`,
+    `rotation`, `scale`, `opacity` and `color`, indexed by the sprite index
+    returned from `add`.  The arrays can be modified freely; the vertices of
+    all sprites are computed and uploaded in one pass by `update`.
+
+    All sprites are drawn from a single vertex list in the order of their
+    indices, using the same `SpriteGroup` as a `Sprite` displaying the same
+    texture, so a sprite batch is ordered with other sprites and groups in a
+    `Batch` as usual.  Unlike `Sprite`, vertex coordinates are not rounded
+    to integers.
+
+    :since: pyglet 1.2
+    '''
+    _vertex_list = None
+
+    def __init__(self, texture,
+                 batch=None,
+                 group=None,
+                 blend_src=GL_SRC_ALPHA,
+                 blend_dest=GL_ONE_MINUS_SRC_ALPHA,
+                 usage='stream'):
+        '''Create a sprite batch.
+
+        :Parameters:
+            `texture` : `Texture`
+                Texture shared by all sprites.  Images added to the batch
+                must be this texture or regions of it, for example the
+                images of a `TextureGrid` or a texture atlas.
+            `batch` : `Batch`
+                Optional batch to add the sprites to.
+            `group` : `Group`
+                Optional parent group of the sprites.
+            `blend_src` : int
+                OpenGL blend source mode.
+            `blend_dest` : int
+                OpenGL blend destination mode.
+            `usage` : str
+                Vertex buffer object usage hint, one of ``"none"``,
+                ``"stream"`` (default), ``"dynamic"`` or ``"static"``.
+                Applies to vertex and color data.
+
+        '''
+        self._texture = texture
+        self._batch = batch
+        self._group = SpriteGroup(texture, blend_src, blend_dest, group)
+        self._usage = usage
+        self._tex_coords_dirty = False
+
+        #: X coordinate of each sprite.
+        self.x = array.array('f')
+        #: Y coordinate of each sprite.
+        self.y = array.array('f')
+        #: Clockwise rotation of each sprite, in degrees.
+        self.rotation = array.array('f')
+        #: Scaling factor of each sprite.
+        self.scale = array.array('f')
+        #: Blend opacity of each sprite, in the range 0 to 255.
+        self.opacity = array.array('B')
+        #: Blend color of each sprite, as three consecutive (red, green,
+        #: blue) components per sprite.
+        self.color = array.array('B')
+
+        # Image geometry and texture coordinates of each sprite
+        self._anchor_x = array.array('f')
+        self._anchor_y = array.array('f')
+        self._width = array.array('f')
+        self._height = array.array('f')
+        self._tex_coords = array.array('f')
+
+    def __len__(self):
+        return len(self.x)
+
+    def add(self, img=None, x=0, y=0, rotation=0, scale=1.0, opacity=255,
+            color=(255, 255, 255)):
+        '''Add a sprite to the batch.
+
+        The sprite is not displayed until `update` is called.
+
+        :Parameters:
+            `img` : `AbstractImage`
+                Image to display, or None to display the whole texture.
+            `x` : float
+                X coordinate of the sprite.
+            `y` : float
+                Y coordinate of the sprite.
+            `rotation` : float
+                Clockwise rotation of the sprite, in degrees.
+            `scale` : float
+                Scaling factor.
+            `opacity` : int
+                Blend opacity.
+            `color` : (int, int, int)
+                Blend color.
+
+        :rtype: int
+        :return: The index of the sprite.
+        '''
+        if img is None:
+            img = self._texture
+        texture = self._get_texture(img)
+
+        index = len(self.x)
+        self.x.append(x)
+        self.y.append(y)
+        self.rotation.append(rotation)
+        self.scale.append(scale)
+        self.opacity.append(opacity)
+        self.color.extend(color)
+        for a in (self._anchor_x, self._anchor_y, self._width, self._height):
+            a.append(0)
+        self._tex_coords.extend(texture.tex_coords)
+        self._set_texture(index, texture)
+        return index
+
+    def remove(self, index):
+        '''Remove a sprite from the batch.
+
+        The last sprite in the batch is moved to the index of the removed
+        sprite, so that the arrays remain contiguous.  The sprite is removed
+        from display when `update` is called.
+
+        :Parameters:
+            `index` : int
+                Index of the sprite to remove.
+
+        '''
+        last = len(self.x) - 1
+        if index < 0 or index > last:
+            raise IndexError('sprite index out of range')
+        if index != last:
+            for a in (self.x, self.y, self.rotation, self.scale, self.opacity,
+                      self._anchor_x, self._anchor_y,
+                      self._width, self._height):
+                a[index] = a[last]
+            self.color[index * 3:index * 3 + 3] = self.color[last * 3:]
+            self._tex_coords[index * 12:index * 12 + 12] = \
+                self._tex_coords[last * 12:]
+        for a in (self.x, self.y, self.rotation, self.scale, self.opacity,
+                  self._anchor_x, self._anchor_y, self._width, self._height):
+            del a[last]
+        del self.color[last * 3:]
+        del self._tex_coords[last * 12:]
+        self._tex_coords_dirty = True
+
+    def set_image(self, index, img):
+        '''Change the image displayed by a sprite.
+
+        :Parameters:
+            `index` : int
+                Index of the sprite.
+            `img` : `AbstractImage`
+                Image to display.  Its texture must be the texture of the
+                batch or a region of it.
+
+        '''
+        self._set_texture(index, self._get_texture(img))
+
+    def _get_texture(self, img):
+        texture = img.get_texture()
+        if (texture.id != self._texture.id or
+            texture.target != self._texture.target):
+            raise ValueError('Image is not a region of the batch texture')
+        return texture
+
+    def _set_texture(self, index, texture):
+        self._anchor_x[index] = texture.anchor_x
+        self._anchor_y[index] = texture.anchor_y
+        self._width[index] = texture.width
+        self._height[index] = texture.height
+        self._tex_coords[index * 12:index * 12 + 12] = \
+            array.array('f', texture.tex_coords)
+        self._tex_coords_dirty = True
+
+    def delete(self):
+        '''Force immediate removal of the sprites from video memory.'''
+        if self._vertex_list is not None:
+            self._vertex_list.delete()
+            self._vertex_list = None
+        self._group = None
+
+    def _get_vertex_list(self):
+        # Create or resize the vertex list to hold every sprite; returns
+        # None if the batch is empty.
+        count = len(self.x) * 4
+        vertex_list = self._vertex_list
+        if count == 0:
+            if vertex_list is not None:
+                vertex_list.delete()
+                self._vertex_list = None
+            return None
+
+        if vertex_list is None:
+            formats = ('v2f/%s' % self._usage, 'c4B/%s' % self._usage, 't3f')
+            if self._batch is None:
+                vertex_list = graphics.vertex_list(count, *formats)
+            else:
+                vertex_list = self._batch.add(count, GL_QUADS, self._group,
+                                              *formats)
+            self._vertex_list = vertex_list
+            self._tex_coords_dirty = True
+        elif vertex_list.get_size() != count:
+            vertex_list.resize(count)
+            self._tex_coords_dirty = True
+        return vertex_list
+
+    def update(self):
+        '''Write the vertices and colors of every sprite.
+
+        Call this after modifying the attribute arrays or adding and removing
+        sprites.
+        '''
+        self.update_vertices()
+        self.update_colors()
+
+    def update_vertices(self):
+        '''Write the vertices and texture coordinates of every sprite.
+
+        This is sufficient after modifying only the `x`, `y`, `rotation` or
+        `scale` arrays.
+        '''
+        vertex_list = self._get_vertex_list()
+        if vertex_list is None:
+            return
+
+        if numpy is not None:
+            _copy_into(vertex_list.vertices, self._get_vertices_numpy())
+        else:
+            _copy_into(vertex_list.vertices, self._get_vertices())
+
+        if self._tex_coords_dirty:
+            _copy_into(vertex_list.tex_coords, self._tex_coords)
+            self._tex_coords_dirty = False
+
+    def update_colors(self):
+        '''Write the colors of every sprite.
+
+        This is sufficient after modifying only the `opacity` or `color`
+        arrays.
+        '''
+        vertex_list = self._get_vertex_list()
+        if vertex_list is None:
+            return
+
+        if numpy is not None:
+            n = len(self.x)
+            colors = numpy.empty((n, 4, 4), numpy.uint8)
+            colors[:, :, :3] = \
+                numpy.frombuffer(self.color, numpy.uint8).reshape(n, 1, 3)
+            colors[:, :, 3] = \
+                numpy.frombuffer(self.opacity, numpy.uint8).reshape(n, 1)
+        else:
+            colors = array.array('B')
+            color = self.color
+            for i, opacity in enumerate(self.opacity):
+                c = color[i * 3:i * 3 + 3]
+                c.append(opacity)
+                colors.extend(c * 4)
+        _copy_into(vertex_list.colors, colors)
+
+    def _get_vertices(self):
+        radians = math.radians
+        cos = math.cos
+        sin = math.sin
+        vertices = []
+        extend = vertices.extend
+        for x, y, rotation, scale, anchor_x, anchor_y, width, height in zip(
+                self.x, self.y, self.rotation, self.scale,
+                self._anchor_x, self._anchor_y, self._width, self._height):
+            x1 = -anchor_x * scale
+            y1 = -anchor_y * scale
+            x2 = x1 + width * scale
+            y2 = y1 + height * scale
+            if rotation:
+                r = -radians(rotation)
+                cr = cos(r)
+                sr = sin(r)
+                extend((x1 * cr - y1 * sr + x, x1 * sr + y1 * cr + y,
+                        x2 * cr - y1 * sr + x, x2 * sr + y1 * cr + y,
+                        x2 * cr - y2 * sr + x, x2 * sr + y2 * cr + y,
+                        x1 * cr - y2 * sr + x, x1 * sr + y2 * cr + y))
+            else:
+                x1 += x
+                y1 += y
+                x2 += x
+                y2 += y
+                extend((x1, y1, x2, y1, x2, y2, x1, y2))
+        return array.array('f', vertices)
+
+    def _get_vertices_numpy(self):
+        def view(a):
+            return numpy.frombuffer(a, numpy.float32)
+        x = view(self.x)
+        y = view(self.y)
+        scale = view(self.scale)
+        x1 = -view(self._anchor_x) * scale
+        y1 = -view(self._anchor_y) * scale
+        x2 = x1 + view(self._width) * scale
+        y2 = y1 + view(self._height) * scale
+        r = -numpy.radians(view(self.rotation))
+        cr = numpy.cos(r)
+        sr = numpy.sin(r)
+
+        vertices = numpy.empty((len(x), 8), numpy.float32)
+        vertices[:, 0] = x1 * cr - y1 * sr + x
+        vertices[:, 1] = x1 * sr + y1 * cr + y
+        vertices[:, 2] = x2 * cr - y1 * sr + x
+        vertices[:, 3] = x2 * sr + y1 * cr + y
+        vertices[:, 4] = x2 * cr - y2 * sr + x
+        vertices[:, 5] = x2 * sr + y2 * cr + y
+        vertices[:, 6] = x1 * cr - y2 * sr + x
+        vertices[:, 7] = x1 * sr + y2 * cr + y
+        return vertices
+
+    def _get_batch(self):
+        return self._batch
+
+    batch = property(_get_batch,
+                     doc='''Graphics batch the sprites are drawn in.
+
+    Read-only.
+
+    :type: `Batch`
+    ''')
+
+    def _get_group(self):
+        return self._group.parent
+
+    group = property(_get_group,
+                     doc='''Parent graphics group.
+
+    Read-only.
+
+    :type: `Group`
+    ''')
+
+    def draw(self):
+        '''Draw every sprite in the batch.
+
+        `update` must have been called since the sprites were last changed.
+        '''
+        if self._vertex_list is None:
+            return
+        self._group.set_state_recursive()
+        self._vertex_list.draw(GL_QUADS)
+        self._group.unset_state_recursive()
@@ -672,6 +672,16 @@ class TextLayoutTextureGroup(graphics.Group):
 
         self.texture = texture
 
+        # A subclass setting other state is only switched to directly if it
+        # gives its own state key.
+        if (graphics._is_default_method(self.set_state,
+                TextLayoutTextureGroup.set_state) and
+            graphics._is_default_method(self.unset_state,
+                graphics.Group.unset_state) and
+            graphics._is_default_method(self.switch_state,
+                graphics.Group.switch_state)):
+            self.state_key = GL_TEXTURE_2D
+
     def set_state(self):
         glBindTexture(GL_TEXTURE_2D, self.texture.id)
 
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+'''Test that frame time statistics are computed over the most recent
+frames.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import unittest
+
+from pyglet import clock
+
+__noninteractive = True
+
+class SimulatedTime(object):
+    def __init__(self):
+        self.ts = 0.
+
+    def __call__(self):
+        return self.ts
+
+class FRAME_STATS(unittest.TestCase):
+    def run_frames(self, c, frame_time, times):
+        for dt in times:
+            frame_time.ts += dt
+            c.tick(poll=True)
+
+    def test_frame_stats(self):
+        frame_time = SimulatedTime()
+        c = clock.Clock(frame_time_function=frame_time)
+        stats = c.get_frame_stats()
+        self.assertTrue(stats.count == 0)
+        self.assertTrue(stats.max == 0)
+
+        c.tick(poll=True)
+        self.run_frames(c, frame_time, [0.016] * 95 + [0.050] * 5)
+        stats = c.get_frame_stats()
+        self.assertTrue(stats.count == 100)
+        self.assertAlmostEqual(stats.p50, 0.016)
+        self.assertAlmostEqual(stats.p95, 0.016)
+        self.assertAlmostEqual(stats.p99, 0.050)
+        self.assertAlmostEqual(stats.max, 0.050)
+        self.assertAlmostEqual(stats.mean, 0.0177)
+        self.assertAlmostEqual(stats.jitter, 0.034 / 99)
+
+    def test_ring(self):
+        frame_time = SimulatedTime()
+        c = clock.Clock(frame_time_function=frame_time)
+        c.tick(poll=True)
+        self.run_frames(c, frame_time, [0.1] * 10)
+        self.run_frames(c, frame_time,
+                        [0.01, 0.02] * (clock.Clock.FRAME_STATS_SIZE // 2))
+
+        # Only the most recent frames are included.
+        stats = c.get_frame_stats()
+        self.assertTrue(stats.count == clock.Clock.FRAME_STATS_SIZE)
+        self.assertAlmostEqual(stats.max, 0.02)
+        self.assertAlmostEqual(stats.p50, 0.01)
+        self.assertAlmostEqual(stats.jitter, 0.01)
+
+    def test_monotonic(self):
+        # The default frame time function is independent of time_function.
+        c = clock.Clock(time_function=lambda: 0.)
+        for i in range(10):
+            c.tick(poll=True)
+        stats = c.get_frame_stats()
+        self.assertTrue(stats.count == 9)
+        self.assertTrue(stats.max > 0)
+
+if __name__ == '__main__':
+    unittest.main()
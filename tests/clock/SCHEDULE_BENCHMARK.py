@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+'''Measure the time taken to schedule, fire and unschedule a large number
+of timers, and check that each fired the expected number of times.
+
+The clock is driven by a simulated 60Hz time function, so only the time
+spent managing the schedule and calling the timers is measured.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import random
+import time
+import unittest
+
+from pyglet import clock
+
+__noninteractive = True
+
+TIMERS = 100000
+SOFT_TIMERS = 100
+SECONDS = 10
+
+class SimulatedTime(object):
+    def __init__(self):
+        self.ts = 0.
+
+    def __call__(self):
+        return self.ts
+
+class Timer(object):
+    def __init__(self):
+        self.count = 0
+
+    def fire(self, dt):
+        self.count += 1
+
+class SCHEDULE_BENCHMARK(unittest.TestCase):
+    def tick(self, c, ticks):
+        for i in range(ticks):
+            self.time.ts += 1. / 60
+            c.tick(poll=True)
+
+    def test_benchmark(self):
+        random.seed(1)
+        self.time = SimulatedTime()
+        c = clock.Clock(time_function=self.time)
+        c.tick()
+
+        once = [Timer() for i in range(TIMERS // 2)]
+        interval = [(Timer(), random.uniform(0.5, 5))
+                    for i in range(TIMERS // 2)]
+        soft = [Timer() for i in range(SOFT_TIMERS)]
+
+        start_time = time.time()
+        for timer in once:
+            c.schedule_once(timer.fire, random.uniform(0, SECONDS - 1))
+        for timer, period in interval:
+            c.schedule_interval(timer.fire, period)
+        for timer in soft:
+            c.schedule_interval_soft(timer.fire, 0.5)
+        schedule_time = time.time() - start_time
+
+        start_time = time.time()
+        self.tick(c, SECONDS * 60)
+        tick_time = time.time() - start_time
+
+        start_time = time.time()
+        for timer, period in interval:
+            c.unschedule(timer.fire)
+        unschedule_time = time.time() - start_time
+
+        print
+        print 'schedule %d timers:   %8.3fs' % (len(once) + len(interval),
+                                               schedule_time)
+        print 'tick %d frames:        %8.3fs' % (SECONDS * 60, tick_time)
+        print 'unschedule %d timers: %8.3fs' % (len(interval),
+                                               unschedule_time)
+
+        self.assertTrue([t.count for t in once] == [1] * len(once))
+        for timer, period in interval:
+            self.assertTrue(abs(timer.count - int(SECONDS / period)) <= 1)
+        for timer in soft:
+            self.assertTrue(abs(timer.count - SECONDS * 2) <= 1)
+
+        # Unscheduled timers are no longer called.
+        counts = [timer.count for timer, period in interval]
+        self.tick(c, 600)
+        self.assertTrue([timer.count for timer, period in interval] == counts)
+        self.assertTrue(soft[0].count > SECONDS * 2 + 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# $Id:$
+
+'''Compare the speed of the vertex buffer allocators.
+
+Runs the mixed alloc/realloc/dealloc workload of GRAPHICS_ALLOCATION at a
+scale typical of a batch of sprites and glyphs, growing the buffer the same
+way `VertexDomain` does, and prints the time taken by each allocator.  Also
+prints the time taken to allocate from a buffer fragmented into many free
+blocks too small for the allocation.
+'''
+
+import random
+import time
+import unittest
+
+from pyglet.graphics import allocation
+
+__noninteractive = True
+
+# Number of regions live at the end of the warm-up phase, and the number of
+# random operations performed afterwards.
+LIVE_REGIONS = 10000
+OPERATIONS = 20000
+
+def _nearest_pow2(v):
+    p = 1
+    while p < v:
+        p <<= 1
+    return p
+
+def force(allocator, func, *args):
+    try:
+        return func(*args)
+    except allocation.AllocatorMemoryException, e:
+        allocator.set_capacity(_nearest_pow2(e.requested_capacity))
+        return func(*args)
+
+def run_workload(allocator, seed=1):
+    random.seed(seed)
+    sizes = [4, 4, 4, 4, 8, 12, 24]
+    regions = []
+
+    start_time = time.time()
+    for i in range(LIVE_REGIONS):
+        size = random.choice(sizes)
+        regions.append([force(allocator, allocator.alloc, size), size])
+
+    for i in range(OPERATIONS):
+        r = random.random()
+        if r < 0.4:
+            size = random.choice(sizes)
+            regions.append([force(allocator, allocator.alloc, size), size])
+        elif r < 0.6 and regions:
+            region = random.choice(regions)
+            new_size = random.choice(sizes)
+            region[0] = force(allocator, allocator.realloc,
+                              region[0], region[1], new_size)
+            region[1] = new_size
+        elif regions:
+            region = regions.pop(random.randrange(len(regions)))
+            allocator.dealloc(*region)
+        if i % 100 == 0:
+            allocator.get_allocated_regions()
+
+    for start, size in regions:
+        allocator.dealloc(start, size)
+    return time.time() - start_time
+
+def run_fragmented(allocator):
+    # Leave free blocks of 5 between regions of 3, then allocate 6 each
+    # time.
+    starts = [force(allocator, allocator.alloc, 8)
+              for i in range(LIVE_REGIONS)]
+    for start in starts[::2]:
+        allocator.realloc(start, 8, 3)
+
+    start_time = time.time()
+    for i in range(LIVE_REGIONS // 10):
+        force(allocator, allocator.alloc, 6)
+    return time.time() - start_time
+
+class ALLOCATION_BENCHMARK(unittest.TestCase):
+    def benchmark(self, name, allocator):
+        elapsed = run_workload(allocator)
+        print '%-24s %8.3fs  capacity=%d' % (
+            name, elapsed, allocator.capacity)
+        self.assertTrue(allocator.get_free_size() == allocator.capacity)
+        return elapsed
+
+    def test_benchmark(self):
+        print
+        self.benchmark('Allocator', allocation.Allocator(16))
+        self.benchmark('FreeListAllocator first',
+            allocation.FreeListAllocator(16, allocation.FIRST_FIT))
+        self.benchmark('FreeListAllocator best',
+            allocation.FreeListAllocator(16, allocation.BEST_FIT))
+
+    def test_fragmented(self):
+        print
+        for name, policy in (('first', allocation.FIRST_FIT),
+                             ('best', allocation.BEST_FIT)):
+            elapsed = run_fragmented(
+                allocation.FreeListAllocator(16, policy))
+            print '%-24s %8.3fs  fragmented' % (
+                'FreeListAllocator ' + name, elapsed)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# $Id:$
+
+'''Measure the frame rate of the clock with increasing numbers of animated
+sprites, and check that sprites started at different times keep their own
+frame timelines.
+
+The clock is driven by a simulated 60Hz time function, so only the time
+spent advancing animations is measured.
+'''
+
+import time
+import unittest
+
+from pyglet.gl import *
+from pyglet import clock
+from pyglet import graphics
+from pyglet import image
+from pyglet import sprite
+
+__noninteractive = True
+
+SPRITE_COUNTS = (100, 1000, 5000, 20000)
+TICKS = 120
+
+class SimulatedTime(object):
+    def __init__(self):
+        self.ts = 0.
+
+    def __call__(self):
+        return self.ts
+
+class ANIMATION_BENCHMARK(unittest.TestCase):
+    def setUp(self):
+        # Texture objects are only used for their coordinates, so no texture
+        # name or context is needed.
+        texture = image.Texture(64, 16, GL_TEXTURE_2D, 0)
+        self.frames = [texture.get_region(i * 16, 0, 16, 16)
+                       for i in range(4)]
+        self.animation = image.Animation.from_image_sequence(
+            self.frames, 0.1)
+
+        self.time = SimulatedTime()
+        self.saved_clock = clock.get_default()
+        clock.set_default(clock.Clock(time_function=self.time))
+
+    def tearDown(self):
+        clock.set_default(self.saved_clock)
+
+    def tick(self):
+        self.time.ts += 1 / 60.
+        clock.tick()
+
+    def get_frame(self, s):
+        tex_coords = tuple(s._vertex_list.tex_coords)
+        for i, frame in enumerate(self.frames):
+            if tex_coords == tuple(frame.tex_coords):
+                return i
+
+    def test_timelines(self):
+        batch = graphics.Batch()
+        clock.tick()
+        first = [sprite.Sprite(self.animation, batch=batch)
+                 for i in range(10)]
+        for i in range(3):
+            self.tick()
+        second = [sprite.Sprite(self.animation, batch=batch)
+                  for i in range(10)]
+
+        ends = []
+        first[0].push_handlers(on_animation_end=lambda: ends.append(True))
+        for i in range(25):
+            self.tick()
+            self.assertTrue(len(set(map(self.get_frame, first))) == 1)
+            self.assertTrue(len(set(map(self.get_frame, second))) == 1)
+        # 28 ticks after the first sprites were created and 25 after the
+        # second; the first sprites have looped.
+        self.assertTrue(self.get_frame(first[0]) == 0)
+        self.assertTrue(self.get_frame(second[0]) == 3)
+        self.assertTrue(ends == [True])
+
+        second[0].image = self.frames[1]
+        first[1].delete()
+        for i in range(6):
+            self.tick()
+        self.assertTrue(self.get_frame(second[0]) == 1)
+        self.assertTrue([self.get_frame(s) for s in first[2:]] == [1] * 8)
+        self.assertTrue([self.get_frame(s) for s in second[1:]] == [0] * 9)
+
+    def test_benchmark(self):
+        print
+        for count in SPRITE_COUNTS:
+            batch = graphics.Batch()
+            clock.tick()
+            sprites = [sprite.Sprite(self.animation, batch=batch)
+                       for i in range(count)]
+
+            start_time = time.time()
+            for i in range(TICKS):
+                self.tick()
+            elapsed = time.time() - start_time
+            print '%6d sprites: %8.1f frames/sec' % (count, TICKS / elapsed)
+
+            for s in sprites:
+                s.delete()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# $Id:$
+
+'''Test that compacting a vertex domain preserves vertex list contents and
+collapses the allocated regions.
+'''
+
+import unittest
+
+from pyglet.gl import *
+from pyglet import graphics
+from pyglet.graphics import vertexdomain
+
+__noninteractive = True
+
+class DOMAIN_COMPACT(unittest.TestCase):
+    def create_lists(self, domain, n, indexed=False):
+        vertex_lists = []
+        for i in range(n):
+            if indexed:
+                vertex_list = domain.create(4, 6)
+                start = vertex_list.start
+                vertex_list.indices[:] = \
+                    [start + j for j in (0, 1, 2, 0, 2, 3)]
+            else:
+                vertex_list = domain.create(4)
+            vertex_list.vertices[:] = [i] * 8
+            vertex_list.colors[:] = [i % 256] * 16
+            vertex_lists.append(vertex_list)
+        return vertex_lists
+
+    def check_lists(self, vertex_lists, indexed=False):
+        for vertex_list in vertex_lists:
+            i = int(vertex_list.vertices[0])
+            self.assertTrue(list(vertex_list.vertices) == [i] * 8)
+            self.assertTrue(list(vertex_list.colors) == [i % 256] * 16)
+            if indexed:
+                start = vertex_list.start
+                self.assertTrue(list(vertex_list.indices) ==
+                    [start + j for j in (0, 1, 2, 0, 2, 3)])
+
+    def test_compact(self):
+        domain = vertexdomain.create_domain('v2f/static', 'c4B')
+        vertex_lists = self.create_lists(domain, 100)
+        for vertex_list in vertex_lists[::3]:
+            vertex_list.delete()
+        vertex_lists = [v for i, v in enumerate(vertex_lists) if i % 3]
+        starts, sizes = domain.allocator.get_allocated_regions()
+        self.assertTrue(len(starts) > 1)
+
+        domain.compact()
+        starts, sizes = domain.allocator.get_allocated_regions()
+        self.assertTrue(starts == [0])
+        self.assertTrue(sizes == [len(vertex_lists) * 4])
+        self.assertTrue(domain.get_fragmented_fraction() == 0.)
+        self.assertTrue(domain.allocator.capacity == 512)
+        self.check_lists(vertex_lists)
+
+        # Domain remains usable after compaction
+        self.check_lists(self.create_lists(domain, 10))
+
+    def test_compact_no_shrink(self):
+        domain = vertexdomain.create_domain('v2f/static', 'c4B')
+        vertex_lists = self.create_lists(domain, 100)
+        for vertex_list in vertex_lists[:90]:
+            vertex_list.delete()
+        domain.compact(shrink=False)
+        self.assertTrue(domain.allocator.capacity == 512)
+        domain.compact()
+        self.assertTrue(domain.allocator.capacity == 64)
+        self.check_lists(vertex_lists[90:])
+
+    def test_compact_indexed(self):
+        domain = vertexdomain.create_indexed_domain('v2f/static', 'c4B')
+        vertex_lists = self.create_lists(domain, 50, indexed=True)
+        for vertex_list in vertex_lists[1::2]:
+            vertex_list.delete()
+        vertex_lists = vertex_lists[::2]
+
+        domain.compact()
+        starts, sizes = domain.index_allocator.get_allocated_regions()
+        self.assertTrue(starts == [0])
+        self.assertTrue(sizes == [len(vertex_lists) * 6])
+        self.check_lists(vertex_lists, indexed=True)
+
+    def test_batch_compact(self):
+        batch = graphics.Batch()
+        vertex_lists = [batch.add(4, GL_QUADS, None,
+                                  ('v2f', [i] * 8), ('c4B', [i] * 16))
+                        for i in range(20)]
+        for vertex_list in vertex_lists[::2]:
+            vertex_list.delete()
+        domain = vertex_lists[1].domain
+        fraction = domain.get_fragmented_fraction()
+        self.assertTrue(fraction > 0.)
+
+        batch.compact(threshold=fraction)
+        self.assertTrue(domain.get_fragmented_fraction() == fraction)
+        batch.compact()
+        self.assertTrue(domain.get_fragmented_fraction() == 0.)
+        self.check_lists(vertex_lists[1::2])
+
+if __name__ == '__main__':
+    unittest.main()
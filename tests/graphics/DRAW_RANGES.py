@@ -0,0 +1,60 @@
+#!/usr/bin/python
+# $Id:$
+
+'''Test that the ranges drawn by a vertex domain are cached until the domain
+changes.
+'''
+
+import unittest
+
+from pyglet.gl import *
+from pyglet import graphics
+from pyglet.graphics import vertexdomain
+
+__noninteractive = True
+
+class DRAW_RANGES(unittest.TestCase):
+    def test_cache(self):
+        domain = vertexdomain.create_domain('v2f')
+        vertex_lists = [domain.create(4) for i in range(10)]
+
+        ranges = domain._get_draw_ranges()
+        self.assertTrue(ranges[0] == 1)
+        self.assertTrue(domain._get_draw_ranges() is ranges)
+        self.assertTrue(domain.draw_cache_hits == 1)
+        self.assertTrue(domain.draw_cache_misses == 1)
+
+        vertex_lists[3].delete()
+        primcount, starts, sizes = domain._get_draw_ranges()
+        self.assertTrue(primcount == 2)
+        self.assertTrue(list(starts) == [0, 16])
+        self.assertTrue(list(sizes) == [12, 24])
+        self.assertTrue(domain.draw_cache_misses == 2)
+
+        domain.compact()
+        self.assertTrue(domain._get_draw_ranges()[0] == 1)
+        self.assertTrue(domain.draw_cache_misses == 3)
+
+    def test_indexed_cache(self):
+        domain = vertexdomain.create_indexed_domain('v2f')
+        vertex_lists = [domain.create(4, 6) for i in range(10)]
+        vertex_lists[3].delete()
+
+        primcount, starts, sizes = domain._get_draw_ranges()
+        element_size = domain.index_element_size
+        ptr = domain.index_buffer.ptr
+        self.assertTrue(primcount == 2)
+        self.assertTrue([s for s in starts] ==
+                        [ptr, ptr + 24 * element_size])
+        self.assertTrue(domain._get_draw_ranges()[1] is starts)
+        self.assertTrue(domain.draw_cache_hits == 1)
+
+    def test_batch_stats(self):
+        batch = graphics.Batch()
+        vertex_list = batch.add(4, GL_QUADS, None, 'v2f')
+        vertex_list.domain._get_draw_ranges()
+        vertex_list.domain._get_draw_ranges()
+        self.assertTrue(batch.get_draw_cache_stats() == (1, 1))
+
+if __name__ == '__main__':
+    unittest.main()
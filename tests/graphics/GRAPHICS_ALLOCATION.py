@@ -18,7 +18,7 @@ class Region(object):
 
 class RegionAllocator(object):
     def __init__(self, capacity):
-        self.allocator = allocation.Allocator(capacity)
+        self.allocator = fixture.create_allocator(capacity)
         self.regions = []
 
     def check_region(self, region):
@@ -145,6 +145,9 @@ class TestAllocation(unittest.TestCase):
         global fixture
         fixture = self
 
+    def create_allocator(self, capacity):
+        return allocation.Allocator(capacity)
+
     def test_alloc1(self):
         capacity = 10
         allocator = RegionAllocator(capacity)
@@ -424,5 +427,74 @@ class TestAllocation(unittest.TestCase):
             allocator.dealloc(region) 
         self.assertTrue(allocator.get_free_size() == allocator.capacity)
 
+    def test_fragmentation(self):
+        allocator = RegionAllocator(20)
+        regions = []
+        for i in range(10):
+            regions.append(allocator.alloc(2))
+        for region in regions[1:9:2]:
+            allocator.dealloc(region)
+        self.assertTrue(allocator.get_free_size() == 8)
+        self.assertTrue(allocator.allocator.get_fragmentation() == 1.)
+
+def check_random_fit(test, policy, choose):
+    # Compare with choosing from a list of the free blocks that fit.
+    random.seed(1)
+    allocator = allocation.FreeListAllocator(1000, policy)
+    regions = []
+    for i in range(2000):
+        if regions and random.random() < 0.5:
+            allocator.dealloc(*regions.pop(random.randrange(len(regions))))
+            continue
+        size = random.randint(1, 20)
+        blocks = []
+        end = 0
+        for start, length in zip(*allocator.get_allocated_regions()) + \
+                             [(allocator.capacity, 0)]:
+            if start - end >= size:
+                blocks.append((end, start - end))
+            end = start + length
+        try:
+            start = allocator.alloc(size)
+        except allocation.AllocatorMemoryException:
+            test.assertTrue(not blocks)
+            continue
+        test.assertTrue(start == choose(blocks)[0])
+        regions.append((start, size))
+    for region in regions:
+        allocator.dealloc(*region)
+    test.assertTrue(allocator.get_free_size() == allocator.capacity)
+    test.assertTrue(len(allocator._free_sizes) == 1)
+
+class TestFreeListFirstFit(TestAllocation):
+    def create_allocator(self, capacity):
+        return allocation.FreeListAllocator(capacity, allocation.FIRST_FIT)
+
+    def test_first_fit(self):
+        allocator = RegionAllocator(20)
+        regions = [allocator.alloc(size) for size in (2, 4, 2, 2, 2)]
+        allocator.dealloc(regions[1])
+        allocator.dealloc(regions[3])
+        self.assertTrue(allocator.alloc(2).start == 2)
+
+    def test_first_fit_random(self):
+        check_random_fit(self, allocation.FIRST_FIT,
+                         lambda blocks: blocks[0])
+
+class TestFreeListBestFit(TestAllocation):
+    def create_allocator(self, capacity):
+        return allocation.FreeListAllocator(capacity, allocation.BEST_FIT)
+
+    def test_best_fit(self):
+        allocator = RegionAllocator(20)
+        regions = [allocator.alloc(size) for size in (2, 4, 2, 2, 2)]
+        allocator.dealloc(regions[1])
+        allocator.dealloc(regions[3])
+        self.assertTrue(allocator.alloc(2).start == 8)
+
+    def test_best_fit_random(self):
+        check_random_fit(self, allocation.BEST_FIT, lambda blocks:
+                         min(blocks, key=lambda (start, size): (size, start)))
+
 if __name__ == '__main__':
     unittest.main()
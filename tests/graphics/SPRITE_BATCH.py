@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# $Id:$
+
+'''Test that a sprite batch writes the same vertices, colors and texture
+coordinates as individual sprites with the same attributes.
+'''
+
+import unittest
+
+from pyglet.gl import *
+from pyglet import graphics
+from pyglet import image
+from pyglet import sprite
+
+__noninteractive = True
+
+class SPRITE_BATCH(unittest.TestCase):
+    def setUp(self):
+        # Texture objects are only used for their size and coordinates, so
+        # no texture name or context is needed.
+        self.texture = image.Texture(64, 32, GL_TEXTURE_2D, 0)
+        self.images = [self.texture,
+                       self.texture.get_region(0, 0, 16, 16),
+                       self.texture.get_region(16, 8, 32, 24)]
+        self.images[1].anchor_x = 8
+        self.images[1].anchor_y = 4
+
+    def sprite_attributes(self, n):
+        for i in range(n):
+            yield (self.images[i % 3], 10 + i * 7, 20 + i * 3,
+                   (i % 4) * 30, 1.0 + (i % 3) * 0.5, 255 - i,
+                   (i, 2 * i, 255 - i))
+
+    def check_sprite(self, vertex_list, start, attributes):
+        img, x, y, rotation, scale, opacity, color = attributes
+        s = sprite.Sprite(img, x, y, batch=graphics.Batch())
+        s.rotation = rotation
+        s.scale = scale
+        s.opacity = opacity
+        s.color = color
+
+        vertices = vertex_list.vertices[start * 8:start * 8 + 8]
+        for v, expected in zip(vertices, s._vertex_list.vertices):
+            # Sprite truncates coordinates to integers.
+            self.assertTrue(abs(v - expected) < 1.001)
+        self.assertTrue(list(vertex_list.colors[start * 16:start * 16 + 16]) ==
+                        list(s._vertex_list.colors))
+        tex_coords = vertex_list.tex_coords[start * 12:start * 12 + 12]
+        for t, expected in zip(tex_coords, img.tex_coords):
+            self.assertTrue(abs(t - expected) < 1e-6)
+        s.delete()
+
+    def test_update(self):
+        batch = graphics.Batch()
+        sprites = sprite.SpriteBatch(self.texture, batch)
+        attributes = list(self.sprite_attributes(20))
+        for args in attributes:
+            sprites.add(*args)
+        sprites.update()
+        self.assertTrue(len(sprites) == 20)
+        for i, args in enumerate(attributes):
+            self.check_sprite(sprites._vertex_list, i, args)
+
+        for i in range(len(sprites)):
+            sprites.x[i] += 5
+            sprites.rotation[i] = 45
+        sprites.update_vertices()
+        for i, args in enumerate(attributes):
+            args = (args[0], args[1] + 5, args[2], 45) + args[4:]
+            self.check_sprite(sprites._vertex_list, i, args)
+
+    def test_remove(self):
+        sprites = sprite.SpriteBatch(self.texture, graphics.Batch())
+        attributes = list(self.sprite_attributes(5))
+        for args in attributes:
+            sprites.add(*args)
+        sprites.update()
+
+        # The last sprite takes the place of the removed one.
+        sprites.remove(1)
+        sprites.remove(3)
+        sprites.update()
+        self.assertTrue(len(sprites) == 3)
+        self.assertTrue(sprites._vertex_list.get_size() == 12)
+        for i, args in enumerate([attributes[0], attributes[4],
+                                  attributes[2]]):
+            self.check_sprite(sprites._vertex_list, i, args)
+
+        for i in range(3):
+            sprites.remove(0)
+        sprites.update()
+        self.assertTrue(sprites._vertex_list is None)
+        self.assertRaises(IndexError, sprites.remove, 0)
+
+    def test_group(self):
+        batch = graphics.Batch()
+        parent = graphics.OrderedGroup(1)
+        s = sprite.Sprite(self.images[1], batch=batch, group=parent)
+        sprites = sprite.SpriteBatch(self.texture, batch, parent)
+        sprites.add(self.images[2])
+        sprites.update()
+
+        # Sprites and sprite batches with the same texture share a group.
+        self.assertTrue(sprites.group is parent)
+        groups = [g for g in batch.group_map if g.parent is parent]
+        self.assertTrue(len(groups) == 1)
+        self.assertTrue(len(batch.group_map[groups[0]]) == 2)
+        self.assertRaises(ValueError, sprites.add,
+                          image.Texture(16, 16, GL_TEXTURE_2D, 1))
+        s.delete()
+        sprites.delete()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/python
+# $Id:$
+
+'''Test that a batch of sprite groups with 1000 textures is drawn with fewer
+OpenGL calls than setting and unsetting every group and domain in turn, and
+that the result is the same.  Also test that subclasses of the texture,
+sprite and text layout groups setting other state are not switched to
+directly.
+'''
+
+import unittest
+
+from pyglet.gl import *
+from pyglet import graphics
+from pyglet import image
+from pyglet import sprite
+from pyglet import window
+from pyglet.graphics import vertexattribute, vertexbuffer, vertexdomain
+from pyglet.text import layout
+
+__noninteractive = True
+
+TEXTURES = 1000
+
+class GLCallCounter(object):
+    '''Count calls to OpenGL functions made by the given modules.'''
+    def __init__(self, *modules):
+        self.modules = modules
+        self.count = 0
+        self.saved = []
+
+    def install(self):
+        for module in self.modules:
+            for name, func in vars(module).items():
+                if name.startswith('gl') and hasattr(func, 'argtypes'):
+                    self.saved.append((module, name, func))
+                    setattr(module, name, self.wrap(func))
+
+    def uninstall(self):
+        for module, name, func in self.saved:
+            setattr(module, name, func)
+        self.saved = []
+
+    def wrap(self, func):
+        def counted(*args):
+            self.count += 1
+            return func(*args)
+        return counted
+
+def draw_unoptimised(batch):
+    # Group and domain state is set and unset around every domain.
+    def visit(group):
+        group.set_state()
+        for (_, mode, _), domain in batch.group_map[group].items():
+            domain.draw(mode)
+        children = batch.group_children.get(group, [])
+        children.sort()
+        for child in children:
+            visit(child)
+        group.unset_state()
+
+    batch.top_groups.sort()
+    for group in batch.top_groups:
+        visit(group)
+
+class FakeTexture(object):
+    target = GL_TEXTURE_2D
+    id = 1
+
+class BlendTextureGroup(graphics.TextureGroup):
+    def set_state(self):
+        super(BlendTextureGroup, self).set_state()
+        glEnable(GL_BLEND)
+
+class RecordingSpriteGroup(sprite.SpriteGroup):
+    calls = []
+
+    def set_state(self):
+        self.calls.append(('set', self))
+
+    def unset_state(self):
+        self.calls.append(('unset', self))
+
+class RecordingTextGroup(layout.TextLayoutTextureGroup):
+    def set_state(self):
+        pass
+
+class STATE_CHANGES(unittest.TestCase):
+    def get_pixels(self):
+        buffer = image.get_buffer_manager().get_color_buffer()
+        return buffer.get_image_data().get_data('RGBA', buffer.width * 4)
+
+    def test_state_changes(self):
+        w = window.Window(64, 64, visible=False)
+        w.switch_to()
+
+        batch = graphics.Batch()
+        parent = graphics.OrderedGroup(0)
+        textures = []
+        for i in range(TEXTURES):
+            texture = image.Texture.create(1, 1)
+            textures.append(texture)
+            group = sprite.SpriteGroup(texture, GL_SRC_ALPHA,
+                                       GL_ONE_MINUS_SRC_ALPHA, parent)
+            x = i % 32 * 2
+            y = i // 32 * 2
+            batch.add(4, GL_QUADS, group,
+                ('v2i', (x, y, x + 2, y, x + 2, y + 2, x, y + 2)),
+                ('c4B', (i % 256, 255, 0, 255) * 4),
+                ('t3f', texture.tex_coords))
+
+        counter = GLCallCounter(graphics, vertexattribute, vertexbuffer,
+                                vertexdomain, sprite)
+        counter.install()
+        try:
+            glClear(GL_COLOR_BUFFER_BIT)
+            counter.count = 0
+            draw_unoptimised(batch)
+            unoptimised_count = counter.count
+            unoptimised_pixels = self.get_pixels()
+
+            batch.draw()  # Compile draw list
+            glClear(GL_COLOR_BUFFER_BIT)
+            counter.count = 0
+            batch.draw()
+            count = counter.count
+            pixels = self.get_pixels()
+        finally:
+            counter.uninstall()
+            w.close()
+
+        print '%d GL calls unoptimised, %d in batch' % (
+            unoptimised_count, count)
+        self.assertTrue(count < unoptimised_count / 2)
+        self.assertTrue(pixels == unoptimised_pixels)
+
+    def test_texture_group_subclass(self):
+        texture = FakeTexture()
+        self.assertTrue(
+            graphics.TextureGroup(texture).state_key == GL_TEXTURE_2D)
+        self.assertTrue(BlendTextureGroup(texture).state_key is None)
+
+        self.assertTrue(layout.TextLayoutTextureGroup(texture, None).state_key
+                        == GL_TEXTURE_2D)
+        self.assertTrue(RecordingTextGroup(texture, None).state_key is None)
+
+    def test_sprite_group_subclass(self):
+        parent = graphics.OrderedGroup(0)
+        textures = [FakeTexture(), FakeTexture()]
+        textures[1].id = 2
+        groups = [sprite.SpriteGroup(texture, GL_SRC_ALPHA,
+                                     GL_ONE_MINUS_SRC_ALPHA, parent)
+                  for texture in textures]
+        ops = [('set', groups[0]), ('unset', groups[0]),
+               ('set', groups[1]), ('unset', groups[1])]
+        draw_list = graphics.Batch()._compile_draw_list(ops)
+        self.assertTrue(len(draw_list) == 3)
+
+        # Both siblings of a subclass setting other state are set.
+        groups = [RecordingSpriteGroup(texture, GL_SRC_ALPHA,
+                                       GL_ONE_MINUS_SRC_ALPHA, parent)
+                  for texture in textures]
+        ops = [('set', groups[0]), ('unset', groups[0]),
+               ('set', groups[1]), ('unset', groups[1])]
+        for func in graphics.Batch()._compile_draw_list(ops):
+            func()
+        self.assertTrue(RecordingSpriteGroup.calls == ops)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 #!/usr/bin/python
 # $Id:$
 
+import random
 import unittest
 
 from pyglet.image import atlas
@@ -26,7 +27,7 @@ class AllocatorEnvironment(object):
     def __init__(self, test_case, width, height):
         self.test_case = test_case
         self.rectes = []
-        self.allocator = atlas.Allocator(width, height)
+        self.allocator = test_case.allocator_class(width, height)
 
     def check(self, test_case):
         for i, rect in enumerate(self.rectes):
@@ -47,6 +48,8 @@ class AllocatorEnvironment(object):
                                     self.allocator.alloc, width, height)
 
 class TestPack(unittest.TestCase):
+    allocator_class = atlas.Allocator
+
     def test_over_x(self):
         env = AllocatorEnvironment(self, 3, 3)
         env.add_fail(3, 4)
@@ -87,6 +90,36 @@ class TestPack(unittest.TestCase):
         env.add(4, 2)
         env.add(1, 2)
         env.add_fail(1, 1)
-   
+
+    def test_random(self):
+        random.seed(1)
+        env = AllocatorEnvironment(self, 64, 64)
+        area = 0
+        for i in range(200):
+            width = random.randint(1, 12)
+            height = random.randint(1, 12)
+            try:
+                env.add(width, height)
+                area += width * height
+            except atlas.AllocatorException:
+                pass
+        self.assertTrue(env.allocator.used_area == area)
+        self.assertTrue(0 < env.allocator.get_usage() <= 1)
+        self.assertTrue(0 <= env.allocator.get_fragmentation() < 1)
+
+class TestSkylinePack(TestPack):
+    allocator_class = atlas.SkylineAllocator
+
+    def test_5(self):
+        # The area beneath the skyline next to the first box cannot be used.
+        env = AllocatorEnvironment(self, 4, 4)
+        env.add(3, 2)
+        env.add(4, 2)
+        env.add_fail(1, 2)
+        self.assertTrue(env.allocator.get_fragmentation() == 2 / 16.)
+
+class TestMaxRectsPack(TestPack):
+    allocator_class = atlas.MaxRectsAllocator
+
 if __name__ == '__main__':
     unittest.main()
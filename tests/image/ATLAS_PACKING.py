@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# $Id:$
+
+'''Compare the number of atlases and the area used by a texture bin for
+each allocator, adding images of mixed sizes one at a time in an arbitrary
+order and all at once with `TextureBin.add_many`.
+
+Atlas textures are created without uploading any image data, so no context
+is needed.
+'''
+
+import random
+import time
+import unittest
+
+from pyglet.gl import *
+from pyglet import image
+from pyglet.image import atlas
+
+__noninteractive = True
+
+IMAGES = 600
+
+class Image(object):
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+class TextureAtlas(atlas.TextureAtlas):
+    def __init__(self, width=256, height=256, allocator_class=atlas.Allocator):
+        self.texture = image.Texture(width, height, GL_TEXTURE_2D, 0)
+        self.allocator = allocator_class(width, height)
+
+    def add(self, img):
+        x, y = self.allocator.alloc(img.width, img.height)
+        return self.texture.get_region(x, y, img.width, img.height)
+
+class ATLAS_PACKING(unittest.TestCase):
+    def setUp(self):
+        self.saved_atlas = atlas.TextureAtlas
+        atlas.TextureAtlas = TextureAtlas
+
+        random.seed(1)
+        self.images = []
+        for i in range(IMAGES):
+            if random.random() < 0.7:
+                # Glyph or icon sized
+                size = (random.randint(4, 24), random.randint(8, 32))
+            else:
+                size = (random.randint(16, 96), random.randint(16, 96))
+            self.images.append(Image(*size))
+
+    def tearDown(self):
+        atlas.TextureAtlas = self.saved_atlas
+
+    def check_regions(self, bin, regions):
+        self.assertTrue(len(regions) == len(self.images))
+        boxes = {}
+        for img, region in zip(self.images, regions):
+            self.assertTrue((region.width, region.height) ==
+                            (img.width, img.height))
+            boxes.setdefault(id(region.owner), []).append(
+                (region.x, region.y, region.x + region.width,
+                 region.y + region.height))
+        for rects in boxes.values():
+            rects.sort()
+            for i, (x1, y1, x2, y2) in enumerate(rects):
+                self.assertTrue(0 <= x1 and x2 <= bin.texture_width)
+                self.assertTrue(0 <= y1 and y2 <= bin.texture_height)
+                for ox1, oy1, ox2, oy2 in rects[i + 1:]:
+                    if ox1 >= x2:
+                        break
+                    self.assertFalse(oy1 < y2 and y1 < oy2)
+        return len(boxes)
+
+    def test_packing(self):
+        print
+        print '%-18s %-8s %7s %7s %7s %8s' % ('allocator', 'order',
+            'atlases', 'usage', 'frag', 'time')
+        results = {}
+        for allocator_class in (atlas.Allocator, atlas.SkylineAllocator,
+                                atlas.MaxRectsAllocator):
+            for many in (False, True):
+                bin = atlas.TextureBin(allocator_class=allocator_class)
+                start_time = time.time()
+                if many:
+                    regions = bin.add_many(self.images)
+                else:
+                    regions = [bin.add(img) for img in self.images]
+                elapsed = time.time() - start_time
+                atlas_count = self.check_regions(bin, regions)
+                results[allocator_class, many] = atlas_count
+
+                # Usage counts the full atlases the bin no longer adds to.
+                area = sum([img.width * img.height for img in self.images])
+                self.assertTrue(abs(bin.get_usage() - area /
+                    float(atlas_count * 256 * 256)) < 1e-9)
+                print '%-18s %-8s %7d %6.1f%% %6.1f%% %7.3fs' % (
+                    allocator_class.__name__, many and 'sorted' or 'access',
+                    atlas_count, bin.get_usage() * 100,
+                    bin.get_fragmentation() * 100, elapsed)
+
+        # Sorting never needs more atlases, and the new allocators need no
+        # more than the strips allocator.
+        for allocator_class in (atlas.Allocator, atlas.SkylineAllocator,
+                                atlas.MaxRectsAllocator):
+            self.assertTrue(results[allocator_class, True] <=
+                            results[allocator_class, False])
+            self.assertTrue(results[allocator_class, False] <=
+                            results[atlas.Allocator, False])
+
+if __name__ == '__main__':
+    unittest.main()
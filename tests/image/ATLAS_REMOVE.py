@@ -0,0 +1,208 @@
+#!/usr/bin/python
+# $Id:$
+
+'''Test that regions removed from an atlas are reused, and that
+defragmenting an atlas moves the regions in use together, copying their
+texture data and updating their texture coordinates.
+
+Prints the number of textures a texture bin keeps after loading and
+unloading images for a while, with and without removing and defragmenting
+the regions.
+
+Atlas textures are kept in memory, so no context is needed.
+'''
+
+import random
+import struct
+import unittest
+
+from pyglet.gl import *
+from pyglet import image
+from pyglet.image import atlas
+
+__noninteractive = True
+
+ALLOCATORS = (atlas.Allocator, atlas.SkylineAllocator,
+              atlas.MaxRectsAllocator)
+
+class MemoryTexture(image.Texture):
+    # Texture keeping its RGBA data in memory.
+    def __init__(self, width, height):
+        super(MemoryTexture, self).__init__(width, height, GL_TEXTURE_2D, 0)
+        self.buffer = bytearray(width * height * 4)
+
+    def blit_into(self, source, x, y, z):
+        pitch = source.width * 4
+        data = source.get_data('RGBA', pitch)
+        for row in range(source.height):
+            start = ((y + row) * self.width + x) * 4
+            self.buffer[start:start + pitch] = \
+                data[row * pitch:(row + 1) * pitch]
+
+    def get_image_data(self, z=0):
+        return image.ImageData(self.width, self.height, 'RGBA',
+                               str(self.buffer))
+
+def create_texture(cls, width, height, *args, **kwargs):
+    return MemoryTexture(width, height)
+
+def make_image(index, width, height):
+    color = struct.pack('<I', index + 1)
+    return image.ImageData(width, height, 'RGBA', color * (width * height))
+
+def random_size():
+    return random.randint(4, 40), random.randint(4, 40)
+
+class ATLAS_REMOVE(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+        self.saved_create = image.Texture.__dict__['create']
+        image.Texture.create = classmethod(create_texture)
+
+    def tearDown(self):
+        image.Texture.create = self.saved_create
+
+    def check_regions(self, texture_atlas, regions):
+        # Each region holds its image and does not overlap another.
+        texture = texture_atlas.texture
+        data = str(texture.buffer)
+        rects = []
+        for index, region in regions:
+            self.assertTrue(region.owner is texture)
+            color = struct.pack('<I', index + 1)
+            for row in range(region.height):
+                start = ((region.y + row) * texture.width + region.x) * 4
+                self.assertTrue(data[start:start + region.width * 4] ==
+                                color * region.width)
+            expected = texture.get_region(region.x, region.y,
+                                          region.width, region.height)
+            self.assertTrue(region.tex_coords == expected.tex_coords)
+            rects.append((region.x, region.y, region.x + region.width,
+                          region.y + region.height))
+        rects.sort()
+        for i, (x1, y1, x2, y2) in enumerate(rects):
+            self.assertTrue(0 <= x1 and x2 <= texture.width)
+            self.assertTrue(0 <= y1 and y2 <= texture.height)
+            for ox1, oy1, ox2, oy2 in rects[i + 1:]:
+                if ox1 >= x2:
+                    break
+                self.assertFalse(oy1 < y2 and y1 < oy2)
+
+    def test_dealloc(self):
+        allocator = atlas.MaxRectsAllocator(128, 128)
+        boxes = [allocator.alloc(64, 64) for i in range(4)]
+        self.assertRaises(atlas.AllocatorException, allocator.alloc, 1, 1)
+
+        allocator.dealloc(boxes[1][0], boxes[1][1], 64, 64)
+        self.assertTrue(allocator.alloc(64, 64) == boxes[1])
+        self.assertRaises(atlas.AllocatorException,
+                          allocator.dealloc, 1, 1, 64, 64)
+
+        # Neighbouring areas join up.
+        for x, y in boxes:
+            allocator.dealloc(x, y, 64, 64)
+        self.assertTrue(allocator.used_area == 0)
+        self.assertTrue(allocator.alloc(128, 128) == (0, 0))
+
+    def test_churn(self):
+        allocator = atlas.MaxRectsAllocator(256, 256)
+        for i in range(2000):
+            if allocator.allocated_rects and random.random() < 0.5:
+                rect = random.choice(list(allocator.allocated_rects))
+                allocator.dealloc(*rect)
+            else:
+                width, height = random_size()
+                try:
+                    allocator.alloc(width, height)
+                except atlas.AllocatorException:
+                    pass
+            rects = sorted(allocator.allocated_rects)
+            self.assertTrue(allocator.used_area ==
+                sum([width * height for x, y, width, height in rects]))
+            for j, (x, y, width, height) in enumerate(rects):
+                for other_x, other_y, other_width, other_height in \
+                        rects[j + 1:]:
+                    if other_x >= x + width:
+                        break
+                    self.assertFalse(other_y < y + height and
+                                     y < other_y + other_height)
+
+    def test_defragment(self):
+        for allocator_class in ALLOCATORS:
+            texture_atlas = atlas.TextureAtlas(256, 256, allocator_class)
+            regions = []
+            for i in range(60):
+                regions.append((i, texture_atlas.add(make_image(i,
+                    *random_size()))))
+            self.check_regions(texture_atlas, regions)
+
+            # Remove some regions and let others be collected.
+            random.shuffle(regions)
+            for index, region in regions[:20]:
+                texture_atlas.remove(region)
+            self.assertRaises(ValueError, texture_atlas.remove,
+                              regions[0][1])
+            del regions[:30]
+            self.assertTrue(texture_atlas.get_region_count() == 30)
+
+            texture_atlas.defragment()
+            self.check_regions(texture_atlas, regions)
+            self.assertTrue(texture_atlas.allocator.used_area ==
+                sum([region.width * region.height
+                     for index, region in regions]))
+
+            # Reclaimed area is used by new images.
+            for i in range(60, 90):
+                regions.append((i, texture_atlas.add(make_image(i,
+                    *random_size()))))
+            self.check_regions(texture_atlas, regions)
+
+            # Nothing to reclaim; the layout is kept.
+            positions = [(region.x, region.y) for index, region in regions]
+            texture_atlas.defragment()
+            self.assertTrue(positions ==
+                [(region.x, region.y) for index, region in regions])
+
+    def test_bin(self):
+        print
+        for allocator_class in ALLOCATORS:
+            counts = []
+            for remove in (False, True):
+                random.seed(2)
+                bin = atlas.TextureBin(allocator_class=allocator_class)
+                kept = []
+                regions = []
+                for i in range(3000):
+                    region = bin.add(make_image(i, *random_size()))
+                    if i % 20 == 0:
+                        # Some images stay loaded for the whole run.
+                        kept.append((i, region))
+                    else:
+                        regions.append((i, region))
+                    if len(regions) > 100:
+                        # Unload an image loaded a while ago.
+                        index, region = regions.pop(random.randrange(50))
+                        if remove:
+                            bin.remove(region)
+                    if remove and i % 250 == 0:
+                        bin.defragment()
+                regions.extend(kept)
+                if remove:
+                    bin.defragment()
+                    for texture_atlas in bin.atlases:
+                        self.check_regions(texture_atlas,
+                            [(index, region) for index, region in regions
+                             if region.owner is texture_atlas.texture])
+
+                # Textures still referenced by the bin or a region.
+                textures = set([texture_atlas.texture
+                                for texture_atlas in bin.atlases])
+                textures.update([region.owner for index, region in regions])
+                counts.append(len(textures))
+            print '%-18s textures kept: %3d  removed: %3d' % (
+                allocator_class.__name__, counts[0], counts[1])
+            self.assertTrue(counts[1] <= 4)
+            self.assertTrue(counts[1] < counts[0])
+
+if __name__ == '__main__':
+    unittest.main()
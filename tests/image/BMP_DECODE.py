@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+'''Test that the BMP decoder expands palette and bit field images to the
+same pixels as a per-pixel reference decoder, and that run-length encoded
+(BI_RLE8 and BI_RLE4) images decode correctly.  Prints the time taken by
+each decoder.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import os
+import random
+import struct
+import time
+import unittest
+from StringIO import StringIO
+
+from pyglet.image.codecs import bmp
+
+__noninteractive = True
+
+FILES = [
+    'rgb_1bpp.bmp',
+    'rgb_4bpp.bmp',
+    'rgb_8bpp.bmp',
+    'rgb_16bpp.bmp',
+    'rgb_24bpp.bmp',
+    'rgb_32bpp.bmp',
+    'rgba_32bpp.bmp',
+]
+
+def reference_decode(data):
+    # Per-pixel decoder for uncompressed images, returning rows of RGB
+    # pixels from the bottom.
+    (offset,) = struct.unpack('<I', data[10:14])
+    (size, width, height, planes, bitcount, compression, size_image,
+     xppm, yppm, clr_used, clr_important) = struct.unpack('<IiiHHIIiiII',
+                                                         data[14:54])
+    palette = []
+    for i in range(clr_used or (bitcount < 16 and 1 << bitcount or 0)):
+        b, g, r, x = map(ord, data[14 + size + i * 4:18 + size + i * 4])
+        palette.append((r, g, b))
+    if compression == bmp.BI_BITFIELDS:
+        masks = struct.unpack('<III', data[54:66])
+    else:
+        masks = (0x7c00, 0x3e0, 0x1f)
+    pitch = (width * bitcount + 31) // 32 * 4
+    rows = []
+    for y in range(height):
+        row = data[offset + y * pitch:offset + (y + 1) * pitch]
+        pixels = []
+        for x in range(width):
+            if bitcount < 8:
+                bit = x * bitcount
+                index = ord(row[bit // 8]) >> (8 - bitcount - bit % 8)
+                pixels.append(palette[index & ((1 << bitcount) - 1)])
+            elif bitcount == 8:
+                pixels.append(palette[ord(row[x])])
+            elif bitcount == 24 or (bitcount == 32 and
+                                    compression == bmp.BI_RGB):
+                i = x * bitcount // 8
+                b, g, r = map(ord, row[i:i + 3])
+                pixels.append((r, g, b))
+            else:
+                i = x * bitcount // 8
+                packed = struct.unpack(bitcount == 16 and '<H' or '<I',
+                                       row[i:i + bitcount // 8])[0]
+                pixel = []
+                for mask in masks:
+                    shift1, shift2 = bmp.get_shift(mask)
+                    pixel.append((packed & mask) >> shift1 << shift2 & 0xff)
+                pixels.append(tuple(pixel))
+        rows.append(pixels)
+    return rows
+
+def get_rows(img):
+    data = img.get_data('RGB', img.width * 3)
+    rows = []
+    for y in range(img.height):
+        row = data[y * img.width * 3:(y + 1) * img.width * 3]
+        rows.append([tuple(map(ord, row[x * 3:x * 3 + 3]))
+                     for x in range(img.width)])
+    return rows
+
+def make_rle(width, height, bitcount, palette, bits):
+    file_header_size = 14
+    info_header_size = 40
+    offset = file_header_size + info_header_size + len(palette) * 4
+    compression = bitcount == 8 and bmp.BI_RLE8 or bmp.BI_RLE4
+    info_header = struct.pack('<IiiHHIIiiII', info_header_size, width,
+                              height, 1, bitcount, compression, len(bits),
+                              2835, 2835, len(palette), 0)
+    file_header = struct.pack('<2sIHHI', 'BM', offset + len(bits), 0, 0,
+                              offset)
+    colors = ''.join([struct.pack('BBBB', b, g, r, 0)
+                      for r, g, b in palette])
+    return file_header + info_header + colors + bits
+
+class BMP_DECODE(unittest.TestCase):
+    def decode(self, data):
+        return bmp.BMPImageDecoder().decode(StringIO(data), 'test.bmp')
+
+    def test_files(self):
+        print
+        directory = os.path.dirname(__file__)
+        for filename in FILES:
+            data = open(os.path.join(directory, filename), 'rb').read()
+            start_time = time.time()
+            expected = reference_decode(data)
+            reference_time = time.time() - start_time
+
+            start_time = time.time()
+            img = self.decode(data)
+            decode_time = time.time() - start_time
+            self.assertTrue(get_rows(img) == expected)
+            print '%-16s reference %8.4fs  decoder %8.4fs' % (
+                filename, reference_time, decode_time)
+
+    def test_rle8(self):
+        palette = [(0, 0, 0), (255, 0, 0), (0, 255, 0), (0, 0, 255)]
+        bits = ''.join([
+            # Bottom row: run of 3 red, absolute green blue red (padded).
+            '\x03\x01', '\x00\x03\x02\x03\x01\x00', '\x00\x00',
+            # Skip the second row and 2 pixels of the third, then 2 blue and
+            # a run longer than the rest of the row, which is clipped.
+            '\x00\x02\x02\x01', '\x02\x03', '\x09\x02', '\x00\x00',
+            '\x00\x01'])
+        img = self.decode(make_rle(6, 3, 8, palette, bits))
+        K, R, G, B = palette
+        self.assertTrue(get_rows(img) == [
+            [R, R, R, G, B, R],
+            [K, K, K, K, K, K],
+            [K, K, B, B, G, G]])
+
+    def test_rle4(self):
+        palette = [(0, 0, 0), (255, 0, 0), (0, 255, 0), (0, 0, 255)]
+        bits = ''.join([
+            # Run of 5 alternating red and green, absolute blue red green.
+            '\x05\x12', '\x00\x03\x31\x20', '\x00\x00',
+            # Delta past the end of the image.
+            '\x00\x02\x00\x05', '\x04\x33',
+            '\x00\x01'])
+        img = self.decode(make_rle(8, 2, 4, palette, bits))
+        K, R, G, B = palette
+        self.assertTrue(get_rows(img) == [
+            [R, G, R, G, R, B, R, G],
+            [K, K, K, K, K, K, K, K]])
+
+    def test_rle8_random(self):
+        random.seed(1)
+        width, height = 37, 11
+        palette = [(i, 255 - i, i // 2) for i in range(256)]
+        indices = [[random.choice((1, 2, random.randrange(256)))
+                    for x in range(width)] for y in range(height)]
+        bits = []
+        for row in indices:
+            x = 0
+            while x < width:
+                count = 1
+                while x + count < width and row[x + count] == row[x]:
+                    count += 1
+                if count > 1 or width - x < 3:
+                    bits.append(chr(count) + chr(row[x]))
+                    x += count
+                else:
+                    run = row[x:x + 3]
+                    bits.append('\x00\x03' + ''.join(map(chr, run)) + '\x00')
+                    x += 3
+            bits.append('\x00\x00')
+        bits.append('\x00\x01')
+        img = self.decode(make_rle(width, height, 8, palette, ''.join(bits)))
+        self.assertTrue(get_rows(img) ==
+                        [[palette[i] for i in row] for row in indices])
+
+if __name__ == '__main__':
+    unittest.main()
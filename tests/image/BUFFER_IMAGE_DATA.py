@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+'''Test that ImageData accepts buffer objects, converts and crops them
+the same as string data, and passes them to OpenGL without copying when no
+conversion is needed.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import array
+import ctypes
+import mmap
+import unittest
+
+from pyglet import image
+
+__noninteractive = True
+
+WIDTH = 5
+HEIGHT = 4
+
+class BUFFER_IMAGE_DATA(unittest.TestCase):
+    def setUp(self):
+        self.pitch = WIDTH * 3 + 1
+        self.data = ''.join([chr((i * 7) % 256)
+                             for i in range(self.pitch * HEIGHT)])
+
+    def get_buffers(self):
+        buffers = [bytearray(self.data),
+                   array.array('B', self.data),
+                   ctypes.create_string_buffer(self.data, len(self.data))]
+        f = mmap.mmap(-1, len(self.data))
+        f.write(self.data)
+        buffers.append(f)
+        if image.numpy is not None:
+            buffers.append(image.numpy.frombuffer(self.data, 'uint8').copy())
+            buffers.append(image.numpy.frombuffer(self.data, 'uint8')
+                           .reshape((HEIGHT, self.pitch)))
+        return buffers
+
+    def check_buffers(self, get_data):
+        for pitch in (self.pitch, -self.pitch):
+            expected = get_data(image.ImageData(WIDTH, HEIGHT, 'RGB',
+                                                self.data, pitch))
+            for data in self.get_buffers():
+                img = image.ImageData(WIDTH, HEIGHT, 'RGB', data, pitch)
+                result = get_data(img)
+                if not isinstance(data, ctypes.Array):
+                    # ctypes arrays are returned unchanged, as before.
+                    self.assertTrue(type(result) is str)
+                self.assertTrue(image._as_bytes(result) == expected)
+
+    def test_get_data(self):
+        self.check_buffers(lambda img: img.get_data('RGB', self.pitch))
+        self.check_buffers(lambda img: img.get_data('RGBA', -WIDTH * 4))
+        self.check_buffers(lambda img: img.get_data('BGR', WIDTH * 3))
+
+    def test_region(self):
+        self.check_buffers(lambda img:
+            img.get_region(1, 1, 3, 2).get_data('RGB', 9))
+        self.check_buffers(lambda img:
+            img.get_region(2, 0, 3, 4).get_data('RGBA', -12))
+        self.check_buffers(lambda img:
+            img.get_region(0, 3, 5, 1).get_image_data().data)
+
+        # Rows of the region are cropped from the parent data.
+        img = image.ImageData(WIDTH, HEIGHT, 'RGB', self.data, -self.pitch)
+        row = self.data[self.pitch:self.pitch * 2]
+        self.assertTrue(img.get_region(1, 2, 2, 1).get_data('RGB', 6) ==
+                        row[3:9])
+
+    def test_pointer(self):
+        # Writes through the pointer are seen in the original buffer, so it
+        # was not copied.
+        for data in self.get_buffers():
+            if isinstance(data, ctypes.Array):
+                continue
+            pointer = image._get_pointer(data)
+            ctypes.memset(pointer, ord('x'), 1)
+            self.assertTrue(image._as_bytes(data)[0] == 'x')
+
+if __name__ == '__main__':
+    unittest.main()
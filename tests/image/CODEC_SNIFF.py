@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+'''Test that images are given only to the decoders recognising the
+beginning of the file, so misnamed files are loaded by the right decoder.
+
+Prints the time taken and the number of decode attempts to load a mixed
+directory of correctly named and misnamed images, compared with trying
+every decoder registered for the extension and then every other decoder.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from StringIO import StringIO
+
+from pyglet import image
+from pyglet.image import codecs
+from pyglet.image.codecs import bmp, dds, gif, png
+
+__noninteractive = True
+
+# (fixture, extension it is saved with)
+FILES = [
+    ('rgb.png', '.png'),
+    ('rgba.png', '.png'),
+    ('l.png', '.bmp'),
+    ('la.png', '.dds'),
+    ('rgb_8bpp.bmp', '.bmp'),
+    ('rgb_24bpp.bmp', '.png'),
+    ('rgb_32bpp.bmp', '.jpg'),
+    ('rgb_dxt1.dds', '.dds'),
+    ('rgba_dxt5.dds', '.png'),
+    ('rgba_dxt3.dds', ''),
+]
+REPEAT = 5
+
+def load_every_decoder(filename):
+    # Implementation of pyglet.image.load up to pyglet 1.2alpha1.
+    file = open(filename, 'rb')
+    first_exception = None
+    for decoder in codecs.get_decoders(filename):
+        try:
+            return decoder.decode(file, filename)
+        except codecs.ImageDecodeException, e:
+            first_exception = first_exception or e
+            file.seek(0)
+    raise first_exception
+
+def count_attempts(attempts):
+    # Record each call to the decode method of the registered decoders.
+    def wrap(decode):
+        def wrapped(file, filename):
+            attempts.append(decode)
+            return decode(file, filename)
+        return wrapped
+    for decoder in codecs.get_decoders():
+        decoder.decode = wrap(decoder.decode)
+
+def uncount_attempts():
+    for decoder in codecs.get_decoders():
+        del decoder.decode
+
+def get_decoder(cls):
+    for decoder in codecs.get_decoders():
+        if isinstance(decoder, cls):
+            return decoder
+
+class CODEC_SNIFF(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        source = os.path.dirname(__file__)
+        self.files = []
+        for i, (fixture, extension) in enumerate(FILES):
+            filename = os.path.join(self.directory, '%d%s' % (i, extension))
+            shutil.copy(os.path.join(source, fixture), filename)
+            self.files.append((fixture, filename))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_signatures(self):
+        png_decoder = get_decoder(png.PNGImageDecoder)
+        bmp_decoder = get_decoder(bmp.BMPImageDecoder)
+        gif_decoder = get_decoder(gif.GIFImageDecoder)
+        dds_decoder = get_decoder(dds.DDSImageDecoder)
+
+        decoders = codecs.get_decoders('a.bmp', '\x89PNG\r\n\x1a\n')
+        self.assertTrue(png_decoder in decoders)
+        self.assertTrue(bmp_decoder not in decoders)
+        self.assertTrue(dds_decoder not in decoders)
+        decoders = codecs.get_decoders('a.png', 'GIF89a')
+        self.assertTrue(gif_decoder in decoders)
+        self.assertTrue(png_decoder not in decoders)
+        decoders = codecs.get_animation_decoders('a.png', 'GIF87a')
+        self.assertTrue(gif_decoder in decoders)
+        self.assertTrue(codecs.get_decoders('a.png', 'BM')[-1] is not
+                        gif_decoder)
+
+        # Without a header, every decoder is tried, extension first.
+        decoders = codecs.get_decoders('a.bmp')
+        self.assertTrue(decoders[0] is bmp_decoder or
+                        not bmp_decoder.get_file_signatures())
+        self.assertTrue(len(decoders) == len(codecs.get_decoders()))
+
+        # Resolved lists are cached, but not shared with the caller.
+        decoders.append(None)
+        self.assertTrue(None not in codecs.get_decoders('a.bmp'))
+
+    def test_unrecognised(self):
+        if [d for d in codecs.get_decoders() if not d.get_file_signatures()]:
+            return
+        self.assertRaises(codecs.ImageDecodeException, image.load,
+                          'a.png', StringIO('not an image'))
+
+    def test_benchmark(self):
+        attempts = []
+        count_attempts(attempts)
+        try:
+            start_time = time.time()
+            for i in range(REPEAT):
+                for fixture, filename in self.files:
+                    img = image.load(filename)
+                    self.assertTrue(img.width and img.height)
+            sniff_time = time.time() - start_time
+            sniff_attempts = len(attempts)
+
+            del attempts[:]
+            start_time = time.time()
+            for i in range(REPEAT):
+                for fixture, filename in self.files:
+                    img = load_every_decoder(filename)
+                    self.assertTrue(img.width and img.height)
+            every_time = time.time() - start_time
+            every_attempts = len(attempts)
+        finally:
+            uncount_attempts()
+
+        # Each file is decoded by the first decoder tried, unless there are
+        # decoders accepting every format.
+        if not [d for d in codecs.get_decoders()
+                if not d.get_file_signatures()]:
+            self.assertTrue(sniff_attempts == REPEAT * len(self.files))
+
+        print
+        print '%d files  sniffed: %8.3fs %4d attempts' % (
+            len(self.files) * REPEAT, sniff_time, sniff_attempts)
+        print '%d files  every:   %8.3fs %4d attempts' % (
+            len(self.files) * REPEAT, every_time, every_attempts)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+'''Compare ImageData pixel format conversion with the regular expression
+implementation used previously, for common format, pitch and row order
+combinations.  Prints the time taken by each implementation, and checks
+that their results match.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import random
+import re
+import time
+import unittest
+
+from pyglet import image
+
+__noninteractive = True
+
+WIDTH = 512
+HEIGHT = 512
+
+# (current format, current pitch padding, format, pitch padding, flip)
+CONVERSIONS = [
+    ('RGB', 0, 'RGBA', 0, False),
+    ('RGBA', 0, 'BGRA', 0, False),
+    ('BGRA', 0, 'RGBA', 0, True),
+    ('RGBA', 0, 'RGB', 0, False),
+    ('RGB', 1, 'RGB', 0, True),
+    ('RGBA', 0, 'RGBA', 0, True),
+    ('L', 0, 'RGB', 0, False),
+    ('LA', 2, 'RGBA', 0, True),
+    ('RGBA', 0, 'LA', 0, False),
+    ('RGB', 0, 'BGR', 4, False),
+]
+
+def regex_convert(data, width, current_format, current_pitch, format, pitch):
+    # Implementation of ImageData._convert up to pyglet 1.2alpha1.
+    sign_pitch = current_pitch // abs(current_pitch)
+    if format != current_format:
+        repl = ''
+        for c in format:
+            try:
+                idx = current_format.index(c) + 1
+            except ValueError:
+                idx = 1
+            repl += r'\%d' % idx
+
+        swap_pattern = re.compile('(.)' * len(current_format), re.DOTALL)
+        packed_pitch = width * len(current_format)
+        if abs(current_pitch) != packed_pitch:
+            rows = re.findall('.' * abs(current_pitch), data, re.DOTALL)
+            rows = [swap_pattern.sub(repl, r[:packed_pitch]) for r in rows]
+            data = ''.join(rows)
+        else:
+            data = swap_pattern.sub(repl, data)
+        current_pitch = sign_pitch * (len(format) * width)
+
+    if pitch != current_pitch:
+        diff = abs(current_pitch) - abs(pitch)
+        if diff > 0:
+            pattern = re.compile(
+                '(%s)%s' % ('.' * abs(pitch), '.' * diff), re.DOTALL)
+            data = pattern.sub(r'\1', data)
+        elif diff < 0:
+            pattern = re.compile('(%s)' % ('.' * abs(current_pitch)),
+                                 re.DOTALL)
+            pad = '.' * -diff
+            data = pattern.sub(r'\1%s' % pad, data)
+
+        if current_pitch * pitch < 0:
+            rows = re.findall('.' * abs(pitch), data, re.DOTALL)
+            rows.reverse()
+            data = ''.join(rows)
+    return data
+
+def strip_padding(data, packed, pitch):
+    return [data[i:i + packed] for i in range(0, len(data), abs(pitch))]
+
+class CONVERT_BENCHMARK(unittest.TestCase):
+    def test_benchmark(self):
+        random.seed(1)
+        numpy = image.numpy
+        print
+        print '%-22s %10s %10s %10s' % ('conversion', 'regex', 'python',
+                                        'numpy')
+        try:
+            for (current_format, current_padding, format, padding,
+                 flip) in CONVERSIONS:
+                current_pitch = WIDTH * len(current_format) + current_padding
+                pitch = WIDTH * len(format) + padding
+                if flip:
+                    pitch = -pitch
+                data = ''.join([chr(random.randrange(256))
+                                for i in range(current_pitch * HEIGHT)])
+                img = image.ImageData(WIDTH, HEIGHT, current_format, data,
+                                      current_pitch)
+
+                start_time = time.time()
+                expected = regex_convert(data, WIDTH, current_format,
+                                         current_pitch, format, pitch)
+                regex_time = time.time() - start_time
+                expected = strip_padding(expected, WIDTH * len(format), pitch)
+
+                times = []
+                for use_numpy in (None, numpy):
+                    image.numpy = use_numpy
+                    start_time = time.time()
+                    result = img.get_data(format, pitch)
+                    times.append(time.time() - start_time)
+                    self.assertTrue(len(result) == abs(pitch) * HEIGHT)
+                    self.assertTrue(strip_padding(
+                        result, WIDTH * len(format), pitch) == expected)
+                if not numpy:
+                    times[1] = None
+
+                name = '%s/%d -> %s/%d' % (current_format, current_pitch,
+                                           format, pitch)
+                print '%-22s %9.4fs %9.4fs %10s' % (name, regex_time,
+                    times[0], times[1] and '%9.4fs' % times[1] or '-')
+        finally:
+            image.numpy = numpy
+
+if __name__ == '__main__':
+    unittest.main()
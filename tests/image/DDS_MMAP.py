@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+'''Test that DDS files decoded with a memory-mapped decoder give the same
+mipmap levels as files read into memory, and that the mapping is released.
+Prints the time taken to decode a large mipmapped texture each way.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import os
+import random
+import struct
+import tempfile
+import time
+import unittest
+from ctypes import string_at, sizeof
+from StringIO import StringIO
+
+from pyglet import image
+from pyglet.image.codecs import dds
+
+__noninteractive = True
+
+FILES = [
+    'rgb_dxt1.dds',
+    'rgba_dxt1.dds',
+    'rgba_dxt3.dds',
+    'rgba_dxt5.dds',
+]
+
+def get_levels(img):
+    levels = [img.data] + img.mipmap_data
+    return [isinstance(data, str) and data or
+            string_at(data, sizeof(data)) for data in levels]
+
+def make_dds(width, height, fourcc, alpha_mask, block_size):
+    # Mipmapped DDS file with random level data.
+    sizes = []
+    w, h = width, height
+    while w or h:
+        sizes.append(((max(w, 1) + 3) // 4) * ((max(h, 1) + 3) // 4) *
+                     block_size)
+        w >>= 1
+        h >>= 1
+    pixel_format = struct.pack(dds.DDPIXELFORMAT.get_format(),
+        dds.DDPIXELFORMAT.get_size(), dds.DDPF_FOURCC, fourcc,
+        0, 0, 0, 0, alpha_mask)
+    header = struct.pack(dds.DDSURFACEDESC2.get_format(),
+        'DDS ', 124,
+        dds.DDSD_CAPS | dds.DDSD_HEIGHT | dds.DDSD_WIDTH |
+        dds.DDSD_PIXELFORMAT | dds.DDSD_LINEARSIZE | dds.DDSD_MIPMAPCOUNT,
+        height, width, sizes[0], 0, len(sizes), '', pixel_format,
+        dds.DDSCAPS_TEXTURE | dds.DDSCAPS_MIPMAP | dds.DDSCAPS_COMPLEX, 0,
+        '', 0)
+    data = os.urandom(sum(sizes))
+    return header + data
+
+class DDS_MMAP(unittest.TestCase):
+    def setUp(self):
+        self.filenames = []
+
+    def tearDown(self):
+        for filename in self.filenames:
+            os.remove(filename)
+
+    def write(self, data):
+        handle, filename = tempfile.mkstemp('.dds')
+        os.write(handle, data)
+        os.close(handle)
+        self.filenames.append(filename)
+        return filename
+
+    def decode(self, filename, use_mmap):
+        decoder = dds.DDSImageDecoder(use_mmap=use_mmap)
+        return image.load(filename, decoder=decoder)
+
+    def test_files(self):
+        directory = os.path.dirname(__file__)
+        for filename in FILES:
+            filename = os.path.join(directory, filename)
+            expected = self.decode(filename, False)
+            img = self.decode(filename, True)
+            self.assertTrue(isinstance(img, dds.MappedCompressedImageData))
+            self.assertTrue(img.gl_format == expected.gl_format)
+            self.assertTrue(get_levels(img) == get_levels(expected))
+
+            # Software decoding reads from the mapping.
+            decoded = img.decoder(image._as_bytes(img.data), img.width,
+                                  img.height)
+            self.assertTrue(decoded.get_data('RGBA', img.width * 4) ==
+                expected.decoder(expected.data, img.width,
+                                 img.height).get_data('RGBA', img.width * 4))
+
+            img.release()
+            self.assertTrue(img.mapping is None and img.data is None)
+            self.assertRaises(image.ImageException, img.get_texture)
+            img.release()
+
+        # Files that cannot be mapped are read.
+        data = open(filename, 'rb').read()
+        img = dds.DDSImageDecoder(use_mmap=True).decode(StringIO(data),
+                                                        filename)
+        self.assertTrue(not isinstance(img, dds.MappedCompressedImageData))
+        self.assertTrue(get_levels(img) == get_levels(expected))
+
+    def test_mipmaps(self):
+        filename = self.write(make_dds(64, 16, 'DXT5', 0xff000000, 16))
+        expected = self.decode(filename, False)
+        img = self.decode(filename, True)
+        self.assertTrue(len(img.mipmap_data) == 6)
+        self.assertTrue(get_levels(img) == get_levels(expected))
+        self.assertTrue([sizeof(data) for data in img.mipmap_data] ==
+                        [256, 64, 32, 16, 16, 16])
+        img.release()
+
+    def test_truncated(self):
+        data = make_dds(64, 64, 'DXT1', 0, 8)
+        filename = self.write(data[:-1])
+        self.assertRaises(dds.DDSException, self.decode, filename, True)
+
+    def test_benchmark(self):
+        filename = self.write(make_dds(2048, 2048, 'DXT5', 0xff000000, 16))
+        print
+        for use_mmap in (False, True):
+            start_time = time.time()
+            img = self.decode(filename, use_mmap)
+            print 'decode %s: %8.4fs' % (use_mmap and 'mmap' or 'read',
+                                         time.time() - start_time)
+            self.assertTrue(len(img.mipmap_data) == 11)
+            if use_mmap:
+                img.release()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+'''Test that the pure Python GIF decoder decompresses image data and
+composes animation frames with transparency and each disposal method, and
+that composed frames are kept within the cache budget.  Prints the time
+taken to decode a large image.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import random
+import struct
+import time
+import unittest
+from StringIO import StringIO
+
+from pyglet import image
+from pyglet.image.codecs import gif
+
+__noninteractive = True
+
+def encode_lzw(indices, lzw_code_size):
+    # LZW compressor emitting a clear code whenever the table is full.
+    clear_code = 1 << lzw_code_size
+    codes = [clear_code]
+    table = dict([(chr(i), i) for i in range(clear_code)])
+    code_sizes = []
+    code_size = lzw_code_size + 1
+    next_code = clear_code + 2
+    prefix = ''
+    for c in indices:
+        if prefix + c in table:
+            prefix += c
+            continue
+        codes.append(table[prefix])
+        code_sizes.append(code_size)
+        if next_code < 4096:
+            table[prefix + c] = next_code
+            next_code += 1
+            if next_code > 1 << code_size and code_size < 12:
+                code_size += 1
+        else:
+            codes.append(clear_code)
+            code_sizes.append(code_size)
+            table = dict([(chr(i), i) for i in range(clear_code)])
+            code_size = lzw_code_size + 1
+            next_code = clear_code + 2
+        prefix = c
+    codes.append(table[prefix])
+    code_sizes.append(code_size)
+    codes.append(clear_code + 1)
+    code_sizes.append(code_size)
+
+    bits = 0
+    bit_count = 0
+    data = []
+    for code, size in zip(codes, [lzw_code_size + 1] + code_sizes):
+        bits |= code << bit_count
+        bit_count += size
+        while bit_count >= 8:
+            data.append(chr(bits & 0xff))
+            bits >>= 8
+            bit_count -= 8
+    if bit_count:
+        data.append(chr(bits))
+    data = ''.join(data)
+    return ''.join([chr(len(data[i:i + 255])) + data[i:i + 255]
+                    for i in range(0, len(data), 255)]) + '\0'
+
+def interlace(indices, width, height):
+    rows = range(0, height, 8) + range(4, height, 8) + \
+           range(2, height, 4) + range(1, height, 2)
+    return ''.join([indices[y * width:(y + 1) * width] for y in rows])
+
+class Frame(object):
+    def __init__(self, left, top, width, height, indices, palette=None,
+                 transparent=None, disposal=0, delay=10, interlaced=False):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.indices = indices
+        self.palette = palette
+        self.transparent = transparent
+        self.disposal = disposal
+        self.delay = delay
+        self.interlaced = interlaced
+
+def encode_gif(width, height, palette, frames):
+    data = ['GIF89a', struct.pack('<HHBBB', width, height, 0xf7, 0, 0),
+            ''.join(palette).ljust(256 * 3, '\0')]
+    for frame in frames:
+        fields = frame.disposal << 2
+        if frame.transparent is not None:
+            fields |= 1
+        data.append(struct.pack('<BBBBHBB', 0x21, 0xf9, 4, fields,
+                                frame.delay, frame.transparent or 0, 0))
+        fields = 0
+        if frame.palette:
+            fields |= 0x87
+        if frame.interlaced:
+            fields |= 0x40
+        data.append(struct.pack('<BHHHHB', 0x2c, frame.left, frame.top,
+                                frame.width, frame.height, fields))
+        if frame.palette:
+            data.append(''.join(frame.palette).ljust(256 * 3, '\0'))
+        indices = frame.indices
+        if frame.interlaced:
+            indices = interlace(indices, frame.width, frame.height)
+        data.append('\x08' + encode_lzw(indices, 8))
+    data.append('\x3b')
+    return ''.join(data)
+
+def compose(width, height, palette, frames):
+    # Reference compositor returning the RGBA rows of each frame, from the
+    # top.
+    screen = [['\0\0\0\0'] * width for y in range(height)]
+    images = []
+    for frame in frames:
+        previous = [row[:] for row in screen]
+        colors = frame.palette or palette
+        for y in range(frame.height):
+            for x in range(frame.width):
+                index = ord(frame.indices[y * frame.width + x])
+                if index != frame.transparent:
+                    screen[frame.top + y][frame.left + x] = \
+                        colors[index] + '\xff'
+        images.append([''.join(row) for row in screen])
+        if frame.disposal == 2:
+            for y in range(frame.height):
+                for x in range(frame.width):
+                    screen[frame.top + y][frame.left + x] = '\0\0\0\0'
+        elif frame.disposal == 3:
+            screen = previous
+    return images
+
+def get_rows(img):
+    data = img.get_data('RGBA', -img.width * 4)
+    return [data[y * img.width * 4:(y + 1) * img.width * 4]
+            for y in range(img.height)]
+
+def random_indices(width, height, colors):
+    return ''.join([chr(random.choice(colors))
+                    for i in range(width * height)])
+
+class GIF_DECODE(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+        self.palette = [struct.pack('BBB', i, 255 - i, (i * 7) & 0xff)
+                        for i in range(256)]
+        self.local_palette = [struct.pack('BBB', 255 - i, i, 0)
+                              for i in range(256)]
+        self.frames = [
+            Frame(0, 0, 24, 20, random_indices(24, 20, range(256))),
+            Frame(3, 2, 10, 9, random_indices(10, 9, [1, 2, 5]),
+                  transparent=2, disposal=3),
+            Frame(8, 5, 13, 11, random_indices(13, 11, [4, 7]),
+                  self.local_palette, transparent=4, disposal=2,
+                  interlaced=True),
+            Frame(1, 10, 20, 10, '\x09' * 200, disposal=1),
+            Frame(0, 0, 24, 20, random_indices(24, 20, [0, 3]),
+                  transparent=0, delay=0),
+        ]
+        self.data = encode_gif(24, 20, self.palette, self.frames)
+        self.expected = compose(24, 20, self.palette, self.frames)
+
+    def test_lzw(self):
+        indices = random_indices(100, 100, range(16)) + '\x05' * 5000
+        data = encode_lzw(indices, 8)
+        blocks = gif.read_data_sub_blocks(StringIO(data))
+        self.assertTrue(gif.decode_lzw(blocks, 8, len(indices)) == indices)
+
+    def test_image(self):
+        decoder = gif.GIFImageDecoder()
+        img = decoder.decode(StringIO(self.data), 'test.gif')
+        self.assertTrue(get_rows(img) == self.expected[0])
+
+    def test_animation(self):
+        decoder = gif.GIFImageDecoder()
+        animation = image.load_animation('test.gif', StringIO(self.data),
+                                         decoder)
+        self.assertTrue(len(animation.frames) == 5)
+        self.assertTrue([frame.duration for frame in animation.frames] ==
+                        [0.1, 0.1, 0.1, 0.1, gif.DEFAULT_DELAY])
+        for frame, expected in zip(animation.frames, self.expected):
+            self.assertTrue(get_rows(frame.image) == expected)
+
+        # Frames are composed again out of order.
+        cache = animation.frames[0].cache
+        cache.clear()
+        for i in (3, 1, 4, 2, 0, 4):
+            img = animation.frames[i].image
+            self.assertTrue(get_rows(img) == self.expected[i])
+        self.assertTrue(animation.frames[2].image is
+                        animation.frames[2].image)
+
+    def test_budget(self):
+        decoder = gif.GIFImageDecoder(cache_budget=24 * 20 * 4 * 2)
+        animation = decoder.decode_animation(StringIO(self.data), 'test.gif')
+        cache = animation.frames[0].cache
+        for i in (0, 1, 2, 3, 4, 2, 0):
+            img = animation.frames[i].image
+            self.assertTrue(get_rows(img) == self.expected[i])
+            self.assertTrue(cache.size <= cache.budget)
+        self.assertTrue(sorted(cache._frames.keys()) == [0, 2])
+
+        # Frames composed again while cached are listed once.
+        frames = [Frame(0, 0, 4, 4, random_indices(4, 4, [1, 2, 3]),
+                        disposal=3 if i == 2 else 0)
+                  for i in range(4)]
+        expected = compose(4, 4, self.palette, frames)
+        decoder = gif.GIFImageDecoder(cache_budget=4 * 4 * 4 * 3)
+        small = decoder.decode_animation(
+            StringIO(encode_gif(4, 4, self.palette, frames)), 'test.gif')
+        cache = small.frames[0].cache
+        for i in (0, 1, 2, 3, 2, 0, 1, 3, 0, 1, 2):
+            self.assertTrue(get_rows(small.frames[i].image) == expected[i])
+            self.assertTrue(sorted(cache._order) ==
+                            sorted(cache._frames.keys()))
+            self.assertTrue(cache.size <= cache.budget)
+
+        # An assigned image replaces the composed frame.
+        texture = image.Texture(24, 20, 0, 0)
+        animation.frames[1].image = texture
+        self.assertTrue(animation.frames[1].image is texture)
+
+    def test_benchmark(self):
+        width, height = 512, 512
+        frame = Frame(0, 0, width, height,
+                      ''.join([chr((x // 8 + y // 8) & 0xff)
+                               for y in range(height)
+                               for x in range(width)]))
+        data = encode_gif(width, height, self.palette, [frame])
+        start_time = time.time()
+        img = gif.GIFImageDecoder().decode(StringIO(data), 'test.gif')
+        print
+        print 'decode %dx%d: %8.3fs' % (width, height,
+                                        time.time() - start_time)
+        rows = get_rows(img)
+        self.assertTrue(rows[17][40 * 4:41 * 4] ==
+                        self.palette[(40 // 8 + 17 // 8)] + '\xff')
+
+if __name__ == '__main__':
+    unittest.main()
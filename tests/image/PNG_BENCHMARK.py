@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+'''Compare the time taken to decode PNG images with PyPNG and with the
+faster reader in the PNG codec, with and without NumPy, and check that the
+results match.
+
+The test images are read, along with images written using each of the PNG
+scanline filters.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import os
+import random
+import struct
+import time
+import unittest
+import zlib
+from StringIO import StringIO
+
+from pyglet.image.codecs import png
+from pyglet.image.codecs import pypng
+
+__noninteractive = True
+
+FILENAMES = ['rgba.png', 'rgb.png', 'la.png', 'l.png']
+
+def paeth(a, b, c):
+    p = a + b - c
+    pa = abs(p - a)
+    pb = abs(p - b)
+    pc = abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    elif pb <= pc:
+        return b
+    return c
+
+def filter_line(filter_type, line, prior, psize):
+    result = [filter_type]
+    for i, x in enumerate(line):
+        a = i >= psize and line[i - psize] or 0
+        b = prior[i]
+        c = i >= psize and prior[i - psize] or 0
+        predictor = (0, a, b, (a + b) >> 1, paeth(a, b, c))[filter_type]
+        result.append((x - predictor) & 0xff)
+    return result
+
+def chunk(tag, data):
+    checksum = zlib.crc32(data, zlib.crc32(tag)) & 0xffffffff
+    return struct.pack('!I4s', len(data), tag) + data + \
+        struct.pack('!I', checksum)
+
+def write_png(width, height, color_type, rows, filter_types):
+    # Write a PNG using the given filter for each row, splitting the image
+    # data over several IDAT chunks.
+    psize = png._color_type_planes[color_type]
+    prior = [0] * width * psize
+    scanlines = []
+    for y, line in enumerate(rows):
+        scanlines.extend(filter_line(filter_types[y % len(filter_types)],
+                                     line, prior, psize))
+        prior = line
+    compressed = zlib.compress(''.join(map(chr, scanlines)))
+    data = png._signature + chunk('IHDR',
+        struct.pack('!2I5B', width, height, 8, color_type, 0, 0, 0))
+    for i in range(0, len(compressed), 1000):
+        data += chunk('IDAT', compressed[i:i + 1000])
+    return data + chunk('IEND', '')
+
+def read_pypng(data):
+    width, height, pixels, metadata = pypng.Reader(file=StringIO(data)).read()
+    return pixels.tostring()
+
+def read_png(data):
+    width, height, color_type, pixels = png._decode(StringIO(data))
+    return str(pixels)
+
+class PNG_BENCHMARK(unittest.TestCase):
+    def compare(self, name, data, expected=None):
+        numpy = png.numpy
+        start_time = time.time()
+        result = read_pypng(data)
+        pypng_time = time.time() - start_time
+        if expected is not None:
+            self.assertTrue(result == expected)
+
+        times = []
+        try:
+            for use_numpy in (None, numpy):
+                png.numpy = use_numpy
+                start_time = time.time()
+                self.assertTrue(read_png(data) == result)
+                times.append(time.time() - start_time)
+        finally:
+            png.numpy = numpy
+        if not numpy:
+            times[1] = None
+        print '%-22s %9.4fs %9.4fs %10s' % (name, pypng_time, times[0],
+            times[1] and '%9.4fs' % times[1] or '-')
+
+    def test_benchmark(self):
+        print
+        print '%-22s %10s %10s %10s' % ('image', 'pypng', 'python', 'numpy')
+        for filename in FILENAMES:
+            path = os.path.join(os.path.dirname(__file__), filename)
+            self.compare(filename, open(path, 'rb').read())
+
+        random.seed(1)
+        width, height = 64, 48
+        for color_type, psize in sorted(png._color_type_planes.items()):
+            # Smooth gradients with noise, so the filters do some work.
+            rows = [[(x * 3 + y * 5 + i * 40 + random.randrange(8)) & 0xff
+                     for x in range(width) for i in range(psize)]
+                    for y in range(height)]
+            expected = ''.join([''.join(map(chr, row)) for row in rows])
+            for filter_types in ([0], [1], [2], [3], [4], [4, 3, 2, 1, 0]):
+                data = write_png(width, height, color_type, rows,
+                                 filter_types)
+                name = 'type %d filter %s' % (color_type,
+                    ''.join(map(str, filter_types)))
+                self.compare(name, data, expected)
+
+    def test_decode(self):
+        path = os.path.join(os.path.dirname(__file__), 'la.png')
+        img = png.PNGImageDecoder().decode(open(path, 'rb'), path)
+        self.assertTrue(img.format == 'LA')
+        self.assertTrue(img.pitch == -img.width * 2)
+
+        # Interlaced images are decoded by PyPNG.
+        data = StringIO()
+        pypng.Writer(8, 8, interlaced=True).write_array(data,
+            pypng.array('B', range(8 * 8 * 3)))
+        data.seek(0)
+        img = png.PNGImageDecoder().decode(data, None)
+        self.assertTrue(img.get_data('RGB', -24) ==
+                        ''.join(map(chr, range(8 * 8 * 3))))
+
+        self.assertRaises(png.ImageDecodeException,
+            png.PNGImageDecoder().decode, StringIO(open(path, 'rb').read(
+                5000)), path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+'''Test the software S3TC decoders against a straightforward per-pixel
+implementation of the specification, using the DDS test images, and check
+that images survive compression by the encoders.  Prints the decoding
+throughput with and without NumPy.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import os
+import struct
+import time
+import unittest
+from StringIO import StringIO
+
+from pyglet.image import ImageData
+from pyglet.image.codecs import dds
+from pyglet.image.codecs import s3tc
+
+__noninteractive = True
+
+FILES = [
+    ('rgb_dxt1.dds', 'DXT1', s3tc.decode_dxt1_rgb, 'RGB'),
+    ('rgba_dxt1.dds', 'DXT1A', s3tc.decode_dxt1_rgba, 'RGBA'),
+    ('rgba_dxt3.dds', 'DXT3', s3tc.decode_dxt3, 'RGBA'),
+    ('rgba_dxt5.dds', 'DXT5', s3tc.decode_dxt5, 'RGBA'),
+]
+
+def expand(color):
+    r, g, b = color >> 11, (color >> 5) & 0x3f, color & 0x1f
+    return [(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)]
+
+def reference_color(block, index, four_color, transparent):
+    color0, color1, bits = struct.unpack('<HHI', block)
+    code = (bits >> (index * 2)) & 3
+    c0 = expand(color0)
+    c1 = expand(color1)
+    if code == 0:
+        return c0 + [255]
+    elif code == 1:
+        return c1 + [255]
+    elif four_color or color0 > color1:
+        if code == 2:
+            return [(2 * a + b) // 3 for a, b in zip(c0, c1)] + [255]
+        return [(a + 2 * b) // 3 for a, b in zip(c0, c1)] + [255]
+    elif code == 2:
+        return [(a + b) // 2 for a, b in zip(c0, c1)] + [255]
+    elif transparent:
+        return [0, 0, 0, 0]
+    return [0, 0, 0, 255]
+
+def reference_alpha(block, index, kind):
+    if kind == 'DXT3':
+        bits = struct.unpack('<Q', block)[0]
+        return ((bits >> (index * 4)) & 0xf) * 17
+    a0, a1 = ord(block[0]), ord(block[1])
+    lo, hi = struct.unpack('<IH', block[2:])
+    code = ((lo | hi << 32) >> (index * 3)) & 7
+    if code == 0:
+        return a0
+    elif code == 1:
+        return a1
+    elif a0 > a1:
+        return ((8 - code) * a0 + (code - 1) * a1) // 7
+    elif code == 6:
+        return 0
+    elif code == 7:
+        return 255
+    return ((6 - code) * a0 + (code - 1) * a1) // 5
+
+def reference_decode(data, width, height, kind):
+    stride = kind in ('DXT1', 'DXT1A') and 8 or 16
+    components = kind == 'DXT1' and 3 or 4
+    blocks_x = (width + 3) // 4
+    out = []
+    for y in range(height):
+        for x in range(width):
+            i = ((y // 4) * blocks_x + x // 4) * stride
+            index = (y % 4) * 4 + x % 4
+            pixel = reference_color(data[i + stride - 8:i + stride], index,
+                                    stride == 16, kind == 'DXT1A')
+            if stride == 16:
+                pixel[3] = reference_alpha(data[i:i + 8], index, kind)
+            out.extend(pixel[:components])
+    return ''.join(map(chr, out))
+
+def load(filename):
+    path = os.path.join(os.path.dirname(__file__), filename)
+    return dds.DDSImageDecoder().decode(open(path, 'rb'), filename)
+
+def gradient(width, height):
+    # Colours within each block lie along a line, which S3TC can represent
+    # closely.
+    data = []
+    for y in range(height):
+        for x in range(width):
+            t = (x * 7 + y * 3) % 256
+            data.extend([t, t // 2 + 64, 255 - t, (x * 16 + y * 8) % 256])
+    return ''.join(map(chr, data))
+
+class S3TC(unittest.TestCase):
+    def test_decode(self):
+        numpy = s3tc.numpy
+        print
+        print '%-16s %12s %12s' % ('file', 'python', 'numpy')
+        try:
+            for filename, kind, decode, format in FILES:
+                compressed = load(filename)
+                data = compressed.data
+                width, height = compressed.width, compressed.height
+                expected = reference_decode(data, width, height, kind)
+
+                rates = []
+                for use_numpy in (None, numpy):
+                    s3tc.numpy = use_numpy
+                    start_time = time.time()
+                    image = decode(data, width, height)
+                    elapsed = time.time() - start_time
+                    rates.append(len(expected) / elapsed / 1024 / 1024)
+                    self.assertTrue(image.format == format)
+                    self.assertTrue(image.get_data(format, width * len(format))
+                                    == expected)
+                if not numpy:
+                    rates[1] = None
+                print '%-16s %7.1f MB/s %12s' % (filename, rates[0],
+                    rates[1] and '%7.1f MB/s' % rates[1] or '-')
+        finally:
+            s3tc.numpy = numpy
+
+    def test_partial_blocks(self):
+        # Images whose size is not a multiple of 4 are cropped.
+        data = load('rgba_dxt5.dds').data[:3 * 2 * 16]
+        image = s3tc.decode_dxt5(data, 10, 7)
+        expected = reference_decode(data, 10, 7, 'DXT5')
+        self.assertTrue(image.get_data('RGBA', 40) == expected)
+
+    def check_encode(self, encode, decode, tolerance, alpha_tolerance):
+        width, height = 18, 10
+        data = gradient(width, height)
+        image = decode(encode(data, width, height), width, height)
+        result = image.get_data('RGBA', width * 4)
+        self.assertTrue(len(result) == len(data))
+        for i, (a, b) in enumerate(zip(data, result)):
+            if i % 4 == 3:
+                self.assertTrue(abs(ord(a) - ord(b)) <= alpha_tolerance)
+            else:
+                self.assertTrue(abs(ord(a) - ord(b)) <= tolerance)
+
+    def test_encode(self):
+        self.check_encode(s3tc.encode_dxt1, s3tc.decode_dxt1_rgb, 8, 255)
+        self.check_encode(s3tc.encode_dxt3, s3tc.decode_dxt3, 8, 8)
+        self.check_encode(s3tc.encode_dxt5, s3tc.decode_dxt5, 8, 20)
+
+        # DXT1 alpha is either transparent or opaque.
+        data = '\xff\x00\x00\xff' * 8 + '\x00\x00\x00\x00' * 8
+        image = s3tc.decode_dxt1_rgba(s3tc.encode_dxt1(data, 4, 4, True),
+                                      4, 4)
+        self.assertTrue(image.get_data('RGBA', 16) == data)
+
+    def test_save(self):
+        data = gradient(16, 8)
+        file = StringIO()
+        ImageData(16, 8, 'RGBA', data).save('test.dds', file)
+        file.seek(0)
+        compressed = dds.DDSImageDecoder().decode(file, 'test.dds')
+        self.assertTrue(compressed.gl_format ==
+                        dds.GL_COMPRESSED_RGBA_S3TC_DXT5_EXT)
+        self.assertTrue(compressed.data == s3tc.encode_dxt5(data, 16, 8))
+
+        file = StringIO()
+        ImageData(16, 8, 'RGBA', data).save('test.png', file)
+        self.assertTrue(file.getvalue().startswith('\x89PNG'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# $Id:$
+
+'''Test that the texture upload queue copies images in bands of rows
+within its byte budget, and replaces pending uploads to the same position.
+'''
+
+import unittest
+
+from pyglet import image
+from pyglet.image import upload
+
+__noninteractive = True
+
+class RecordingTexture(object):
+    '''Records the rows blitted into it instead of using OpenGL.'''
+    def __init__(self):
+        self.rows = {}
+        self.blits = 0
+
+    def blit_into(self, source, x, y, z):
+        self.blits += 1
+        data = source.get_data('RGB', source.width * 3)
+        for i in range(source.height):
+            self.rows[y + i] = (x, data[i * source.width * 3:
+                                        (i + 1) * source.width * 3])
+
+def make_image(width, height, value):
+    data = ''.join([chr((value + i) % 256)
+                    for i in range(width * height * 3)])
+    return image.ImageData(width, height, 'RGB', data)
+
+class UPLOAD_QUEUE(unittest.TestCase):
+    def check_texture(self, texture, img, x=0, y=0):
+        data = img.get_data('RGB', img.width * 3)
+        for i in range(img.height):
+            self.assertTrue(texture.rows[y + i] ==
+                (x, data[i * img.width * 3:(i + 1) * img.width * 3]))
+
+    def test_budget(self):
+        queue = upload.TextureUploadQueue(budget=1000, use_pbo=False)
+        texture = RecordingTexture()
+        img = make_image(10, 100, 0)
+        queue.put(img, texture, 5, 0)
+        self.assertTrue(queue.depth == 1)
+        self.assertTrue(queue.pending_bytes == 3000)
+
+        # 33 rows of 30 bytes fit within the budget.
+        self.assertTrue(queue.update() == 990)
+        self.assertTrue(texture.blits == 1)
+        self.assertTrue(queue.pending_bytes == 2010)
+        while queue.depth:
+            queue.update()
+        self.assertTrue(texture.blits == 4)
+        self.assertTrue(queue.uploaded_bytes == 3000)
+        self.check_texture(texture, img, 5, 0)
+
+    def test_large_rows(self):
+        # A row larger than the budget is still uploaded.
+        queue = upload.TextureUploadQueue(budget=10, use_pbo=False)
+        texture = RecordingTexture()
+        img = make_image(10, 3, 0)
+        queue.put(img, texture)
+        self.assertTrue(queue.update() == 30)
+        queue.flush()
+        self.assertTrue(queue.depth == 0)
+        self.check_texture(texture, img)
+
+    def test_replace(self):
+        queue = upload.TextureUploadQueue(budget=300, use_pbo=False)
+        texture = RecordingTexture()
+        other = RecordingTexture()
+        frames = [make_image(10, 20, i) for i in range(3)]
+        queue.put(frames[0], texture)
+        queue.put(frames[1], other)
+        queue.update()
+        queue.put(frames[2], texture)
+        self.assertTrue(queue.depth == 2)
+
+        # The newest frame is uploaded from the row the replaced one reached,
+        # then from the first row.
+        self.assertTrue(queue.pending_bytes == 2 * 20 * 30)
+        queue.update()
+        self.assertTrue(texture.rows[0] ==
+                        (0, frames[0].get_data('RGB', 30)[:30]))
+        self.assertTrue(texture.rows[10] ==
+                        (0, frames[2].get_data('RGB', 30)[300:330]))
+        queue.flush()
+        self.assertTrue(queue.depth == 0)
+        self.check_texture(texture, frames[2])
+        self.check_texture(other, frames[1])
+
+        # Frames replaced before they complete still update every row.
+        texture = RecordingTexture()
+        queue = upload.TextureUploadQueue(budget=150, use_pbo=False)
+        frames = [make_image(10, 20, i) for i in range(8)]
+        for frame in frames:
+            queue.put(frame, texture)
+            queue.update()
+            self.assertTrue(queue.depth == 1)
+        self.assertTrue(sorted(texture.rows.keys()) == range(20))
+        queue.flush()
+        self.assertTrue(queue.depth == 0)
+        self.check_texture(texture, frames[-1])
+
+        queue.put(frames[0], texture, 0, 0)
+        queue.put(frames[1], texture, 0, 20)
+        queue.clear()
+        self.assertTrue(queue.depth == 0)
+        self.assertTrue(queue.update() == 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+'''Test that static sources loaded from the same file share their decoded
+data, that the audio cache maps data decoded in an earlier run instead of
+decoding it again, and that queued static sources read the shared data in
+place.
+
+Prints the time taken to load a WAVE file as a static source many times,
+without the cache, with the cache in memory, and from cache files.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import ctypes
+import gc
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import wave
+
+from pyglet import media
+
+__noninteractive = True
+
+LOADS = 30
+
+def write_wave(filename, data, sample_rate=44100):
+    writer = wave.open(filename, 'wb')
+    writer.setnchannels(2)
+    writer.setsampwidth(2)
+    writer.setframerate(sample_rate)
+    writer.writeframes(data)
+    writer.close()
+
+def read(source):
+    data = []
+    while True:
+        audio_data = source.get_audio_data(10000)
+        if not audio_data:
+            break
+        data.append(audio_data.get_string_data())
+    return ''.join(data)
+
+class AUDIO_CACHE(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'test.wav')
+        self.data = os.urandom(44100 * 4)
+        write_wave(self.filename, self.data)
+
+        self.saved_cache = media.audio_cache
+        self.saved_decode = media._decode_audio
+        self.decodes = 0
+        def decode_audio(source, write):
+            self.decodes += 1
+            self.saved_decode(source, write)
+        media._decode_audio = decode_audio
+
+    def tearDown(self):
+        media.audio_cache = self.saved_cache
+        media._decode_audio = self.saved_decode
+        gc.collect()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def load(self):
+        source = media.load(self.filename, streaming=False)
+        self.assertTrue(isinstance(source, media.StaticSource))
+        return source
+
+    def test_shared(self):
+        media.audio_cache = media.AudioCache()
+        source = self.load()
+        other_source = self.load()
+        self.assertTrue(self.decodes == 1)
+        self.assertTrue(other_source._data is source._data)
+        self.assertTrue(read(source._get_queue_source()) == self.data)
+
+        # Data is decoded again once no source uses it.
+        del source, other_source
+        gc.collect()
+        self.load()
+        self.assertTrue(self.decodes == 2)
+
+        # Without a cache every source is decoded.
+        media.audio_cache = None
+        self.assertTrue(self.load()._data is not self.load()._data)
+        self.assertTrue(self.decodes == 4)
+
+    def test_files(self):
+        cache_path = os.path.join(self.directory, 'cache')
+        media.audio_cache = media.AudioCache(cache_path)
+        source = self.load()
+        self.assertTrue(self.decodes == 1)
+        self.assertTrue(len(os.listdir(cache_path)) == 1)
+        self.assertTrue(read(source._get_queue_source()) == self.data)
+
+        # A later run maps the cache file.
+        del source
+        gc.collect()
+        media.audio_cache = media.AudioCache(cache_path)
+        source = self.load()
+        self.assertTrue(self.decodes == 1)
+        self.assertTrue(self.load()._data is source._data)
+        self.assertTrue(read(source._get_queue_source()) == self.data)
+        del source
+        gc.collect()
+
+        # A changed file is decoded again.
+        data = os.urandom(1000)
+        write_wave(self.filename, data)
+        stat = os.stat(self.filename)
+        os.utime(self.filename, (stat.st_atime, stat.st_mtime + 10))
+        source = self.load()
+        self.assertTrue(self.decodes == 2)
+        self.assertTrue(read(source._get_queue_source()) == data)
+        self.assertTrue(len(os.listdir(cache_path)) == 2)
+        del source
+        gc.collect()
+
+        media.audio_cache.clear()
+        self.assertTrue(os.listdir(cache_path) == [])
+
+    def test_empty(self):
+        write_wave(self.filename, '')
+        media.audio_cache = media.AudioCache(self.directory)
+        for i in range(2):
+            source = self.load()
+            self.assertTrue(source.duration == 0)
+            self.assertTrue(source._get_queue_source().get_audio_data(100)
+                            is None)
+
+    def test_queue_source(self):
+        media.audio_cache = media.AudioCache(self.directory)
+        source = self.load()
+        base = ctypes.addressof(source._data)
+        queue_source = source._get_queue_source()
+        queue_source.seek(0.25)
+        audio_data = queue_source.get_audio_data(1000)
+        self.assertTrue(ctypes.cast(audio_data.data, ctypes.c_void_p).value ==
+                        base + 44100)
+        self.assertTrue(audio_data.get_string_data() ==
+                        self.data[44100:45100])
+
+    def test_benchmark(self):
+        data = os.urandom(44100 * 4 * 10)
+        write_wave(self.filename, data)
+        cache_path = os.path.join(self.directory, 'cache')
+
+        times = []
+        for cache in (None, media.AudioCache(), media.AudioCache(cache_path),
+                      media.AudioCache(cache_path)):
+            media.audio_cache = cache
+            self.decodes = 0
+            start_time = time.time()
+            sources = [self.load() for i in range(LOADS)]
+            times.append((time.time() - start_time, self.decodes,
+                          len(set([id(source._data) for source in sources]))))
+            self.assertTrue(read(sources[-1]._get_queue_source()) == data)
+            del sources
+            gc.collect()
+
+        print
+        for name, (elapsed, decodes, copies) in zip(
+                ('no cache', 'memory cache', 'cache files, first run',
+                 'cache files, later run'), times):
+            print '%d loads, %-22s %2d decodes %2d copies %8.3fs' % (
+                LOADS, name + ':', decodes, copies, elapsed)
+        self.assertTrue(times[0][1:] == (LOADS, LOADS))
+        self.assertTrue(times[1][1:] == (1, 1))
+        self.assertTrue(times[2][1:] == (1, 1))
+        self.assertTrue(times[3][1:] == (0, 1))
+        self.assertTrue(times[3][0] < times[0][0])
+
+if __name__ == '__main__':
+    unittest.main()
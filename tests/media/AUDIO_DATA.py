@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+'''Test that audio data packets are consumed without copying their data,
+that static sources give views of their data, and that a streaming WAVE
+source reuses the buffers of released packets.
+
+Prints the number of sample buffers allocated, the number of bytes copied
+between them, and the time taken to stream a WAVE file through a player
+writing part of a packet at a time, compared with the copying
+implementation.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import ctypes
+import io
+import os
+import time
+import unittest
+import wave
+
+from pyglet import media
+from pyglet.media import riff
+
+__noninteractive = True
+
+def wave_data(data, channels=2, sample_rate=44100):
+    file = io.BytesIO()
+    writer = wave.open(file, 'wb')
+    writer.setnchannels(channels)
+    writer.setsampwidth(2)
+    writer.setframerate(sample_rate)
+    writer.writeframes(data)
+    writer.close()
+    return file.getvalue()
+
+def address(data):
+    if isinstance(data, str):
+        return ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p).value
+    return ctypes.cast(data, ctypes.c_void_p).value
+
+def stream(source, output, packet_size, write_size):
+    # Write packets to output the way the PulseAudio player does, a part
+    # of a packet at a time, and release them.
+    offset = 0
+    while True:
+        audio_data = source.get_audio_data(packet_size)
+        if not audio_data:
+            return offset
+        while audio_data.length:
+            length = min(write_size, audio_data.length)
+            ctypes.memmove(ctypes.byref(output, offset), audio_data.data,
+                           length)
+            offset += length
+            audio_data.consume(length, source.audio_format)
+        audio_data.release()
+
+class CopyingAudioData(object):
+    # Packet consumption up to pyglet 1.2alpha1, counting the buffers it
+    # allocates and the bytes it copies into them.
+    allocations = 0
+    copied = 0
+
+    def __init__(self, data):
+        self.data = data
+        self.length = len(data)
+
+    def consume(self, bytes):
+        if bytes == self.length:
+            self.data = None
+            self.length = 0
+            return
+        if not isinstance(self.data, str):
+            data = ctypes.create_string_buffer(self.length)
+            ctypes.memmove(data, self.data, self.length)
+            self.data = data
+            CopyingAudioData.allocations += 1
+            CopyingAudioData.copied += self.length
+        self.data = self.data[bytes:]
+        self.length -= bytes
+        CopyingAudioData.allocations += 1
+        CopyingAudioData.copied += self.length
+
+def reference_stream(file, start, size, output, packet_size, write_size):
+    file.seek(start)
+    offset = 0
+    while offset < size:
+        audio_data = CopyingAudioData(
+            file.read(min(packet_size, size - offset)))
+        CopyingAudioData.allocations += 1
+        while audio_data.length:
+            length = min(write_size, audio_data.length)
+            ctypes.memmove(ctypes.byref(output, offset), audio_data.data,
+                           length)
+            offset += length
+            audio_data.consume(length)
+    return offset
+
+class AUDIO_DATA(unittest.TestCase):
+    def setUp(self):
+        self.audio_format = media.AudioFormat(2, 16, 44100)
+
+    def test_consume(self):
+        data = os.urandom(4000)
+        array = (ctypes.c_char * 4000).from_buffer_copy(data)
+        pointer = ctypes.cast(array, ctypes.POINTER(ctypes.c_ubyte))
+        for packet_data in (data, array, pointer):
+            audio_data = media.AudioData(packet_data, 4000, 1.0, 4000 / 176400.,
+                                         [media.MediaEvent(0, 'on_eos')])
+            base = address(packet_data)
+            offset = 0
+            for length in (1000, 4, 0, 1996):
+                audio_data.consume(length, self.audio_format)
+                offset += length
+                self.assertTrue(audio_data.events == ())
+                self.assertTrue(audio_data.length == 4000 - offset)
+                self.assertTrue(abs(audio_data.timestamp -
+                                    (1.0 + offset / 176400.)) < 1e-9)
+                # The remaining data is not copied.
+                self.assertTrue(address(audio_data.data) == base + offset)
+                self.assertTrue(audio_data.get_string_data() ==
+                                data[offset:])
+                self.assertTrue(str(buffer(audio_data.get_buffer())) ==
+                                data[offset:])
+            audio_data.consume(1000, self.audio_format)
+            self.assertTrue(audio_data.length == 0)
+            self.assertTrue(audio_data.data is None)
+
+    def test_offset(self):
+        data = os.urandom(4000)
+        audio_data = media.AudioData(data, 1000, 0., 0., [], 3000)
+        self.assertTrue(address(audio_data.data) == address(data) + 3000)
+        self.assertTrue(audio_data.get_string_data() == data[3000:])
+
+    def test_static_source(self):
+        data = os.urandom(44100 * 4)
+        source = media.StaticSource(
+            media.StaticMemorySource(data, self.audio_format))
+        queue_source = source._get_queue_source()
+        queue_source.seek(0.5)
+        audio_data = queue_source.get_audio_data(10000)
+        self.assertTrue(audio_data.timestamp == 0.5)
+        self.assertTrue(address(audio_data.data) ==
+                        address(source._data) + 88200)
+        self.assertTrue(audio_data.get_string_data() == data[88200:98200])
+
+        audio_data = queue_source.get_audio_data(1 << 20)
+        self.assertTrue(audio_data.length == len(data) - 98200)
+        self.assertTrue(queue_source.get_audio_data(1000) is None)
+
+    def test_pool(self):
+        pool = media.AudioDataPool()
+        audio_data = pool.get_audio_data(1000, 2.0, 0.5)
+        self.assertTrue(audio_data.length == 1000)
+        self.assertTrue(audio_data.timestamp == 2.0)
+        self.assertTrue(len(audio_data.get_buffer()) == 1000)
+        buffer = audio_data.data
+        audio_data.consume(300, self.audio_format)
+        audio_data.release()
+        audio_data.release()
+
+        # The released packet is reused, with its whole buffer.
+        self.assertTrue(pool.get_audio_data(2000) is audio_data)
+        self.assertTrue(audio_data.data is buffer)
+        self.assertTrue(audio_data.length == 2000)
+        self.assertTrue(audio_data.events == [])
+        self.assertTrue(pool.get_audio_data(2000) is not audio_data)
+        self.assertTrue(pool.allocations == 2)
+
+        # Packets not released are not reused.
+        for i in range(10):
+            pool.get_audio_data(100)
+        self.assertTrue(pool.allocations == 12)
+
+    def test_wave_source(self):
+        data = os.urandom(44100 * 4)
+        file = io.BytesIO(wave_data(data))
+        source = riff.WaveSource('test.wav', file)
+        output = (ctypes.c_char * len(data))()
+        self.assertTrue(stream(source, output, 4096, 3000) == len(data))
+        self.assertTrue(output.raw == data)
+        self.assertTrue(source._audio_data_pool.allocations == 1)
+
+        source.seek(0.5)
+        audio_data = source.get_audio_data(1000)
+        self.assertTrue(audio_data.timestamp == 0.5)
+        self.assertTrue(audio_data.get_string_data() == data[88200:89200])
+
+    def test_benchmark(self):
+        duration = 10
+        data = os.urandom(44100 * 4 * duration)
+        # A file object that cannot be mapped, so packets are read into
+        # buffers.
+        file = io.BytesIO(wave_data(data))
+        output = (ctypes.c_char * len(data))()
+
+        source = riff.WaveSource('test.wav', file)
+        start_time = time.time()
+        reference_stream(file, source._start_offset, len(data),
+                         output, 16384, 3000)
+        reference_time = time.time() - start_time
+        self.assertTrue(output.raw == data)
+
+        ctypes.memset(output, 0, len(data))
+        source.seek(0)
+        start_time = time.time()
+        stream(source, output, 16384, 3000)
+        stream_time = time.time() - start_time
+        self.assertTrue(output.raw == data)
+        file.close()
+
+        # Packets are read into the pool's buffer and not copied after.
+        allocations = source._audio_data_pool.allocations
+        print
+        print '%ds stream, copying:   %6d buffers %10d bytes %8.3fs' % (
+            duration, CopyingAudioData.allocations, CopyingAudioData.copied,
+            reference_time)
+        print '%ds stream, zero-copy: %6d buffers %10d bytes %8.3fs' % (
+            duration, allocations, 0, stream_time)
+        self.assertTrue(allocations == 1)
+        self.assertTrue(CopyingAudioData.copied > len(data))
+        self.assertTrue(stream_time < duration)
+
+if __name__ == '__main__':
+    unittest.main()
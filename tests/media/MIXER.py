@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+'''Test that the mixer driver mixes players with their volume, pitch and
+position into one stream, and dispatches their events.
+
+Prints the time taken to mix a second of audio from many players, and the
+number of threads the silent driver and the mixer driver use for them.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import os
+import random
+import struct
+import threading
+import time
+import unittest
+import wave
+from StringIO import StringIO
+
+import pyglet
+from pyglet import media
+from pyglet.media import procedural
+from pyglet.media.drivers import mixer, silent
+
+__noninteractive = True
+
+PLAYERS = 64
+
+class DataSource(media.StaticSource):
+    def __init__(self, data, audio_format):
+        self._data = data
+        self.audio_format = audio_format
+        self._duration = len(data) / float(audio_format.bytes_per_second)
+
+def constant_source(samples, duration, sample_size=16, sample_rate=44100):
+    # Source repeating a frame of the given sample values.
+    channels = len(samples)
+    if sample_size == 8:
+        frame = struct.pack('%dB' % channels, *samples)
+    else:
+        frame = struct.pack('<%dh' % channels, *samples)
+    audio_format = media.AudioFormat(channels, sample_size, sample_rate)
+    return DataSource(frame * int(duration * sample_rate), audio_format)
+
+class MIXER(unittest.TestCase):
+    def setUp(self):
+        self.saved_driver = media._audio_driver
+        self.file = StringIO()
+        self.driver = mixer.MixerAudioDriver(
+            mixer.FileAudioSink(self.file), threaded=False)
+        media._audio_driver = self.driver
+
+    def tearDown(self):
+        media._audio_driver = self.saved_driver
+        self.driver.delete()
+
+    def play(self, source, **properties):
+        player = media.Player()
+        for name, value in properties.items():
+            setattr(player, name, value)
+        player.queue(source)
+        player.play()
+        return player
+
+    def render(self):
+        while self.driver.update():
+            pass
+        self.driver.sink.close()
+        reader = wave.open(StringIO(self.file.getvalue()))
+        data = reader.readframes(reader.getnframes())
+        return [struct.unpack('<hh', data[i:i + 4])
+                for i in range(0, len(data), 4)]
+
+    def test_mix(self):
+        self.play(constant_source([1000], 0.1))
+        self.play(constant_source([2000, -3000], 0.05), volume=0.5)
+        self.play(constant_source([128 + 10], 0.05, sample_size=8))
+        frames = self.render()
+        self.assertTrue(len(frames) >= 4410)
+        self.assertTrue(len(frames) < 4410 + self.driver.period)
+        self.assertTrue(frames[0] == (1000 + 1000 + 2560,
+                                      1000 - 1500 + 2560))
+        self.assertTrue(frames[3000] == (1000, 1000))
+        self.assertTrue(frames[-1] == (0, 0))
+
+    def test_saturate(self):
+        self.play(constant_source([30000, -30000], 0.01))
+        self.play(constant_source([30000, -30000], 0.01))
+        self.assertTrue(self.render()[0] == (32767, -32768))
+
+    def test_position(self):
+        listener = self.driver.get_listener()
+        self.play(constant_source([1000], 0.01), position=(2, 0, 0))
+        self.play(constant_source([1000], 0.01), position=(0, 3, -1),
+                  max_distance=2.)
+        listener.volume = 0.5
+        frames = self.render()
+        # Panned right, at twice the minimum distance; and straight ahead,
+        # at the maximum distance.
+        self.assertTrue(frames[0] == (250, 250 + 250))
+
+    def test_pitch_and_rate(self):
+        self.play(constant_source([1000], 0.2, sample_rate=22050), pitch=2.)
+        frames = self.render()
+        self.assertTrue(abs(len(frames) - 4410) < self.driver.period)
+        self.assertTrue(frames[100] == (1000, 1000))
+
+    def test_events(self):
+        events = []
+        player = self.play(constant_source([1000, 1000], 0.25))
+        player.push_handlers(
+            on_eos=lambda: events.append(('on_eos', player.time)),
+            on_player_eos=lambda: events.append(('on_player_eos',)))
+
+        times = []
+        while self.driver.update():
+            times.append(player.time)
+            pyglet.app.platform_event_loop.dispatch_posted_events()
+        pyglet.app.platform_event_loop.dispatch_posted_events()
+
+        period_time = self.driver.period / 44100.
+        self.assertTrue(times == sorted(times))
+        self.assertTrue(abs(times[0] - 4410 / 44100.) < period_time)
+        self.assertTrue(len(events) == 2)
+        self.assertTrue(events[0][0] == 'on_eos')
+        self.assertTrue(abs(events[0][1] - 0.25) < 1e-6)
+        self.assertTrue(events[1] == ('on_player_eos',))
+        self.assertTrue(not self.driver._players)
+
+    def test_benchmark(self):
+        audio_format = media.AudioFormat(1, 16, 44100)
+        source = DataSource(os.urandom(44100 * 2), audio_format)
+
+        # Silent driver: a thread for each player.
+        threads = threading.activeCount()
+        driver = silent.create_audio_driver()
+        audio_players = []
+        for i in range(PLAYERS):
+            group = media.SourceGroup(audio_format, None)
+            group.queue(source)
+            audio_players.append(
+                driver.create_audio_player(group, media.Player()))
+        silent_threads = threading.activeCount() - threads
+        for audio_player in audio_players:
+            audio_player.delete()
+
+        # Mixer driver: one thread, started when a player plays.
+        threads = threading.activeCount()
+        driver = mixer.MixerAudioDriver(mixer.NullAudioSink(realtime=False))
+        audio_players = []
+        for i in range(PLAYERS):
+            group = media.SourceGroup(audio_format, None)
+            group.queue(source)
+            audio_player = driver.create_audio_player(group, media.Player())
+            audio_player.set_volume(random.random())
+            audio_player.set_position((random.uniform(-5, 5), 0, -1))
+            if i % 4 == 0:
+                audio_player.set_pitch(random.uniform(0.5, 2))
+            audio_players.append(audio_player)
+        start_time = time.time()
+        for audio_player in audio_players:
+            audio_player.play()
+        mixer_threads = threading.activeCount() - threads
+        while [p for p in audio_players if p._is_active()]:
+            time.sleep(0.001)
+        elapsed = time.time() - start_time
+        driver.delete()
+        pyglet.app.platform_event_loop.dispatch_posted_events()
+
+        print
+        print '%d players: silent driver %d threads, mixer %d thread' % (
+            PLAYERS, silent_threads, mixer_threads)
+        print 'mix %.2fs of audio: %8.3fs' % (
+            driver.sink.get_play_position() / 44100., elapsed)
+        self.assertTrue(silent_threads == PLAYERS)
+        self.assertTrue(mixer_threads == 1)
+        self.assertTrue(elapsed < source.duration)
+
+if __name__ == '__main__':
+    unittest.main()
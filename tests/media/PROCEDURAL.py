@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+'''Test that procedural sources generate continuous waveforms across
+buffers and after seeking, with envelopes and mixing, and that the
+generators without NumPy give the same data.
+
+Prints the time taken to generate a few seconds of a sine wave, compared
+with computing each sample in a Python loop.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import array
+import ctypes
+import math
+import time
+import unittest
+
+from pyglet.media import procedural
+
+__noninteractive = True
+
+def read(source, bytes=1 << 30):
+    data = []
+    while True:
+        audio_data = source.get_audio_data(bytes)
+        if not audio_data:
+            break
+        data.append(audio_data.data)
+    return ''.join(data)
+
+def samples(data):
+    return array.array('h', data)
+
+def reference_sine(duration, frequency, sample_rate=44800):
+    # Implementation of Sine up to pyglet 1.2alpha1.
+    count = int(duration * sample_rate)
+    data = (ctypes.c_short * count)()
+    step = frequency * (math.pi * 2) / sample_rate
+    for i in range(count):
+        data[i] = int(math.sin(step * i) * 32767)
+    return data
+
+def make_sources():
+    return [
+        procedural.Silence(0.1),
+        procedural.Silence(0.1, sample_size=8),
+        procedural.Sine(0.1, 440),
+        procedural.Sine(0.1, 300, sample_size=8, sample_rate=22050),
+        procedural.Saw(0.1, 440),
+        procedural.Square(0.1, 330),
+        procedural.FM(0.1, 440, 110, 2.0,
+                      envelope=procedural.ADSREnvelope(0.01, 0.02, 0.03)),
+        procedural.Mix([procedural.Sine(0.05, 262),
+                        procedural.Square(0.1, 392,
+                            envelope=procedural.LinearDecayEnvelope())],
+                       [0.5, 0.25], envelope=procedural.FlatEnvelope(0.8)),
+    ]
+
+class PROCEDURAL(unittest.TestCase):
+    def setUp(self):
+        self.saved_numpy = procedural.numpy
+
+    def tearDown(self):
+        procedural.numpy = self.saved_numpy
+
+    def test_buffers(self):
+        for source in make_sources():
+            data = read(source)
+            self.assertTrue(len(data) ==
+                int(source.duration * source.audio_format.bytes_per_second))
+
+            # Read in small buffers, and after seeking.
+            source.seek(0)
+            self.assertTrue(read(source, 1000) == data)
+            source.seek(0.03)
+            offset = int(0.03 * source.audio_format.bytes_per_second)
+            offset -= offset % source.audio_format.bytes_per_sample
+            self.assertTrue(read(source, 333) == data[offset:])
+
+    def test_waveforms(self):
+        data = samples(read(procedural.Sine(0.1, 440)))
+        self.assertTrue(list(data) == list(reference_sine(0.1, 440)))
+
+        self.assertTrue(read(procedural.Silence(0.01, sample_size=8)) ==
+                        '\x80' * 448)
+
+        # 8 samples a cycle.
+        data = samples(read(procedural.Square(0.01, 5600)))
+        self.assertTrue(list(data[:16]) == [-32767] * 4 + [32767] * 4 +
+                                           [-32767] * 4 + [32767] * 4)
+        data = samples(read(procedural.Saw(0.01, 5600)))
+        self.assertTrue(list(data[:9]) == [0, 16383, 32767, 16383, 0,
+                                           -16383, -32767, -16383, 0])
+
+    def test_envelopes(self):
+        envelope = procedural.ADSREnvelope(0.1, 0.1, 0.2, 0.5)
+        gains = envelope.get_gains(0, 11, 10, 1.0)
+        self.assertTrue([round(g, 6) for g in gains] ==
+                        [0, 1, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.25, 0])
+
+        # Release starts after the decay in short sources.
+        gains = envelope.get_gains(0, 4, 10, 0.3)
+        self.assertTrue([round(g, 6) for g in gains] == [0, 1, 0.5, 0])
+
+        source = procedural.Sine(0.1, 440,
+                                 envelope=procedural.FlatEnvelope(0.5))
+        data = samples(read(source))
+        expected = reference_sine(0.1, 440)
+        self.assertTrue(max([abs(a - b / 2.)
+                             for a, b in zip(data, expected)]) <= 1)
+
+    def test_mix(self):
+        mix = procedural.Mix([procedural.Sine(0.05, 440),
+                              procedural.Sine(0.1, 440)], [0.75, 0.75])
+        data = samples(read(mix))
+        expected = reference_sine(0.1, 440)
+        count = int(0.05 * 44800)
+        for i in range(0, len(data), 7):
+            if i < count:
+                value = min(max(expected[i] * 1.5, -32767), 32767)
+            else:
+                value = expected[i] * 0.75
+            self.assertTrue(abs(data[i] - value) <= 2)
+
+        self.assertRaises(procedural.MediaException, procedural.Mix,
+                          [procedural.Sine(0.1, sample_rate=22050)])
+
+    def test_without_numpy(self):
+        if procedural.numpy is None:
+            return
+        expected = [read(source) for source in make_sources()]
+        procedural.numpy = None
+        for source, data in zip(make_sources(), expected):
+            result = read(source)
+            self.assertTrue(len(result) == len(data))
+            if source.audio_format.sample_size == 8:
+                result = array.array('B', result)
+                data = array.array('B', data)
+            else:
+                result = samples(result)
+                data = samples(data)
+            self.assertTrue(max([abs(a - b)
+                                 for a, b in zip(result, data)]) <= 1)
+
+    def test_benchmark(self):
+        duration = 5.0
+        start_time = time.time()
+        reference_sine(duration, 440)
+        reference_time = time.time() - start_time
+
+        start_time = time.time()
+        read(procedural.Sine(duration, 440), 4096)
+        sine_time = time.time() - start_time
+
+        start_time = time.time()
+        read(procedural.FM(duration, 440, 220,
+            envelope=procedural.ADSREnvelope(0.05, 0.1, 1.0)), 4096)
+        fm_time = time.time() - start_time
+
+        print
+        print '%.1fs sine, per sample:  %8.3fs' % (duration, reference_time)
+        print '%.1fs sine:              %8.3fs' % (duration, sine_time)
+        print '%.1fs FM with envelope:  %8.3fs' % (duration, fm_time)
+        self.assertTrue(sine_time < duration)
+        if procedural.numpy is not None:
+            self.assertTrue(sine_time < reference_time)
+
+if __name__ == '__main__':
+    unittest.main()
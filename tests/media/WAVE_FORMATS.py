@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+'''Test that WAVE files with 8 to 32-bit integer, float, extensible and IMA
+ADPCM data are read as 8 or 16-bit samples, from a file or from a mapping
+of the file, and after seeking.
+
+Prints the time taken to stream a WAVE file and to seek around in it,
+read from a file object and from a mapping.
+'''
+
+__docformat__ = 'restructuredtext'
+__version__ = '$Id: $'
+
+import array
+import audioop
+import ctypes
+import io
+import math
+import random
+import struct
+import tempfile
+import time
+import unittest
+
+from pyglet.media import riff
+
+__noninteractive = True
+
+STREAMS = 10
+
+INDEX_TABLE = [-1, -1, -1, -1, 2, 4, 6, 8] * 2
+STEP_TABLE = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41,
+    45, 50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190,
+    209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724,
+    796, 876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272,
+    2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132,
+    7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500,
+    20350, 22385, 24623, 27086, 29794, 32767]
+
+def wave_file(format_tag, channels, bits, data, sample_rate=22050,
+              block_align=None, extra=None, extensible=False, chunks=''):
+    if block_align is None:
+        block_align = bits // 8 * channels
+    if extensible:
+        extra = struct.pack('<HLH14s', bits, 3, format_tag,
+                            riff._KSDATAFORMAT_SUBTYPE)
+        format_tag = riff.WAVE_FORMAT_EXTENSIBLE
+    fmt = struct.pack('<HHLLHH', format_tag, channels, sample_rate,
+                      sample_rate * block_align, block_align, bits)
+    if extra is not None:
+        fmt += struct.pack('<H', len(extra)) + extra
+    body = 'WAVE' + chunk('fmt ', fmt) + chunks + chunk('data', data)
+    return chunk('RIFF', body)
+
+def chunk(name, data):
+    return name + struct.pack('<L', len(data)) + data + '\0' * (len(data) & 1)
+
+def samples(count, channels=1):
+    return [int(20000 * math.sin(i * 0.01 * (1 + i % channels)))
+            for i in range(count * channels)]
+
+def pack(values):
+    return array.array('h', values).tostring()
+
+def read(source, bytes=5000):
+    data = []
+    while True:
+        audio_data = source.get_audio_data(bytes)
+        if not audio_data:
+            break
+        data.append(audio_data.get_string_data())
+        audio_data.release()
+    return ''.join(data)
+
+def encode_ima_adpcm(values, channels, block_align):
+    # Encode interleaved samples into blocks, the last one shorter.
+    block_frames = (block_align - 4 * channels) * 2 // channels + 1
+    frames = len(values) // channels
+    indexes = [0] * channels
+    blocks = []
+    for start in range(0, frames, block_frames):
+        count = min(block_frames, frames - start)
+        count -= (count - 1) % 8
+        header = ''
+        words = []
+        for channel in range(channels):
+            channel_values = values[start * channels + channel::channels]
+            channel_values = channel_values[:count]
+            header += struct.pack('<hBx', channel_values[0], indexes[channel])
+            data, (value, indexes[channel]) = audioop.lin2adpcm(
+                pack(channel_values[1:]), 2,
+                (channel_values[0], indexes[channel]))
+            data = data.translate(riff._swap_nibbles)
+            words.append([data[i:i + 4] for i in range(0, len(data), 4)])
+        blocks.append(header + ''.join([''.join(group)
+                                        for group in zip(*words)]))
+    return ''.join(blocks)
+
+def decode_ima_adpcm(data, channels, block_align):
+    # Reference decoder, a sample at a time.
+    values = []
+    for offset in range(0, len(data), block_align):
+        block = data[offset:offset + block_align]
+        channel_values = []
+        for channel in range(channels):
+            value, index = struct.unpack('<hBx',
+                block[channel * 4:channel * 4 + 4])
+            decoded = [value]
+            for word in range(4 * channels + channel * 4, len(block),
+                              4 * channels):
+                for byte in block[word:word + 4]:
+                    for nibble in (ord(byte) & 0xf, ord(byte) >> 4):
+                        step = STEP_TABLE[index]
+                        diff = step >> 3
+                        if nibble & 4:
+                            diff += step
+                        if nibble & 2:
+                            diff += step >> 1
+                        if nibble & 1:
+                            diff += step >> 2
+                        if nibble & 8:
+                            value = max(value - diff, -32768)
+                        else:
+                            value = min(value + diff, 32767)
+                        index = min(max(index + INDEX_TABLE[nibble], 0), 88)
+                        decoded.append(value)
+            channel_values.append(decoded)
+        for frame in zip(*channel_values):
+            values.extend(frame)
+    return values
+
+class WAVE_FORMATS(unittest.TestCase):
+    def load(self, data, mapped=False):
+        if mapped:
+            file = tempfile.TemporaryFile()
+            file.write(data)
+            file.flush()
+        else:
+            file = io.BytesIO(data)
+        source = riff.WaveSource('test.wav', file)
+        self.assertTrue((source._mapping is not None) == mapped)
+        return source
+
+    def check(self, data, expected, sample_size=16, channels=2,
+              block_frames=1):
+        for mapped in (False, True):
+            source = self.load(data, mapped)
+            self.assertTrue(source.audio_format.sample_size == sample_size)
+            self.assertTrue(source.audio_format.channels == channels)
+            self.assertTrue(read(source) == expected)
+            self.assertTrue(abs(source.duration - len(expected) /
+                float(source.audio_format.bytes_per_second)) < 1e-9)
+
+            # Seek to a frame, or the start of its block.
+            frame_size = source.audio_format.bytes_per_sample
+            frame = len(expected) // frame_size // 3
+            frame -= frame % block_frames
+            source.seek(float(frame) / source.audio_format.sample_rate)
+            self.assertTrue(read(source, 777) ==
+                            expected[frame * frame_size:])
+            source.seek(source.duration + 1)
+            self.assertTrue(source.get_audio_data(1000) is None)
+
+    def test_integer(self):
+        values = samples(1000, 2)
+        expected = pack(values)
+        self.check(wave_file(1, 2, 16, expected), expected)
+        self.check(wave_file(1, 2, 24, ''.join(
+            [struct.pack('<i', value << 8)[:3] for value in values])),
+            expected)
+        self.check(wave_file(1, 2, 32, ''.join(
+            [struct.pack('<i', (value << 16) + 0x7fff)
+             for value in values])), expected)
+
+        data = ''.join([chr(value // 256 + 128) for value in values])
+        self.check(wave_file(1, 2, 8, data), data, sample_size=8)
+
+    def test_float(self):
+        values = samples(1000, 2)
+        floats = [value / 32767. for value in values] + [1.5, -2.]
+        expected = pack(values + [32767, -32767])
+        for typecode, bits in (('f', 32), ('d', 64)):
+            data = array.array(typecode, floats).tostring()
+            self.check(wave_file(3, 2, bits, data), expected)
+
+            saved_numpy = riff.numpy
+            riff.numpy = None
+            try:
+                self.check(wave_file(3, 2, bits, data), expected)
+            finally:
+                riff.numpy = saved_numpy
+
+    def test_extensible(self):
+        values = samples(1000, 2)
+        expected = pack(values)
+        data = ''.join([struct.pack('<i', value << 8)[:3]
+                        for value in values])
+        self.check(wave_file(1, 2, 24, data, extensible=True), expected)
+        data = array.array('f', [value / 32767. for value in values])
+        self.check(wave_file(3, 2, 32, data.tostring(), extensible=True),
+                   expected)
+
+        # Format chunk of odd size, and an odd-sized chunk before the data.
+        self.check(wave_file(1, 2, 16, expected, extra='\0',
+                             chunks=chunk('LIST', 'odd')), expected)
+
+    def test_ima_adpcm(self):
+        for channels, block_align in ((1, 256), (2, 512)):
+            values = samples(5000, channels)
+            data = encode_ima_adpcm(values, channels, block_align)
+            self.assertTrue(len(data) % block_align != 0)
+            decoded = decode_ima_adpcm(data, channels, block_align)
+            block_frames = (block_align - 4 * channels) * 2 // channels + 1
+            extra = struct.pack('<H', block_frames)
+            self.check(wave_file(0x11, channels, 4, data, extra=extra,
+                block_align=block_align), pack(decoded), channels=channels,
+                block_frames=block_frames)
+
+            # The decoded samples are close to the encoded ones.
+            errors = [abs(a - b) for a, b in zip(values, decoded)]
+            self.assertTrue(sum(errors) / len(errors) < 100)
+
+    def test_unsupported(self):
+        for data in (wave_file(0x55, 2, 0, '\0' * 100),
+                     wave_file(1, 2, 12, '\0' * 100),
+                     wave_file(3, 2, 16, '\0' * 100),
+                     wave_file(0x11, 2, 4, '\0' * 100, block_align=8),
+                     'RIFF\4\0\0\0WAVE'):
+            self.assertRaises(riff.WAVEFormatException, self.load, data)
+
+    def test_mapping(self):
+        values = samples(10000, 2)
+        data = wave_file(1, 2, 16, pack(values))
+        source = self.load(data, mapped=True)
+        base = ctypes.addressof(source._mapping_data)
+        source.seek(0.1)
+        audio_data = source.get_audio_data(4000)
+        self.assertTrue(ctypes.addressof(audio_data.data) ==
+                        base + 44 + 2205 * 4)
+        self.assertTrue(audio_data.get_string_data() ==
+                        pack(values[4410:6410]))
+
+    def test_benchmark(self):
+        duration = 60
+        data = wave_file(1, 2, 16, '\0' * (duration * 22050 * 4))
+        file = tempfile.TemporaryFile()
+        file.write(data)
+        file.flush()
+
+        # Sources reading file objects.
+        source = riff.WaveSource('test.wav', io.BytesIO(data))
+        file_times = self.time_source(source, duration)
+
+        source = riff.WaveSource('test.wav', file)
+        mapped_times = self.time_source(source, duration)
+        self.assertTrue(source._mapping is not None)
+
+        print
+        print '%d x %ds stream: file %8.3fs  mapped %8.3fs' % (
+            STREAMS, duration, file_times[0], mapped_times[0])
+        print '1000 seeks:       file %8.3fs  mapped %8.3fs' % (
+            file_times[1], mapped_times[1])
+        self.assertTrue(mapped_times[0] < file_times[0])
+        self.assertTrue(mapped_times[1] < file_times[1])
+
+    def time_source(self, source, duration):
+        start_time = time.time()
+        for i in range(STREAMS):
+            source.seek(0)
+            while True:
+                audio_data = source.get_audio_data(65536)
+                if not audio_data:
+                    break
+                audio_data.release()
+        stream_time = time.time() - start_time
+
+        random.seed(1)
+        start_time = time.time()
+        for i in range(1000):
+            source.seek(random.uniform(0, duration))
+            source.get_audio_data(65536).release()
+        seek_time = time.time() - start_time
+        return stream_time, seek_time
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# $Id:$
+
+'''Test that images preloaded in the background are uploaded by the
+progress object, are returned by later image requests, and that images that
+cannot be loaded or uploaded are reported.
+'''
+
+import time
+import unittest
+
+from pyglet import resource
+from pyglet import window
+from pyglet.image.atlas import AllocatorException
+
+__noninteractive = True
+
+class TestCase(unittest.TestCase):
+    def setUp(self):
+        self.w = window.Window(width=10, height=10, visible=False)
+        self.loader = resource.Loader('@' + __name__)
+
+    def tearDown(self):
+        self.w.close()
+
+    def test_update(self):
+        names = ['rgbm.png', 'dir1/res.zip', 'missing.png']
+        progress = self.loader.preload(names, threads=2)
+        self.assertTrue(progress.total == 3)
+        self.assertTrue(progress.fraction == 0.)
+        while not progress.done:
+            try:
+                progress.update()
+            except resource.ResourceNotFoundException:
+                self.assertTrue('missing.png' in progress.errors)
+            except Exception:
+                self.assertTrue('dir1/res.zip' in progress.errors)
+        self.assertTrue(progress.fraction == 1.)
+        self.assertTrue(progress.images.keys() == ['rgbm.png'])
+        self.assertTrue(sorted(progress.errors.keys()) ==
+                        ['dir1/res.zip', 'missing.png'])
+
+        img = progress.images['rgbm.png']
+        self.assertTrue((img.width, img.height) == (4, 4))
+        self.assertTrue(self.loader.image('rgbm.png') is img)
+
+    def test_wait(self):
+        img = self.loader.image('rgbm.png')
+        progress = self.loader.preload(['rgbm.png'] * 4)
+        progress.wait()
+        self.assertTrue(progress.done)
+        self.assertTrue(progress.images['rgbm.png'] is img)
+
+    def test_cancel(self):
+        progress = self.loader.preload([], threads=1)
+        self.assertTrue(progress.done)
+        progress = self.loader.preload(['rgbm.png'] * 100, threads=1)
+        progress.cancel()
+        self.assertTrue(progress.total < 100)
+        progress.wait()
+        self.assertTrue(progress.count == progress.total)
+
+class UploadErrorLoader(resource.Loader):
+    def _upload_image(self, img, atlas=True):
+        raise AllocatorException('no room')
+
+class UploadErrorTestCase(unittest.TestCase):
+    def test_upload_error(self):
+        loader = UploadErrorLoader('@' + __name__)
+        progress = loader.preload(['rgbm.png'] * 3, threads=1)
+        while progress._decoded.qsize() < 3:
+            time.sleep(0.01)
+
+        # The images after the failed upload in the same update are still
+        # counted.
+        self.assertRaises(AllocatorException, progress.update)
+        self.assertTrue(progress.count == 3)
+        self.assertTrue(progress.done)
+        self.assertTrue(progress.errors.keys() == ['rgbm.png'])
+        self.assertTrue(progress.images == {})
+        progress.wait()
+
+if __name__ == '__main__':
+    unittest.main()